@@ -0,0 +1,288 @@
+"""
+Admission Control Module
+Concurrency limits and CPU budgeting for the heavy modelling endpoints
+
+Each endpoint class (modelling, export, ...) gets a concurrency semaphore and a
+bounded wait queue. A request that finds the queue full, or waits longer than
+the class allows, is answered 429 with a Retry-After estimated from the recent
+job durations. While jobs of a class run, BLAS/OpenMP pools are capped to the
+class's share of the cores so parallel SARIMA / Prophet fits do not
+oversubscribe the CPU and light endpoints keep responding.
+
+The BLAS cap is a global cap: BLAS pools are shared by the whole process, so
+threadpoolctl limits every thread of the Flask process (not only the capped
+job) while at least one capped job runs. Environment variables are never
+changed from request threads (setenv races with the C libraries reading
+them); they are only set in worker processes, by cap_worker_threads.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+from flask import jsonify
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # threadpoolctl is optional: environment variables only
+    threadpool_limits = None
+
+logger = logging.getLogger("AdmissionControl")
+
+# Variables read by OpenBLAS / MKL / OpenMP / numexpr when their pools start
+BLAS_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS'
+)
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Retry-After bounds (seconds)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 300
+
+
+def cap_worker_threads(threads):
+    """
+    Cap BLAS/OpenMP threads for the rest of this process.
+
+    Meant for worker processes (parallel_runner): environment variables cover
+    pools started later and the subprocesses (cmdstan), threadpoolctl the pools
+    numpy already started.
+    """
+    threads = max(1, int(threads))
+    for var in BLAS_ENV_VARS:
+        os.environ[var] = str(threads)
+    if threadpool_limits is not None:
+        threadpool_limits(limits=threads)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the suggested Retry-After"""
+
+    def __init__(self, class_name, reason, retry_after):
+        super().__init__(f"{class_name}: {reason}")
+        self.class_name = class_name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def rejection_response(e):
+    """429 response with Retry-After for an AdmissionRejected"""
+    logger.warning(f"Request rejected ({e}), retry after {e.retry_after}s")
+    response = jsonify({
+        'error': 'Server busy, too many analyses in progress',
+        'reason': e.reason,
+        'retry_after': e.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+class WorkClass:
+    """Concurrency budget of one endpoint class"""
+
+    def __init__(self, name, max_concurrent, max_queue, max_wait, blas_threads=None):
+        """
+        Args:
+            name: Class name ('modelling', 'export', ...)
+            max_concurrent: Jobs running at the same time
+            max_queue: Requests allowed to wait for a slot (0: reject when busy)
+            max_wait: Seconds a queued request waits before being rejected
+            blas_threads: BLAS/OpenMP threads per job (None: no cap)
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.blas_threads = blas_threads
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_waiting_seen = 0
+        self.avg_duration = None  # exponential moving average (seconds)
+        self.avg_wait = 0.0
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, from the recent job durations"""
+        with self.lock:
+            duration = self.avg_duration if self.avg_duration is not None else self.max_wait
+            backlog = self.waiting + 1
+        estimate = math.ceil(duration * backlog / self.max_concurrent)
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, estimate)))
+
+    def record(self, duration, waited):
+        with self.lock:
+            if self.avg_duration is None:
+                self.avg_duration = duration
+            else:
+                self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+            self.avg_wait = 0.8 * self.avg_wait + 0.2 * waited
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'running': self.running,
+                'queued': self.waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'max_wait': self.max_wait,
+                'blas_threads': self.blas_threads,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'max_queued_seen': self.max_waiting_seen,
+                'avg_duration': round(self.avg_duration, 3) if self.avg_duration is not None else None,
+                'avg_wait': round(self.avg_wait, 3)
+            }
+
+
+class AdmissionController:
+    """Registry of work classes and the Flask decorator that enforces them"""
+
+    def __init__(self):
+        self.classes = {}
+        self.blas_lock = threading.Lock()
+        self.blas_users = 0
+        self.blas_limiter = None
+
+    def add_class(self, name, max_concurrent, max_queue=None, max_wait=30, blas_threads=None):
+        """
+        Register an endpoint class.
+
+        Args:
+            max_queue: Defaults to twice max_concurrent
+            blas_threads: Defaults to an even share of the cores between concurrent jobs
+        """
+        max_concurrent = max(1, int(max_concurrent))
+        if max_queue is None:
+            max_queue = 2 * max_concurrent
+        if blas_threads is None:
+            blas_threads = max(1, CPU_COUNT // max_concurrent)
+        self.classes[name] = WorkClass(name, max_concurrent, max_queue, max_wait, blas_threads)
+        logger.info(f"Admission class {name}: {max_concurrent} concurrent, queue {max_queue}, "
+                    f"wait {max_wait}s, {blas_threads} BLAS threads per job")
+        return self.classes[name]
+
+    # ------------------------------------------------------------------
+    # BLAS thread caps: global to the process (BLAS pools are shared by all
+    # threads), held while at least one capped job runs. Without threadpoolctl
+    # jobs run uncapped in the Flask process; use worker processes
+    # (parallel_runner) for a per-job cap.
+    # ------------------------------------------------------------------
+
+    def _enter_blas_cap(self, threads):
+        with self.blas_lock:
+            self.blas_users += 1
+            if self.blas_users > 1 or threadpool_limits is None:
+                return
+            self.blas_limiter = threadpool_limits(limits=threads)
+
+    def _exit_blas_cap(self):
+        with self.blas_lock:
+            self.blas_users -= 1
+            if self.blas_users > 0:
+                return
+            if self.blas_limiter is not None:
+                self.blas_limiter.restore_original_limits()
+                self.blas_limiter = None
+
+    # ------------------------------------------------------------------
+    # Admission
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def admit(self, class_name):
+        """
+        Run the enclosed block within the class's budget.
+
+        Raises:
+            AdmissionRejected: Queue full, or no slot freed within max_wait
+        """
+        work = self.classes[class_name]
+        arrived = time.monotonic()
+
+        if not work.semaphore.acquire(blocking=False):
+            with work.lock:
+                if work.waiting >= work.max_queue:
+                    work.rejected += 1
+                    full = True
+                else:
+                    work.waiting += 1
+                    work.max_waiting_seen = max(work.max_waiting_seen, work.waiting)
+                    full = False
+            if full:
+                raise AdmissionRejected(class_name, 'queue full', work.retry_after())
+            try:
+                acquired = work.semaphore.acquire(timeout=work.max_wait)
+            finally:
+                with work.lock:
+                    work.waiting -= 1
+            if not acquired:
+                with work.lock:
+                    work.rejected += 1
+                    work.timed_out += 1
+                raise AdmissionRejected(class_name, 'wait timeout', work.retry_after())
+
+        started = time.monotonic()
+        with work.lock:
+            work.running += 1
+            work.admitted += 1
+        if work.blas_threads:
+            self._enter_blas_cap(work.blas_threads)
+        try:
+            yield work
+        finally:
+            if work.blas_threads:
+                self._exit_blas_cap()
+            with work.lock:
+                work.running -= 1
+            work.semaphore.release()
+            work.record(time.monotonic() - started, started - arrived)
+
+    def run(self, class_name, fn, *args, **kwargs):
+        """
+        fn(*args, **kwargs) inside admit(class_name).
+
+        Meant as the function of a single-flight call, so that only the leader
+        takes a slot and the followers wait for its result:
+
+            computation_flights.do(key, admission.run, 'modelling', build_delivery_plan, ...)
+
+        Raises:
+            AdmissionRejected: see admit (answer it with rejection_response)
+        """
+        with self.admit(class_name):
+            return fn(*args, **kwargs)
+
+    def guard(self, class_name):
+        """
+        Flask route decorator: run the view inside admit(class_name), or
+        answer 429 with Retry-After when it cannot be admitted.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                try:
+                    with self.admit(class_name):
+                        return f(*args, **kwargs)
+                except AdmissionRejected as e:
+                    return rejection_response(e)
+            return decorated_function
+        return decorator
+
+    def snapshot(self):
+        """Queue depth and counters per class"""
+        return {name: work.snapshot() for name, work in self.classes.items()}
@@ -0,0 +1,250 @@
+"""
+Analytics Engine Module
+In-process DuckDB over the local Parquet snapshot, for the heavy aggregations
+
+Multi-year GROUP BYs (commercial list, historical deliveries, exports) compete
+with the transactional traffic when they run on MySQL. When the sales snapshot
+(see sales_snapshot) has been built and duckdb is installed, these queries are
+routed to an embedded DuckDB reading the Parquet files instead. MySQL keeps the
+point lookups, the writes and the authentication.
+
+Routing API:
+- read_aggregate(query, params, conn): DataFrame of an aggregate query
+- iter_aggregate_chunks(query, params, conn): the same, as DataFrame chunks
+
+Both take the MySQL query as written for MySQL; it is translated for DuckDB
+(placeholders, DATE_FORMAT, DATE_ADD). If DuckDB cannot run it (engine or
+snapshot missing, unknown column, ...) the query runs on `conn` as before.
+Results are as fresh as the last snapshot synchronization: when it is older
+than ANALYTICS_MAX_STALENESS seconds (the refresher stopped), queries go back
+to MySQL until the snapshot is synchronized again.
+
+DuckDB views:
+- entetecommercials: code, date, commercial_code, client_code, net_a_payer
+- lignecommercials: entetecommercial_code, produit_code, quantite
+- sales_lines: one row per invoice line (invoices without lines kept) with
+  the invoice columns plus produit_code and quantite
+"""
+
+import os
+import re
+import logging
+import threading
+from datetime import datetime
+
+from chunked_loader import coerce_chunk, iter_query_chunks, load_dataframe, DEFAULT_CHUNK_SIZE
+from sales_snapshot import get_snapshot
+from sales_repository import qmark_placeholders, strftime_format
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    duckdb = None
+    DUCKDB_AVAILABLE = False
+
+logger = logging.getLogger("AnalyticsEngine")
+
+# Columns only found on invoice lines: queries using them read sales_lines
+LINE_COLUMNS = ('produit_code', 'quantite')
+
+# Seconds since the last snapshot synchronization beyond which MySQL answers
+# (ANALYTICS_MAX_STALENESS, 0: no limit); three default refresh intervals
+DEFAULT_MAX_STALENESS = 900
+
+_DATE_ADD = re.compile(r"DATE_ADD\(\s*([^,()]+?)\s*,\s*INTERVAL\s+(\d+)\s+(DAY|MONTH|YEAR)\s*\)", re.IGNORECASE)
+# DATE_FORMAT(expr, 'format') with a literal format (expr may hold one level of parentheses);
+# other forms are left as is and make DuckDB fail, so the query runs on MySQL
+_DATE_FORMAT = re.compile(r"\bDATE_FORMAT\(\s*((?:[^()',]|\([^()]*\))+?)\s*,\s*'([^']*)'\s*\)", re.IGNORECASE)
+
+
+def to_duckdb_sql(query, has_params=True):
+    """
+    Translate a MySQL query (mysql.connector parameter style) to DuckDB.
+
+    Args:
+        query: SQL with %s placeholders
+        has_params: Whether the query is run with parameters (%% escapes)
+
+    Returns:
+        str: DuckDB SQL with ? placeholders
+    """
+    sql = query
+    if has_params:
+        sql = qmark_placeholders(sql)
+    # After the %% unescape: the specifiers are translated on the real format
+    sql = _DATE_FORMAT.sub(lambda m: f"strftime({m.group(1)}, '{strftime_format(m.group(2))}')", sql)
+    sql = _DATE_ADD.sub(lambda m: f"(CAST({m.group(1)} AS DATE) + INTERVAL {m.group(2)} {m.group(3).upper()})", sql)
+    return sql
+
+
+class AnalyticsEngine:
+    """DuckDB connection with views over the snapshot partitions"""
+
+    def __init__(self, snapshot=None, max_staleness=None):
+        """
+        Args:
+            snapshot: SalesSnapshot read by the views (default: get_snapshot())
+            max_staleness: Seconds after its last synchronization the snapshot
+                is still used (None: ANALYTICS_MAX_STALENESS, 0: no limit)
+        """
+        self.snapshot = snapshot or get_snapshot()
+        self.max_staleness = max_staleness
+        self.lock = threading.Lock()
+        self.con = None
+
+    def staleness(self):
+        """Seconds since the last snapshot synchronization, None before the first one"""
+        state = self.snapshot.state()
+        if not state or not state.get('synced_at'):
+            return None
+        return (datetime.now() - datetime.strptime(state['synced_at'], '%Y-%m-%d %H:%M:%S')).total_seconds()
+
+    def available(self):
+        """DuckDB installed and a snapshot synchronized within max_staleness"""
+        if not (DUCKDB_AVAILABLE and self.snapshot.available()):
+            return False
+        max_staleness = self.max_staleness
+        if max_staleness is None:
+            max_staleness = float(os.environ.get('ANALYTICS_MAX_STALENESS', DEFAULT_MAX_STALENESS))
+        if max_staleness <= 0:
+            return True
+        staleness = self.staleness()
+        if staleness is None or staleness > max_staleness:
+            logger.info(f"Sales snapshot synchronized {staleness and round(staleness)}s ago "
+                        f"(limit {max_staleness:.0f}s), using MySQL")
+            return False
+        return True
+
+    def _connection(self):
+        with self.lock:
+            if self.con is None:
+                con = duckdb.connect(':memory:')
+                root = self.snapshot.root.replace("'", "''")
+                con.execute(f"""
+                    CREATE VIEW entetecommercials AS
+                    SELECT code, date, CAST(commercial_code AS VARCHAR) AS commercial_code,
+                           CAST(client_code AS VARCHAR) AS client_code, net_a_payer
+                    FROM read_parquet('{root}/entetecommercials/*/part.parquet')
+                """)
+                con.execute(f"""
+                    CREATE VIEW lignecommercials AS
+                    SELECT entetecommercial_code, CAST(produit_code AS VARCHAR) AS produit_code, quantite
+                    FROM read_parquet('{root}/lignecommercials/*/part.parquet')
+                """)
+                con.execute("""
+                    CREATE VIEW sales_lines AS
+                    SELECT ec.code, ec.date, ec.commercial_code, ec.client_code, ec.net_a_payer,
+                           lc.produit_code, lc.quantite
+                    FROM entetecommercials ec
+                    LEFT JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+                """)
+                self.con = con
+            # One cursor per query: cursors of a DuckDB connection can be used from several threads
+            return self.con.cursor()
+
+    def execute(self, query, params=None):
+        """Run a MySQL-style query on DuckDB; returns the DuckDB cursor"""
+        cursor = self._connection()
+        cursor.execute(to_duckdb_sql(query, bool(params)), list(params or []))
+        return cursor
+
+    def read(self, query, params=None, dtypes=None):
+        df = self.execute(query, params).df()
+        return coerce_chunk(df, dtypes)
+
+    def iter_chunks(self, query, params=None, chunksize=DEFAULT_CHUNK_SIZE, dtypes=None):
+        reader = self.execute(query, params).fetch_record_batch(chunksize)
+        for batch in reader:
+            if batch.num_rows:
+                yield coerce_chunk(batch.to_pandas(), dtypes)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Process-wide engine over the default snapshot"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AnalyticsEngine()
+        return _engine
+
+
+def set_engine(engine):
+    """Replace the process-wide engine (benchmarks); None goes back to the default snapshot"""
+    global _engine
+    with _engine_lock:
+        _engine = engine
+
+
+def analytics_available():
+    """True when aggregate queries can be routed to DuckDB (ANALYTICS_ENGINE=0 disables it)"""
+    if os.environ.get('ANALYTICS_ENGINE', '1') == '0':
+        return False
+    return get_engine().available()
+
+
+def _routed_engine(engine):
+    """Engine answering the query, or None for MySQL"""
+    if engine is None:
+        return get_engine() if analytics_available() else None
+    return engine if engine.available() else None
+
+
+def uses_line_columns(query):
+    """Whether a query over entetecommercials references invoice line columns"""
+    return any(re.search(rf"\b{column}\b", query) for column in LINE_COLUMNS)
+
+
+def read_aggregate(query, params=None, conn=None, dtypes=None, columns=None, engine=None, engine_query=None):
+    """
+    Run an aggregate query on DuckDB when possible, on MySQL otherwise.
+
+    Args:
+        query: MySQL query
+        params: Query parameters
+        conn: MySQL connection (DBAPI or SQLAlchemy engine) for the fallback
+        dtypes: Per-column dtype coercion (see chunked_loader.coerce_chunk)
+        columns: Column names of the empty DataFrame returned by MySQL when there are no rows
+        engine: AnalyticsEngine (default: get_engine()); not used when
+            unavailable (see AnalyticsEngine.available)
+        engine_query: Variant of the query for DuckDB (default: query)
+
+    Returns:
+        pd.DataFrame
+    """
+    engine = _routed_engine(engine)
+    if engine is not None:
+        try:
+            return engine.read(engine_query or query, params, dtypes)
+        except Exception as e:
+            logger.warning(f"DuckDB could not run the query, using MySQL: {e}")
+    if conn is None:
+        raise RuntimeError("Analytics engine unavailable and no MySQL connection given")
+    return load_dataframe(conn, query, params=params, dtypes=dtypes, columns=columns)
+
+
+def iter_aggregate_chunks(query, params=None, conn=None, chunksize=DEFAULT_CHUNK_SIZE, dtypes=None, engine=None,
+                          engine_query=None):
+    """
+    Chunked variant of read_aggregate. The query runs when iteration starts;
+    if DuckDB fails before the first chunk, the whole result comes from MySQL.
+    """
+    engine = _routed_engine(engine)
+    if engine is not None:
+        try:
+            chunks = engine.iter_chunks(engine_query or query, params, chunksize, dtypes)
+            first = next(chunks, None)
+        except Exception as e:
+            logger.warning(f"DuckDB could not run the query, using MySQL: {e}")
+        else:
+            if first is not None:
+                yield first
+                yield from chunks
+            return
+    if conn is None:
+        raise RuntimeError("Analytics engine unavailable and no MySQL connection given")
+    yield from iter_query_chunks(conn, query, params=params, chunksize=chunksize, dtypes=dtypes)
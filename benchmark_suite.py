@@ -0,0 +1,524 @@
+"""
+Benchmark Suite
+Offline benchmarks of the prediction, routing and export hot paths
+
+Each benchmark runs on a synthetic history (synthetic_data) loaded into the
+in-memory SQLite stand-in (sales_repository), so no MySQL server or network
+is needed. For every benchmark and scale factor the suite records:
+
+- wall time: median of `repeat` runs
+- peak memory: peak of the Python allocations (tracemalloc) in one more run
+- fit counts: calls to SARIMAX.fit, RandomForestRegressor.fit, Prophet.fit
+  and ExponentialSmoothing.fit during that run
+
+Micro benchmarks time a single step (a query, an aggregation, an index, one
+SARIMA parameter search); macro benchmarks time a whole pipeline (delivery
+plan, demand predictions, 365-day optimization, exports). A benchmark whose
+dependencies are not installed is reported as skipped.
+
+Each run is appended to a JSON history file and compared with the stored
+baseline; slower or bigger results beyond the threshold are regressions.
+
+    python benchmark_suite.py --scales 0.1 0.5
+    python benchmark_suite.py --only generate_delivery_plan export_commercials_xlsx --repeat 5
+    python benchmark_suite.py --scales 0.5 --save-baseline
+"""
+
+import gc
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import logging
+import argparse
+import platform
+import importlib
+import subprocess
+import tracemalloc
+import contextlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("BenchmarkSuite")
+
+DEFAULT_HISTORY = os.path.join('benchmarks', 'history.json')
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+DEFAULT_SCALES = [0.1, 0.5]
+DEFAULT_REPEAT = 3
+# Relative increase of wall time or peak memory reported as a regression
+DEFAULT_THRESHOLD = 0.20
+
+# Model fits counted during the benchmarks: (module, class, method)
+FIT_TARGETS = [
+    ('statsmodels.tsa.statespace.sarimax', 'SARIMAX', 'fit'),
+    ('statsmodels.tsa.holtwinters', 'ExponentialSmoothing', 'fit'),
+    ('sklearn.ensemble', 'RandomForestRegressor', 'fit'),
+    ('prophet', 'Prophet', 'fit'),
+]
+
+BENCHMARKS = {}
+
+
+def benchmark(name, kind):
+    """
+    Register a benchmark.
+
+    The decorated function receives the Dataset, does its setup and returns
+    the zero-argument callable that is measured.
+    """
+    def register(setup):
+        BENCHMARKS[name] = {'name': name, 'kind': kind, 'setup': setup}
+        return setup
+    return register
+
+
+class FitCounter:
+    """Counts the model fits (FIT_TARGETS) made while the context is active"""
+
+    def __init__(self, targets=FIT_TARGETS):
+        self.targets = targets
+        self.counts = Counter()
+        self.patched = []
+
+    def __enter__(self):
+        for module_name, class_name, method in self.targets:
+            try:
+                cls = getattr(importlib.import_module(module_name), class_name)
+            except (ImportError, AttributeError):
+                continue
+            original = cls.__dict__.get(method)
+            if original is None:
+                continue
+            self.patched.append((cls, method, original))
+            setattr(cls, method, self._counting(original, class_name))
+        return self
+
+    def _counting(self, original, label):
+        counts = self.counts
+
+        def fit(*args, **kwargs):
+            counts[label] += 1
+            return original(*args, **kwargs)
+        return fit
+
+    def __exit__(self, *exc):
+        for cls, method, original in reversed(self.patched):
+            setattr(cls, method, original)
+        self.patched = []
+        return False
+
+
+class Dataset:
+    """
+    Synthetic history of one scale factor, loaded into an in-memory SQLite
+    repository installed as the process repository. A Parquet snapshot of it
+    backs the analytics engine, as in production once the snapshot is built
+    (the heavy export and history aggregations then run on DuckDB).
+
+    The history ends yesterday, so the queries relative to NOW() see it.
+    """
+
+    def __init__(self, scale, seed=42, years=2):
+        from synthetic_data import SyntheticSalesGenerator
+        from sales_repository import SQLiteRepository, set_repository
+        from sales_snapshot import SalesSnapshot
+        from analytics_engine import AnalyticsEngine, set_engine
+
+        started = time.perf_counter()
+        self.scale = scale
+        self.end = pd.Timestamp(datetime.now().date() - timedelta(days=1))
+        self.start = self.end - pd.DateOffset(years=years) + pd.Timedelta(days=1)
+        self.generator = SyntheticSalesGenerator(scale, seed, self.start, self.end)
+        self.repository = SQLiteRepository()
+        self.counts = self.generator.write_repository(self.repository)
+        set_repository(self.repository)
+        self.snapshot_dir = tempfile.mkdtemp(prefix='benchmark_snapshot_')
+        conn = self.repository.connect()
+        try:
+            SalesSnapshot(self.snapshot_dir).sync(conn)
+        finally:
+            conn.close()
+        set_engine(AnalyticsEngine(SalesSnapshot(self.snapshot_dir)))
+
+        # The busiest commercial is the one benchmarked
+        invoices = self.repository.read_frame(
+            "SELECT commercial_code, COUNT(*) AS n FROM entetecommercials GROUP BY commercial_code ORDER BY n DESC")
+        self.commercial_code = invoices['commercial_code'].iloc[0]
+        self.build_seconds = round(time.perf_counter() - started, 3)
+        self._lines = None
+
+    def close(self):
+        from sales_repository import set_repository
+        from analytics_engine import set_engine
+        set_repository(None)
+        set_engine(None)
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+
+    def lines(self):
+        """Last year of invoice lines of the benchmarked commercial (load_delivery_lines)"""
+        if self._lines is None:
+            from delivery_data import load_delivery_lines
+            conn = self.repository.connect()
+            try:
+                self._lines = load_delivery_lines(conn, self.commercial_code)
+            finally:
+                conn.close()
+        return self._lines
+
+    def locations(self):
+        """locations_data as app.get_locations_data builds it"""
+        users, clients = self.generator.users(), self.generator.clients()
+        return {
+            'commercials': {c: (float(la), float(lo)) for c, la, lo in users[['code', 'latitude', 'longitude']].values},
+            'commercial_names': dict(zip(users['code'], users['nom'])),
+            'clients': {c: (float(la), float(lo)) for c, la, lo in clients[['code', 'latitude', 'longitude']].values},
+            'client_names': dict(zip(clients['code'], clients['nom'])),
+        }
+
+    def summary(self):
+        return {'scale': self.scale, 'invoices': self.counts.get('entetecommercials', 0),
+                'lines': self.counts.get('lignecommercials', 0), 'commercial_code': self.commercial_code,
+                'build_seconds': self.build_seconds}
+
+
+# ---------------------------------------------------------------------------
+# Micro benchmarks
+# ---------------------------------------------------------------------------
+
+@benchmark('load_delivery_lines', 'micro')
+def bench_load_delivery_lines(dataset):
+    from delivery_data import load_delivery_lines
+
+    def run():
+        conn = dataset.repository.connect()
+        try:
+            return load_delivery_lines(conn, dataset.commercial_code)
+        finally:
+            conn.close()
+    return run
+
+
+@benchmark('daily_client_aggregates', 'micro')
+def bench_daily_client_aggregates(dataset):
+    from delivery_data import daily_client_aggregates
+    lines = dataset.lines()
+    return lambda: daily_client_aggregates(lines)
+
+
+@benchmark('calendar_index', 'micro')
+def bench_calendar_index(dataset):
+    from calendar_index import CalendarIndex
+    from delivery_data import delivery_lines_view
+    view = delivery_lines_view(dataset.lines())
+    target = dataset.end + pd.Timedelta(days=1)
+
+    def run():
+        index = CalendarIndex.from_frame(view, commercial_column=None)
+        return index.candidates(None, target, exclude_year=target.year)
+    return run
+
+
+@benchmark('identify_sarima_parameters', 'micro')
+def bench_identify_sarima_parameters(dataset):
+    from sarima_delivery_optimization import get_historical_deliveries, prepare_data_for_sarima, identify_sarima_parameters
+    history = get_historical_deliveries(str(dataset.start.date()), str(dataset.end.date()), dataset.commercial_code)
+    with contextlib.redirect_stdout(io.StringIO()):
+        series = prepare_data_for_sarima(history, dataset.commercial_code, metric='nb_clients_visites', freq='W')
+    return lambda: identify_sarima_parameters(series, seasonal_period=52)
+
+
+# ---------------------------------------------------------------------------
+# Macro benchmarks
+# ---------------------------------------------------------------------------
+
+@benchmark('generate_delivery_plan', 'macro')
+def bench_generate_delivery_plan(dataset):
+    from delivery_optimization import generate_delivery_plan
+    from delivery_data import delivery_lines_view
+    view = delivery_lines_view(dataset.lines())
+    locations = dataset.locations()
+    delivery_date = (dataset.end + pd.Timedelta(days=1)).to_pydatetime()
+    return lambda: generate_delivery_plan(dataset.commercial_code, delivery_date, view.copy(), locations,
+                                          save_json=False)
+
+
+@benchmark('generate_demand_predictions', 'macro')
+def bench_generate_demand_predictions(dataset):
+    from demand_prediction import generate_demand_predictions
+    from delivery_data import delivery_lines_view
+    view = delivery_lines_view(dataset.lines()).rename(columns={'product_quantity': 'quantite'})
+    clients = view['client_code'].value_counts().index[:5].tolist()
+    products = view['produit_code'].value_counts().index[:5].tolist()
+    prediction_date = dataset.end + pd.Timedelta(days=1)
+    return lambda: generate_demand_predictions(view, clients, products, prediction_date)
+
+
+@benchmark('dual_delivery_optimization_365_days', 'macro')
+def bench_dual_delivery_optimization(dataset):
+    from sarima_delivery_optimization import dual_delivery_optimization_365_days
+    selected_date = str(dataset.end.date())
+    return lambda: dual_delivery_optimization_365_days(dataset.commercial_code, selected_date, save_results=False)
+
+
+def _export(fmt):
+    def setup(dataset):
+        from export_utilities import run_export
+
+        def run():
+            path = run_export('commercials', fmt)
+            os.remove(path)
+        return run
+    return setup
+
+
+benchmark('export_commercials_xlsx', 'macro')(_export('xlsx'))
+benchmark('export_commercials_parquet', 'macro')(_export('parquet'))
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def measure(run, repeat=DEFAULT_REPEAT, quiet=True):
+    """
+    Time `repeat` runs, then trace one more run for peak memory and fit counts.
+
+    Returns:
+        dict: wall_time_s (median), wall_times, peak_memory_mb, fits
+    """
+    output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+    timings = []
+    with output:
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+
+        gc.collect()
+        with FitCounter() as fits:
+            tracemalloc.start()
+            try:
+                run()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    return {
+        'wall_time_s': round(float(np.median(timings)), 4),
+        'wall_times': [round(t, 4) for t in timings],
+        'peak_memory_mb': round(peak / 1e6, 2),
+        'fits': dict(fits.counts),
+    }
+
+
+def run_suite(scales=DEFAULT_SCALES, names=None, repeat=DEFAULT_REPEAT, seed=42, quiet=True):
+    """
+    Run the benchmarks on a synthetic dataset of each scale factor.
+
+    Args:
+        scales: Scale factors (see synthetic_data)
+        names: Benchmarks to run (default: all)
+        repeat: Timed runs per benchmark
+
+    Returns:
+        dict: Run record (environment, datasets and one result per benchmark and scale)
+    """
+    names = list(names or BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+
+    # The invoice lines are read from the database, not from a local snapshot
+    previous = os.environ.get('SALES_SNAPSHOT')
+    os.environ['SALES_SNAPSHOT'] = '0'
+    record = {
+        'run_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'datasets': [],
+        'results': []
+    }
+    try:
+        for scale in scales:
+            dataset = Dataset(scale, seed)
+            record['datasets'].append(dataset.summary())
+            logger.info(f"Scale {scale}: {dataset.summary()}")
+            try:
+                run_benchmarks(dataset, names, repeat, quiet, record['results'])
+            finally:
+                dataset.close()
+    finally:
+        if previous is None:
+            os.environ.pop('SALES_SNAPSHOT', None)
+        else:
+            os.environ['SALES_SNAPSHOT'] = previous
+    return record
+
+
+def run_benchmarks(dataset, names, repeat, quiet, results):
+    scale = dataset.scale
+    for name in names:
+        spec = BENCHMARKS[name]
+        result = {'benchmark': name, 'kind': spec['kind'], 'scale': scale}
+        try:
+            run = spec['setup'](dataset)
+        except ImportError as e:
+            result.update(status='skipped', error=f"missing dependency: {e}")
+        else:
+            try:
+                result.update(status='ok', **measure(run, repeat, quiet))
+            except Exception as e:
+                result.update(status='error', error=f"{type(e).__name__}: {e}")
+        logger.info(f"{name} @ {scale}: {result['status']} {result.get('wall_time_s', '')}")
+        results.append(result)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# History, baseline and comparison
+# ---------------------------------------------------------------------------
+
+def load_json(path, default=None):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def append_history(record, path=DEFAULT_HISTORY):
+    """Append a run record to the JSON history (a list of runs)"""
+    history = load_json(path, [])
+    history.append(record)
+    write_json(path, history)
+    return len(history)
+
+
+def compare(record, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare a run with the baseline run, benchmark by benchmark.
+
+    Returns:
+        list: One dict per benchmark and scale: benchmark, scale, time_ratio,
+            memory_ratio, fits, baseline_fits and status ('ok', 'regression',
+            'improvement', 'new', or the status of a run that did not complete)
+    """
+    reference = {(r['benchmark'], r['scale']): r for r in (baseline or {}).get('results', [])
+                 if r.get('status') == 'ok'}
+    rows = []
+    for result in record['results']:
+        row = {'benchmark': result['benchmark'], 'scale': result['scale']}
+        base = reference.get((result['benchmark'], result['scale']))
+        if result['status'] != 'ok':
+            row['status'] = result['status']
+        elif base is None:
+            row['status'] = 'new'
+        else:
+            row['time_ratio'] = _ratio(result['wall_time_s'], base['wall_time_s'])
+            row['memory_ratio'] = _ratio(result['peak_memory_mb'], base['peak_memory_mb'])
+            row['fits'] = sum(result['fits'].values())
+            row['baseline_fits'] = sum(base['fits'].values())
+            if (row['time_ratio'] > 1 + threshold or row['memory_ratio'] > 1 + threshold
+                    or row['fits'] > row['baseline_fits']):
+                row['status'] = 'regression'
+            elif row['time_ratio'] < 1 - threshold:
+                row['status'] = 'improvement'
+            else:
+                row['status'] = 'ok'
+        rows.append(row)
+    return rows
+
+
+def _ratio(value, reference):
+    if not reference:
+        return 1.0 if not value else float('inf')
+    return round(value / reference, 3)
+
+
+def format_report(record, rows):
+    """Text report of a run and its comparison with the baseline"""
+    results = {(r['benchmark'], r['scale']): r for r in record['results']}
+    lines = [f"Benchmark run {record['run_at']} (commit {record['commit'] or '?'}, repeat {record['repeat']})"]
+    for dataset in record['datasets']:
+        lines.append(f"  scale {dataset['scale']}: {dataset['invoices']} invoices, {dataset['lines']} lines, "
+                     f"commercial {dataset['commercial_code']}, built in {dataset['build_seconds']}s")
+    lines.append("")
+    lines.append(f"{'benchmark':<38}{'scale':>6}{'time (s)':>11}{'peak (MB)':>11}{'fits':>6}"
+                 f"{'time x':>9}{'mem x':>8}  status")
+    for row in rows:
+        result = results[(row['benchmark'], row['scale'])]
+        if result['status'] == 'ok':
+            measures = (f"{result['wall_time_s']:>11.4f}{result['peak_memory_mb']:>11.2f}"
+                        f"{sum(result['fits'].values()):>6}")
+        else:
+            measures = f"{'-':>11}{'-':>11}{'-':>6}"
+        ratios = (f"{row['time_ratio']:>9.2f}{row['memory_ratio']:>8.2f}" if 'time_ratio' in row
+                  else f"{'-':>9}{'-':>8}")
+        status = row['status'] + (f" ({result['error']})" if result.get('error') else "")
+        lines.append(f"{row['benchmark']:<38}{row['scale']:>6}{measures}{ratios}  {status}")
+    regressions = sum(row['status'] == 'regression' for row in rows)
+    lines.append("")
+    lines.append(f"{regressions} regression(s)" if regressions else "No regression")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic data")
+    parser.add_argument('--scales', type=float, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--only', nargs='+', metavar='BENCHMARK', help=f"Subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--kind', choices=['micro', 'macro'], help="Only the micro or the macro benchmarks")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 on a regression")
+    parser.add_argument('--verbose', action='store_true', help="Keep the output of the benchmarked code")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logger.setLevel(logging.INFO)
+    names = args.only or [name for name, spec in BENCHMARKS.items() if not args.kind or spec['kind'] == args.kind]
+
+    record = run_suite(args.scales, names, args.repeat, args.seed, quiet=not args.verbose)
+    rows = compare(record, load_json(args.baseline), args.threshold)
+    append_history(record, args.history)
+    print(format_report(record, rows))
+    print(f"\nHistory: {args.history}")
+    if args.save_baseline:
+        write_json(args.baseline, record)
+        print(f"Baseline saved: {args.baseline}")
+    if args.fail_on_regression and any(row['status'] == 'regression' for row in rows):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Calendar Index Module
+Same-day-of-year client lookups without scanning the whole history
+
+The delivery planning looks for the clients visited on the same day and month
+in previous years. Filtering with DAY(date) / MONTH(date) cannot use an index,
+so every lookup scanned all the invoices ever recorded. This module provides:
+
+- a migration adding a persisted month_day column (MONTH * 100 + DAY, e.g.
+  1225 for December 25th) to entetecommercials, with the composite indexes
+  (commercial_code, date), (client_code, date) and (month_day, commercial_code)
+- the sargable candidate query over month_day (index seek), with the former
+  DAY/MONTH query as fallback until the migration has run
+- CalendarIndex: an in-memory map (commercial, month, day) -> clients per year,
+  for repeated lookups over data already loaded
+
+    python calendar_index.py migrate
+"""
+
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import defaultdict
+
+import pandas as pd
+
+from sales_repository import get_repository
+
+logger = logging.getLogger("CalendarIndex")
+
+# Seconds a month_day availability check result is reused
+AVAILABILITY_TTL = 60
+
+MIGRATIONS = {
+    'mysql': [
+        ("month_day column",
+         "ALTER TABLE entetecommercials ADD COLUMN month_day SMALLINT "
+         "GENERATED ALWAYS AS (MONTH(date) * 100 + DAY(date)) STORED"),
+        ("idx_ec_commercial_date",
+         "CREATE INDEX idx_ec_commercial_date ON entetecommercials (commercial_code, date)"),
+        ("idx_ec_client_date",
+         "CREATE INDEX idx_ec_client_date ON entetecommercials (client_code, date)"),
+        ("idx_ec_month_day_commercial",
+         "CREATE INDEX idx_ec_month_day_commercial ON entetecommercials (month_day, commercial_code)"),
+    ],
+    # SQLite only allows VIRTUAL generated columns in ALTER TABLE; they can be indexed
+    'sqlite': [
+        ("month_day column",
+         "ALTER TABLE entetecommercials ADD COLUMN month_day INTEGER "
+         "GENERATED ALWAYS AS (CAST(strftime('%m', date) AS INTEGER) * 100 "
+         "+ CAST(strftime('%d', date) AS INTEGER)) VIRTUAL"),
+        ("idx_ec_commercial_date",
+         "CREATE INDEX IF NOT EXISTS idx_ec_commercial_date ON entetecommercials (commercial_code, date)"),
+        ("idx_ec_client_date",
+         "CREATE INDEX IF NOT EXISTS idx_ec_client_date ON entetecommercials (client_code, date)"),
+        ("idx_ec_month_day_commercial",
+         "CREATE INDEX IF NOT EXISTS idx_ec_month_day_commercial ON entetecommercials (month_day, commercial_code)"),
+    ]
+}
+
+# Errors meaning that the column / index is already there
+ALREADY_APPLIED = ('duplicate column', 'duplicate key name', 'already exists')
+
+# Clients of a commercial on a day of year before a date: seek on (month_day, commercial_code)
+CANDIDATES_QUERY = """
+    SELECT ec.client_code, COUNT(*) as freq
+    FROM entetecommercials ec
+    WHERE ec.month_day = %s
+      AND ec.commercial_code = %s
+      AND ec.date < %s
+    GROUP BY ec.client_code
+    ORDER BY freq DESC
+"""
+
+# Same result without the month_day column (full scan)
+LEGACY_CANDIDATES_QUERY = """
+    SELECT ec.client_code, COUNT(*) as freq
+    FROM entetecommercials ec
+    WHERE ec.commercial_code = %s
+      AND DAY(ec.date) = %s
+      AND MONTH(ec.date) = %s
+      AND YEAR(ec.date) < %s
+    GROUP BY ec.client_code
+    ORDER BY freq DESC
+"""
+
+
+def get_db_connection():
+    """Connexion utilisée par la migration en ligne de commande (MySQL, ou SQLite avec SALES_DB_BACKEND=sqlite)"""
+    return get_repository().connect()
+
+
+def month_day(date):
+    """month_day value of a date (MONTH * 100 + DAY)"""
+    date = pd.Timestamp(date)
+    return date.month * 100 + date.day
+
+
+def migrate(conn, dialect='mysql'):
+    """
+    Add the month_day column and the indexes; steps already applied are skipped.
+
+    Args:
+        conn: DBAPI connection
+        dialect: 'mysql' or 'sqlite'
+
+    Returns:
+        dict: {step: 'applied' | 'present'}
+    """
+    result = {}
+    cursor = conn.cursor()
+    try:
+        for name, statement in MIGRATIONS[dialect]:
+            try:
+                cursor.execute(statement)
+                conn.commit()
+                result[name] = 'applied'
+            except Exception as e:
+                if not any(marker in str(e).lower() for marker in ALREADY_APPLIED):
+                    raise
+                result[name] = 'present'
+            logger.info(f"{name}: {result[name]}")
+    finally:
+        cursor.close()
+    _availability.clear()
+    return result
+
+
+_availability = {}
+_availability_lock = threading.Lock()
+
+
+def month_day_available(conn):
+    """True when entetecommercials has the month_day column (checked at most every AVAILABILITY_TTL seconds)"""
+    with _availability_lock:
+        cached = _availability.get('value')
+        if cached is not None and time.monotonic() - cached[1] < AVAILABILITY_TTL:
+            return cached[0]
+    try:
+        pd.read_sql("SELECT month_day FROM entetecommercials LIMIT 0", conn)
+        available = True
+    except Exception as e:
+        logger.info(f"month_day column unavailable, using DAY/MONTH filters: {e}")
+        available = False
+    with _availability_lock:
+        _availability['value'] = (available, time.monotonic())
+    return available
+
+
+def candidates_query(conn, commercial_code, target_date):
+    """
+    Query of the clients visited by a commercial on the day and month of
+    `target_date` in the previous years, most frequent first.
+
+    Returns:
+        tuple: (sql, params)
+    """
+    date = pd.Timestamp(target_date)
+    if month_day_available(conn):
+        return CANDIDATES_QUERY, [month_day(date), commercial_code, f"{date.year}-01-01"]
+    return LEGACY_CANDIDATES_QUERY, [commercial_code, date.day, date.month, date.year]
+
+
+class CalendarIndex:
+    """
+    Clients of each (commercial, month, day), per year, with their number of rows.
+
+    Built once from loaded rows (or the database), then answers any
+    same-day-of-year lookup with a dictionary access instead of a scan.
+    """
+
+    def __init__(self):
+        # (commercial, month, day) -> [(year, client_code, count), ...]
+        self.entries = defaultdict(list)
+
+    @classmethod
+    def from_frame(cls, df, date_column='date', client_column='client_code',
+                   commercial_column='commercial_code', count_column=None):
+        """
+        Args:
+            df: Rows with a date and a client (one row per visit / line)
+            commercial_column: Column of the commercial; None (or absent) keys
+                every row under the commercial None
+            count_column: Column holding pre-aggregated counts (None: one per row)
+        """
+        index = cls()
+        if df is None or df.empty or date_column not in df.columns or client_column not in df.columns:
+            return index
+        dates = pd.to_datetime(df[date_column], errors='coerce')
+        keys = pd.DataFrame({
+            'commercial': df[commercial_column] if commercial_column in df.columns else None,
+            'month': dates.dt.month,
+            'day': dates.dt.day,
+            'year': dates.dt.year,
+            'client': df[client_column]
+        })
+        if count_column:
+            keys['count'] = df[count_column].to_numpy()
+            counts = keys.groupby(['commercial', 'month', 'day', 'year', 'client'], dropna=False)['count'].sum()
+        else:
+            counts = keys.groupby(['commercial', 'month', 'day', 'year', 'client'], dropna=False).size()
+        for (commercial, month, day, year, client), count in counts.items():
+            if pd.isna(month):
+                continue
+            commercial = None if pd.isna(commercial) else commercial
+            index.entries[(commercial, int(month), int(day))].append((int(year), client, int(count)))
+        return index
+
+    @classmethod
+    def from_database(cls, conn, commercial_code=None):
+        """
+        Index of the invoices (one count per invoice) of one or all commercials.
+        """
+        query = """
+            SELECT commercial_code, date, client_code, COUNT(*) AS freq
+            FROM entetecommercials
+            WHERE client_code IS NOT NULL
+        """
+        params = []
+        if commercial_code is not None:
+            query += " AND commercial_code = %s"
+            params.append(commercial_code)
+        query += " GROUP BY commercial_code, date, client_code"
+        df = pd.read_sql(query, conn, params=params)
+        return cls.from_frame(df, count_column='freq')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def client_sets(self, commercial, month, day):
+        """{year: set of clients} of a commercial on a day of year"""
+        sets = defaultdict(set)
+        for year, client, _ in self.entries.get((commercial, month, day), []):
+            sets[year].add(client)
+        return dict(sets)
+
+    def candidates(self, commercial, target_date, exclude_year=None, before_year=None, limit=None):
+        """
+        Clients of `commercial` on the day and month of `target_date`, most
+        frequent first (ties by client code).
+
+        Args:
+            exclude_year: Year left out (e.g. the year of the target date)
+            before_year: Only the years strictly before this one
+            limit: Maximum number of clients
+
+        Returns:
+            list: [(client_code, count), ...]
+        """
+        date = pd.Timestamp(target_date)
+        totals = defaultdict(int)
+        for year, client, count in self.entries.get((commercial, date.month, date.day), []):
+            if year == exclude_year or (before_year is not None and year >= before_year):
+                continue
+            totals[client] += count
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], str(item[0])))
+        return ranked[:limit] if limit else ranked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calendar columns and indexes of entetecommercials")
+    parser.add_argument('command', choices=['migrate'])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    conn = get_db_connection()
+    try:
+        result = migrate(conn, dialect=get_repository().dialect)
+    finally:
+        conn.close()
+    print(f"{args.command}: {result}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
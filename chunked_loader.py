@@ -0,0 +1,239 @@
+"""
+Chunked Loader Module
+Memory-bounded reads of large result sets from MySQL
+
+Rows are pulled through unbuffered (server-side) cursors in fixed-size chunks,
+coerced to compact dtypes chunk by chunk, and can be aggregated incrementally
+so that callers needing only daily or monthly aggregates never hold the raw rows.
+"""
+
+import decimal
+import pandas as pd
+import numpy as np
+
+# Rows per chunk when streaming a result set
+DEFAULT_CHUNK_SIZE = 10000
+
+# Partial aggregates accumulated before they are merged together
+MERGE_EVERY = 20
+
+
+def _open_cursor(conn):
+    """
+    Open a streaming cursor on a DBAPI connection or a SQLAlchemy engine.
+
+    Returns:
+        tuple: (cursor-like object with execute/fetchmany/description, cleanup callable)
+    """
+    if hasattr(conn, 'cursor'):
+        # mysql.connector: an unbuffered cursor reads rows from the socket on demand
+        try:
+            cursor = conn.cursor(buffered=False)
+        except TypeError:
+            # sqlite3 and other DBAPI drivers without the buffered option
+            cursor = conn.cursor()
+        return cursor, cursor.close
+
+    # SQLAlchemy engine (sarima_delivery_optimization.get_db_connection)
+    connection = conn.connect().execution_options(stream_results=True)
+    return _EngineCursor(connection), connection.close
+
+
+class _EngineCursor:
+    """Minimal DBAPI-like wrapper around a streaming SQLAlchemy result"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+        self.description = None
+
+    def execute(self, query, params=None):
+        if params:
+            self.result = self.connection.exec_driver_sql(query, tuple(params))
+        else:
+            self.result = self.connection.exec_driver_sql(query)
+        self.description = [(key,) for key in self.result.keys()]
+
+    def fetchmany(self, size):
+        return self.result.fetchmany(size)
+
+
+def coerce_chunk(df, dtypes=None):
+    """
+    Convert a chunk to compact, predictable dtypes.
+
+    Args:
+        df: DataFrame chunk as read from the cursor
+        dtypes: Optional {column: type} where type is 'datetime', 'date', 'float',
+            'int', 'str', 'category' or any numpy/pandas dtype
+
+    Returns:
+        pd.DataFrame: The coerced chunk
+    """
+    dtypes = dtypes or {}
+
+    for col in df.columns:
+        target = dtypes.get(col)
+        if target is None:
+            # MySQL SUM()/AVG() come back as Decimal objects: store them as floats
+            if df[col].dtype == object:
+                first = df[col].dropna().head(1)
+                if len(first) and isinstance(first.iloc[0], decimal.Decimal):
+                    df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+            continue
+
+        if target in ('datetime', 'date'):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+            if target == 'date':
+                df[col] = df[col].dt.normalize()
+        elif target == 'float':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        elif target == 'int':
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int64')
+        elif target == 'str':
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        else:
+            df[col] = df[col].astype(target)
+    return df
+
+
+def iter_query_chunks(conn, query, params=None, chunksize=DEFAULT_CHUNK_SIZE, dtypes=None):
+    """
+    Stream a query result as typed DataFrame chunks.
+
+    The query runs when iteration starts. The connection is left open, but the
+    cursor is closed when the iterator is exhausted or discarded.
+
+    Args:
+        conn: mysql.connector connection, DBAPI connection or SQLAlchemy engine
+        query: SQL query (driver parameter style)
+        params: Query parameters
+        chunksize: Rows per chunk
+        dtypes: Per-column dtype coercion (see coerce_chunk)
+
+    Yields:
+        pd.DataFrame: Chunks of at most `chunksize` rows
+    """
+    cursor, cleanup = _open_cursor(conn)
+    try:
+        if params:
+            cursor.execute(query, tuple(params))
+        else:
+            cursor.execute(query)
+        columns = [col[0] for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows:
+                break
+            yield coerce_chunk(pd.DataFrame.from_records(rows, columns=columns), dtypes)
+    finally:
+        try:
+            cleanup()
+        except Exception:
+            pass
+
+
+def load_dataframe(conn, query, params=None, chunksize=DEFAULT_CHUNK_SIZE, dtypes=None, columns=None):
+    """
+    Load a full result set chunk by chunk.
+
+    Only the coerced chunks are kept (no driver-side buffer of the whole result),
+    which roughly halves peak memory compared to pd.read_sql.
+
+    Args:
+        columns: Column names used for the empty DataFrame when there are no rows
+
+    Returns:
+        pd.DataFrame: Concatenated result
+    """
+    chunks = list(iter_query_chunks(conn, query, params, chunksize, dtypes))
+    if not chunks:
+        return pd.DataFrame(columns=columns or [])
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+# How each aggregation is computed on a chunk and merged across chunks
+_PARTIAL_MERGE = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+
+def aggregate_chunks(chunks, by, aggregations, date_column='date', freq=None):
+    """
+    Aggregate a stream of chunks without materializing the raw rows.
+
+    Args:
+        chunks: Iterable of DataFrames (e.g. iter_query_chunks(...))
+        by: Grouping columns
+        aggregations: {output_column: (source_column, func)} with func in
+            'sum', 'count', 'min', 'max', 'mean' or 'nunique'
+        date_column: Column truncated to `freq` before grouping
+        freq: None (no truncation), 'D' (day) or 'M' (month start)
+
+    Returns:
+        pd.DataFrame: One row per group with the output columns
+    """
+    by = list(by)
+    partial_specs = {}
+    distinct_specs = {}
+    for output, (source, func) in aggregations.items():
+        if func == 'mean':
+            partial_specs[f"{output}__sum"] = (source, 'sum')
+            partial_specs[f"{output}__count"] = (source, 'count')
+        elif func == 'nunique':
+            distinct_specs[output] = source
+        elif func in _PARTIAL_MERGE:
+            partial_specs[output] = (source, func)
+        else:
+            raise ValueError(f"Unsupported aggregation: {func}")
+
+    def merge_partials(frames):
+        merged = pd.concat(frames, ignore_index=True)
+        merge_funcs = {col: _PARTIAL_MERGE[func] for col, (_, func) in partial_specs.items()}
+        return merged.groupby(by, as_index=False, observed=True).agg(merge_funcs)
+
+    def merge_distinct(frames):
+        return pd.concat(frames, ignore_index=True).drop_duplicates()
+
+    partials = []
+    distinct_parts = {output: [] for output in distinct_specs}
+
+    for chunk in chunks:
+        if chunk is None or chunk.empty:
+            continue
+        if freq and date_column in chunk.columns:
+            dates = pd.to_datetime(chunk[date_column], errors='coerce')
+            chunk = chunk.assign(**{date_column: dates.dt.to_period(freq).dt.to_timestamp() if freq == 'M' else dates.dt.normalize()})
+
+        if partial_specs:
+            partials.append(
+                chunk.groupby(by, as_index=False, observed=True).agg(**partial_specs)
+            )
+            if len(partials) >= MERGE_EVERY:
+                partials = [merge_partials(partials)]
+
+        # Distinct counts keep (group, value) pairs, which is bounded by the
+        # number of distinct values, not by the number of rows
+        for output, source in distinct_specs.items():
+            distinct_parts[output].append(chunk[by + [source]].drop_duplicates())
+            if len(distinct_parts[output]) >= MERGE_EVERY:
+                distinct_parts[output] = [merge_distinct(distinct_parts[output])]
+
+    output_columns = by + list(aggregations)
+    if not partials and not any(distinct_parts.values()):
+        return pd.DataFrame(columns=output_columns)
+
+    result = merge_partials(partials) if partials else None
+    for output, source in distinct_specs.items():
+        counts = (merge_distinct(distinct_parts[output])
+                  .groupby(by, observed=True)[source].nunique()
+                  .rename(output).reset_index())
+        result = counts if result is None else result.merge(counts, on=by, how='left')
+
+    for output, (_, func) in aggregations.items():
+        if func == 'mean':
+            total = result.pop(f"{output}__sum")
+            count = result.pop(f"{output}__count")
+            result[output] = np.where(count > 0, total / count.where(count > 0, 1), np.nan)
+
+    return result[output_columns].sort_values(by).reset_index(drop=True)
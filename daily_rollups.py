@@ -0,0 +1,458 @@
+"""
+Daily Rollups Module
+Materialized daily aggregates per commercial, maintained incrementally
+
+Several screens and models re-aggregate years of entetecommercials rows by day
+and commercial on every call. This module keeps those aggregates in tables:
+
+- commercial_daily_stats: one row per (day, commercial) with the invoice count,
+  the visits (distinct clients of the day), the revenue, the average basket and
+  the number of distinct products sold
+- commercial_client_stats: one row per (commercial, client); unique clients over
+  a period cannot be summed from daily rows, so they are counted from here
+- rollup_watermarks: date of the latest invoice already aggregated
+
+refresh() only re-aggregates the days from the watermark (minus a lookback for
+late invoices) onwards; rebuild() recomputes everything. Both are available
+from the command line:
+
+    python daily_rollups.py refresh [--lookback-days 3]
+    python daily_rollups.py rebuild
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from sales_repository import get_repository
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock outside MySQL
+    fcntl = None
+
+logger = logging.getLogger("DailyRollups")
+
+ROLLUP_NAME = 'commercial_daily_stats'
+
+# Days re-aggregated before the watermark, for invoices entered late
+DEFAULT_LOOKBACK_DAYS = 3
+
+# Seconds an availability check result is reused
+AVAILABILITY_TTL = 60
+
+# Seconds after its last refresh a rollup is still used (ROLLUP_MAX_AGE, 0: no limit).
+# Beyond it the refresher is presumed stopped and the raw tables are queried.
+DEFAULT_MAX_AGE = 3600
+
+# Lock taken by a refresh round, so one process refreshes at a time
+REFRESH_LOCK_NAME = 'rollups'
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS commercial_daily_stats (
+        stat_date DATE NOT NULL,
+        commercial_code VARCHAR(50) NOT NULL,
+        invoice_count INT NOT NULL,
+        visits INT NOT NULL,
+        revenue DECIMAL(16, 3),
+        priced_invoice_count INT NOT NULL,
+        avg_basket DECIMAL(16, 3),
+        products_sold INT NOT NULL,
+        PRIMARY KEY (stat_date, commercial_code)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS commercial_client_stats (
+        commercial_code VARCHAR(50) NOT NULL,
+        client_code VARCHAR(50) NOT NULL,
+        first_date DATE,
+        last_date DATE,
+        invoice_count INT NOT NULL,
+        revenue DECIMAL(16, 3),
+        PRIMARY KEY (commercial_code, client_code)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_watermarks (
+        name VARCHAR(64) NOT NULL PRIMARY KEY,
+        watermark DATE,
+        refreshed_at DATETIME
+    )
+    """
+]
+
+# Aggregates of the days >= %s (invoices and distinct products are aggregated
+# separately so that the line join does not multiply the revenue)
+INSERT_DAILY_STATS = """
+INSERT INTO commercial_daily_stats
+    (stat_date, commercial_code, invoice_count, visits, revenue, priced_invoice_count, avg_basket, products_sold)
+SELECT h.stat_date, h.commercial_code, h.invoice_count, h.visits, h.revenue, h.priced_invoice_count,
+       h.revenue / h.invoice_count, COALESCE(p.products_sold, 0)
+FROM (
+    SELECT DATE(date) AS stat_date, commercial_code,
+           COUNT(*) AS invoice_count,
+           COUNT(DISTINCT client_code) AS visits,
+           SUM(net_a_payer) AS revenue,
+           COUNT(net_a_payer) AS priced_invoice_count
+    FROM entetecommercials
+    WHERE date >= %s AND commercial_code IS NOT NULL
+    GROUP BY DATE(date), commercial_code
+) h
+LEFT JOIN (
+    SELECT DATE(ec.date) AS stat_date, ec.commercial_code,
+           COUNT(DISTINCT lc.produit_code) AS products_sold
+    FROM entetecommercials ec
+    JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+    WHERE ec.date >= %s AND ec.commercial_code IS NOT NULL
+    GROUP BY DATE(ec.date), ec.commercial_code
+) p ON p.stat_date = h.stat_date AND p.commercial_code = h.commercial_code
+"""
+
+# (commercial, client) pairs having invoices on or after %s
+_TOUCHED_PAIRS = """
+    (commercial_code, client_code) IN (
+        SELECT DISTINCT commercial_code, client_code FROM entetecommercials WHERE date >= %s
+    )
+"""
+
+DELETE_CLIENT_STATS = "DELETE FROM commercial_client_stats WHERE " + _TOUCHED_PAIRS
+
+INSERT_CLIENT_STATS = """
+INSERT INTO commercial_client_stats
+    (commercial_code, client_code, first_date, last_date, invoice_count, revenue)
+SELECT commercial_code, client_code, MIN(DATE(date)), MAX(DATE(date)), COUNT(*), SUM(net_a_payer)
+FROM entetecommercials
+WHERE commercial_code IS NOT NULL AND client_code IS NOT NULL
+  AND """ + _TOUCHED_PAIRS + """
+GROUP BY commercial_code, client_code
+"""
+
+
+def get_db_connection():
+    """Connexion utilisée par le rafraîchissement en ligne de commande (MySQL, ou SQLite avec SALES_DB_BACKEND=sqlite)"""
+    return get_repository().connect()
+
+
+def ensure_tables(conn):
+    cursor = conn.cursor()
+    for statement in CREATE_TABLES:
+        cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+
+
+def get_watermark(conn, name=ROLLUP_NAME):
+    """Date of the latest invoice aggregated by rollup `name`, or None before the first build"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT watermark FROM rollup_watermarks WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    cursor.close()
+    if not row or row[0] is None:
+        return None
+    return pd.Timestamp(row[0]).date()
+
+
+def set_watermark(cursor, latest, name=ROLLUP_NAME):
+    """Record `latest` (date of the newest invoice) as the watermark of rollup `name`"""
+    watermark = pd.Timestamp(latest).strftime('%Y-%m-%d') if latest is not None else None
+    cursor.execute("DELETE FROM rollup_watermarks WHERE name = %s", (name,))
+    cursor.execute("INSERT INTO rollup_watermarks (name, watermark, refreshed_at) VALUES (%s, %s, %s)",
+                   (name, watermark, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+    return watermark
+
+
+def _aggregate_from(conn, start_date):
+    """Replace every aggregate fed by invoices dated on or after start_date"""
+    start = start_date.strftime('%Y-%m-%d')
+    cursor = conn.cursor()
+    # Capped at now: a future-dated invoice (typo, pre-entered order) would otherwise
+    # move the watermark ahead and freeze the refresh until that date
+    cursor.execute("SELECT MAX(date) FROM entetecommercials WHERE date <= %s",
+                   (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+    latest = cursor.fetchone()[0]
+
+    cursor.execute("DELETE FROM commercial_daily_stats WHERE stat_date >= %s", (start,))
+    cursor.execute(INSERT_DAILY_STATS, (start, start))
+    daily_rows = cursor.rowcount
+
+    cursor.execute(DELETE_CLIENT_STATS, (start,))
+    cursor.execute(INSERT_CLIENT_STATS, (start,))
+    client_rows = cursor.rowcount
+
+    watermark = set_watermark(cursor, latest)
+    conn.commit()
+    cursor.close()
+    return {'from': start, 'watermark': watermark, 'daily_rows': daily_rows, 'client_rows': client_rows}
+
+
+def rebuild(conn):
+    """Full recomputation of the rollup tables"""
+    ensure_tables(conn)
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM commercial_daily_stats")
+    cursor.execute("DELETE FROM commercial_client_stats")
+    conn.commit()
+    cursor.close()
+    result = _aggregate_from(conn, datetime(1900, 1, 1))
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Rollups rebuilt: {result}")
+    _availability.pop(ROLLUP_NAME, None)
+    return result
+
+
+def refresh(conn, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """
+    Incremental refresh: re-aggregate only the days from the watermark minus
+    `lookback_days`. Builds the tables on first use.
+    """
+    ensure_tables(conn)
+    watermark = get_watermark(conn)
+    if watermark is None:
+        return rebuild(conn)
+    started = time.perf_counter()
+    result = _aggregate_from(conn, watermark - timedelta(days=lookback_days))
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Rollups refreshed: {result}")
+    return result
+
+
+# ----------------------------------------------------------------------
+# Readers
+# ----------------------------------------------------------------------
+
+_availability = {}
+_availability_lock = threading.Lock()
+
+
+def rollups_available(conn, name=ROLLUP_NAME):
+    """
+    True when rollup `name` has been built and refreshed within ROLLUP_MAX_AGE
+    seconds (checked at most every AVAILABILITY_TTL seconds). DAILY_ROLLUPS=0
+    disables every rollup.
+    """
+    if os.environ.get('DAILY_ROLLUPS', '1') == '0':
+        return False
+    with _availability_lock:
+        cached = _availability.get(name)
+        if cached is not None and time.monotonic() - cached[1] < AVAILABILITY_TTL:
+            return cached[0]
+    try:
+        df = pd.read_sql("SELECT watermark, refreshed_at FROM rollup_watermarks WHERE name = %s", conn,
+                         params=(name,))
+        available = not df.empty and df['watermark'].notna().any()
+        max_age = float(os.environ.get('ROLLUP_MAX_AGE', DEFAULT_MAX_AGE))
+        if available and max_age > 0:
+            refreshed_at = pd.to_datetime(df['refreshed_at']).max()
+            age = (datetime.now() - refreshed_at).total_seconds() if pd.notna(refreshed_at) else None
+            if age is None or age > max_age:
+                logger.warning(f"Rollup {name} last refreshed at {refreshed_at}, older than {max_age:.0f}s: "
+                               f"using raw aggregation")
+                available = False
+    except Exception as e:
+        logger.info(f"Rollup {name} unavailable, using raw aggregation: {e}")
+        available = False
+    with _availability_lock:
+        _availability[name] = (available, time.monotonic())
+    return available
+
+
+def daily_stats_query(columns, date_debut=None, date_fin=None, commercial_code=None):
+    """
+    SELECT over commercial_daily_stats.
+
+    Args:
+        columns: {output alias: expression over the table columns}
+        date_debut, date_fin: Inclusive bounds on stat_date
+        commercial_code: Optional commercial filter
+
+    Returns:
+        tuple: (sql, params) ordered by date then commercial
+    """
+    select = ', '.join(f"{expr} AS {alias}" for alias, expr in columns.items())
+    query = f"SELECT {select} FROM commercial_daily_stats WHERE 1=1"
+    params = []
+    if date_debut:
+        query += " AND stat_date >= %s"
+        params.append(date_debut)
+    if date_fin:
+        query += " AND stat_date <= %s"
+        params.append(date_fin)
+    if commercial_code is not None:
+        query += " AND commercial_code = %s"
+        params.append(str(commercial_code))
+    query += " ORDER BY stat_date, commercial_code"
+    return query, params
+
+
+def commercial_summary_query(training_start=None, training_end=None, min_records=30):
+    """
+    Per-commercial totals (get_commercial_list) from the rollups.
+
+    With a training window, commercials need `min_records` invoices inside it;
+    otherwise `min_records` invoices overall.
+
+    Returns:
+        tuple: (sql, params)
+    """
+    params = []
+    if training_start is not None:
+        window = "SUM(CASE WHEN d.stat_date BETWEEN %s AND %s THEN d.invoice_count ELSE 0 END)"
+        training = f", {window} AS training_period_records"
+        params += [training_start, training_end]
+        having = f"{window} >= %s"
+        params_having = [training_start, training_end, min_records]
+        order = "training_period_records DESC, total_records DESC"
+    else:
+        training = ""
+        having = "SUM(d.invoice_count) >= %s"
+        params_having = [min_records]
+        order = "total_records DESC"
+    query = f"""
+    SELECT d.commercial_code,
+           SUM(d.invoice_count) AS total_records,
+           COALESCE(MAX(c.unique_clients), 0) AS unique_clients,
+           MIN(d.stat_date) AS first_record,
+           MAX(d.stat_date) AS last_record,
+           SUM(d.revenue) / NULLIF(SUM(d.priced_invoice_count), 0) AS avg_transaction_value{training}
+    FROM commercial_daily_stats d
+    LEFT JOIN (
+        SELECT commercial_code, COUNT(*) AS unique_clients
+        FROM commercial_client_stats
+        GROUP BY commercial_code
+    ) c ON c.commercial_code = d.commercial_code
+    GROUP BY d.commercial_code
+    HAVING {having}
+    ORDER BY {order}
+    """
+    return query, params + params_having
+
+
+# ----------------------------------------------------------------------
+# Background refresher
+# ----------------------------------------------------------------------
+
+@contextmanager
+def refresh_lock(conn, name=REFRESH_LOCK_NAME):
+    """
+    Cross-process lock of a refresh round, without waiting.
+
+    MySQL GET_LOCK covers every process and host sharing the database; on
+    databases without it (the SQLite stand-in), an flock in the temp directory
+    covers the processes of this machine.
+
+    Yields:
+        bool: True when acquired, False when another process is refreshing
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (name,))
+        acquired = cursor.fetchone()[0] == 1
+    except Exception:
+        acquired = None
+    if acquired is not None:
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                cursor.fetchone()
+            cursor.close()
+        return
+    cursor.close()
+
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(tempfile.gettempdir(), f"{name}.refresh.lock"), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def start_refresher(connect, interval, lookback_days=DEFAULT_LOOKBACK_DAYS, refreshers=None):
+    """
+    Refresh the rollups every `interval` seconds in a daemon thread.
+
+    Every process may start one (several Flask / gunicorn workers): each round
+    runs under refresh_lock, and is skipped while another process holds it.
+
+    Args:
+        connect: Callable returning a new DBAPI connection
+        interval: Seconds between refreshes (<= 0: no thread)
+        refreshers: Refresh functions called with (conn, lookback_days)
+            (default: this module's refresh only)
+
+    Returns:
+        threading.Thread or None
+    """
+    if interval <= 0:
+        return None
+    refreshers = refreshers or [refresh]
+
+    def loop():
+        while True:
+            conn = None
+            try:
+                conn = connect()
+                with refresh_lock(conn) as acquired:
+                    if not acquired:
+                        logger.info("Rollup refresh skipped: running in another process")
+                    else:
+                        for refresh_rollup in refreshers:
+                            try:
+                                refresh_rollup(conn, lookback_days)
+                            except Exception as e:
+                                logger.warning(f"Rollup refresh failed ({refresh_rollup.__module__}): {e}")
+            except Exception as e:
+                logger.warning(f"Rollup refresh failed: {e}")
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name='rollup-refresher', daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the commercial_daily_stats rollups")
+    parser.add_argument('command', choices=['refresh', 'rebuild'])
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS,
+                        help="Days re-aggregated before the watermark (refresh only)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    conn = get_db_connection()
+    try:
+        if args.command == 'rebuild':
+            result = rebuild(conn)
+        else:
+            result = refresh(conn, args.lookback_days)
+    finally:
+        conn.close()
+    print(f"{args.command}: {result}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Dashboard Context Module
+Request-scoped data shared by the computations of a client dashboard
+
+The client dashboard needs a forecast, the top products and the average basket
+of one client. Instead of each computation opening its own connection and
+re-querying the client and its invoices, a ClientDataContext loads each piece
+once (lazily, thread-safe) and the computations run side by side with fan_out().
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from product_rollups import load_top_products
+
+logger = logging.getLogger("DashboardContext")
+
+# pyplot keeps global state (current figure, ...) and is not thread-safe:
+# every plotting section run from a worker thread must hold this lock
+PLOT_LOCK = threading.RLock()
+
+
+class ClientDataContext:
+    """Client data loaded at most once per request"""
+
+    def __init__(self, client_code, connect):
+        """
+        Args:
+            client_code: Client code
+            connect: Callable returning a new database connection
+                (one per load, so concurrent loads never share a connection)
+        """
+        self.client_code = client_code
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.values = {}
+        self.queries = 0
+
+    def _get(self, name, loader):
+        """Value of `name`, loading it on first use; concurrent callers wait for that load"""
+        with self.lock:
+            if name in self.values:
+                return self.values[name]
+            key_lock = self.key_locks.setdefault(name, threading.Lock())
+        with key_lock:
+            with self.lock:
+                if name in self.values:
+                    return self.values[name]
+            value = loader()
+            with self.lock:
+                self.values[name] = value
+            return value
+
+    def _with_connection(self, fn):
+        """fn(conn) on a new connection, closed afterwards and counted in `queries`"""
+        conn = self.connect()
+        try:
+            with self.lock:
+                self.queries += 1
+            return fn(conn)
+        finally:
+            conn.close()
+
+    def _read_sql(self, query, params):
+        return self._with_connection(lambda conn: pd.read_sql(query, conn, params=params))
+
+    # ------------------------------------------------------------------
+    # Shared data
+    # ------------------------------------------------------------------
+
+    @property
+    def client(self):
+        """(nom, prenom) of the client, or (None, None) when unknown"""
+        def load():
+            df = self._read_sql("SELECT nom, prenom FROM clients WHERE code = %s", [self.client_code])
+            if df.empty:
+                return None, None
+            return df['nom'].iloc[0], df['prenom'].iloc[0]
+        return self._get('client', load)
+
+    @property
+    def client_name(self):
+        nom, _ = self.client
+        return nom if nom else self.client_code
+
+    @property
+    def client_full_name(self):
+        nom, prenom = self.client
+        if not nom:
+            return self.client_code
+        return f"{nom} {prenom}".strip() if prenom else nom
+
+    @property
+    def invoices(self):
+        """All invoices of the client: code, date (datetime64), net_a_payer"""
+        def load():
+            df = self._read_sql("""
+            SELECT code, date, net_a_payer
+            FROM entetecommercials
+            WHERE client_code = %s
+            """, [self.client_code])
+            df['date'] = pd.to_datetime(df['date'], errors='coerce')
+            df['net_a_payer'] = pd.to_numeric(df['net_a_payer'], errors='coerce')
+            return df
+        return self._get('invoices', load)
+
+    @property
+    def invoice_lines(self):
+        """Product lines of the client's invoices: entetecommercial_code, produit_code"""
+        def load():
+            return self._read_sql("""
+            SELECT lc.entetecommercial_code, lc.produit_code
+            FROM lignecommercials lc
+            JOIN entetecommercials ec ON lc.entetecommercial_code = ec.code
+            WHERE ec.client_code = %s
+            """, [self.client_code])
+        return self._get('invoice_lines', load)
+
+    # ------------------------------------------------------------------
+    # Derived results
+    # ------------------------------------------------------------------
+
+    def top_products(self, limit=5):
+        """
+        Top products by sales, as the top-products query computes them: the
+        invoice amount summed over the invoice's lines of each product.
+        Read from the monthly product rollup when it is built.
+
+        Loaded once per limit, like the shared data; a failing rollup read falls
+        back to the invoices and lines of the context.
+
+        Returns:
+            DataFrame: produit_code, produit_nom, total_ventes, image_url
+        """
+        def load():
+            try:
+                top = self._with_connection(lambda conn: load_top_products(conn, self.client_code, limit))
+            except Exception as e:
+                logger.warning(f"Top products rollup unreadable for {self.client_code}, using the invoices: {e}")
+                top = None
+            return top if top is not None else self._top_products_from_lines(limit)
+        return self._get(('top_products', limit), load)
+
+    def _top_products_from_lines(self, limit):
+        lines = self.invoice_lines.merge(self.invoices[['code', 'net_a_payer']],
+                                         left_on='entetecommercial_code', right_on='code', how='inner')
+        top = (lines.groupby('produit_code', as_index=False)['net_a_payer'].sum()
+               .rename(columns={'net_a_payer': 'total_ventes'})
+               .sort_values('total_ventes', ascending=False, kind='stable')
+               .head(limit))
+        codes = top['produit_code'].tolist()
+        if not codes:
+            return pd.DataFrame(columns=['produit_code', 'produit_nom', 'total_ventes', 'image_url'])
+
+        placeholders = ', '.join(['%s'] * len(codes))
+        try:
+            details = self._read_sql(f"SELECT code, libelle, image_url FROM produits WHERE code IN ({placeholders})",
+                                     codes)
+        except Exception:
+            # The image_url column doesn't exist
+            details = self._read_sql(f"SELECT code, libelle FROM produits WHERE code IN ({placeholders})", codes)
+            details['image_url'] = None
+        details = details.rename(columns={'code': 'produit_code', 'libelle': 'produit_nom'})
+        top = top.merge(details, on='produit_code', how='left')
+        return top[['produit_code', 'produit_nom', 'total_ventes', 'image_url']]
+
+    def average_basket(self, date_debut, date_fin):
+        """Revenue, invoice count and average basket between two dates (inclusive, like BETWEEN)"""
+        invoices = self.invoices
+        mask = (invoices['date'] >= pd.Timestamp(date_debut)) & (invoices['date'] <= pd.Timestamp(date_fin))
+        selected = invoices.loc[mask, 'net_a_payer']
+        chiffre_affaire_total = float(selected.sum()) if selected.notna().any() else 0
+        nombre_factures = int(mask.sum())
+        panier_moyen = chiffre_affaire_total / nombre_factures if nombre_factures > 0 else 0
+        return {
+            'chiffre_affaire_total': chiffre_affaire_total,
+            'nombre_factures': nombre_factures,
+            'panier_moyen': panier_moyen
+        }
+
+
+def fan_out(tasks, max_workers=None):
+    """
+    Run independent computations concurrently.
+
+    Args:
+        tasks: {name: callable}
+        max_workers: Thread count (default: one per task)
+
+    Returns:
+        dict: {name: result}
+
+    Raises:
+        The exception of the first failing task (in the order of `tasks`)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or len(tasks),
+                            thread_name_prefix='dashboard') as executor:
+        futures = {name: executor.submit(task) for name, task in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,94 @@
+"""
+Delivery Data Module
+Single-scan data loading for the delivery optimization endpoint
+
+The delivery plan needs the invoice lines (client, product, quantity) of a
+commercial, and the SARIMA / visits analyses need the same invoices aggregated
+by day and client. Both are derived from one line-level query: the lines are
+fetched once with typed columns, the invoice-level aggregates are computed in
+pandas after de-duplicating the invoices.
+"""
+
+import pandas as pd
+
+from chunked_loader import load_dataframe
+from sales_snapshot import get_snapshot, snapshot_available
+
+# Invoice lines of the last year, one row per line (invoices without lines kept)
+DELIVERY_LINES_QUERY = """
+SELECT ec.code, ec.date, ec.commercial_code, ec.client_code, ec.net_a_payer,
+       lc.produit_code, lc.quantite as product_quantity
+FROM entetecommercials ec
+LEFT JOIN lignecommercials lc ON ec.code = lc.entetecommercial_code
+WHERE ec.date >= DATE_SUB(NOW(), INTERVAL %s MONTH)
+"""
+
+DELIVERY_LINE_COLUMNS = ['code', 'date', 'commercial_code', 'client_code', 'net_a_payer',
+                         'produit_code', 'product_quantity']
+
+# Codes are left as the driver returns them: the delivery and prediction code
+# compares them with the values found in these same rows
+DELIVERY_LINE_DTYPES = {
+    'date': 'datetime',
+    'net_a_payer': 'float',
+    'product_quantity': 'float'
+}
+
+
+def load_delivery_lines(conn, commercial_code=None, months=12):
+    """
+    Fetch the invoice lines of the last `months` months in one query.
+
+    When the local sales snapshot has been built, the history is read from it
+    and only the invoices after its watermark are queried (codes are then
+    strings, as stored in the snapshot).
+
+    Args:
+        conn: Database connection
+        commercial_code: Commercial whose lines are fetched. None fetches the
+            whole fleet; only pass None when fleet-wide data is really needed.
+        months: History length
+
+    Returns:
+        pd.DataFrame: DELIVERY_LINE_COLUMNS, ordered by date
+    """
+    if snapshot_available():
+        start = pd.Timestamp.now() - pd.DateOffset(months=int(months))
+        lines = get_snapshot().load_lines(start, None, commercial_code, conn, categorical=False)
+        return lines[lines['date'] >= start].reset_index(drop=True)
+
+    query = DELIVERY_LINES_QUERY
+    params = [int(months)]
+    if commercial_code is not None:
+        query += " AND ec.commercial_code = %s"
+        params.append(commercial_code)
+    query += " ORDER BY ec.date"
+    return load_dataframe(conn, query, params, dtypes=DELIVERY_LINE_DTYPES, columns=DELIVERY_LINE_COLUMNS)
+
+
+def daily_client_aggregates(lines):
+    """
+    Invoice aggregates by date, commercial and client, as the SARIMA query returned them.
+
+    Each invoice is counted once whatever its number of lines.
+
+    Returns:
+        pd.DataFrame: date, commercial_code, client_code, nombre_visites, net_a_payer, quantite
+    """
+    columns = ['date', 'commercial_code', 'client_code', 'nombre_visites', 'net_a_payer', 'quantite']
+    if lines.empty:
+        return pd.DataFrame(columns=columns)
+    invoices = lines.drop_duplicates('code')
+    keys = ['date', 'commercial_code', 'client_code']
+    grouped = invoices.groupby(keys, dropna=False, sort=True)
+    aggregates = pd.DataFrame({
+        'nombre_visites': grouped['client_code'].nunique(),
+        'net_a_payer': grouped['net_a_payer'].sum(min_count=1),
+        'quantite': grouped.size()
+    }).reset_index()
+    return aggregates[columns]
+
+
+def delivery_lines_view(lines):
+    """The line-level columns expected by generate_delivery_plan (invoice code dropped)"""
+    return lines.drop(columns=['code'])
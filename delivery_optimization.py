@@ -4,23 +4,19 @@ from datetime import datetime
 import geopy.distance
 from sklearn.ensemble import RandomForestRegressor
 from historical_analysis import analyze_sales_trends
+from calendar_index import CalendarIndex
+from sales_repository import get_repository
 import json
-import mysql.connector
 import os
 
 def get_db_connection():
     """
-    Create a connection to the MySQL database.
+    Create a connection to the sales database (MySQL, or SQLite with SALES_DB_BACKEND=sqlite).
     
     Returns:
-        mysql.connector.connection: Database connection object
+        DBAPI connection (mysql.connector or sqlite3)
     """
-    return mysql.connector.connect(
-        host='127.0.0.1',
-        database='pfe1',
-        user='root',
-        password=''
-    )
+    return get_repository().connect()
 
 def get_product_prices():
     """
@@ -197,7 +193,8 @@ def predict_client_products(historical_data, client_code, delivery_date, filter_
         print(f"🚨 Using emergency fallback predictions")
         return fallback_predictions, fallback_prices
 
-def generate_delivery_plan(commercial_code, delivery_date, historical_data, locations_data, product_codes=None, save_json=True):
+def generate_delivery_plan(commercial_code, delivery_date, historical_data, locations_data, product_codes=None, save_json=True,
+                           calendar_index=None):
     """
     Generate complete delivery plan with route and product predictions.
     
@@ -206,6 +203,8 @@ def generate_delivery_plan(commercial_code, delivery_date, historical_data, loca
         delivery_date (datetime): Planned delivery date
         historical_data (pd.DataFrame): Historical sales data
         locations_data (dict): Dictionary containing GPS coordinates for commercial and clients
+        calendar_index (CalendarIndex): Optional index of historical_data, reused
+            when several dates are planned from the same data
     
     Returns:
         dict: Complete delivery plan with route and predictions
@@ -229,23 +228,10 @@ def generate_delivery_plan(commercial_code, delivery_date, historical_data, loca
         delivery_date_str = delivery_date.strftime('%Y-%m-%d')
         print(f"Filtering clients for delivery date: {delivery_date_str}")
         
-        # Filter clients by same day/month in previous years
-        day = delivery_date.day
-        month = delivery_date.month
-        year = delivery_date.year
-        years = historical_data['date'].dt.year.unique()
-        years = [y for y in years if y != year]
-        client_counts = {}
-        for y in years:
-            mask = (
-                (historical_data['date'].dt.year == y) &
-                (historical_data['date'].dt.month == month) &
-                (historical_data['date'].dt.day == day)
-            )
-            clients = historical_data[mask]['client_code'].values
-            for c in clients:
-                client_counts[c] = client_counts.get(c, 0) + 1
-        sorted_clients = sorted(client_counts.items(), key=lambda x: (-x[1], str(x[0])))
+        # Filter clients by same day/month in other years (one row = one count)
+        if calendar_index is None:
+            calendar_index = CalendarIndex.from_frame(historical_data, commercial_column=None)
+        sorted_clients = calendar_index.candidates(None, delivery_date, exclude_year=delivery_date.year)
         scheduled_clients = [c for c, _ in sorted_clients]
         MAX_CLIENTS_PER_DAY = 200
         if len(scheduled_clients) > MAX_CLIENTS_PER_DAY:
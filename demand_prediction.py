@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from datetime import datetime, timedelta
+from metrics import model_fit
 
 def train_sarima_model(data, date_col='date', value_col='quantite'):
     """
@@ -77,7 +78,8 @@ def train_sarima_model(data, date_col='date', value_col='quantite'):
         )
         
         # Use robust settings for fit
-        fitted_model = model.fit(disp=False, maxiter=50)
+        with model_fit('sarimax'):
+            fitted_model = model.fit(disp=False, maxiter=50)
         return fitted_model
         
     except Exception as e:
@@ -96,7 +98,8 @@ def train_sarima_model(data, date_col='date', value_col='quantite'):
                     order=(1, 0, 0),
                     seasonal_order=(0, 0, 0, 0)
                 )
-                return simple_model.fit(disp=False)
+                with model_fit('sarimax'):
+                    return simple_model.fit(disp=False)
             else:
                 raise ValueError("Cannot train model with less than 2 observations")
         except Exception as e2:
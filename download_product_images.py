@@ -8,7 +8,6 @@ and downloads images for each product from various online sources.
 """
 
 import os
-import time
 import random
 import requests
 import mysql.connector
@@ -188,6 +187,57 @@ def create_placeholder_image(product_code, product_name):
         logger.error(f"Error creating placeholder for {product_code}: {e}")
         return False
 
+def build_search_query(product):
+    """Search query for a product: its name, plus the barcode when known."""
+    search_query = product['name']
+    if product.get('barcode'):
+        # Add barcode to search query if available
+        search_query = f"{product['name']} {product['barcode']}"
+    return search_query
+
+def find_image_urls(product, fetch, max_urls=5):
+    """
+    Find candidate image URLs for a product from a Bing image search page.
+    
+    Args:
+        product: Product dict with 'code', 'name' and 'barcode'
+        fetch: Callable url -> response (or None on failure)
+        max_urls: Maximum number of URLs to return
+    
+    Returns:
+        list: Candidate image URLs
+    """
+    search_url = f"https://www.bing.com/images/search?q={quote_plus(build_search_query(product))}"
+    response = fetch(search_url)
+    if response is None:
+        return []
+    
+    # Simple extraction of image links - not reliable for production
+    # We're looking for image URLs in the response
+    text = response.text.lower()
+    start_marker = '"murl":"'
+    end_marker = '"'
+    
+    image_urls = []
+    start_pos = 0
+    
+    # Extract a few image URLs
+    for _ in range(max_urls):
+        start_idx = text.find(start_marker, start_pos)
+        if start_idx == -1:
+            break
+            
+        start_idx += len(start_marker)
+        end_idx = text.find(end_marker, start_idx)
+        
+        if end_idx != -1:
+            img_url = text[start_idx:end_idx]
+            if img_url.startswith('http') and (img_url.endswith('.jpg') or img_url.endswith('.jpeg') or img_url.endswith('.png')):
+                image_urls.append(img_url)
+            start_pos = end_idx
+    
+    return image_urls
+
 def search_and_download_image(product):
     """
     Search for a product image using the product name and code,
@@ -195,7 +245,6 @@ def search_and_download_image(product):
     """
     product_code = product['code']
     product_name = product['name']
-    barcode = product['barcode']
     
     # Check if image already exists
     image_path = os.path.join(IMAGE_DIR, f"{product_code}.jpg")
@@ -205,50 +254,16 @@ def search_and_download_image(product):
     
     logger.info(f"Searching image for {product_code}: {product_name}")
     
-    # Try searching by product name
-    search_query = product_name
-    if barcode:
-        # Add barcode to search query if available
-        search_query = f"{product_name} {barcode}"
+    def fetch(url):
+        headers = {'User-Agent': random.choice(USER_AGENTS)}
+        response = requests.get(url, headers=headers, timeout=15)
+        return response if response.status_code == 200 else None
     
     # Check publicly available image sources (no API key required)
-    # Using simple web scraping approach for demonstration
     try:
-        # Example: Search for product images using Bing
-        search_url = f"https://www.bing.com/images/search?q={quote_plus(search_query)}"
-        headers = {'User-Agent': random.choice(USER_AGENTS)}
-        response = requests.get(search_url, headers=headers, timeout=15)
-        
-        if response.status_code == 200:
-            # Simple extraction of image links - not reliable for production
-            # We're looking for image URLs in the response
-            text = response.text.lower()
-            start_marker = '"murl":"'
-            end_marker = '"'
-            
-            image_urls = []
-            start_pos = 0
-            
-            # Extract a few image URLs
-            for _ in range(5):  # Try to find up to 5 images
-                start_idx = text.find(start_marker, start_pos)
-                if start_idx == -1:
-                    break
-                    
-                start_idx += len(start_marker)
-                end_idx = text.find(end_marker, start_idx)
-                
-                if end_idx != -1:
-                    img_url = text[start_idx:end_idx]
-                    if img_url.startswith('http') and (img_url.endswith('.jpg') or img_url.endswith('.jpeg') or img_url.endswith('.png')):
-                        image_urls.append(img_url)
-                    start_pos = end_idx
-            
-            # Try to download any of the found images
-            for img_url in image_urls:
-                if download_image_from_url(img_url, product_code):
-                    return True
-    
+        for img_url in find_image_urls(product, fetch):
+            if download_image_from_url(img_url, product_code):
+                return True
     except Exception as e:
         logger.warning(f"Error during image search: {e}")
     
@@ -257,6 +272,16 @@ def search_and_download_image(product):
 
 def main():
     """Main function to orchestrate the download process."""
+    import argparse
+    from product_image_ingestion import ImageIngestionPipeline
+    
+    parser = argparse.ArgumentParser(description="Download product images concurrently")
+    parser.add_argument('--workers', type=int, default=8, help="Number of download threads")
+    parser.add_argument('--rate', type=float, default=4.0, help="Maximum requests per second")
+    parser.add_argument('--retries', type=int, default=3, help="Retries per request")
+    parser.add_argument('--retry-missing', action='store_true', help="Retry products previously not found")
+    args = parser.parse_args()
+    
     logger.info("Starting product image download process")
     
     # Get all products from database
@@ -267,22 +292,24 @@ def main():
         logger.error("No products found or database connection failed!")
         return
     
-    # Process each product
-    success_count = 0
-    for i, product in enumerate(products):
-        logger.info(f"Processing {i+1}/{len(products)}: {product['code']} - {product['name']}")
-        
-        if search_and_download_image(product):
-            success_count += 1
-        
-        # Be nice to servers, add small delay between requests
-        time.sleep(1)
-        
-        # Show progress
-        if (i+1) % 10 == 0 or (i+1) == len(products):
-            logger.info(f"Progress: {i+1}/{len(products)} products processed ({success_count} images saved)")
+    # Products without an image are rendered on demand by product_image_service
+    # (from their current label), so no placeholder files are written here.
+    pipeline = ImageIngestionPipeline(
+        resolve_urls=find_image_urls,
+        image_dir=IMAGE_DIR,
+        max_workers=args.workers,
+        rate=args.rate,
+        burst=args.workers,
+        max_retries=args.retries,
+        user_agents=USER_AGENTS
+    )
+    try:
+        stats = pipeline.run(products, retry_missing=args.retry_missing)
+    finally:
+        pipeline.close()
     
-    logger.info(f"Process complete. {success_count} out of {len(products)} images saved.")
+    logger.info(f"Process complete. {stats['done']} images saved, {stats['not_found']} not found, "
+                f"{stats['failed']} failed, {stats['skipped']} already done in a previous run.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
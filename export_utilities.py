@@ -7,21 +7,46 @@ import pandas as pd
 import json
 import io
 import os
+import math
+import shutil
+import zipfile
+import tempfile
+import xlsxwriter
 from datetime import datetime
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils.dataframe import dataframe_to_rows
-import mysql.connector
-from flask import send_file, jsonify
+from flask import send_file, jsonify, Response, stream_with_context
+from chunked_loader import iter_query_chunks
+from sales_repository import get_repository
+import fast_json
+
+# Rows fetched from the database per chunk when streaming exports
+EXPORT_CHUNK_SIZE = 5000
+
+# Rows inspected to estimate Excel column widths
+WIDTH_SAMPLE_ROWS = 200
+
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# File formats of the global exports: extension and mimetype of the download
+EXPORT_FORMATS = {
+    'xlsx': ('.xlsx', EXCEL_MIMETYPE),
+    'parquet': ('.zip', 'application/zip')
+}
+
+# Low-cardinality text columns stored as Arrow dictionaries in Parquet exports
+DICTIONARY_COLUMNS = {'ville', 'mois', 'category'}
+
+# Row-oriented formats that can be streamed with chunked transfer encoding
+STREAM_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
 
 def get_db_connection():
-    """Get database connection"""
-    return mysql.connector.connect(
-        host='127.0.0.1',
-        database='pfe1',
-        user='root',
-        password=''
-    )
+    """Get database connection (MySQL, or SQLite with SALES_DB_BACKEND=sqlite)"""
+    return get_repository().connect()
 
 class ExportManager:
     """Centralized export manager for all data types"""
@@ -81,13 +106,10 @@ class ExportManager:
                     for col_num, value in enumerate(df.columns.values):
                         worksheet.write(0, col_num, value, header_format)
                     
-                    # Auto-adjust column widths
-                    for idx, col in enumerate(df.columns):
-                        max_length = max(
-                            df[col].astype(str).map(len).max(),
-                            len(col)
-                        ) + 2
-                        worksheet.set_column(idx, idx, min(max_length, 50))
+                    # Auto-adjust column widths from a bounded sample of rows
+                    widths = estimate_column_widths(df.head(WIDTH_SAMPLE_ROWS))
+                    for idx, width in enumerate(widths):
+                        worksheet.set_column(idx, idx, width)
                     
                     # Apply number format to numeric columns
                     for idx, col in enumerate(df.columns):
@@ -97,12 +119,59 @@ class ExportManager:
         output.seek(0)
         return output
     
+    def export_to_excel_streaming(self, sheets, filename_prefix="export"):
+        """
+        Export chunked data to Excel with bounded memory
+        
+        Args:
+            sheets: Dictionary with sheet_name: iterable of DataFrame chunks
+                (e.g. pd.read_sql(..., chunksize=EXPORT_CHUNK_SIZE))
+            filename_prefix: Prefix for the temporary file name
+        
+        Returns:
+            str: Path of the temporary .xlsx file (see send_temp_file)
+        """
+        writer = StreamingExcelWriter(prefix=f"{filename_prefix}_")
+        try:
+            for sheet_name, chunks in sheets.items():
+                writer.add_sheet(sheet_name, chunks)
+            return writer.close()
+        except Exception:
+            writer.discard()
+            raise
+    
+    def export_to_parquet_streaming(self, sheets, filename_prefix="export"):
+        """
+        Export chunked data to Parquet with bounded memory
+        
+        Each sheet becomes one Parquet file; the files are bundled in a zip.
+        
+        Args:
+            sheets: Dictionary with sheet_name: iterable of DataFrame chunks
+            filename_prefix: Prefix for the temporary file name
+        
+        Returns:
+            str: Path of the temporary .zip file (see send_temp_file)
+        """
+        writer = StreamingParquetWriter(prefix=f"{filename_prefix}_")
+        try:
+            for sheet_name, chunks in sheets.items():
+                writer.add_sheet(sheet_name, chunks)
+            return writer.close()
+        except Exception:
+            writer.discard()
+            raise
+    
     def export_to_csv(self, df, filename_prefix="export"):
         """Export DataFrame to CSV"""
         output = io.StringIO()
         df.to_csv(output, index=False, encoding='utf-8')
         return output.getvalue()
     
+    def stream_to_csv(self, chunks):
+        """Streaming counterpart of export_to_csv: yields CSV text chunk by chunk"""
+        return csv_lines(chunks)
+    
     def export_to_json(self, data, filename_prefix="export"):
         """Export data to JSON with metadata"""
         export_data = {
@@ -115,294 +184,972 @@ class ExportManager:
         }
         
         filename = f"{self.export_dir}/{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, indent=2, ensure_ascii=False, default=str)
+        # DataFrames, numpy values and dates are encoded natively
+        try:
+            payload = fast_json.dumps(export_data, indent=True)
+        except TypeError:
+            # Unknown object types: previous behaviour (str() of the object)
+            payload = json.dumps(export_data, indent=2, ensure_ascii=False, default=str).encode('utf-8')
+        with open(filename, 'wb') as f:
+            f.write(payload)
         
         return filename
 
-def export_clients_data():
-    """Export all clients data"""
-    try:
-        conn = get_db_connection()
+def estimate_column_widths(sample_df, max_width=50):
+    """Column widths from a sample of rows (header length included)"""
+    widths = []
+    for col in sample_df.columns:
+        sample_length = sample_df[col].astype(str).map(len).max() if len(sample_df) else 0
+        if pd.isna(sample_length):
+            sample_length = 0
+        widths.append(min(max(int(sample_length), len(str(col))) + 2, max_width))
+    return widths
+
+class StreamingExcelWriter:
+    """
+    Excel writer with bounded memory.
+    
+    The workbook uses xlsxwriter's constant_memory mode (each row is flushed to
+    disk once the next one starts) and is written to a temporary file, so peak
+    memory is one chunk of rows regardless of the table size.
+    """
+    
+    def __init__(self, prefix="export_", sample_rows=WIDTH_SAMPLE_ROWS):
+        fd, self.path = tempfile.mkstemp(prefix=prefix, suffix='.xlsx')
+        os.close(fd)
+        self.sample_rows = sample_rows
+        self.workbook = xlsxwriter.Workbook(self.path, {'constant_memory': True})
         
-        # Main clients data
-        clients_query = """
-        SELECT 
-            client_code,
-            nom_client,
-            adresse,
-            ville,
-            COUNT(DISTINCT commercial_code) as nombre_commerciaux,
-            COUNT(*) as total_commandes,
-            SUM(net_a_payer) as chiffre_affaires_total,
-            AVG(net_a_payer) as commande_moyenne,
-            MIN(date) as premiere_commande,
-            MAX(date) as derniere_commande
-        FROM entetecommercials 
-        WHERE client_code IS NOT NULL AND nom_client IS NOT NULL
-        GROUP BY client_code, nom_client, adresse, ville
-        ORDER BY chiffre_affaires_total DESC
+        # Same formats as ExportManager.export_to_excel
+        self.header_format = self.workbook.add_format({
+            'bold': True,
+            'text_wrap': True,
+            'valign': 'top',
+            'bg_color': '#4472C4',
+            'font_color': 'white',
+            'border': 1
+        })
+        self.date_format = self.workbook.add_format({
+            'num_format': 'dd/mm/yyyy',
+            'border': 1
+        })
+        self.number_format = self.workbook.add_format({
+            'num_format': '#,##0.00',
+            'border': 1
+        })
+    
+    def add_sheet(self, sheet_name, chunks):
         """
+        Write a sheet from an iterable of DataFrame chunks
         
-        clients_df = pd.read_sql(clients_query, conn)
+        Column widths and formats are decided from the first non-empty chunk.
+        Sheets without any rows are skipped, as in export_to_excel.
         
-        # Clients by commercial
-        clients_commercial_query = """
-        SELECT 
-            commercial_code,
-            client_code,
-            nom_client,
-            COUNT(*) as commandes,
-            SUM(net_a_payer) as ca_total,
-            MAX(date) as derniere_visite
-        FROM entetecommercials 
-        WHERE client_code IS NOT NULL AND commercial_code IS NOT NULL
-        GROUP BY commercial_code, client_code, nom_client
-        ORDER BY commercial_code, ca_total DESC
+        Returns:
+            int: Number of data rows written
         """
+        if isinstance(chunks, pd.DataFrame):
+            chunks = [chunks]
         
-        clients_commercial_df = pd.read_sql(clients_commercial_query, conn)
+        worksheet = None
+        row_idx = 0
+        writers = []
         
-        # Top products by client
-        products_clients_query = """
-        SELECT 
-            client_code,
-            nom_client,
-            produit_code,
-            SUM(quantite) as quantite_totale,
-            SUM(net_a_payer) as ca_produit
-        FROM entetecommercials 
-        WHERE client_code IS NOT NULL AND produit_code IS NOT NULL
-        GROUP BY client_code, nom_client, produit_code
-        ORDER BY client_code, ca_produit DESC
+        for chunk in chunks:
+            if chunk is None or chunk.empty:
+                continue
+            
+            if worksheet is None:
+                worksheet = self.workbook.add_worksheet(sheet_name[:31])
+                widths = estimate_column_widths(chunk.head(self.sample_rows))
+                for idx, col in enumerate(chunk.columns):
+                    if pd.api.types.is_datetime64_any_dtype(chunk[col]):
+                        writers.append(self._date_cell)
+                        worksheet.set_column(idx, idx, max(widths[idx], 12), self.date_format)
+                    elif pd.api.types.is_numeric_dtype(chunk[col]) and not pd.api.types.is_bool_dtype(chunk[col]):
+                        writers.append(self._number_cell)
+                        worksheet.set_column(idx, idx, widths[idx], self.number_format)
+                    else:
+                        writers.append(self._generic_cell)
+                        worksheet.set_column(idx, idx, widths[idx])
+                    worksheet.write(0, idx, str(col), self.header_format)
+                row_idx = 1
+            
+            # constant_memory mode requires rows to be written in order
+            for values in chunk.itertuples(index=False, name=None):
+                for col_idx, value in enumerate(values):
+                    writers[col_idx](worksheet, row_idx, col_idx, value)
+                row_idx += 1
+        
+        return max(row_idx - 1, 0)
+    
+    def _number_cell(self, worksheet, row, col, value):
+        if value is None or pd.isna(value):
+            return
+        worksheet.write_number(row, col, float(value), self.number_format)
+    
+    def _date_cell(self, worksheet, row, col, value):
+        if value is None or pd.isna(value):
+            return
+        worksheet.write_datetime(row, col, pd.Timestamp(value).to_pydatetime(), self.date_format)
+    
+    def _generic_cell(self, worksheet, row, col, value):
+        if value is None or (not isinstance(value, (list, dict, tuple)) and pd.isna(value)):
+            return
+        if isinstance(value, (list, dict, tuple)):
+            value = str(value)
+        worksheet.write(row, col, value)
+    
+    def close(self):
+        """Finish the workbook and return the file path"""
+        self.workbook.close()
+        return self.path
+    
+    def discard(self):
+        """Close and delete the temporary file after a failure"""
+        try:
+            self.workbook.close()
+        except Exception:
+            pass
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def is_dictionary_column(name):
+    """Code columns and known low-cardinality labels are dictionary-encoded"""
+    return name == 'code' or name.endswith('_code') or name in DICTIONARY_COLUMNS
+
+class StreamingParquetWriter:
+    """
+    Parquet writer with bounded memory.
+    
+    Chunks are appended as row groups through pyarrow's ParquetWriter, one file
+    per sheet, then bundled in a zip. Code columns are dictionary-encoded so
+    readers get categoricals instead of repeated strings.
+    """
+    
+    def __init__(self, prefix="export_", compression='zstd'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required for Parquet exports (pip install pyarrow)")
+        self.pa = pa
+        self.pq = pq
+        self.prefix = prefix
+        self.compression = compression
+        self.directory = tempfile.mkdtemp(prefix=prefix)
+        self.files = []
+    
+    def _schema_for(self, table):
+        """Schema of a sheet, decided from its first chunk"""
+        pa = self.pa
+        fields = []
+        for field in table.schema:
+            field_type = field.type
+            if pa.types.is_null(field_type):
+                # All-null column in the first chunk: keep it as text
+                field_type = pa.string()
+            if is_dictionary_column(field.name) and (pa.types.is_string(field_type) or pa.types.is_large_string(field_type)):
+                field_type = pa.dictionary(pa.int32(), pa.string())
+            fields.append(pa.field(field.name, field_type))
+        return pa.schema(fields)
+    
+    def _encodings_for(self, schema):
         """
+        Column encodings other than dictionary
         
-        products_clients_df = pd.read_sql(products_clients_query, conn)
-        conn.close()
+        Timestamps are nearly sorted and almost all distinct: delta encoding
+        stores them in a few bits per row. Float bytes are split by position,
+        which helps the compressor on amounts.
+        """
+        pa = self.pa
+        encodings = {}
+        for field in schema:
+            if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+                encodings[field.name] = 'DELTA_BINARY_PACKED'
+            elif pa.types.is_floating(field.type):
+                encodings[field.name] = 'BYTE_STREAM_SPLIT'
+        return encodings
+    
+    def add_sheet(self, sheet_name, chunks):
+        """
+        Write a sheet from an iterable of DataFrame chunks
         
-        export_manager = ExportManager()
+        Sheets without any rows are skipped, as in StreamingExcelWriter.
         
-        # Prepare data for Excel export
-        data_dict = {
-            'Clients_Resume': clients_df,
-            'Clients_par_Commercial': clients_commercial_df,
-            'Produits_par_Client': products_clients_df
-        }
+        Returns:
+            int: Number of rows written
+        """
+        if isinstance(chunks, pd.DataFrame):
+            chunks = [chunks]
         
-        return export_manager.export_to_excel(data_dict, "clients_analysis")
+        path = os.path.join(self.directory, f"{sheet_name}.parquet")
+        writer = None
+        schema = None
+        rows = 0
+        try:
+            for chunk in chunks:
+                if chunk is None or chunk.empty:
+                    continue
+                table = self.pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    schema = self._schema_for(table)
+                    encodings = self._encodings_for(schema)
+                    writer = self.pq.ParquetWriter(
+                        path, schema, compression=self.compression,
+                        use_dictionary=[name for name in schema.names if name not in encodings],
+                        column_encoding=encodings or None
+                    )
+                writer.write_table(table.select(schema.names).cast(schema))
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
         
+        if writer is not None:
+            self.files.append(path)
+        return rows
+    
+    def close(self):
+        """Bundle the Parquet files in a zip and return its path"""
+        fd, zip_path = tempfile.mkstemp(prefix=self.prefix, suffix='.zip')
+        os.close(fd)
+        # Parquet pages are already compressed: store them as is
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for path in self.files:
+                archive.write(path, os.path.basename(path))
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return zip_path
+    
+    def discard(self):
+        """Remove the temporary files after a failed export"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def query_chunks(conn, query, params=None, chunksize=EXPORT_CHUNK_SIZE, dtypes=None):
+    """
+    Iterate over a query result as DataFrame chunks
+    
+    The query only runs when iteration starts, so several sheets can be
+    prepared on one connection and consumed one after the other.
+    """
+    # Unbuffered cursor: rows are pulled from the server one chunk at a time
+    for chunk in iter_query_chunks(conn, query, params=params, chunksize=chunksize, dtypes=dtypes):
+        yield chunk
+
+def send_temp_file(path, download_name, mimetype=EXCEL_MIMETYPE, block_size=64 * 1024):
+    """
+    Stream a temporary file to the client and delete it afterwards
+    
+    Args:
+        path: File to send (removed once the response is finished)
+        download_name: File name proposed to the browser
+        mimetype: Response content type
+        block_size: Bytes read per block
+    
+    Returns:
+        flask.Response: Streaming attachment response
+    """
+    file_size = os.path.getsize(path)
+    
+    def generate():
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(block_size)
+                    if not block:
+                        break
+                    yield block
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    response = Response(generate(), mimetype=mimetype, direct_passthrough=True)
+    response.headers['Content-Length'] = str(file_size)
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
+
+def ndjson_lines(chunks):
+    """
+    Serialize DataFrame chunks as newline-delimited JSON
+    
+    Dates are written in ISO format and missing values as null.
+    
+    Yields:
+        str: One block of NDJSON lines per chunk
+    """
+    for chunk in chunks:
+        if chunk is None or chunk.empty:
+            continue
+        block = chunk.to_json(orient='records', lines=True, date_format='iso',
+                              date_unit='s', force_ascii=False)
+        yield block if block.endswith('\n') else block + '\n'
+
+def csv_lines(chunks):
+    """
+    Serialize DataFrame chunks as CSV, with the header written once
+    
+    Yields:
+        str: One block of CSV rows per chunk
+    """
+    header = True
+    for chunk in chunks:
+        if chunk is None or chunk.empty:
+            continue
+        output = io.StringIO()
+        chunk.to_csv(output, index=False, header=header)
+        header = False
+        yield output.getvalue()
+
+def frame_chunks(df, chunksize=EXPORT_CHUNK_SIZE):
+    """Split an in-memory DataFrame into chunks for the streaming serializers"""
+    if df is None:
+        return
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+def records_chunks(records, chunksize=EXPORT_CHUNK_SIZE):
+    """Group an iterable of dicts into DataFrame chunks without building the full list"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= chunksize:
+            yield pd.DataFrame.from_records(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame.from_records(batch)
+
+def stream_export(chunks, fmt, filename_prefix="export"):
+    """
+    Build a chunked streaming response from DataFrame chunks
+    
+    No Content-Length is set, so the body is sent with chunked transfer
+    encoding and the client can start consuming the first rows immediately.
+    
+    Args:
+        chunks: Iterable of DataFrames (consumed lazily while the response is sent)
+        fmt: 'ndjson' or 'csv'
+        filename_prefix: Prefix of the proposed download name
+    
+    Returns:
+        flask.Response: Streaming response
+    
+    Raises:
+        ValueError: If the format is not supported
+    """
+    if fmt not in STREAM_MIMETYPES:
+        raise ValueError(f"Unsupported stream format: {fmt}. Use one of {', '.join(STREAM_MIMETYPES)}")
+    
+    lines = ndjson_lines(chunks) if fmt == 'ndjson' else csv_lines(chunks)
+    response = Response(stream_with_context(lines), mimetype=STREAM_MIMETYPES[fmt])
+    filename = f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Disable proxy buffering (nginx) so rows reach the client as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def stream_query_export(query, params=None, fmt='ndjson', filename_prefix="export",
+                        dtypes=None, connect=None, chunksize=EXPORT_CHUNK_SIZE):
+    """
+    Stream a query result straight from the database to the client
+    
+    The connection is opened before the response starts (so connection errors
+    still surface as HTTP errors) and closed once the last row has been sent.
+    
+    Args:
+        query: SQL query
+        params: Query parameters
+        fmt: 'ndjson' or 'csv'
+        filename_prefix: Prefix of the proposed download name
+        dtypes: Per-column dtype coercion (see chunked_loader.coerce_chunk)
+        connect: Connection factory (defaults to get_db_connection)
+        chunksize: Rows fetched per chunk
+    
+    Returns:
+        flask.Response: Streaming response
+    """
+    if fmt not in STREAM_MIMETYPES:
+        raise ValueError(f"Unsupported stream format: {fmt}. Use one of {', '.join(STREAM_MIMETYPES)}")
+    
+    conn = (connect or get_db_connection)()
+    chunks = iter_query_chunks(conn, query, params=params, chunksize=chunksize, dtypes=dtypes)
+    response = stream_export(chunks, fmt, filename_prefix)
+    # Runs once the body has been sent, or when the client disconnects
+    response.call_on_close(conn.close)
+    return response
+
+# Sheet definitions of the global exports.
+# Each sheet is a query on entetecommercials described by its select list, so
+# column selection and filters can be pushed into the SQL (see build_export_query).
+# Expressions containing a literal % are written with %% (driver escaping).
+EXPORT_DEFINITIONS = {
+    'clients': {
+        'prefix': 'clients_analysis',
+        'sheets': {
+            'Clients_Resume': {
+                'select': [
+                    ('client_code', 'client_code'),
+                    ('nom_client', 'nom_client'),
+                    ('adresse', 'adresse'),
+                    ('ville', 'ville'),
+                    ('nombre_commerciaux', 'COUNT(DISTINCT commercial_code)'),
+                    ('total_commandes', 'COUNT(*)'),
+                    ('chiffre_affaires_total', 'SUM(net_a_payer)'),
+                    ('commande_moyenne', 'AVG(net_a_payer)'),
+                    ('premiere_commande', 'MIN(date)'),
+                    ('derniere_commande', 'MAX(date)'),
+                ],
+                'where': ['client_code IS NOT NULL', 'nom_client IS NOT NULL'],
+                'group_by': 'client_code, nom_client, adresse, ville',
+                'order_by': 'SUM(net_a_payer) DESC',
+            },
+            'Clients_par_Commercial': {
+                'select': [
+                    ('commercial_code', 'commercial_code'),
+                    ('client_code', 'client_code'),
+                    ('nom_client', 'nom_client'),
+                    ('commandes', 'COUNT(*)'),
+                    ('ca_total', 'SUM(net_a_payer)'),
+                    ('derniere_visite', 'MAX(date)'),
+                ],
+                'where': ['client_code IS NOT NULL', 'commercial_code IS NOT NULL'],
+                'group_by': 'commercial_code, client_code, nom_client',
+                'order_by': 'commercial_code, SUM(net_a_payer) DESC',
+            },
+            'Produits_par_Client': {
+                'select': [
+                    ('client_code', 'client_code'),
+                    ('nom_client', 'nom_client'),
+                    ('produit_code', 'produit_code'),
+                    ('quantite_totale', 'SUM(quantite)'),
+                    ('ca_produit', 'SUM(net_a_payer)'),
+                ],
+                'where': ['client_code IS NOT NULL', 'produit_code IS NOT NULL'],
+                'group_by': 'client_code, nom_client, produit_code',
+                'order_by': 'client_code, SUM(net_a_payer) DESC',
+            },
+        },
+    },
+    'commercials': {
+        'prefix': 'commercials_analysis',
+        'sheets': {
+            'Commerciaux_Performance': {
+                'select': [
+                    ('commercial_code', 'commercial_code'),
+                    ('nombre_clients', 'COUNT(DISTINCT client_code)'),
+                    ('total_visites', 'COUNT(*)'),
+                    ('chiffre_affaires_total', 'SUM(net_a_payer)'),
+                    ('ca_moyen_par_visite', 'AVG(net_a_payer)'),
+                    ('premiere_visite', 'MIN(date)'),
+                    ('derniere_visite', 'MAX(date)'),
+                    ('mois_actifs', "COUNT(DISTINCT DATE_FORMAT(date, '%%Y-%%m'))"),
+                ],
+                'where': ['commercial_code IS NOT NULL'],
+                'group_by': 'commercial_code',
+                'order_by': 'SUM(net_a_payer) DESC',
+            },
+            'Performance_Mensuelle': {
+                'select': [
+                    ('commercial_code', 'commercial_code'),
+                    ('mois', "DATE_FORMAT(date, '%%Y-%%m')"),
+                    ('visites', 'COUNT(*)'),
+                    ('clients_uniques', 'COUNT(DISTINCT client_code)'),
+                    ('ca_mensuel', 'SUM(net_a_payer)'),
+                ],
+                'where': ['commercial_code IS NOT NULL'],
+                'group_by': "commercial_code, DATE_FORMAT(date, '%%Y-%%m')",
+                'order_by': "commercial_code, DATE_FORMAT(date, '%%Y-%%m')",
+            },
+            'Produits_par_Commercial': {
+                'select': [
+                    ('commercial_code', 'commercial_code'),
+                    ('produit_code', 'produit_code'),
+                    ('quantite_totale', 'SUM(quantite)'),
+                    ('ca_produit', 'SUM(net_a_payer)'),
+                    ('clients_touches', 'COUNT(DISTINCT client_code)'),
+                ],
+                'where': ['commercial_code IS NOT NULL', 'produit_code IS NOT NULL'],
+                'group_by': 'commercial_code, produit_code',
+                'order_by': 'commercial_code, SUM(net_a_payer) DESC',
+            },
+        },
+    },
+    'products': {
+        'prefix': 'products_analysis',
+        'sheets': {
+            'Produits_Performance': {
+                'select': [
+                    ('produit_code', 'produit_code'),
+                    ('nombre_clients', 'COUNT(DISTINCT client_code)'),
+                    ('nombre_commerciaux', 'COUNT(DISTINCT commercial_code)'),
+                    ('quantite_totale', 'SUM(quantite)'),
+                    ('chiffre_affaires_total', 'SUM(net_a_payer)'),
+                    ('prix_moyen', 'AVG(net_a_payer)'),
+                    ('premiere_vente', 'MIN(date)'),
+                    ('derniere_vente', 'MAX(date)'),
+                ],
+                'where': ['produit_code IS NOT NULL'],
+                'group_by': 'produit_code',
+                'order_by': 'SUM(net_a_payer) DESC',
+            },
+            'Tendances_Mensuelles': {
+                'select': [
+                    ('produit_code', 'produit_code'),
+                    ('mois', "DATE_FORMAT(date, '%%Y-%%m')"),
+                    ('quantite_mensuelle', 'SUM(quantite)'),
+                    ('ca_mensuel', 'SUM(net_a_payer)'),
+                    ('clients_uniques', 'COUNT(DISTINCT client_code)'),
+                ],
+                'where': ['produit_code IS NOT NULL'],
+                'group_by': "produit_code, DATE_FORMAT(date, '%%Y-%%m')",
+                'order_by': "produit_code, DATE_FORMAT(date, '%%Y-%%m')",
+            },
+            'Clients_par_Produit': {
+                'select': [
+                    ('produit_code', 'produit_code'),
+                    ('client_code', 'client_code'),
+                    ('nom_client', 'nom_client'),
+                    ('quantite_totale', 'SUM(quantite)'),
+                    ('ca_total', 'SUM(net_a_payer)'),
+                    ('nombre_commandes', 'COUNT(*)'),
+                ],
+                'where': ['produit_code IS NOT NULL', 'client_code IS NOT NULL'],
+                'group_by': 'produit_code, client_code, nom_client',
+                'order_by': 'produit_code, SUM(net_a_payer) DESC',
+            },
+        },
+    },
+    'dashboard': {
+        'prefix': 'dashboard_global',
+        'sheets': {
+            'KPIs_Globaux': {
+                'select': [
+                    ('total_clients', 'COUNT(DISTINCT client_code)'),
+                    ('total_commerciaux', 'COUNT(DISTINCT commercial_code)'),
+                    ('total_produits', 'COUNT(DISTINCT produit_code)'),
+                    ('total_transactions', 'COUNT(*)'),
+                    ('chiffre_affaires_global', 'SUM(net_a_payer)'),
+                    ('transaction_moyenne', 'AVG(net_a_payer)'),
+                    ('premiere_transaction', 'MIN(date)'),
+                    ('derniere_transaction', 'MAX(date)'),
+                ],
+            },
+            'Activite_Quotidienne': {
+                'select': [
+                    ('date', 'date'),
+                    ('transactions', 'COUNT(*)'),
+                    ('clients_actifs', 'COUNT(DISTINCT client_code)'),
+                    ('commerciaux_actifs', 'COUNT(DISTINCT commercial_code)'),
+                    ('ca_journalier', 'SUM(net_a_payer)'),
+                ],
+                'group_by': 'date',
+                'order_by': 'date DESC',
+                'limit': 365,
+            },
+            'Top_50_Clients': {
+                'select': [
+                    ('client_code', 'client_code'),
+                    ('nom_client', 'nom_client'),
+                    ('ca_total', 'SUM(net_a_payer)'),
+                    ('transactions', 'COUNT(*)'),
+                ],
+                'where': ['client_code IS NOT NULL'],
+                'group_by': 'client_code, nom_client',
+                'order_by': 'SUM(net_a_payer) DESC',
+                'limit': 50,
+            },
+        },
+    },
+    'complete': {
+        'prefix': 'export_complet',
+        'sheets': {
+            'Resume_Global': {
+                'select': [
+                    ('category', "'Global Statistics'"),
+                    ('total_clients', 'COUNT(DISTINCT client_code)'),
+                    ('total_commerciaux', 'COUNT(DISTINCT commercial_code)'),
+                    ('total_produits', 'COUNT(DISTINCT produit_code)'),
+                    ('total_transactions', 'COUNT(*)'),
+                    ('chiffre_affaires_total', 'SUM(net_a_payer)'),
+                    ('transaction_moyenne', 'AVG(net_a_payer)'),
+                ],
+            },
+            'Activite_Recente': {
+                'select': [
+                    ('date', 'date'),
+                    ('commercial_code', 'commercial_code'),
+                    ('client_code', 'client_code'),
+                    ('nom_client', 'nom_client'),
+                    ('produit_code', 'produit_code'),
+                    ('quantite', 'quantite'),
+                    ('net_a_payer', 'net_a_payer'),
+                ],
+                'order_by': 'date DESC',
+                'limit': 1000,
+            },
+        },
+    },
+}
+
+# Sheets of the products export served by the client_product_monthly_sales
+# rollup (see product_rollups), same output columns as EXPORT_DEFINITIONS['products']
+ROLLUP_EXPORT_DEFINITIONS = {
+    'products': {
+        'prefix': 'products_analysis',
+        'table': 'client_product_monthly_sales',
+        'sheets': {
+            'Produits_Performance': {
+                'select': [
+                    ('produit_code', 'produit_code'),
+                    ('nombre_clients', 'COUNT(DISTINCT client_code)'),
+                    ('nombre_commerciaux', "COUNT(DISTINCT NULLIF(commercial_code, ''))"),
+                    ('quantite_totale', 'SUM(quantity)'),
+                    ('chiffre_affaires_total', 'SUM(revenue)'),
+                    ('prix_moyen', 'SUM(revenue) / SUM(line_count)'),
+                    ('premiere_vente', 'MIN(first_date)'),
+                    ('derniere_vente', 'MAX(last_date)'),
+                ],
+                'where': ["produit_code <> ''"],
+                'group_by': 'produit_code',
+                'order_by': 'SUM(revenue) DESC',
+            },
+            'Tendances_Mensuelles': {
+                'select': [
+                    ('produit_code', 'produit_code'),
+                    ('mois', 'month'),
+                    ('quantite_mensuelle', 'SUM(quantity)'),
+                    ('ca_mensuel', 'SUM(revenue)'),
+                    ('clients_uniques', 'COUNT(DISTINCT client_code)'),
+                ],
+                'where': ["produit_code <> ''"],
+                'group_by': 'produit_code, month',
+                'order_by': 'produit_code, month',
+            },
+            'Clients_par_Produit': {
+                'select': [
+                    ('produit_code', 'produit_code'),
+                    ('client_code', 'client_code'),
+                    ('nom_client', 'MAX((SELECT c.nom FROM clients c '
+                                   'WHERE c.code = client_product_monthly_sales.client_code))'),
+                    ('quantite_totale', 'SUM(quantity)'),
+                    ('ca_total', 'SUM(revenue)'),
+                    ('nombre_commandes', 'SUM(line_count)'),
+                ],
+                'where': ["produit_code <> ''", "client_code <> ''"],
+                'group_by': 'produit_code, client_code',
+                'order_by': 'produit_code, SUM(revenue) DESC',
+            },
+        },
+    },
+}
+
+def build_export_query(sheet, columns=None, filters=None, table='entetecommercials', month_column=None):
+    """
+    Build the SQL of an export sheet with column pruning and filters
+    
+    Grouping keys stay in the GROUP BY even when they are not selected, so the
+    granularity of a sheet does not change with the column selection.
+    
+    Args:
+        sheet: Sheet definition from EXPORT_DEFINITIONS
+        columns: Optional collection of output columns to keep
+        filters: Optional dict with start_date, end_date (YYYY-MM-DD) and commercial_code
+        table: Source table
+        month_column: For monthly tables, column holding the month ('YYYY-MM');
+            the date filters then select whole months
+    
+    Returns:
+        tuple: (query, params), or (None, []) when no selected column belongs to the sheet
+    """
+    select = sheet['select']
+    if columns:
+        select = [(alias, expr) for alias, expr in select if alias in columns]
+        if not select:
+            return None, []
+    
+    filters = filters or {}
+    conditions = list(sheet.get('where', []))
+    params = []
+    if month_column:
+        if filters.get('start_date'):
+            conditions.append(f"{month_column} >= %s")
+            params.append(str(filters['start_date'])[:7])
+        if filters.get('end_date'):
+            conditions.append(f"{month_column} <= %s")
+            params.append(str(filters['end_date'])[:7])
+    else:
+        if filters.get('start_date'):
+            conditions.append("date >= %s")
+            params.append(filters['start_date'])
+        if filters.get('end_date'):
+            conditions.append("date < DATE_ADD(%s, INTERVAL 1 DAY)")
+            params.append(filters['end_date'])
+    if filters.get('commercial_code'):
+        conditions.append("commercial_code = %s")
+        params.append(filters['commercial_code'])
+    
+    query = "SELECT " + ", ".join(expr if expr == alias else f"{expr} AS {alias}" for alias, expr in select)
+    query += f" FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if sheet.get('group_by'):
+        query += f" GROUP BY {sheet['group_by']}"
+    if sheet.get('order_by'):
+        query += f" ORDER BY {sheet['order_by']}"
+    if sheet.get('limit'):
+        query += f" LIMIT {int(sheet['limit'])}"
+    
+    # Without parameters the driver does no interpolation, so %% must be unescaped
+    if not params:
+        query = query.replace('%%', '%')
+    return query, params
+
+def routed_query_chunks(conn, sheet, query, params, columns=None, filters=None, table='entetecommercials'):
+    """
+    Chunks of an export sheet, computed by the DuckDB analytics engine over
+    the local snapshot when it is available, by MySQL otherwise
+    
+    Sheets over entetecommercials using line columns (produit_code, quantite)
+    read the sales_lines view of the engine.
+    """
+    from analytics_engine import analytics_available, iter_aggregate_chunks, uses_line_columns
+    if table != 'entetecommercials' or not analytics_available():
+        return query_chunks(conn, query, params)
+    engine_query = query
+    if uses_line_columns(query):
+        engine_query, _ = build_export_query(sheet, columns, filters, table='sales_lines')
+    return iter_aggregate_chunks(query, params, conn, chunksize=EXPORT_CHUNK_SIZE, engine_query=engine_query)
+
+def rollup_export_possible(conn, filters):
+    """True when the monthly rollup is built and the date filters cover whole months"""
+    from product_rollups import product_rollups_available, month_range
+    filters = filters or {}
+    start, end = filters.get('start_date'), filters.get('end_date')
+    if start or end:
+        # An open bound is aligned by definition
+        if month_range(start or '1900-01-01', end or '2999-12-31') is None:
+            return False
+    return product_rollups_available(conn)
+
+def run_export(name, fmt='xlsx', columns=None, filters=None):
+    """
+    Run one of the global exports (see EXPORT_DEFINITIONS)
+    
+    Args:
+        name: 'clients', 'commercials', 'products', 'dashboard' or 'complete'
+        fmt: 'xlsx' (one sheet per query) or 'parquet' (zip of one Parquet file per query)
+        columns: Optional collection of output columns to keep
+        filters: Optional dict with start_date, end_date and commercial_code
+    
+    Returns:
+        str: Path of the temporary export file (see send_temp_file)
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}. Use one of {', '.join(EXPORT_FORMATS)}")
+    definition = EXPORT_DEFINITIONS[name]
+    
+    conn = get_db_connection()
+    try:
+        table, month_column = 'entetecommercials', None
+        if name in ROLLUP_EXPORT_DEFINITIONS and rollup_export_possible(conn, filters):
+            definition = ROLLUP_EXPORT_DEFINITIONS[name]
+            table, month_column = definition['table'], 'month'
+        sheets = {}
+        for sheet_name, sheet in definition['sheets'].items():
+            query, params = build_export_query(sheet, columns, filters, table, month_column)
+            if query:
+                # Lazy: each query runs when its sheet is written
+                sheets[sheet_name] = routed_query_chunks(conn, sheet, query, params, columns, filters, table)
+        
+        export_manager = ExportManager()
+        if fmt == 'parquet':
+            return export_manager.export_to_parquet_streaming(sheets, definition['prefix'])
+        return export_manager.export_to_excel_streaming(sheets, definition['prefix'])
+    finally:
+        conn.close()
+
+def export_clients_data(fmt='xlsx', columns=None, filters=None):
+    """Export all clients data"""
+    try:
+        return run_export('clients', fmt, columns, filters)
     except Exception as e:
         print(f"Error exporting clients data: {str(e)}")
         return None
 
-def export_commercials_data():
+def export_commercials_data(fmt='xlsx', columns=None, filters=None):
     """Export all commercials data"""
     try:
-        conn = get_db_connection()
-        
-        # Commercials performance
-        commercials_query = """
-        SELECT 
-            commercial_code,
-            COUNT(DISTINCT client_code) as nombre_clients,
-            COUNT(*) as total_visites,
-            SUM(net_a_payer) as chiffre_affaires_total,
-            AVG(net_a_payer) as ca_moyen_par_visite,
-            MIN(date) as premiere_visite,
-            MAX(date) as derniere_visite,
-            COUNT(DISTINCT DATE_FORMAT(date, '%Y-%m')) as mois_actifs
-        FROM entetecommercials 
-        WHERE commercial_code IS NOT NULL
-        GROUP BY commercial_code
-        ORDER BY chiffre_affaires_total DESC
-        """
-        
-        commercials_df = pd.read_sql(commercials_query, conn)
-        
-        # Monthly performance
-        monthly_query = """
-        SELECT 
-            commercial_code,
-            DATE_FORMAT(date, '%Y-%m') as mois,
-            COUNT(*) as visites,
-            COUNT(DISTINCT client_code) as clients_uniques,
-            SUM(net_a_payer) as ca_mensuel
-        FROM entetecommercials 
-        WHERE commercial_code IS NOT NULL
-        GROUP BY commercial_code, DATE_FORMAT(date, '%Y-%m')
-        ORDER BY commercial_code, mois
-        """
-        
-        monthly_df = pd.read_sql(monthly_query, conn)
-        
-        # Product performance by commercial
-        products_query = """
-        SELECT 
-            commercial_code,
-            produit_code,
-            SUM(quantite) as quantite_totale,
-            SUM(net_a_payer) as ca_produit,
-            COUNT(DISTINCT client_code) as clients_touches
-        FROM entetecommercials 
-        WHERE commercial_code IS NOT NULL AND produit_code IS NOT NULL
-        GROUP BY commercial_code, produit_code
-        ORDER BY commercial_code, ca_produit DESC
-        """
-        
-        products_df = pd.read_sql(products_query, conn)
-        conn.close()
-        
-        export_manager = ExportManager()
-        
-        data_dict = {
-            'Commerciaux_Performance': commercials_df,
-            'Performance_Mensuelle': monthly_df,
-            'Produits_par_Commercial': products_df
-        }
-        
-        return export_manager.export_to_excel(data_dict, "commercials_analysis")
-        
+        return run_export('commercials', fmt, columns, filters)
     except Exception as e:
         print(f"Error exporting commercials data: {str(e)}")
         return None
 
-def export_products_data():
+def export_products_data(fmt='xlsx', columns=None, filters=None):
     """Export all products data"""
     try:
-        conn = get_db_connection()
-        
-        # Products performance
-        products_query = """
-        SELECT 
-            produit_code,
-            COUNT(DISTINCT client_code) as nombre_clients,
-            COUNT(DISTINCT commercial_code) as nombre_commerciaux,
-            SUM(quantite) as quantite_totale,
-            SUM(net_a_payer) as chiffre_affaires_total,
-            AVG(net_a_payer) as prix_moyen,
-            MIN(date) as premiere_vente,
-            MAX(date) as derniere_vente
-        FROM entetecommercials 
-        WHERE produit_code IS NOT NULL
-        GROUP BY produit_code
-        ORDER BY chiffre_affaires_total DESC
-        """
-        
-        products_df = pd.read_sql(products_query, conn)
-        
-        # Monthly trends
-        monthly_products_query = """
-        SELECT 
-            produit_code,
-            DATE_FORMAT(date, '%Y-%m') as mois,
-            SUM(quantite) as quantite_mensuelle,
-            SUM(net_a_payer) as ca_mensuel,
-            COUNT(DISTINCT client_code) as clients_uniques
-        FROM entetecommercials 
-        WHERE produit_code IS NOT NULL
-        GROUP BY produit_code, DATE_FORMAT(date, '%Y-%m')
-        ORDER BY produit_code, mois
-        """
-        
-        monthly_products_df = pd.read_sql(monthly_products_query, conn)
-        
-        # Top clients per product
-        clients_products_query = """
-        SELECT 
-            produit_code,
-            client_code,
-            nom_client,
-            SUM(quantite) as quantite_totale,
-            SUM(net_a_payer) as ca_total,
-            COUNT(*) as nombre_commandes
-        FROM entetecommercials 
-        WHERE produit_code IS NOT NULL AND client_code IS NOT NULL
-        GROUP BY produit_code, client_code, nom_client
-        ORDER BY produit_code, ca_total DESC
-        """
-        
-        clients_products_df = pd.read_sql(clients_products_query, conn)
-        conn.close()
-        
-        export_manager = ExportManager()
-        
-        data_dict = {
-            'Produits_Performance': products_df,
-            'Tendances_Mensuelles': monthly_products_df,
-            'Clients_par_Produit': clients_products_df
-        }
-        
-        return export_manager.export_to_excel(data_dict, "products_analysis")
-        
+        return run_export('products', fmt, columns, filters)
     except Exception as e:
         print(f"Error exporting products data: {str(e)}")
         return None
 
-def export_global_dashboard_data():
+def export_global_dashboard_data(fmt='xlsx', columns=None, filters=None):
     """Export global dashboard data"""
     try:
-        conn = get_db_connection()
-        
-        # Global KPIs
-        kpis_query = """
-        SELECT 
-            COUNT(DISTINCT client_code) as total_clients,
-            COUNT(DISTINCT commercial_code) as total_commerciaux,
-            COUNT(DISTINCT produit_code) as total_produits,
-            COUNT(*) as total_transactions,
-            SUM(net_a_payer) as chiffre_affaires_global,
-            AVG(net_a_payer) as transaction_moyenne,
-            MIN(date) as premiere_transaction,
-            MAX(date) as derniere_transaction
-        FROM entetecommercials
-        """
-        
-        kpis_df = pd.read_sql(kpis_query, conn)
-        
-        # Daily activity
-        daily_query = """
-        SELECT 
-            date,
-            COUNT(*) as transactions,
-            COUNT(DISTINCT client_code) as clients_actifs,
-            COUNT(DISTINCT commercial_code) as commerciaux_actifs,
-            SUM(net_a_payer) as ca_journalier
-        FROM entetecommercials 
-        GROUP BY date
-        ORDER BY date DESC
-        LIMIT 365
-        """
-        
-        daily_df = pd.read_sql(daily_query, conn)
-        
-        # Top performers
-        top_clients_query = """
-        SELECT 
-            client_code,
-            nom_client,
-            SUM(net_a_payer) as ca_total,
-            COUNT(*) as transactions
-        FROM entetecommercials 
-        WHERE client_code IS NOT NULL
-        GROUP BY client_code, nom_client
-        ORDER BY ca_total DESC
-        LIMIT 50
-        """
-        
-        top_clients_df = pd.read_sql(top_clients_query, conn)
-        
-        conn.close()
-        
-        export_manager = ExportManager()
-        
-        data_dict = {
-            'KPIs_Globaux': kpis_df,
-            'Activite_Quotidienne': daily_df,
-            'Top_50_Clients': top_clients_df
-        }
-        
-        return export_manager.export_to_excel(data_dict, "dashboard_global")
-        
+        return run_export('dashboard', fmt, columns, filters)
     except Exception as e:
         print(f"Error exporting dashboard data: {str(e)}")
         return None
+
+# ================ ALL MODULES EXPORT ================
+
+# Per-module timeouts (seconds) of the aggregate export
+ALL_MODULES_TIMEOUTS = {
+    'commercial_visits': 180,
+    '365_prediction': 600,
+    'product_analysis': 180,
+    'delivery_plan': 180
+}
+
+# Name reported in export_summary.modules_exported for each module
+ALL_MODULES_LABELS = {
+    'commercial_visits': 'commercial_visits_analysis',
+    '365_prediction': '365_day_prediction',
+    'product_analysis': 'product_analysis',
+    'delivery_plan': 'delivery_optimization'
+}
+
+def module_timeouts(overrides=None):
+    """
+    Per-module timeouts of the aggregate export, with client-supplied overrides
+    
+    An override can only shorten a module's timeout: it is capped at the
+    ALL_MODULES_TIMEOUTS value so a request cannot hold a worker longer.
+    
+    Args:
+        overrides: Optional {module: seconds}
+    
+    Returns:
+        dict: {module: seconds} for every module
+    
+    Raises:
+        ValueError: Unknown module, or a timeout that is not a positive finite number
+    """
+    timeouts = dict(ALL_MODULES_TIMEOUTS)
+    for name, value in (overrides or {}).items():
+        if name not in ALL_MODULES_TIMEOUTS:
+            raise ValueError(f"Unknown module '{name}'")
+        seconds = float(value)
+        if not math.isfinite(seconds) or seconds <= 0:
+            raise ValueError(f"Invalid timeout for {name}: {value}")
+        timeouts[name] = min(seconds, ALL_MODULES_TIMEOUTS[name])
+    return timeouts
+
+def export_module_commercial_visits(commercial_code):
+    """Commercial visits analysis, saved to JSON by the module"""
+    from commercial_visits_analysis import save_predictions_to_json, predict_visits_with_sarima
+    visit_results = predict_visits_with_sarima(commercial_code)
+    if not visit_results:
+        raise RuntimeError('No visit predictions generated')
+    save_predictions_to_json(visit_results, commercial_code)
+    return {'commercial_code': commercial_code}
+
+def export_module_365_prediction(commercial_code):
+    """365-day prediction, saved to CSV/JSON by the module"""
+    from sarima_delivery_optimization import dual_delivery_optimization_365_days
+    prediction_results = dual_delivery_optimization_365_days(
+        commercial_code=commercial_code,
+        save_results=True
+    )
+    if not prediction_results:
+        raise RuntimeError('No 365-day prediction generated')
+    # Only plain data crosses the process boundary
+    return {
+        'start_date': prediction_results.get('start_date'),
+        'end_date': prediction_results.get('end_date'),
+        'summary': prediction_results.get('summary')
+    }
+
+def export_module_product_analysis(product_code):
+    """Product sales table and forecast, saved to JSON by the module"""
+    from product_analysis import display_sales_table, forecast_sales_for_2025
+    sales_data = display_sales_table(product_code, save_json=True)
+    try:
+        forecast_sales_for_2025(product_code, save_json=True)
+        has_forecast = True
+    except Exception:
+        has_forecast = False  # Forecast may fail, but the export continues
+    return {'has_sales_data': sales_data is not None, 'has_forecast': has_forecast}
+
+def export_module_delivery_plan(commercial_code, delivery_date):
+    """Delivery plan for a date, saved to JSON by the module"""
+    from delivery_optimization import generate_delivery_plan
+    from historical_analysis import load_historical_data, load_locations_data
+    
+    delivery_plan = generate_delivery_plan(
+        commercial_code=commercial_code,
+        delivery_date=datetime.strptime(delivery_date, '%Y-%m-%d'),
+        historical_data=load_historical_data(commercial_code),
+        locations_data=load_locations_data(),
+        save_json=True
+    )
+    return {
+        'total_clients': len(delivery_plan.get('route', [])) if delivery_plan else 0,
+        'total_distance': delivery_plan.get('total_distance', 0) if delivery_plan else 0
+    }
+
+def export_all_modules(commercial_code, product_code, delivery_date, timeouts=None, max_workers=4):
+    """
+    Run the four module exports in parallel and assemble the combined document
+    
+    Wall time is that of the slowest module (bounded by its timeout) instead
+    of the sum. A failed or timed-out module does not prevent the others
+    from being reported.
+    
+    Args:
+        commercial_code: Commercial for the visits, prediction and delivery modules
+        product_code: Product for the product analysis
+        delivery_date: Delivery plan date (YYYY-MM-DD)
+        timeouts: Optional {module: seconds} shortening ALL_MODULES_TIMEOUTS (see module_timeouts)
+        max_workers: Maximum number of modules running at the same time
+    
+    Returns:
+        dict: Combined document (export_summary, results, modules)
+    """
+    from parallel_runner import run_parallel, STATUS_SUCCESS
+    
+    tasks = {
+        'commercial_visits': (export_module_commercial_visits, (commercial_code,), {}),
+        '365_prediction': (export_module_365_prediction, (commercial_code,), {}),
+        'product_analysis': (export_module_product_analysis, (product_code,), {}),
+        'delivery_plan': (export_module_delivery_plan, (commercial_code, delivery_date), {})
+    }
+    started_at = datetime.now()
+    outcomes = run_parallel(tasks, timeouts=module_timeouts(timeouts),
+                            max_workers=max_workers)
+    
+    combined = {
+        'export_summary': {
+            'commercial_code': commercial_code,
+            'product_code': product_code,
+            'delivery_date': delivery_date,
+            'export_date': started_at.isoformat(),
+            'duration_seconds': round((datetime.now() - started_at).total_seconds(), 3),
+            'modules_exported': []
+        },
+        'results': {},
+        'modules': {}
+    }
+    for name, outcome in outcomes.items():
+        if outcome['status'] == STATUS_SUCCESS:
+            combined['results'][name] = 'success'
+            combined['export_summary']['modules_exported'].append(ALL_MODULES_LABELS[name])
+        else:
+            # First line only: the traceback stays in the module details
+            error_lines = (outcome['error'] or '').strip().splitlines()
+            combined['results'][name] = f"{outcome['status']}: {error_lines[0] if error_lines else ''}"
+        combined['modules'][name] = outcome
+    
+    combined['export_summary']['partial'] = len(combined['export_summary']['modules_exported']) < len(tasks)
+    return combined
@@ -0,0 +1,182 @@
+"""
+Fast JSON Module
+orjson-based serialization for numpy/pandas-heavy API responses
+
+DataFrames, numpy scalars and arrays, Timestamps and Decimals are encoded
+directly, without to_dict('records') round trips or float() casts in the
+routes. Numeric columns go to orjson as numpy arrays, which it serializes
+natively. Additional types can be handled with register_default.
+
+DataFrames are encoded as a list of records by default, or as arrays of
+columns ({"columns": [...], "data": {col: [...]}}) with the columnar layout.
+"""
+
+import json
+import decimal
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+from flask import Response, request, has_request_context
+
+from metrics import span
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback, same output structure
+    orjson = None
+
+# Query parameter selecting the DataFrame layout of a response
+LAYOUT_PARAM = 'layout'
+LAYOUT_RECORDS = 'records'
+LAYOUT_COLUMNAR = 'columnar'
+
+# Custom handlers: list of (type, callable) checked in registration order
+_DEFAULT_HANDLERS = []
+
+
+def register_default(type_, handler):
+    """
+    Register a serializer for a type not handled natively.
+
+    Args:
+        type_: Class (or tuple of classes) matched with isinstance
+        handler: Callable obj -> JSON-serializable value
+    """
+    _DEFAULT_HANDLERS.append((type_, handler))
+
+
+def _format_datetime_array(values):
+    """Datetime column -> list of strings ('YYYY-MM-DD' when all values are dates)"""
+    series = pd.Series(values)
+    if series.dt.tz is None and (series.dropna() == series.dropna().dt.normalize()).all():
+        formatted = series.dt.strftime('%Y-%m-%d')
+    else:
+        formatted = series.dt.strftime('%Y-%m-%dT%H:%M:%S')
+    return formatted.where(series.notna(), None).tolist()
+
+
+def _column_values(column):
+    """
+    Values of a Series in a form orjson encodes quickly.
+
+    Numeric columns without missing values stay numpy arrays (native orjson
+    path); other columns become Python lists with NaN/NaT replaced by None.
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return _format_datetime_array(column)
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_integer_dtype(column) or pd.api.types.is_float_dtype(column):
+        values = column.to_numpy()
+        if values.dtype.kind in 'biuf' and values.dtype.isnative:
+            if values.dtype.kind != 'f' or not np.isnan(values).any():
+                return np.ascontiguousarray(values)
+            return [None if v != v else v for v in values.tolist()]
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+def frame_to_columns(df):
+    """DataFrame -> {"columns": [...], "data": {column: values}}"""
+    return {
+        'columns': [str(col) for col in df.columns],
+        'data': {str(col): _column_values(df[col]) for col in df.columns}
+    }
+
+
+def frame_to_records(df):
+    """DataFrame -> list of row dicts, built column-wise"""
+    columns = [str(col) for col in df.columns]
+    values = []
+    for col in df.columns:
+        col_values = _column_values(df[col])
+        values.append(col_values.tolist() if isinstance(col_values, np.ndarray) else col_values)
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _make_default(layout):
+    frame_encoder = frame_to_columns if layout == LAYOUT_COLUMNAR else frame_to_records
+
+    def default(obj):
+        for type_, handler in _DEFAULT_HANDLERS:
+            if isinstance(obj, type_):
+                return handler(obj)
+        if isinstance(obj, pd.DataFrame):
+            return frame_encoder(obj)
+        if isinstance(obj, pd.Series):
+            return _column_values(obj)
+        if isinstance(obj, pd.Index):
+            return obj.tolist()
+        if obj is pd.NaT or obj is pd.NA:
+            return None
+        if isinstance(obj, pd.Timestamp):
+            return obj.strftime('%Y-%m-%d') if obj == obj.normalize() else obj.isoformat()
+        if isinstance(obj, pd.Period):
+            return str(obj)
+        if isinstance(obj, np.datetime64):
+            return default(pd.Timestamp(obj)) if not np.isnat(obj) else None
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.kind == 'M':
+                return _format_datetime_array(obj)
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            value = obj.item()
+            return None if isinstance(value, float) and value != value else value
+        if isinstance(obj, decimal.Decimal):
+            return float(obj)
+        if isinstance(obj, (dt.datetime, dt.date)):
+            return obj.isoformat()
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+    return default
+
+
+_DEFAULTS = {
+    LAYOUT_RECORDS: _make_default(LAYOUT_RECORDS),
+    LAYOUT_COLUMNAR: _make_default(LAYOUT_COLUMNAR),
+}
+
+
+def dumps(obj, layout=LAYOUT_RECORDS, indent=False):
+    """
+    Serialize to JSON bytes.
+
+    Args:
+        obj: Any structure of dicts/lists with pandas/numpy values inside
+        layout: 'records' or 'columnar' (DataFrame encoding)
+        indent: Pretty-print with 2 spaces (files meant to be read by people)
+
+    Returns:
+        bytes: UTF-8 JSON document
+    """
+    default = _DEFAULTS.get(layout, _DEFAULTS[LAYOUT_RECORDS])
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(obj, default=default, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+
+def request_layout():
+    """DataFrame layout requested with ?layout=columnar (records otherwise)"""
+    if has_request_context() and request.args.get(LAYOUT_PARAM) == LAYOUT_COLUMNAR:
+        return LAYOUT_COLUMNAR
+    return LAYOUT_RECORDS
+
+
+def fast_jsonify(obj, status=200, layout=None):
+    """
+    jsonify replacement for large numpy/pandas payloads.
+
+    Args:
+        obj: Response body
+        status: HTTP status code
+        layout: DataFrame layout; defaults to the ?layout= query parameter
+
+    Returns:
+        flask.Response: application/json response
+    """
+    with span('serialize'):
+        body = dumps(obj, layout or request_layout())
+    return Response(body, status=status, mimetype='application/json')
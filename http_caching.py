@@ -0,0 +1,227 @@
+"""
+HTTP Caching Module
+Response compression and conditional GET for the JSON APIs
+
+- gzip / brotli compression negotiated from Accept-Encoding, above a size threshold
+- weak ETags derived from a data watermark (latest invoice date and code),
+  the request path and parameters, the user and the current day
+- 304 Not Modified when the client's If-None-Match still matches, before the
+  view runs, so unchanged polls skip the queries and the model fitting
+"""
+
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from datetime import date
+
+from flask import request, session, g
+
+from single_flight import SingleFlight
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: gzip only
+    brotli = None
+
+logger = logging.getLogger("HttpCaching")
+
+# Bump when the format of cached responses changes, to invalidate client caches
+HTTP_CACHE_VERSION = '1'
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = 1024
+
+# Seconds during which the data watermark is reused before querying it again
+WATERMARK_TTL = 30
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/html',
+    'text/plain',
+    'text/csv',
+    'image/svg+xml'
+}
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header.
+
+    Returns:
+        dict: {encoding: q-value} (encodings with q=0 are excluded)
+    """
+    encodings = {}
+    for part in (header or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(header):
+    """Best supported encoding for an Accept-Encoding header, or None"""
+    accepted = parse_accept_encoding(header)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best = None
+    for encoding in candidates:
+        q = accepted.get(encoding, accepted.get('*', 0))
+        # Ties keep the first candidate (brotli compresses JSON better)
+        if q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+    return best[0] if best else None
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+class DataWatermark:
+    """
+    Latest-data marker shared by all requests, refreshed at most every `ttl` seconds.
+
+    When the TTL expires, one request reloads it while the concurrent ones wait
+    for that result. A failed load is cached for the TTL as well (None:
+    conditional GET disabled), so an unreachable database is not queried by
+    every request.
+    """
+
+    def __init__(self, loader, ttl=WATERMARK_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self.value = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+        self.flight = SingleFlight()
+
+    def _fresh(self):
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    def get(self):
+        with self.lock:
+            if self._fresh():
+                return self.value
+        value, _ = self.flight.do('data_watermark', self._reload)
+        return value
+
+    def _reload(self):
+        with self.lock:
+            # Reloaded by the previous leader while this thread was on its way
+            if self._fresh():
+                return self.value
+        try:
+            value = str(self.loader())
+        except Exception as e:
+            logger.warning(f"Data watermark unavailable, conditional GET disabled for {self.ttl}s: {e}")
+            value = None
+        with self.lock:
+            self.value = value
+            self.loaded_at = time.monotonic()
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.value = None
+            self.loaded_at = None
+
+
+def compute_etag(watermark, path, args, user_key):
+    """Weak ETag of a GET request (the same for every content encoding)"""
+    key = '|'.join([
+        HTTP_CACHE_VERSION,
+        watermark,
+        date.today().isoformat(),  # Views defaulting to "today" change at midnight
+        path,
+        '&'.join(f"{k}={v}" for k, v in sorted(args.items(multi=True))),
+        user_key
+    ])
+    return 'W/"' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '"'
+
+
+def init_http_caching(app, watermark_loader, path_prefix='/api/', exclude_prefixes=(),
+                      min_size=COMPRESSION_MIN_SIZE, watermark_ttl=WATERMARK_TTL,
+                      session_keys=('user_id', 'is_admin')):
+    """
+    Install the compression and conditional GET hooks on a Flask app.
+
+    Args:
+        app: Flask application
+        watermark_loader: Callable returning a value that changes whenever the data changes
+        path_prefix: Only GET requests under this prefix use ETags
+        exclude_prefixes: Paths under path_prefix without ETags (downloads, streams)
+        min_size: Compression threshold in bytes
+        watermark_ttl: Seconds between two watermark queries
+        session_keys: Session values that make responses user-specific
+
+    Returns:
+        DataWatermark: The shared watermark (call invalidate() after writes)
+    """
+    watermark = DataWatermark(watermark_loader, watermark_ttl)
+
+    def cacheable():
+        return (request.method == 'GET'
+                and request.path.startswith(path_prefix)
+                and not any(request.path.startswith(prefix) for prefix in exclude_prefixes)
+                # Anonymous requests are redirected to the login page
+                and 'user_id' in session)
+
+    @app.before_request
+    def check_not_modified():
+        if not cacheable():
+            return None
+        current = watermark.get()
+        if current is None:
+            return None
+        user_key = '|'.join(str(session.get(key)) for key in session_keys)
+        etag = compute_etag(current, request.path, request.args, user_key)
+        g.http_etag = etag
+        if etag in [value.strip() for value in request.headers.get('If-None-Match', '').split(',')]:
+            response = app.response_class(status=304)
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.headers['Vary'] = 'Accept-Encoding, Cookie'
+            return response
+        return None
+
+    @app.after_request
+    def finalize_response(response):
+        etag = g.pop('http_etag', None)
+        if etag and response.status_code == 200 and 'ETag' not in response.headers:
+            response.headers['ETag'] = etag
+            # Clients must revalidate, which is answered by a cheap 304 when unchanged
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(compress_body(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return watermark
@@ -0,0 +1,607 @@
+"""
+Load Testing Module
+Concurrent HTTP load on the Flask API, on the offline stand-in database
+
+The harness starts app.py against a synthetic history (synthetic_data)
+served by the SQLite backend (SALES_DB_BACKEND=sqlite), logs in, and replays
+a weighted mix of realistic calls: dashboards, searches, delivery
+optimization and 365-day analysis. Two load models:
+
+- closed: N concurrent users, each sending its next request when the
+  previous one has answered (--concurrency 1 4 16)
+- open: requests arrive at a fixed average rate (Poisson arrivals),
+  whatever the response times (--rates 2 5 10). Latency is counted from
+  the scheduled arrival, so queueing in the server is included.
+
+Each load level runs for --duration seconds. For every level and endpoint
+the report gives latency percentiles, throughput, error and rejection
+(429) rates; the saturation point of an endpoint is the first level where
+its p95 latency explodes, its errors rise or its throughput stops growing.
+
+    python load_test.py --concurrency 1 2 4 8 16 --duration 20
+    python load_test.py --rates 1 2 5 10 --mix search_clients=3 dashboard_commercial=1
+    python load_test.py --url http://127.0.0.1:5000 --login admin --password secret
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+
+logger = logging.getLogger("LoadTest")
+
+DEFAULT_DURATION = 15
+DEFAULT_TIMEOUT = 120
+PERCENTILES = (50, 90, 95, 99)
+
+# Saturation criteria, relative to the lightest load level
+LATENCY_FACTOR = 3.0       # p95 latency more than 3x the first level
+ERROR_THRESHOLD = 0.05     # more than 5% errors or 429 rejections
+MIN_THROUGHPUT_GAIN = 0.10  # less than 10% more throughput for a higher load
+
+SCENARIOS = {}
+
+
+def scenario(name, weight):
+    """
+    Register a request scenario.
+
+    The decorated function receives the context (codes of the dataset) and
+    a random.Random, and returns the request: a dict with method, path and
+    optionally params or json.
+    """
+    def register(build):
+        SCENARIOS[name] = {'name': name, 'weight': weight, 'build': build}
+        return build
+    return register
+
+
+# ---------------------------------------------------------------------------
+# Request mix
+# ---------------------------------------------------------------------------
+
+def _period(context):
+    return {'date_debut': context['start'], 'date_fin': context['end']}
+
+
+@scenario('dashboard_commercial', 25)
+def dashboard_commercial(context, rng):
+    return {'method': 'GET', 'path': f"/api/commercial_performance/{rng.choice(context['commercials'])}",
+            'params': _period(context)}
+
+
+@scenario('dashboard_client', 15)
+def dashboard_client(context, rng):
+    client = rng.choice(context['clients'])
+    if rng.random() < 0.5:
+        return {'method': 'GET', 'path': f"/api/top_products/{client}", 'params': {'limit': 5}}
+    return {'method': 'GET', 'path': f"/api/average_basket/{client}", 'params': _period(context)}
+
+
+@scenario('search_clients', 25)
+def search_clients(context, rng):
+    # Partial names and codes, as typed in the autocomplete
+    term = rng.choice(context['clients'])[:rng.randint(3, 6)] if rng.random() < 0.5 \
+        else f"Client {rng.randint(1, 99)}"
+    return {'method': 'GET', 'path': '/search_clients', 'params': {'term': term}}
+
+
+@scenario('search_products', 10)
+def search_products(context, rng):
+    return {'method': 'GET', 'path': '/search_products',
+            'params': {'term': rng.choice(context['products'])[:rng.randint(4, 7)]}}
+
+
+@scenario('delivery_optimize', 15)
+def delivery_optimize(context, rng):
+    delivery_date = datetime.now().date() + timedelta(days=rng.randint(1, 7))
+    return {'method': 'POST', 'path': '/api/delivery/optimize',
+            'json': {'commercial_code': rng.choice(context['commercials']),
+                     'delivery_date': delivery_date.strftime('%Y-%m-%d'),
+                     'min_revenue': rng.choice([0, 0, 1000, 2000]),
+                     'min_frequent_visits': rng.choice([0, 2, 3]),
+                     'product_codes': []}}
+
+
+@scenario('analysis_365', 5)
+def analysis_365(context, rng):
+    selected_date = datetime.now().date() + timedelta(days=rng.randint(0, 30))
+    return {'method': 'POST', 'path': '/api/365_prediction/analyze',
+            'json': {'commercial_code': rng.choice(context['commercials']),
+                     'selected_date': selected_date.strftime('%Y-%m-%d'),
+                     'include_revenue_optimization': True}}
+
+
+def dataset_context(generator):
+    """Codes and period the scenarios draw from, for a SyntheticSalesGenerator"""
+    return {
+        'commercials': [str(code) for code in generator.users()['code']],
+        'clients': list(generator.clients()['code']),
+        'products': list(generator.products()['code']),
+        'start': generator.start.strftime('%Y-%m-%d'),
+        'end': generator.end.strftime('%Y-%m-%d'),
+    }
+
+
+def weighted_mix(scenarios, weights=None):
+    """
+    Scenarios with their weights, overridden by `weights` ({name: weight}).
+
+    Returns:
+        tuple: (names, cumulative weights) for _pick
+    """
+    weights = {**{name: spec['weight'] for name, spec in scenarios.items()}, **(weights or {})}
+    unknown = set(weights) - set(scenarios)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    names = [name for name in scenarios if weights[name] > 0]
+    if not names:
+        raise ValueError("The request mix is empty")
+    return names, list(np.cumsum([weights[name] for name in names]))
+
+
+def _pick(mix, rng):
+    names, cumulative = mix
+    point = rng.random() * cumulative[-1]
+    for name, bound in zip(names, cumulative):
+        if point < bound:
+            return name
+    return names[-1]
+
+
+# ---------------------------------------------------------------------------
+# Application server
+# ---------------------------------------------------------------------------
+
+class AppServer:
+    """
+    app.py in a subprocess, on a synthetic history loaded into the SQLite
+    backend. The history ends yesterday so the queries relative to NOW() see
+    it. The rollup refresher is disabled: the load is the requests only.
+    """
+
+    def __init__(self, scale=0.2, seed=42, years=2, port=None, startup_timeout=180):
+        from synthetic_data import SyntheticSalesGenerator
+
+        end = pd.Timestamp(datetime.now().date() - timedelta(days=1))
+        start = end - pd.DateOffset(years=years) + pd.Timedelta(days=1)
+        self.generator = SyntheticSalesGenerator(scale, seed, start, end)
+        self.port = port or _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.startup_timeout = startup_timeout
+        self.directory = None
+        self.process = None
+        self.log_path = None
+
+    def context(self):
+        return dataset_context(self.generator)
+
+    def credentials(self):
+        user = self.generator.users().iloc[0]
+        return user['login'], user['password']
+
+    def start(self):
+        self.directory = tempfile.mkdtemp(prefix='load_test_')
+        fixtures = os.path.join(self.directory, 'fixtures')
+        counts = self.generator.write_parquet(fixtures)
+        logger.info(f"Fixtures: {counts}")
+
+        env = {**os.environ,
+               'SALES_DB_BACKEND': 'sqlite',
+               'SALES_FIXTURES_DIR': fixtures,
+               'SALES_SNAPSHOT_DIR': os.path.join(self.directory, 'snapshot'),
+               'ROLLUP_REFRESH_INTERVAL': '0'}
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={self.port}, threaded=True, "
+                   f"debug=False, use_reloader=False)"]
+        self.log_path = os.path.join(self.directory, 'app.log')
+        with open(self.log_path, 'wb') as log:
+            self.process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                                            stdout=log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                message = f"app.py exited with status {self.process.returncode}:\n{self.log_tail()}"
+                self.stop()
+                raise RuntimeError(message)
+            try:
+                requests.get(f"{self.url}/login", timeout=2)
+                logger.info(f"app.py listening on {self.url}")
+                return self
+            except requests.RequestException:
+                time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"app.py did not answer within {self.startup_timeout}s")
+
+    def log_tail(self, lines=20):
+        try:
+            with open(self.log_path, encoding='utf-8', errors='replace') as f:
+                return "".join(f.readlines()[-lines:])
+        except OSError:
+            return ""
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def open_session(base_url, credentials=None, timeout=DEFAULT_TIMEOUT):
+    """HTTP session, logged in with (login, password) when given"""
+    session = requests.Session()
+    if credentials:
+        login, password = credentials
+        session.post(f"{base_url}/login", data={'login': login, 'password': password},
+                     allow_redirects=False, timeout=timeout)
+        if not session.cookies:
+            raise RuntimeError(f"Login failed for {login}")
+    return session
+
+
+def send(session, base_url, name, spec, timeout=DEFAULT_TIMEOUT, scheduled=None):
+    """
+    Send one request and time it.
+
+    Redirects are not followed: a redirect to /login is an error, not the
+    login page. With `scheduled` (open model), the latency runs from the
+    scheduled arrival instead of the actual send.
+
+    Returns:
+        dict: scenario, start, latency (seconds), status (HTTP code or None),
+            outcome ('ok', 'rejected' for a 429, 'error'), bytes, error
+    """
+    started = time.perf_counter()
+    sample = {'scenario': name, 'start': scheduled if scheduled is not None else started,
+              'status': None, 'bytes': 0, 'error': None}
+    try:
+        response = session.request(spec['method'], base_url + spec['path'], params=spec.get('params'),
+                                   json=spec.get('json'), timeout=timeout, allow_redirects=False)
+        sample['status'] = response.status_code
+        sample['bytes'] = len(response.content)
+        if response.status_code < 300:
+            sample['outcome'] = 'ok'
+        elif response.status_code == 429:
+            sample['outcome'] = 'rejected'
+        else:
+            sample['outcome'] = 'error'
+            sample['error'] = f"HTTP {response.status_code}"
+    except requests.RequestException as e:
+        sample['outcome'] = 'error'
+        sample['error'] = type(e).__name__
+    sample['latency'] = time.perf_counter() - sample['start']
+    return sample
+
+
+def run_closed(base_url, context, mix, concurrency, duration, credentials=None, scenarios=SCENARIOS,
+               think_time=0.0, timeout=DEFAULT_TIMEOUT, seed=0):
+    """
+    Closed model: `concurrency` users loop for `duration` seconds, each with
+    an optional think time (exponential, mean `think_time` seconds).
+
+    Returns:
+        tuple: (samples, elapsed seconds)
+    """
+    samples = []
+    started = time.perf_counter()
+    stop_at = started + duration
+    failures = []
+
+    def user(index):
+        rng = random.Random(seed * 1000 + index)
+        try:
+            session = open_session(base_url, credentials, timeout)
+        except Exception as e:
+            failures.append(e)
+            return
+        with session:
+            while time.perf_counter() < stop_at:
+                name = _pick(mix, rng)
+                samples.append(send(session, base_url, name, scenarios[name]['build'](context, rng), timeout))
+                if think_time:
+                    time.sleep(rng.expovariate(1.0 / think_time))
+
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures and not samples:
+        raise failures[0]
+    return samples, time.perf_counter() - started
+
+
+def run_open(base_url, context, mix, rate, duration, credentials=None, scenarios=SCENARIOS,
+             max_workers=64, timeout=DEFAULT_TIMEOUT, seed=0):
+    """
+    Open model: Poisson arrivals at `rate` requests per second for
+    `duration` seconds, sent by up to `max_workers` threads.
+
+    Returns:
+        tuple: (samples, elapsed seconds)
+    """
+    rng = random.Random(seed)
+    local = threading.local()
+
+    def dispatch(name, spec, scheduled):
+        if not hasattr(local, 'session'):
+            local.session = open_session(base_url, credentials, timeout)
+        return send(local.session, base_url, name, spec, timeout, scheduled)
+
+    started = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='load') as pool:
+        arrival = started
+        while True:
+            arrival += rng.expovariate(rate)
+            if arrival - started >= duration:
+                break
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            name = _pick(mix, rng)
+            futures.append(pool.submit(dispatch, name, scenarios[name]['build'](context, rng), arrival))
+        samples = [future.result() for future in futures]
+    return samples, time.perf_counter() - started
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+
+def summarize(samples, elapsed):
+    """
+    Statistics of one load level, overall ('all') and per scenario.
+
+    Returns:
+        dict: {scenario: requests, throughput (successful requests per
+            second), error_rate, rejected_rate, latency_ms {p50, p90, p95,
+            p99, max, mean}, errors {message: count}}
+    """
+    groups = {'all': samples}
+    for sample in samples:
+        groups.setdefault(sample['scenario'], []).append(sample)
+
+    stats = {}
+    for name, group in groups.items():
+        latencies = np.array([s['latency'] for s in group]) * 1000
+        ok = sum(s['outcome'] == 'ok' for s in group)
+        errors = {}
+        for s in group:
+            if s['error']:
+                errors[s['error']] = errors.get(s['error'], 0) + 1
+        stats[name] = {
+            'requests': len(group),
+            'throughput': round(ok / elapsed, 3) if elapsed > 0 else 0.0,
+            'error_rate': round(sum(s['outcome'] == 'error' for s in group) / len(group), 4),
+            'rejected_rate': round(sum(s['outcome'] == 'rejected' for s in group) / len(group), 4),
+            'latency_ms': {**{f"p{p}": round(float(np.percentile(latencies, p)), 1) for p in PERCENTILES},
+                           'max': round(float(latencies.max()), 1), 'mean': round(float(latencies.mean()), 1)},
+            'errors': errors,
+        }
+    return stats
+
+
+def find_saturation(levels, latency_factor=LATENCY_FACTOR, error_threshold=ERROR_THRESHOLD,
+                    min_gain=MIN_THROUGHPUT_GAIN):
+    """
+    Saturation point of each scenario over increasing load levels.
+
+    Args:
+        levels: [{'load': level, 'stats': summarize(...)}], by increasing load
+
+    Returns:
+        dict: {scenario: {'saturated_at': first saturated load or None,
+            'max_sustained': last load before it, 'reason': why}}
+    """
+    names = []
+    for level in levels:
+        names += [name for name in level['stats'] if name not in names]
+
+    points = {}
+    for name in names:
+        point = {'saturated_at': None, 'max_sustained': None, 'reason': None}
+        reference = previous = None
+        for level in levels:
+            stats = level['stats'].get(name)
+            if not stats:
+                continue
+            reason = None
+            if stats['error_rate'] + stats['rejected_rate'] > error_threshold:
+                reason = f"{stats['error_rate'] + stats['rejected_rate']:.0%} errors/rejections"
+            elif reference and stats['latency_ms']['p95'] > latency_factor * max(reference['latency_ms']['p95'], 1.0):
+                reason = f"p95 {stats['latency_ms']['p95']:.0f} ms vs {reference['latency_ms']['p95']:.0f} ms"
+            elif previous and stats['throughput'] < (1 + min_gain) * previous['throughput']:
+                reason = f"throughput {stats['throughput']:.2f}/s vs {previous['throughput']:.2f}/s"
+            if reason:
+                point['saturated_at'] = level['load']
+                point['reason'] = reason
+                break
+            point['max_sustained'] = level['load']
+            reference = reference or stats
+            previous = stats
+        points[name] = point
+    return points
+
+
+def run_load_test(base_url, context, loads, model='closed', duration=DEFAULT_DURATION, warmup=0.0,
+                  credentials=None, scenarios=SCENARIOS, weights=None, think_time=0.0, max_workers=64,
+                  timeout=DEFAULT_TIMEOUT, seed=0):
+    """
+    Run the request mix at increasing load levels.
+
+    Args:
+        loads: Concurrency levels (closed model) or arrival rates in
+            requests per second (open model)
+        warmup: Seconds at the first level before measuring (caches,
+            imports, connection pools)
+
+    Returns:
+        dict: model, mix, duration, levels [{'load', 'elapsed', 'stats'}]
+            and saturation (find_saturation)
+    """
+    if model not in ('closed', 'open'):
+        raise ValueError(f"Unknown load model: {model}")
+    mix = weighted_mix(scenarios, weights)
+
+    def run_level(load, seconds, level_seed):
+        if model == 'closed':
+            return run_closed(base_url, context, mix, int(load), seconds, credentials, scenarios,
+                              think_time, timeout, level_seed)
+        return run_open(base_url, context, mix, float(load), seconds, credentials, scenarios,
+                        max_workers, timeout, level_seed)
+
+    if warmup:
+        logger.info(f"Warm-up: {warmup}s at {loads[0]}")
+        run_level(loads[0], warmup, seed - 1)
+
+    levels = []
+    for index, load in enumerate(loads):
+        samples, elapsed = run_level(load, duration, seed + index)
+        if not samples:
+            raise RuntimeError(f"No request completed at load {load}")
+        stats = summarize(samples, elapsed)
+        levels.append({'load': load, 'elapsed': round(elapsed, 3), 'stats': stats})
+        overall = stats['all']
+        logger.info(f"Load {load}: {overall['requests']} requests, {overall['throughput']}/s, "
+                    f"p95 {overall['latency_ms']['p95']} ms, errors {overall['error_rate']:.1%}")
+
+    names, cumulative = mix
+    shares = np.diff([0] + cumulative) / cumulative[-1]
+    return {
+        'run_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'url': base_url,
+        'model': model,
+        'duration': duration,
+        'mix': {name: round(float(share), 3) for name, share in zip(names, shares)},
+        'levels': levels,
+        'saturation': find_saturation(levels),
+    }
+
+
+def format_report(result):
+    """Text report: one table per load level, then the saturation points"""
+    unit = 'users' if result['model'] == 'closed' else 'req/s'
+    mix = ", ".join(f"{name} {share:.0%}" for name, share in result['mix'].items())
+    lines = [f"Load test {result['run_at']} on {result['url']} ({result['model']} model, "
+             f"{result['duration']}s per level)", f"Mix: {mix}"]
+    header = (f"{'scenario':<24}{'requests':>9}{'req/s':>8}{'errors':>8}{'429':>7}"
+              + "".join(f"{'p' + str(p):>9}" for p in PERCENTILES) + f"{'max':>9}")
+    for level in result['levels']:
+        lines += ["", f"--- {level['load']} {unit} ({level['elapsed']}s) ---", header + "  (ms)"]
+        for name, stats in level['stats'].items():
+            latency = stats['latency_ms']
+            lines.append(f"{name:<24}{stats['requests']:>9}{stats['throughput']:>8.2f}"
+                         f"{stats['error_rate']:>8.1%}{stats['rejected_rate']:>7.1%}"
+                         + "".join(f"{latency['p' + str(p)]:>9.0f}" for p in PERCENTILES)
+                         + f"{latency['max']:>9.0f}")
+            for error, count in stats['errors'].items():
+                lines.append(f"{'':<26}{count} x {error}")
+    lines += ["", "Saturation:"]
+    for name, point in result['saturation'].items():
+        if point['saturated_at'] is None:
+            lines.append(f"  {name:<24}not saturated up to {point['max_sustained']} {unit}")
+        else:
+            sustained = point['max_sustained'] if point['max_sustained'] is not None else '-'
+            lines.append(f"  {name:<24}saturated at {point['saturated_at']} {unit} ({point['reason']}), "
+                         f"sustained {sustained}")
+    return "\n".join(lines)
+
+
+def _parse_mix(items):
+    weights = {}
+    for item in items or []:
+        name, _, weight = item.partition('=')
+        weights[name] = float(weight) if weight else 1.0
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test of the Flask API")
+    loads = parser.add_mutually_exclusive_group()
+    loads.add_argument('--concurrency', type=int, nargs='+', help="Closed model: concurrent users per level")
+    loads.add_argument('--rates', type=float, nargs='+', help="Open model: arrivals per second per level")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help="Seconds per load level")
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--think-time', type=float, default=0.0, help="Closed model: mean pause between requests")
+    parser.add_argument('--max-workers', type=int, default=64, help="Open model: sending threads")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--mix', nargs='+', metavar='SCENARIO=WEIGHT',
+                        help=f"Weights overriding the default mix ({', '.join(SCENARIOS)}); 0 disables one")
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO', help="Only these scenarios")
+    parser.add_argument('--scale', type=float, default=0.2, help="Synthetic dataset scale")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help="Target a running server instead of starting app.py")
+    parser.add_argument('--login', help="Login of the load users (default: the first synthetic commercial)")
+    parser.add_argument('--password')
+    parser.add_argument('--output', help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    model, levels = ('open', args.rates) if args.rates else ('closed', args.concurrency or [1, 2, 4, 8])
+    weights = _parse_mix(args.mix)
+    if args.only:
+        weights.update({name: 0 for name in SCENARIOS if name not in args.only})
+
+    server = AppServer(args.scale, args.seed)
+    credentials = (args.login, args.password) if args.login else server.credentials()
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            url = server.start().url
+        result = run_load_test(url, server.context(), levels, model, args.duration, args.warmup, credentials,
+                               weights=weights, think_time=args.think_time, max_workers=args.max_workers,
+                               timeout=args.timeout, seed=args.seed)
+    finally:
+        server.stop()
+
+    print(format_report(result))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""
+Metrics Module
+Request timings, per-stage spans and counters in the Prometheus text format
+
+Three parts:
+
+- request middleware (init_request_metrics): duration histogram and request
+  counter per route and status, and the number of requests in flight
+- spans around the major stages of a computation (DB fetch, cleaning, model
+  fit, forecast, render, serialize), recorded per route so a slow
+  /api/delivery/optimize can be broken down:
+
+      with span('db_fetch'):
+          lines = load_delivery_lines(conn, commercial_code)
+
+      with model_fit('sarimax'):      # stage 'model_fit' + model_fits_total
+          results = model.fit(disp=False)
+
+- a /metrics endpoint exposing the histograms, counters and gauges in the
+  Prometheus text exposition format (version 0.0.4). Values computed at
+  scrape time (cache statistics, running jobs) are registered as callbacks.
+
+Metrics live in the process: with several worker processes, each one is
+scraped separately.
+"""
+
+import math
+import time
+import logging
+import threading
+from contextlib import ContextDecorator
+
+from flask import Response, g, request, has_request_context
+
+logger = logging.getLogger("Metrics")
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds: from a cached dashboard (a few ms) to a 365-day analysis (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Route label of the code running outside of a request (refreshers, workers)
+BACKGROUND = 'background'
+
+
+def _escape(value, quotes=True):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {_escape(self.help, quotes=False)}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+    def render(self):
+        return self.header() + self.samples()
+
+
+class Counter(_Metric):
+    """Monotonic count (fits, cache hits, requests)"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down (requests in flight)"""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Distribution of durations in cumulative buckets, with their sum and count"""
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def get(self, **labels):
+        """{'count', 'sum', 'buckets': {upper bound: cumulative count}}"""
+        with self.lock:
+            state = self.values.get(self._key(labels))
+            if state is None:
+                return {'count': 0, 'sum': 0.0, 'buckets': {}}
+            cumulative, total = {}, 0
+            for bound, count in zip(self.buckets, state['counts']):
+                total += count
+                cumulative[bound] = total
+            return {'count': state['count'], 'sum': state['sum'], 'buckets': cumulative}
+
+    def samples(self):
+        with self.lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self.values.items())
+        lines = []
+        for key, state in items:
+            total = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                total += count
+                le = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {total}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class _Callback(_Metric):
+    """Counter or gauge read at scrape time from a callable returning {label values: value}"""
+
+    def __init__(self, name, help, labelnames, type, fn):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.fn = fn
+
+    def samples(self):
+        try:
+            values = self.fn() or {}
+        except Exception as e:
+            logger.warning(f"Metric {self.name} unavailable: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key if isinstance(key, tuple) else (key,))} "
+                f"{_format_value(value)}" for key, value in sorted(values.items(), key=lambda kv: str(kv[0]))]
+
+
+class Registry:
+    """Metrics exposed together, in registration order"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered differently")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_callback(self, name, help, labelnames, fn, type='gauge'):
+        """
+        Metric computed at scrape time.
+
+        Args:
+            fn: Callable returning {label value tuple (or single value): number}
+            type: 'gauge' or 'counter' (for totals kept elsewhere, e.g. SWRCache.stats)
+        """
+        metric = _Callback(name, help, labelnames, type, fn)
+        with self.lock:
+            self.metrics[name] = metric
+        return metric
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter('http_requests_total', 'HTTP requests by route, method and status',
+                                 ('route', 'method', 'status'))
+HTTP_DURATION = REGISTRY.histogram('http_request_duration_seconds', 'HTTP request duration by route and method',
+                                   ('route', 'method'))
+HTTP_IN_FLIGHT = REGISTRY.gauge('http_requests_in_flight', 'HTTP requests being processed')
+STAGE_DURATION = REGISTRY.histogram('stage_duration_seconds', 'Duration of the computation stages by route',
+                                    ('route', 'stage'))
+MODEL_FITS = REGISTRY.counter('model_fits_total', 'Model fits by model type', ('model',))
+
+
+def current_route():
+    """Route template of the current request ('background' outside of a request)"""
+    if not has_request_context():
+        return BACKGROUND
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+class span(ContextDecorator):
+    """
+    Time a stage of the current request (context manager or decorator).
+
+    Args:
+        stage: Stage name (db_fetch, clean, model_fit, forecast, render, serialize, ...)
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self._starts = threading.local()
+
+    def __enter__(self):
+        stack = getattr(self._starts, 'stack', None)
+        if stack is None:
+            stack = self._starts.stack = []
+        stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        started = self._starts.stack.pop()
+        STAGE_DURATION.observe(time.perf_counter() - started, route=current_route(), stage=self.stage)
+        return False
+
+
+class model_fit(span):
+    """span('model_fit') that also counts the fit in model_fits_total"""
+
+    def __init__(self, model):
+        super().__init__('model_fit')
+        self.model = model
+
+    def __enter__(self):
+        MODEL_FITS.inc(model=self.model)
+        return super().__enter__()
+
+
+def init_request_metrics(app, path='/metrics', registry=REGISTRY):
+    """
+    Time every request of a Flask app and serve the registry at `path`.
+
+    Args:
+        app: Flask application
+        path: Route of the Prometheus endpoint (None: no endpoint)
+        registry: Registry rendered by the endpoint
+    """
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        HTTP_IN_FLIGHT.dec()
+        status = g.pop('metrics_status', 500 if exc is not None else 200)
+        route = current_route()
+        HTTP_DURATION.observe(time.perf_counter() - started, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=status)
+
+    if path:
+        @app.route(path, endpoint='prometheus_metrics')
+        def prometheus_metrics():
+            return Response(registry.render(), content_type=CONTENT_TYPE, headers={'Cache-Control': 'no-store'})
+    return registry
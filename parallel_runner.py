@@ -0,0 +1,140 @@
+"""
+Parallel Runner Module
+Runs independent analysis modules side by side with per-module timeouts
+
+Each module runs in its own worker process: the SARIMA / forecasting code is
+CPU-bound (the GIL would serialize threads) and uses pyplot, whose global state
+is not thread-safe. A module that exceeds its timeout is terminated and reported
+as such, while the results of the other modules are still returned.
+
+Workers are started by a fork server rather than forked from the caller: the
+Flask process runs many threads (requests, refreshers), and forking it could
+copy a lock held by another thread into the child. The fork server is a fresh
+single-threaded process that imports the task modules once (preload) and forks
+each worker from there, so the workers still start quickly.
+"""
+
+import time
+import logging
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+logger = logging.getLogger("ParallelRunner")
+
+# Module statuses
+STATUS_SUCCESS = 'success'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+
+# Default timeout (seconds) for a module without its own
+DEFAULT_MODULE_TIMEOUT = 300
+
+
+def _get_context(preload=()):
+    """
+    forkserver context preloading `preload` (spawn where forkserver is unavailable).
+
+    The fork server is started once per process: the modules of the first call
+    are the ones preloaded, later workers import anything missing themselves.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(sorted(set(preload)))
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _worker(conn, func, args, kwargs, threads=None):
+    """Child process: run the module and send back ('ok', result) or ('error', message)"""
+    try:
+        if threads:
+            from admission_control import cap_worker_threads
+            cap_worker_threads(threads)
+        result = func(*args, **kwargs)
+        conn.send(('ok', result))
+    except Exception as e:
+        conn.send(('error', f"{e}\n{traceback.format_exc(limit=5)}"))
+    finally:
+        conn.close()
+
+
+def run_parallel(tasks, timeouts=None, default_timeout=DEFAULT_MODULE_TIMEOUT, max_workers=4,
+                 threads_per_worker=None):
+    """
+    Run tasks concurrently, each in its own process, with per-task timeouts.
+
+    Args:
+        tasks: Ordered dict {name: (callable, args, kwargs)}. The callable and its
+            result must be picklable (module-level functions returning plain data).
+        timeouts: Optional {name: seconds}, counted from the start of each task
+        default_timeout: Timeout for tasks missing from `timeouts`
+        max_workers: Maximum number of tasks running at the same time
+        threads_per_worker: BLAS/OpenMP threads allowed in each worker
+            (None: an even share of the cores between max_workers)
+
+    Returns:
+        dict: {name: {'status', 'result', 'error', 'duration'}} in the order of `tasks`
+    """
+    timeouts = timeouts or {}
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (multiprocessing.cpu_count() or 1) // max_workers)
+    # Modules of the callables (export_utilities, ...) imported once in the fork server;
+    # '__main__' is only re-imported when a task is defined there
+    context = _get_context(['admission_control'] + [func.__module__ for func, _, _ in tasks.values()])
+    pending = list(tasks.items())
+    running = {}  # reader -> (name, process, started_at, deadline)
+    outcomes = {}
+
+    def start_next():
+        name, (func, args, kwargs) = pending.pop(0)
+        reader, writer = context.Pipe(duplex=False)
+        process = context.Process(target=_worker, args=(writer, func, tuple(args or ()), dict(kwargs or {}), threads_per_worker),
+                                  name=f"module-{name}", daemon=True)
+        process.start()
+        # The child holds the write end; closing ours lets the reader see EOF if it dies
+        writer.close()
+        started_at = time.monotonic()
+        running[reader] = (name, process, started_at, started_at + timeouts.get(name, default_timeout))
+        logger.info(f"Module {name} started (pid {process.pid})")
+
+    def finish(reader, status, result=None, error=None):
+        name, process, started_at, _ = running.pop(reader)
+        if status == STATUS_TIMEOUT and process.is_alive():
+            process.terminate()
+        process.join(timeout=5)
+        reader.close()
+        outcomes[name] = {
+            'status': status,
+            'result': result,
+            'error': error,
+            'duration': round(time.monotonic() - started_at, 3)
+        }
+        logger.info(f"Module {name} finished: {status} in {outcomes[name]['duration']}s")
+
+    while pending or running:
+        while pending and len(running) < max_workers:
+            start_next()
+
+        now = time.monotonic()
+        next_deadline = min(deadline for _, _, _, deadline in running.values())
+        ready = wait(list(running), timeout=max(0.0, next_deadline - now))
+
+        for reader in ready:
+            try:
+                kind, payload = reader.recv()
+            except EOFError:
+                # Process died without reporting (crash, killed by the OS, ...)
+                finish(reader, STATUS_ERROR, error='worker process exited unexpectedly')
+                continue
+            if kind == 'ok':
+                finish(reader, STATUS_SUCCESS, result=payload)
+            else:
+                finish(reader, STATUS_ERROR, error=payload)
+
+        now = time.monotonic()
+        for reader, (name, _, _, deadline) in list(running.items()):
+            if now >= deadline:
+                finish(reader, STATUS_TIMEOUT, error=f'timed out after {timeouts.get(name, default_timeout)}s')
+
+    return {name: outcomes[name] for name in tasks}
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Product Image Ingestion Pipeline
+
+Concurrent replacement for the sequential loop in download_product_images.py:
+- bounded thread pool for downloads
+- token-bucket rate limiter shared by all workers (search pages and images)
+- retries with exponential backoff (honours Retry-After)
+- content-hash deduplication (identical images are stored once and linked)
+- SQLite manifest, so an interrupted run resumes where it left off
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import random
+import threading
+from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from PIL import Image
+
+logger = logging.getLogger("ImageIngestion")
+
+# Statuses recorded in the manifest
+STATUS_DONE = 'done'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_FAILED = 'failed'
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` tokens are available, then consume them."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class ImageManifest:
+    """SQLite record of processed products and of the content hashes already stored"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                product_code TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                source_url TEXT,
+                content_hash TEXT,
+                file_path TEXT,
+                attempts INTEGER DEFAULT 0,
+                error TEXT,
+                updated_at TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS contents (
+                content_hash TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get_status(self, product_code):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status FROM products WHERE product_code = ?", (product_code,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def completed_codes(self, statuses=(STATUS_DONE,)):
+        """Product codes whose status is in `statuses`."""
+        placeholders = ','.join('?' for _ in statuses)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT product_code FROM products WHERE status IN ({placeholders})", tuple(statuses)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, product_code, status, source_url=None, content_hash=None, file_path=None, error=None):
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO products (product_code, status, source_url, content_hash, file_path, attempts, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT(product_code) DO UPDATE SET
+                    status = excluded.status,
+                    source_url = excluded.source_url,
+                    content_hash = excluded.content_hash,
+                    file_path = excluded.file_path,
+                    attempts = products.attempts + 1,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+            """, (product_code, status, source_url, content_hash, file_path, error, datetime.now().isoformat()))
+            self.conn.commit()
+
+    def find_content(self, content_hash):
+        """Return the stored file for a content hash, if it still exists."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT file_path FROM contents WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+
+    def add_content(self, content_hash, file_path):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO contents (content_hash, file_path) VALUES (?, ?)",
+                (content_hash, file_path)
+            )
+            self.conn.commit()
+
+    def summary(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM products GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ImageIngestionPipeline:
+    """Download product images concurrently with rate limiting and resumability"""
+
+    def __init__(self, resolve_urls, image_dir, manifest_path=None, max_workers=8,
+                 rate=5.0, burst=10, max_retries=3, backoff=0.5, timeout=10,
+                 max_size=(800, 800), user_agents=None):
+        """
+        Args:
+            resolve_urls: Callable (product, fetch) -> list of candidate image URLs.
+                `fetch(url)` is the pipeline's rate-limited, retrying GET.
+            image_dir: Folder where {product_code}.jpg files are written
+            manifest_path: SQLite manifest path (defaults to <image_dir>/ingestion_manifest.db)
+            max_workers: Size of the download thread pool
+            rate: Requests per second across all workers
+            burst: Token bucket capacity
+            max_retries: Retries per request after the first attempt
+            backoff: Base delay in seconds for exponential backoff
+            timeout: HTTP timeout in seconds
+            max_size: Bounding box applied before saving
+            user_agents: Optional list of User-Agent strings to rotate
+        """
+        self.resolve_urls = resolve_urls
+        self.image_dir = image_dir
+        os.makedirs(image_dir, exist_ok=True)
+        self.manifest = ImageManifest(manifest_path or os.path.join(image_dir, 'ingestion_manifest.db'))
+        self.max_workers = max_workers
+        self.limiter = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_size = max_size
+        self.user_agents = user_agents or []
+        self._local = threading.local()
+
+    def _session(self):
+        # requests.Session is not thread-safe: one per worker thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def fetch(self, url):
+        """
+        Rate-limited GET with retries and exponential backoff.
+
+        Returns:
+            requests.Response on HTTP 200, None otherwise (requests still failing
+            after the retries are counted, so they are not taken for a missing image)
+        """
+        headers = {}
+        if self.user_agents:
+            headers['User-Agent'] = random.choice(self.user_agents)
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            delay = self.backoff * (2 ** attempt)
+            try:
+                response = self._session().get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Request error for {url} (attempt {attempt + 1}): {e}")
+            else:
+                if response.status_code == 200:
+                    return response
+                if response.status_code not in RETRYABLE_STATUS:
+                    logger.warning(f"Failed to download {url}. Status code: {response.status_code}")
+                    return None
+                retry_after = response.headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                logger.warning(f"Retryable status {response.status_code} for {url} (attempt {attempt + 1})")
+            if attempt < self.max_retries:
+                # Jitter keeps the workers from retrying in lockstep
+                time.sleep(delay * (0.5 + random.random() / 2))
+        self._local.failed_fetches = getattr(self._local, 'failed_fetches', 0) + 1
+        return None
+
+    def _store_image(self, product_code, content):
+        """Save downloaded bytes as {code}.jpg, reusing identical content already stored."""
+        content_hash = hashlib.sha256(content).hexdigest()
+        filepath = os.path.join(self.image_dir, f"{product_code}.jpg")
+
+        existing = self.manifest.find_content(content_hash)
+        if existing:
+            if os.path.abspath(existing) != os.path.abspath(filepath):
+                tmp_path = f"{filepath}.tmp"
+                try:
+                    os.link(existing, tmp_path)
+                except OSError:
+                    shutil.copyfile(existing, tmp_path)
+                os.replace(tmp_path, filepath)
+            return content_hash, filepath, True
+
+        img = Image.open(BytesIO(content))
+        img.thumbnail(self.max_size, Image.LANCZOS)
+        tmp_path = f"{filepath}.tmp"
+        img.convert('RGB').save(tmp_path, 'JPEG', quality=85)
+        os.replace(tmp_path, filepath)
+        self.manifest.add_content(content_hash, filepath)
+        return content_hash, filepath, False
+
+    def process_product(self, product):
+        """Resolve, download and store the image for one product."""
+        product_code = product['code']
+        # Fetches of this product (search included) that exhausted their retries
+        self._local.failed_fetches = 0
+        try:
+            urls = self.resolve_urls(product, self.fetch) or []
+        except Exception as e:
+            self.manifest.record(product_code, STATUS_FAILED, error=f"resolve: {e}")
+            return STATUS_FAILED
+
+        for url in urls:
+            response = self.fetch(url)
+            if response is None:
+                continue
+            if 'image' not in response.headers.get('content-type', '').lower():
+                continue
+            try:
+                content_hash, filepath, duplicate = self._store_image(product_code, response.content)
+            except Exception as e:
+                logger.warning(f"Invalid image from {url} for {product_code}: {e}")
+                continue
+            self.manifest.record(product_code, STATUS_DONE, source_url=url,
+                                 content_hash=content_hash, file_path=filepath)
+            logger.info(f"Image saved for product {product_code}" + (" (duplicate content)" if duplicate else ""))
+            return STATUS_DONE
+
+        failed_fetches = self._local.failed_fetches
+        if failed_fetches:
+            # Network errors or 429/5xx: not a real miss, retried on the next run
+            self.manifest.record(product_code, STATUS_FAILED, error=f"{failed_fetches} request(s) failed after retries")
+            return STATUS_FAILED
+        self.manifest.record(product_code, STATUS_NOT_FOUND, error='no usable image')
+        return STATUS_NOT_FOUND
+
+    def run(self, products, retry_missing=False):
+        """
+        Process products concurrently, skipping those already in the manifest.
+
+        Images already in image_dir (previous downloads, hand-curated files) are
+        recorded as done and never searched or overwritten.
+
+        Args:
+            products: List of dicts with at least a 'code' key
+            retry_missing: Also retry products previously recorded as not found
+
+        Returns:
+            dict: Counts per status for this run, plus 'skipped'
+        """
+        skip_statuses = (STATUS_DONE,) if retry_missing else (STATUS_DONE, STATUS_NOT_FOUND)
+        completed = self.manifest.completed_codes(skip_statuses)
+        for product in products:
+            product_code = product['code']
+            filepath = os.path.join(self.image_dir, f"{product_code}.jpg")
+            if product_code not in completed and os.path.exists(filepath):
+                self.manifest.record(product_code, STATUS_DONE, file_path=filepath)
+                completed.add(product_code)
+        pending = [p for p in products if p['code'] not in completed]
+        stats = {STATUS_DONE: 0, STATUS_NOT_FOUND: 0, STATUS_FAILED: 0, 'skipped': len(products) - len(pending)}
+        logger.info(f"{len(pending)} products to process, {stats['skipped']} already in manifest")
+
+        # Keep at most 2x max_workers futures in flight so memory stays bounded for large catalogues
+        max_in_flight = self.max_workers * 2
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = set()
+            iterator = iter(pending)
+            while True:
+                while len(in_flight) < max_in_flight:
+                    product = next(iterator, None)
+                    if product is None:
+                        break
+                    in_flight.add(executor.submit(self.process_product, product))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        logger.error(f"Unexpected ingestion error: {e}")
+                        status = STATUS_FAILED
+                    stats[status] += 1
+                    processed += 1
+                    if processed % 50 == 0:
+                        logger.info(f"Progress: {processed}/{len(pending)} products processed ({stats[STATUS_DONE]} images saved)")
+
+        return stats
+
+    def close(self):
+        self.manifest.close()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Product Image Service
+
+Serves product images for /product_image/<code> from an on-disk cache:
+- placeholders (code + label) are generated once and pre-generated in bulk
+- originals from IMAGE_DIR are resized to thumbnails in WebP and JPEG
+- cached files are keyed by product code, size and format
+- each cached file carries a fingerprint of its inputs (source file or label),
+  so it is only regenerated when the source image or the product label changes
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from PIL import Image, ImageDraw
+
+# Same folder as download_product_images.py
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'product_images')
+CACHE_DIR = os.path.join(IMAGE_DIR, 'cache')
+
+# Bounding boxes for the generated images (width, height)
+IMAGE_SIZES = {
+    'thumb': (120, 80),
+    'medium': (300, 200),
+    'large': (800, 800)
+}
+DEFAULT_SIZE = 'medium'
+
+IMAGE_FORMATS = {
+    'jpeg': {'pil_format': 'JPEG', 'extension': 'jpg', 'mimetype': 'image/jpeg', 'options': {'quality': 85, 'optimize': True}},
+    'webp': {'pil_format': 'WEBP', 'extension': 'webp', 'mimetype': 'image/webp', 'options': {'quality': 80, 'method': 4}}
+}
+DEFAULT_FORMAT = 'jpeg'
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Bump when the placeholder drawing or the resize pipeline changes
+RENDER_VERSION = '1'
+
+
+def _safe_code(product_code):
+    """Make a product code usable as a file name."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(product_code))
+
+
+class ProductImageService:
+    """Disk-cached product images with fingerprint-based regeneration"""
+
+    def __init__(self, image_dir=IMAGE_DIR, cache_dir=None, label_loader=None, label_ttl=600):
+        """
+        Args:
+            image_dir: Folder containing the original product images ({code}.jpg, ...)
+            cache_dir: Folder for generated images (defaults to <image_dir>/cache)
+            label_loader: Callable returning a {product_code: label} dict
+            label_ttl: Seconds before the labels are reloaded through label_loader
+        """
+        self.image_dir = image_dir
+        self.cache_dir = cache_dir or os.path.join(image_dir, 'cache')
+        self.label_loader = label_loader
+        self.label_ttl = label_ttl
+        self._labels = {}
+        self._labels_loaded_at = 0
+        self._labels_lock = threading.Lock()
+        # One lock per cache key so concurrent requests render an image only once
+        self._render_locks = {}
+        self._render_locks_guard = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------ labels
+
+    def get_label(self, product_code):
+        """Return the product label, reloading the label table when it is stale."""
+        if self.label_loader is not None:
+            with self._labels_lock:
+                if time.time() - self._labels_loaded_at > self.label_ttl:
+                    try:
+                        self._labels = {str(code): label for code, label in self.label_loader().items()}
+                    except Exception as e:
+                        print(f"Error loading product labels: {str(e)}")
+                    # Retry after a full TTL even on failure, so a down database is not hammered
+                    self._labels_loaded_at = time.time()
+        return self._labels.get(str(product_code)) or str(product_code)
+
+    # ------------------------------------------------------------------ paths
+
+    def source_path(self, product_code):
+        """Return the path of the original image for a product, or None."""
+        code = _safe_code(product_code)
+        for extension in SOURCE_EXTENSIONS:
+            path = os.path.join(self.image_dir, f"{code}{extension}")
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def cache_path(self, product_code, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+        """Return the cache file path for (product code, size, format)."""
+        extension = IMAGE_FORMATS[fmt]['extension']
+        return os.path.join(self.cache_dir, f"{_safe_code(product_code)}_{size}.{extension}")
+
+    # ------------------------------------------------------------------ fingerprints
+
+    def fingerprint(self, product_code, label=None, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+        """
+        Fingerprint of everything a cached image depends on.
+
+        Originals are identified by their modification time and file size,
+        placeholders by the product label.
+        """
+        source = self.source_path(product_code)
+        if source:
+            stat = os.stat(source)
+            origin = f"source:{os.path.basename(source)}:{stat.st_mtime_ns}:{stat.st_size}"
+        else:
+            if label is None:
+                label = self.get_label(product_code)
+            origin = f"placeholder:{product_code}:{label}"
+        raw = f"{RENDER_VERSION}|{size}|{fmt}|{origin}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _read_fingerprint(self, path):
+        try:
+            with open(f"{path}.etag", 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _render_lock(self, path):
+        with self._render_locks_guard:
+            return self._render_locks.setdefault(path, threading.Lock())
+
+    # ------------------------------------------------------------------ rendering
+
+    def _render_placeholder(self, product_code, label, size):
+        """Draw the placeholder image used when no original exists."""
+        width, height = IMAGE_SIZES[size]
+        image = Image.new('RGB', (width, height), color=(240, 240, 240))
+        draw = ImageDraw.Draw(image)
+        try:
+            draw.text((width//2, height//3), str(product_code), fill=(0, 0, 0), anchor="mm")
+            draw.text((width//2, height//2), str(label), fill=(70, 70, 70), anchor="mm")
+            draw.text((width//2, 2*height//3), "Image non disponible", fill=(150, 150, 150), anchor="mm")
+        except Exception:
+            # Fonts without anchor support: draw a neutral crossed frame instead
+            draw.rectangle([(0, 0), (width - 1, height - 1)], outline=(200, 200, 200))
+            draw.line([(0, 0), (width, height)], fill=(200, 200, 200))
+            draw.line([(width, 0), (0, height)], fill=(200, 200, 200))
+        return image
+
+    def _render_thumbnail(self, source, size):
+        """Resize an original image to fit the bounding box of the given size."""
+        with Image.open(source) as original:
+            image = original.convert('RGB')
+        image.thumbnail(IMAGE_SIZES[size], Image.LANCZOS)
+        return image
+
+    def _write_image(self, image, path, fmt, fingerprint):
+        """Atomically write an image and its fingerprint to the cache."""
+        spec = IMAGE_FORMATS[fmt]
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, spec['pil_format'], **spec['options'])
+        os.replace(tmp_path, path)
+        with open(f"{path}.etag", 'w', encoding='utf-8') as f:
+            f.write(fingerprint)
+
+    def get_image(self, product_code, label=None, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+        """
+        Return a cached image, generating it if missing or out of date.
+
+        Args:
+            product_code: Product code
+            label: Product label (looked up through label_loader if None)
+            size: One of IMAGE_SIZES
+            fmt: One of IMAGE_FORMATS
+
+        Returns:
+            tuple: (path, etag, last_modified datetime)
+        """
+        if size not in IMAGE_SIZES:
+            raise ValueError(f"Unknown image size: {size}")
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {fmt}")
+
+        path = self.cache_path(product_code, size, fmt)
+        fingerprint = self.fingerprint(product_code, label, size, fmt)
+
+        if not (os.path.exists(path) and self._read_fingerprint(path) == fingerprint):
+            with self._render_lock(path):
+                # Another thread may have rendered it while we were waiting
+                if not (os.path.exists(path) and self._read_fingerprint(path) == fingerprint):
+                    source = self.source_path(product_code)
+                    if source:
+                        image = self._render_thumbnail(source, size)
+                    else:
+                        if label is None:
+                            label = self.get_label(product_code)
+                        image = self._render_placeholder(product_code, label, size)
+                    self._write_image(image, path, fmt, fingerprint)
+
+        last_modified = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+        return path, fingerprint, last_modified
+
+    def pregenerate(self, products, sizes=None, formats=None):
+        """
+        Generate cached images in bulk.
+
+        Args:
+            products: Iterable of (product_code, label) pairs
+            sizes: Sizes to generate (defaults to all sizes)
+            formats: Formats to generate (defaults to all formats)
+
+        Returns:
+            dict: Counts of generated and already up-to-date images
+        """
+        sizes = sizes or list(IMAGE_SIZES)
+        formats = formats or list(IMAGE_FORMATS)
+        stats = {'generated': 0, 'up_to_date': 0, 'errors': 0}
+        for product_code, label in products:
+            for size in sizes:
+                for fmt in formats:
+                    path = self.cache_path(product_code, size, fmt)
+                    before = self._read_fingerprint(path)
+                    try:
+                        _, fingerprint, _ = self.get_image(product_code, label, size, fmt)
+                    except Exception as e:
+                        print(f"Error generating image for {product_code} ({size}/{fmt}): {str(e)}")
+                        stats['errors'] += 1
+                        continue
+                    if before == fingerprint:
+                        stats['up_to_date'] += 1
+                    else:
+                        stats['generated'] += 1
+        return stats
+
+    # ------------------------------------------------------------------ HTTP
+
+    def negotiate_format(self, requested_format=None, accept_header=''):
+        """Pick the output format from an explicit request or the Accept header."""
+        if requested_format:
+            requested_format = requested_format.lower()
+            if requested_format == 'jpg':
+                requested_format = 'jpeg'
+            if requested_format in IMAGE_FORMATS:
+                return requested_format
+        if accept_header and 'image/webp' in accept_header:
+            return 'webp'
+        return DEFAULT_FORMAT
+
+    def send_image(self, product_code, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT, label=None, max_age=3600):
+        """
+        Flask response for a product image, with ETag/Last-Modified validators.
+
+        Requests carrying a matching If-None-Match or If-Modified-Since header
+        are answered with 304 Not Modified.
+        """
+        from flask import send_file
+
+        path, etag, last_modified = self.get_image(product_code, label, size, fmt)
+        response = send_file(
+            path,
+            mimetype=IMAGE_FORMATS[fmt]['mimetype'],
+            etag=etag,
+            last_modified=last_modified,
+            conditional=True,
+            max_age=max_age
+        )
+        response.vary.add('Accept')
+        return response
+
+
+def load_product_labels():
+    """Load {product_code: label} for all products from the sales database (see sales_repository)."""
+    from sales_repository import get_repository
+
+    conn = get_repository().connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT code, libelle FROM produits")
+        return {str(row[0]): (row[1] if row[1] else str(row[0])) for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Pre-generate placeholders and thumbnails for the whole catalogue
+    service = ProductImageService()
+    labels = load_product_labels()
+    print(f"Pre-generating images for {len(labels)} products...")
+    result = service.pregenerate(labels.items())
+    print(f"Done: {result['generated']} generated, {result['up_to_date']} up to date, {result['errors']} errors")
@@ -0,0 +1,236 @@
+"""
+Product Rollups Module
+Monthly client x product sales, maintained incrementally
+
+The top products of a client, the product sales by client of a commercial and
+the products export join entetecommercials to lignecommercials over the whole
+history on every request. This module keeps those sums in one table:
+
+- client_product_monthly_sales: one row per (client, product, month, commercial)
+  with the quantity, the revenue, the number of lines and of invoices, and the
+  first / last sale date of the month
+
+The commercial is part of the key because the commercial screens filter on it;
+a client is normally served by one commercial, so the table stays at the
+client x product x month grain. Missing codes are stored as ''.
+
+The revenue is SUM(ec.net_a_payer) over the lines, as the product queries
+compute it (the invoice amount counted once per line of the product).
+
+The watermark is kept in rollup_watermarks (see daily_rollups). refresh()
+recomputes the months from the one holding the watermark minus a lookback;
+rebuild() recomputes everything:
+
+    python product_rollups.py refresh [--lookback-days 3]
+    python product_rollups.py rebuild
+"""
+
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from daily_rollups import (get_db_connection, get_watermark, set_watermark, rollups_available,
+                           DEFAULT_LOOKBACK_DAYS, CREATE_TABLES as DAILY_CREATE_TABLES)
+
+logger = logging.getLogger("ProductRollups")
+
+ROLLUP_NAME = 'client_product_monthly_sales'
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS client_product_monthly_sales (
+        client_code VARCHAR(50) NOT NULL,
+        produit_code VARCHAR(50) NOT NULL,
+        month CHAR(7) NOT NULL,
+        commercial_code VARCHAR(50) NOT NULL,
+        quantity DECIMAL(16, 3),
+        revenue DECIMAL(16, 3),
+        line_count INT NOT NULL,
+        invoice_count INT NOT NULL,
+        first_date DATE,
+        last_date DATE,
+        PRIMARY KEY (client_code, produit_code, month, commercial_code)
+    )
+    """
+]
+
+# Months are 'YYYY-MM' strings: SUBSTR works on MySQL DATE columns and on text dates
+INSERT_MONTHLY_SALES = """
+INSERT INTO client_product_monthly_sales
+    (client_code, produit_code, month, commercial_code,
+     quantity, revenue, line_count, invoice_count, first_date, last_date)
+SELECT COALESCE(ec.client_code, ''), COALESCE(lc.produit_code, ''), SUBSTR(ec.date, 1, 7),
+       COALESCE(ec.commercial_code, ''),
+       SUM(lc.quantite), SUM(ec.net_a_payer), COUNT(*), COUNT(DISTINCT ec.code),
+       MIN(DATE(ec.date)), MAX(DATE(ec.date))
+FROM entetecommercials ec
+JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+WHERE ec.date >= %s
+GROUP BY COALESCE(ec.client_code, ''), COALESCE(lc.produit_code, ''), SUBSTR(ec.date, 1, 7),
+         COALESCE(ec.commercial_code, '')
+"""
+
+TOP_PRODUCTS_QUERY = """
+SELECT s.produit_code, p.libelle AS produit_nom, SUM(s.revenue) AS total_ventes{image}
+FROM client_product_monthly_sales s
+LEFT JOIN produits p ON s.produit_code = p.code
+WHERE s.client_code = %s
+GROUP BY s.produit_code, p.libelle{image_group}
+ORDER BY total_ventes DESC
+LIMIT %s
+"""
+
+SALES_BY_CLIENT_QUERY = """
+SELECT s.client_code, c.nom AS client_nom, c.prenom AS client_prenom,
+       s.produit_code, p.libelle AS produit_nom, SUM(s.quantity) AS total_quantite
+FROM client_product_monthly_sales s
+LEFT JOIN clients c ON s.client_code = c.code
+LEFT JOIN produits p ON s.produit_code = p.code
+WHERE s.commercial_code = %s AND s.month BETWEEN %s AND %s
+GROUP BY s.client_code, c.nom, c.prenom, s.produit_code, p.libelle
+"""
+
+
+def ensure_tables(conn):
+    cursor = conn.cursor()
+    for statement in DAILY_CREATE_TABLES + CREATE_TABLES:
+        cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+
+
+def _aggregate_from(conn, start_month):
+    """Replace the months from start_month ('YYYY-MM') onwards"""
+    cursor = conn.cursor()
+    # Capped at now: a future-dated invoice (typo, pre-entered order) would otherwise
+    # move the watermark ahead and freeze the refresh until that date
+    cursor.execute("SELECT MAX(date) FROM entetecommercials WHERE date <= %s",
+                   (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+    latest = cursor.fetchone()[0]
+
+    cursor.execute("DELETE FROM client_product_monthly_sales WHERE month >= %s", (start_month,))
+    cursor.execute(INSERT_MONTHLY_SALES, (f"{start_month}-01",))
+    rows = cursor.rowcount
+
+    watermark = set_watermark(cursor, latest, ROLLUP_NAME)
+    conn.commit()
+    cursor.close()
+    return {'from': start_month, 'watermark': watermark, 'rows': rows}
+
+
+def rebuild(conn):
+    """Full recomputation of client_product_monthly_sales"""
+    ensure_tables(conn)
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM client_product_monthly_sales")
+    conn.commit()
+    cursor.close()
+    result = _aggregate_from(conn, '1900-01')
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Product rollups rebuilt: {result}")
+    return result
+
+
+def refresh(conn, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """
+    Incremental refresh: recompute the months from the one holding the
+    watermark minus `lookback_days`. Builds the table on first use.
+    """
+    ensure_tables(conn)
+    watermark = get_watermark(conn, ROLLUP_NAME)
+    if watermark is None:
+        return rebuild(conn)
+    started = time.perf_counter()
+    result = _aggregate_from(conn, (watermark - timedelta(days=lookback_days)).strftime('%Y-%m'))
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info(f"Product rollups refreshed: {result}")
+    return result
+
+
+# ----------------------------------------------------------------------
+# Readers
+# ----------------------------------------------------------------------
+
+def product_rollups_available(conn):
+    """True once client_product_monthly_sales has been built and is recent (see rollups_available)"""
+    return rollups_available(conn, ROLLUP_NAME)
+
+
+def month_range(date_debut, date_fin):
+    """
+    ('YYYY-MM', 'YYYY-MM') covering exactly [date_debut, date_fin], or None
+    when the period does not start on a first day / end on a last day of month
+    (the monthly rows cannot answer it).
+    """
+    try:
+        start = pd.Timestamp(date_debut)
+        end = pd.Timestamp(date_fin)
+    except (ValueError, TypeError):
+        return None
+    if start.day != 1 or not end.is_month_end or end < start:
+        return None
+    return start.strftime('%Y-%m'), end.strftime('%Y-%m')
+
+
+def load_top_products(conn, client_code, limit=5):
+    """
+    Top products of a client from the rollup.
+
+    Returns:
+        DataFrame: produit_code, produit_nom, total_ventes, image_url, or None
+        when the rollup is not available
+    """
+    if not product_rollups_available(conn):
+        return None
+    params = (str(client_code), int(limit))
+    try:
+        query = TOP_PRODUCTS_QUERY.format(image=", p.image_url", image_group=", p.image_url")
+        return pd.read_sql(query, conn, params=params)
+    except Exception:
+        # The image_url column doesn't exist
+        query = TOP_PRODUCTS_QUERY.format(image="", image_group="")
+        df = pd.read_sql(query, conn, params=params)
+        df['image_url'] = None
+        return df
+
+
+def sales_by_client_query(commercial_code, date_debut, date_fin):
+    """
+    Quantities by client and product of a commercial (get_product_sales_by_client).
+
+    Returns:
+        tuple: (sql, params), or None when the period is not made of whole months
+    """
+    months = month_range(date_debut, date_fin)
+    if months is None:
+        return None
+    return SALES_BY_CLIENT_QUERY, [str(commercial_code), months[0], months[1]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the client_product_monthly_sales rollup")
+    parser.add_argument('command', choices=['refresh', 'rebuild'])
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS,
+                        help="Days re-aggregated before the watermark (refresh only)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    conn = get_db_connection()
+    try:
+        if args.command == 'rebuild':
+            result = rebuild(conn)
+        else:
+            result = refresh(conn, args.lookback_days)
+    finally:
+        conn.close()
+    print(f"{args.command}: {result}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
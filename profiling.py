@@ -0,0 +1,447 @@
+"""
+Profiling Module
+On-demand profile of a single request, for administrators
+
+An administrator adds ?_profile=cprofile (or sample) to any URL, or sends the
+header X-Profile: cprofile|sample, and that one request is profiled:
+
+- cprofile: deterministic profile (cProfile) of the request thread, with
+  call counts and exact cumulative times; a stack sampler runs alongside
+  for the flame graph
+- sample: stack sampler only (every PROFILE_INTERVAL seconds), low
+  overhead, closer to the real timings of numpy / pandas heavy code
+
+Each profile is stored under profiles/<id>/ (PROFILES_DIR): the raw
+profile (request.prof, loadable with pstats or snakeviz), the folded
+stacks (stacks.folded, for flamegraph.pl / speedscope), meta.json and a
+standalone report.html with the top-N cumulative-time table and a flame
+graph. profiles/index.html lists them; the same pages are served at
+/admin/profiles. The response carries X-Profile-Id and X-Profile-Url.
+
+Only the request thread is profiled: work handed to other threads or
+processes (fan_out, parallel_runner) shows up as waiting time.
+"""
+
+import os
+import io
+import re
+import sys
+import json
+import html
+import time
+import shutil
+import pstats
+import cProfile
+import hashlib
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, session, jsonify, send_from_directory, abort
+
+logger = logging.getLogger("Profiling")
+
+PROFILES_DIR = os.environ.get('PROFILES_DIR', 'profiles')
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+MODES = {'1': 'cprofile', 'cprofile': 'cprofile', 'sample': 'sample'}
+
+# Seconds between two stack samples
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+# Profiles kept on disk (oldest removed first)
+MAX_PROFILES = int(os.environ.get('MAX_PROFILES', 200))
+TOP_N = 40
+
+# Frames above the Flask request dispatch (server loop, WSGI plumbing) are dropped
+ROOT_FRAME = 'wsgi_app'
+
+PROFILE_FILES = ('report.html', 'request.prof', 'stacks.folded', 'meta.json')
+
+
+def requested_mode():
+    """Profiling mode asked for by the current request, or None"""
+    value = request.args.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if not value:
+        return None
+    return MODES.get(value.strip().lower())
+
+
+def is_admin():
+    return bool(session.get('is_admin'))
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.stacks[frame_stack(frame)] += 1
+            self.samples += 1
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def frame_stack(frame):
+    """Labels of the frames from the request root to the innermost one"""
+    labels = []
+    while frame is not None:
+        if frame.f_code.co_name == ROOT_FRAME:
+            break
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+# ---------------------------------------------------------------------------
+# Summaries
+# ---------------------------------------------------------------------------
+
+def cprofile_summary(profiler, top_n=TOP_N):
+    """
+    Top functions by cumulative time from a cProfile run.
+
+    Returns:
+        list: dicts with function, calls, tottime, cumtime, percall (cumulative)
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (primitive, calls, tottime, cumtime, _) in stats.stats.items():
+        label = f"{name} ({os.path.basename(filename)}:{line})" if line else name
+        rows.append({'function': label, 'calls': calls if calls == primitive else f"{calls}/{primitive}",
+                     'tottime': tottime, 'cumtime': cumtime, 'percall': cumtime / primitive if primitive else 0.0})
+    rows.sort(key=lambda row: row['cumtime'], reverse=True)
+    return rows[:top_n]
+
+
+def sample_summary(stacks, interval, top_n=TOP_N):
+    """
+    Top functions by sampled time: inclusive (function on the stack) and
+    self (innermost frame) time, estimated as samples x interval.
+    """
+    inclusive, own = Counter(), Counter()
+    for stack, count in stacks.items():
+        for label in set(stack):
+            inclusive[label] += count
+        if stack:
+            own[stack[-1]] += count
+    rows = [{'function': label, 'calls': '-', 'tottime': own[label] * interval, 'cumtime': count * interval,
+             'percall': None} for label, count in inclusive.most_common(top_n)]
+    return rows
+
+
+def folded(stacks):
+    """Stacks in the folded format of flamegraph.pl: 'a;b;c count' per line"""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(stacks.items()) if stack)
+
+
+# ---------------------------------------------------------------------------
+# HTML
+# ---------------------------------------------------------------------------
+
+PAGE_STYLE = """
+body { font-family: -apple-system, Segoe UI, Roboto, sans-serif; margin: 24px; color: #222; }
+h1 { font-size: 20px; } h2 { font-size: 16px; margin-top: 28px; }
+table { border-collapse: collapse; font-size: 13px; }
+th, td { padding: 4px 10px; border-bottom: 1px solid #e4e4e4; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+td.fn { font-family: Menlo, Consolas, monospace; text-align: left; }
+.meta td { text-align: left; }
+.flame { position: relative; font: 11px Menlo, Consolas, monospace; border: 1px solid #ddd; }
+.flame div { position: absolute; height: 17px; line-height: 17px; overflow: hidden; white-space: nowrap;
+             box-sizing: border-box; border-right: 1px solid #fff; padding-left: 3px; cursor: default; }
+.flame div:hover { filter: brightness(0.85); }
+"""
+
+FLAME_ROW_HEIGHT = 18
+# Frames narrower than this share of the total are not drawn
+FLAME_MIN_WIDTH = 0.002
+
+
+def _color(label):
+    digest = hashlib.md5(label.split(' (')[0].encode('utf-8')).digest()
+    return f"hsl({10 + digest[0] % 45}, {70 + digest[1] % 25}%, {58 + digest[2] % 14}%)"
+
+
+def render_flame_graph(stacks):
+    """
+    Flame graph (root at the top) as absolutely positioned divs: no
+    JavaScript or external assets, the report stays a standalone file.
+    """
+    total = sum(stacks.values())
+    if not total:
+        return "<p>No samples: the request was shorter than the sampling interval.</p>"
+
+    tree = {'count': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = tree
+        node['count'] += count
+        for label in stack:
+            node = node['children'].setdefault(label, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    boxes, depth_max = [], 0
+    pending = [(tree['children'], 0.0, 0)]
+    while pending:
+        children, left, depth = pending.pop()
+        for label, node in sorted(children.items()):
+            width = node['count'] / total
+            if width >= FLAME_MIN_WIDTH:
+                depth_max = max(depth_max, depth)
+                title = f"{label}: {node['count']} samples ({width:.1%})"
+                boxes.append(f'<div style="left:{left:.4%};width:{width:.4%};top:{depth * FLAME_ROW_HEIGHT}px;'
+                             f'background:{_color(label)}" title="{html.escape(title)}">'
+                             f'{html.escape(label)}</div>')
+                pending.append((node['children'], left, depth + 1))
+            left += width
+    height = (depth_max + 1) * FLAME_ROW_HEIGHT
+    return f'<div class="flame" style="height:{height}px">{"".join(boxes)}</div>'
+
+
+def render_summary(rows, mode):
+    header = ("<tr><th>Function</th><th>Calls</th><th>Own time (s)</th><th>Cumulative (s)</th>"
+              "<th>Per call (s)</th></tr>")
+    lines = []
+    for row in rows:
+        percall = f"{row['percall']:.6f}" if row['percall'] is not None else '-'
+        lines.append(f"<tr><td class=\"fn\">{html.escape(row['function'])}</td><td>{row['calls']}</td>"
+                     f"<td>{row['tottime']:.4f}</td><td>{row['cumtime']:.4f}</td><td>{percall}</td></tr>")
+    note = "" if mode == 'cprofile' else "<p>Times estimated from the samples.</p>"
+    return f"{note}<table>{header}{''.join(lines)}</table>"
+
+
+def render_report(meta, rows, stacks):
+    details = "".join(f"<tr><td>{html.escape(key)}</td><td>{html.escape(str(value))}</td></tr>"
+                      for key, value in meta.items() if key not in ('id', 'files'))
+    downloads = " · ".join(f'<a href="{name}">{name}</a>' for name in PROFILE_FILES[1:]
+                           if name in meta.get('files', ()))
+    title = f"{meta['method']} {meta['path']}"
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Profile {html.escape(title)}</title><style>{PAGE_STYLE}</style></head>
+<body>
+<p><a href="../index.html">All profiles</a></p>
+<h1>{html.escape(title)}</h1>
+<table class="meta">{details}</table>
+<p>{downloads}</p>
+<h2>Top {len(rows)} by cumulative time</h2>
+{render_summary(rows, meta['mode'])}
+<h2>Flame graph ({sum(stacks.values())} samples every {meta['sample_interval_ms']} ms)</h2>
+{render_flame_graph(stacks)}
+</body></html>
+"""
+
+
+def render_index(profiles):
+    rows = "".join(
+        f"<tr><td><a href=\"{p['id']}/report.html\">{html.escape(p['started_at'])}</a></td>"
+        f"<td class=\"fn\">{html.escape(p['method'])} {html.escape(p['path'])}</td><td>{p['status']}</td>"
+        f"<td>{p['duration_ms']}</td><td>{p['mode']}</td><td>{html.escape(str(p.get('user') or ''))}</td></tr>"
+        for p in profiles)
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Profiles</title><style>{PAGE_STYLE}</style></head>
+<body>
+<h1>Request profiles</h1>
+<p>Add <code>?{PROFILE_PARAM}=cprofile</code> or <code>?{PROFILE_PARAM}=sample</code> to a URL
+(or send <code>{PROFILE_HEADER}: cprofile|sample</code>) while logged in as an administrator.</p>
+<table><tr><th>Started</th><th>Request</th><th>Status</th><th>Duration (ms)</th><th>Mode</th><th>User</th></tr>
+{rows}</table>
+</body></html>
+"""
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+class ProfileStore:
+    """Profiles directory: one sub-directory per profiled request, plus index.html"""
+
+    def __init__(self, directory=PROFILES_DIR, max_profiles=MAX_PROFILES):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.lock = threading.Lock()
+
+    def new_id(self, method, path, mode):
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', path).strip('-')[:60] or 'root'
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        return f"{stamp}_{method.lower()}_{slug}_{mode}"
+
+    def path(self, profile_id, name=None):
+        if not re.fullmatch(r'[\w.-]+', profile_id):
+            raise ValueError(f"Invalid profile id: {profile_id}")
+        directory = os.path.join(self.directory, profile_id)
+        return os.path.join(directory, name) if name else directory
+
+    def save(self, meta, rows, stacks, profiler=None):
+        """Write the profile files and refresh the index; returns the profile id"""
+        directory = self.path(meta['id'])
+        os.makedirs(directory, exist_ok=True)
+        files = ['report.html', 'stacks.folded', 'meta.json']
+        if profiler is not None:
+            profiler.dump_stats(os.path.join(directory, 'request.prof'))
+            files.append('request.prof')
+        meta = dict(meta, files=files)
+        with open(os.path.join(directory, 'stacks.folded'), 'w', encoding='utf-8') as f:
+            f.write(folded(stacks))
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, top=rows), f, indent=2, default=str)
+        with open(os.path.join(directory, 'report.html'), 'w', encoding='utf-8') as f:
+            f.write(render_report(meta, rows, stacks))
+        self.refresh_index()
+        return meta['id']
+
+    def list(self):
+        """Metadata of the stored profiles, newest first"""
+        profiles = []
+        if not os.path.isdir(self.directory):
+            return profiles
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            try:
+                with open(os.path.join(self.directory, name, 'meta.json'), encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta.pop('top', None)
+            profiles.append(meta)
+        return profiles
+
+    def refresh_index(self):
+        with self.lock:
+            profiles = self.list()
+            for old in profiles[self.max_profiles:]:
+                shutil.rmtree(self.path(old['id']), ignore_errors=True)
+            profiles = profiles[:self.max_profiles]
+            tmp_path = os.path.join(self.directory, 'index.html.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(render_index(profiles))
+            os.replace(tmp_path, os.path.join(self.directory, 'index.html'))
+        return profiles
+
+
+# ---------------------------------------------------------------------------
+# Flask integration
+# ---------------------------------------------------------------------------
+
+def init_profiling(app, store=None, is_allowed=is_admin, url_prefix='/admin/profiles'):
+    """
+    Install the profiling hooks and the profile pages on a Flask app.
+
+    Args:
+        app: Flask application
+        store: ProfileStore (default: PROFILES_DIR)
+        is_allowed: Callable telling whether the current user may profile
+            and read the profiles (default: administrators)
+        url_prefix: Route of the index; reports are under <prefix>/<id>/
+
+    Returns:
+        ProfileStore: The store profiles are written to
+    """
+    store = store or ProfileStore()
+
+    @app.before_request
+    def start_profile():
+        mode = requested_mode()
+        if mode is None or request.path.startswith(url_prefix) or not is_allowed():
+            return None
+        profiler = None
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:  # another profiler is active on this thread
+                logger.warning(f"cProfile unavailable, sampling only: {e}")
+                profiler = None
+        sampler = StackSampler(threading.get_ident()).start()
+        g.request_profile = {'mode': mode, 'profiler': profiler, 'sampler': sampler,
+                             'started_at': datetime.now(), 'started': time.perf_counter()}
+        return None
+
+    @app.after_request
+    def finish_profile(response):
+        state = g.pop('request_profile', None)
+        if state is None:
+            return response
+        duration = time.perf_counter() - state['started']
+        profiler = state['profiler']
+        if profiler is not None:
+            profiler.disable()
+        stacks = state['sampler'].stop()
+        try:
+            meta = {
+                'id': store.new_id(request.method, request.path, state['mode']),
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'route': request.url_rule.rule if request.url_rule is not None else None,
+                'status': response.status_code,
+                'mode': state['mode'],
+                'started_at': state['started_at'].strftime('%Y-%m-%d %H:%M:%S'),
+                'duration_ms': round(duration * 1000, 1),
+                'user': session.get('user_login'),
+                'sample_interval_ms': round(state['sampler'].interval * 1000, 2),
+                'samples': state['sampler'].samples,
+            }
+            if profiler is not None:
+                rows = cprofile_summary(profiler)
+            else:
+                rows = sample_summary(stacks, state['sampler'].interval)
+            profile_id = store.save(meta, rows, stacks, profiler)
+        except Exception as e:
+            logger.warning(f"Profile of {request.path} not saved: {e}")
+            return response
+        logger.info(f"Profile of {request.method} {request.path} ({meta['duration_ms']} ms): {profile_id}")
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Url'] = f"{url_prefix}/{profile_id}/report.html"
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # Request that ended without a response (the profile is not saved)
+        state = g.pop('request_profile', None)
+        if state is not None:
+            if state['profiler'] is not None:
+                state['profiler'].disable()
+            state['sampler'].stop()
+
+    @app.route(f"{url_prefix}/", endpoint='profile_index')
+    @app.route(f"{url_prefix}/index.html", endpoint='profile_index_html')
+    def profile_index():
+        if not is_allowed():
+            return jsonify({'error': 'Administrators only'}), 403
+        store.refresh_index()
+        return send_from_directory(os.path.abspath(store.directory), 'index.html')
+
+    @app.route(f"{url_prefix}/<profile_id>/<name>", endpoint='profile_file')
+    def profile_file(profile_id, name):
+        if not is_allowed():
+            return jsonify({'error': 'Administrators only'}), 403
+        if name not in PROFILE_FILES:
+            abort(404)
+        try:
+            directory = store.path(profile_id)
+        except ValueError:
+            abort(404)
+        return send_from_directory(os.path.abspath(directory), name, as_attachment=name == 'request.prof')
+
+    return store
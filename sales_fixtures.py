@@ -0,0 +1,125 @@
+"""
+Sales Fixtures Module
+Small seeded sales databases for the test scripts, on the SQLite stand-in
+
+The test scripts of the rollups, the snapshot, the analytics engine, the
+calendar index and the dashboard context all need a few thousand random
+invoices in the application tables. They get them from here, in a
+sales_repository.SQLiteRepository (same schema and MySQL dialect as the
+application), instead of each keeping its own sqlite3 wrapper:
+
+    repository = sales_database('2024-01-01', 4000, days=60)
+    conn = repository.connect()
+    rebuild(conn)
+    insert_rows(conn, random_invoices('2024-03-01', 300, seed=2, first_code=10000, days=5))
+
+Each client is served by one commercial (1300 + client number modulo the
+number of commercials), as in the sales database. For realistic volumes and
+seasonality, see synthetic_data.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from sales_repository import SQLiteRepository, SQLiteConnection, SQLiteCursor
+
+
+def random_invoices(start, count, seed=1, first_code=0, days=365, commercials=4, clients=100, products=25,
+                    lines_per_invoice=(1, 4), no_lines_every=0, null_amount_every=0):
+    """
+    Random invoices and their lines.
+
+    Args:
+        start: First invoice date
+        count: Number of invoices (codes F<first_code>, F<first_code + 1>, ...)
+        seed: Random seed; the same arguments always give the same rows
+        days: Length of the period the dates are drawn from
+        commercials, clients, products: Number of distinct codes
+        lines_per_invoice: (low, high) bounds of the number of lines, high excluded
+        no_lines_every: Every n-th invoice has no line (0: never)
+        null_amount_every: Every n-th invoice has a NULL net_a_payer (0: never)
+
+    Returns:
+        dict: {'entetecommercials': DataFrame, 'lignecommercials': DataFrame}
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=days, freq='D')
+    invoices, lines = [], []
+    for i in range(first_code, first_code + count):
+        code = f"F{i:06d}"
+        client = int(rng.integers(clients))
+        amount = float(round(rng.gamma(2.0, 100.0), 2))
+        invoices.append((code, str(dates[rng.integers(len(dates))].date()), str(1300 + client % commercials),
+                         f"C{client:03d}", None if null_amount_every and i % null_amount_every == 0 else amount))
+        n_lines = 0 if no_lines_every and i % no_lines_every == 0 else int(rng.integers(*lines_per_invoice))
+        for product in rng.choice(products, min(n_lines, products), replace=False):
+            lines.append((code, f"P{product:02d}", float(rng.integers(1, 10))))
+    return {
+        'entetecommercials': pd.DataFrame(invoices, columns=['code', 'date', 'commercial_code', 'client_code',
+                                                             'net_a_payer']),
+        'lignecommercials': pd.DataFrame(lines, columns=['entetecommercial_code', 'produit_code', 'quantite']),
+    }
+
+
+def reference_tables(clients=100, products=25):
+    """clients and produits rows matching the codes of random_invoices"""
+    return {
+        'clients': pd.DataFrame({'code': [f"C{i:03d}" for i in range(clients)],
+                                 'nom': [f"Client {i}" for i in range(clients)], 'prenom': None}),
+        'produits': pd.DataFrame({'code': [f"P{i:02d}" for i in range(products)],
+                                  'libelle': [f"Produit {i}" for i in range(products)],
+                                  'image_url': [f"/img/P{i:02d}.jpg" for i in range(products)]}),
+    }
+
+
+def sales_database(start, count, seed=1, clients=100, products=25, **options):
+    """
+    In-memory SQLite repository with the application schema, the reference
+    tables and `count` random invoices (options: see random_invoices).
+    """
+    repository = SQLiteRepository()
+    repository.load_fixtures(reference_tables(clients, products))
+    repository.load_fixtures(random_invoices(start, count, seed, clients=clients, products=products, **options))
+    return repository
+
+
+def insert_rows(conn, tables):
+    """Insert {table: DataFrame} rows through a connection (%s placeholders) and commit"""
+    cursor = conn.cursor()
+    for table, df in tables.items():
+        columns = ', '.join(df.columns)
+        placeholders = ', '.join(['%s'] * len(df.columns))
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", list(rows))
+    conn.commit()
+
+
+class RecordingCursor(SQLiteCursor):
+    def __init__(self, cursor, dictionary, connection):
+        super().__init__(cursor, dictionary)
+        self.connection = connection
+
+    def execute(self, query, params=None):
+        time.sleep(self.connection.delay)
+        self.connection.executed.append((query, params))
+        return super().execute(query, params)
+
+
+class RecordingConnection(SQLiteConnection):
+    """
+    Connection to a repository's database recording the queries it runs.
+
+    Args:
+        repository: SQLiteRepository
+        delay: Seconds added to every query (network latency of the database server)
+    """
+
+    def __init__(self, repository, delay=0.0):
+        super().__init__(repository.target, repository.uri)
+        self.delay = delay
+        self.executed = []
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        return RecordingCursor(self.conn.cursor(), dictionary, self)
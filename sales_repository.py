@@ -0,0 +1,472 @@
+"""
+Sales Repository Module
+Data access behind one interface, with a MySQL and an SQLite backend
+
+The application modules used to open MySQL connections with hard-coded
+parameters. They now ask the repository selected by SALES_DB_BACKEND:
+
+- mysql (default): the pfe1 MySQL database; SALES_DB_HOST, SALES_DB_NAME,
+  SALES_DB_USER and SALES_DB_PASSWORD override the usual parameters
+- sqlite: a local SQLite database (SALES_SQLITE_PATH, in memory by default)
+  created with the application tables and seeded from the fixtures of
+  SALES_FIXTURES_DIR (one <table>.csv or <table>.parquet file per table)
+
+SQLite connections accept the SQL written for MySQL: %s placeholders,
+DATE_ADD / DATE_SUB with INTERVAL, NOW(), CURDATE(), DATE_FORMAT, DAY, MONTH,
+YEAR and cursor(dictionary=True). They also have dispose(), so they stand in
+for the SQLAlchemy engine of sarima_delivery_optimization. The pipelines can
+then run (and be benchmarked) without a database server.
+
+    SALES_DB_BACKEND=sqlite SALES_SQLITE_PATH=sales.db python app.py
+    python sales_repository.py seed --fixtures fixtures/ --path sales.db
+"""
+
+import os
+import re
+import sys
+import uuid
+import logging
+import sqlite3
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from chunked_loader import load_dataframe
+
+logger = logging.getLogger("SalesRepository")
+
+MYSQL_CONFIG = {
+    'host': os.environ.get('SALES_DB_HOST', '127.0.0.1'),
+    'database': os.environ.get('SALES_DB_NAME', 'pfe1'),
+    'user': os.environ.get('SALES_DB_USER', 'root'),
+    'password': os.environ.get('SALES_DB_PASSWORD', '')
+}
+
+# Tables of the application, as read by app.py and the optimization modules
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS entetecommercials (
+        code TEXT PRIMARY KEY,
+        date TEXT,
+        commercial_code TEXT,
+        client_code TEXT,
+        net_a_payer REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS lignecommercials (
+        entetecommercial_code TEXT,
+        produit_code TEXT,
+        quantite REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS clients (
+        code TEXT PRIMARY KEY,
+        nom TEXT,
+        prenom TEXT,
+        adresse TEXT,
+        ville TEXT,
+        latitude TEXT,
+        longitude TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS produits (
+        code TEXT PRIMARY KEY,
+        libelle TEXT,
+        prix_ttc REAL,
+        image_url TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        code TEXT,
+        login TEXT,
+        password TEXT,
+        nom TEXT,
+        prenom TEXT,
+        grade TEXT,
+        role_code TEXT,
+        isadmin INTEGER DEFAULT 0,
+        isactif INTEGER DEFAULT 1,
+        latitude TEXT,
+        longitude TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_ec_date ON entetecommercials (date)",
+    "CREATE INDEX IF NOT EXISTS idx_lc_entete ON lignecommercials (entetecommercial_code)",
+]
+
+TABLES = ['entetecommercials', 'lignecommercials', 'clients', 'produits', 'users']
+
+# Invoices and lines, as load_delivery_lines returns them
+INVOICE_LINES_QUERY = """
+SELECT ec.code, ec.date, ec.commercial_code, ec.client_code, ec.net_a_payer,
+       lc.produit_code, lc.quantite as product_quantity
+FROM entetecommercials ec
+LEFT JOIN lignecommercials lc ON ec.code = lc.entetecommercial_code
+"""
+
+INVOICES_QUERY = """
+SELECT code, date, commercial_code, client_code, net_a_payer
+FROM entetecommercials ec
+"""
+
+INVOICE_DTYPES = {'date': 'datetime', 'net_a_payer': 'float', 'product_quantity': 'float'}
+
+
+class SalesRepository(ABC):
+    """Data access interface shared by the MySQL and SQLite backends"""
+
+    dialect = None
+
+    @abstractmethod
+    def connect(self):
+        """DBAPI connection accepting the MySQL SQL of the application (%s placeholders)"""
+
+    @abstractmethod
+    def engine(self):
+        """Object for pandas reads with a dispose() method (SQLAlchemy engine on MySQL)"""
+
+    def read_frame(self, query, params=None, dtypes=None, columns=None):
+        """
+        Run a query on a new connection and return its typed result.
+
+        Args:
+            query: MySQL SQL with %s placeholders
+            params: Query parameters
+            dtypes: Per-column dtype coercion (see chunked_loader.coerce_chunk)
+            columns: Column names of the empty result
+
+        Returns:
+            pd.DataFrame
+        """
+        conn = self.connect()
+        try:
+            return load_dataframe(conn, query, params=params, dtypes=dtypes, columns=columns)
+        finally:
+            conn.close()
+
+    def invoices(self, start=None, end=None, commercial_code=None):
+        """Invoices of a date range (inclusive) and optionally one commercial"""
+        query, params = _filtered(INVOICES_QUERY, start, end, commercial_code)
+        return self.read_frame(query + " ORDER BY ec.date, ec.code", params, INVOICE_DTYPES)
+
+    def invoice_lines(self, start=None, end=None, commercial_code=None):
+        """Invoice lines joined with their invoice (invoices without lines kept)"""
+        query, params = _filtered(INVOICE_LINES_QUERY, start, end, commercial_code)
+        return self.read_frame(query + " ORDER BY ec.date, ec.code", params, INVOICE_DTYPES)
+
+
+def _filtered(query, start, end, commercial_code):
+    conditions, params = [], []
+    if start:
+        conditions.append("ec.date >= %s")
+        params.append(str(start))
+    if end:
+        conditions.append("ec.date < DATE_ADD(%s, INTERVAL 1 DAY)")
+        params.append(str(end))
+    if commercial_code is not None:
+        conditions.append("ec.commercial_code = %s")
+        params.append(str(commercial_code))
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, params
+
+
+class MySQLRepository(SalesRepository):
+    """The pfe1 MySQL database"""
+
+    dialect = 'mysql'
+
+    def __init__(self, config=None):
+        self.config = dict(config or MYSQL_CONFIG)
+
+    def connect(self):
+        import mysql.connector
+        return mysql.connector.connect(**self.config)
+
+    def engine(self):
+        from sqlalchemy import create_engine
+        c = self.config
+        connection_url = f"mysql+mysqlconnector://{c['user']}:{c['password']}@{c['host']}/{c['database']}"
+        return create_engine(connection_url, pool_recycle=3600, pool_pre_ping=True)
+
+
+# ---------------------------------------------------------------------------
+# SQLite: MySQL functions registered as SQL functions
+# ---------------------------------------------------------------------------
+
+_INTERVAL = re.compile(r"INTERVAL\s+(%s|\?|-?\d+)\s+(DAY|WEEK|MONTH|YEAR|HOUR|MINUTE)\b", re.IGNORECASE)
+_UNITS = {'DAY': 'days', 'WEEK': 'weeks', 'MONTH': 'months', 'YEAR': 'years', 'HOUR': 'hours', 'MINUTE': 'minutes'}
+# MySQL DATE_FORMAT specifiers that differ from strftime
+_FORMAT_SPECIFIERS = {'%i': '%M', '%s': '%S', '%M': '%B', '%W': '%A', '%e': '%d'}
+# mysql.connector escapes: a %s placeholder or a literal %%
+_PLACEHOLDER = re.compile(r"%([s%])")
+
+
+def qmark_placeholders(query):
+    """
+    mysql.connector parameter style to qmark, in a single pass: %s becomes ?
+    and %% becomes %, so an escaped '%%s' stays the literal '%s'.
+    """
+    return _PLACEHOLDER.sub(lambda m: '?' if m.group(1) == 's' else '%', query)
+
+
+def translate_sql(query, has_params=True):
+    """
+    Rewrite MySQL SQL for the SQLite connection: ? placeholders and
+    `INTERVAL n UNIT` as the extra arguments of DATE_ADD / DATE_SUB.
+    """
+    sql = _INTERVAL.sub(lambda m: f"{m.group(1)}, '{m.group(2).upper()}'", query)
+    if has_params:
+        sql = qmark_placeholders(sql)
+    return sql
+
+
+def _parse(value):
+    if value is None:
+        return None
+    text = str(value)
+    try:
+        return datetime.fromisoformat(text[:19])
+    except ValueError:
+        return None
+
+
+def _format(date, like):
+    # A DATE stays a DATE, a DATETIME stays a DATETIME (as MySQL does)
+    return date.strftime('%Y-%m-%d' if len(str(like)) <= 10 else '%Y-%m-%d %H:%M:%S')
+
+
+def _date_add(value, amount, unit, sign=1):
+    date = _parse(value)
+    if date is None or amount is None:
+        return None
+    return _format(date + relativedelta(**{_UNITS[unit.upper()]: sign * int(amount)}), value)
+
+
+def strftime_format(fmt):
+    """MySQL DATE_FORMAT format to strftime (%M month name -> %B, %i minutes -> %M, ...)"""
+    return re.sub(r"%[a-zA-Z]", lambda m: _FORMAT_SPECIFIERS.get(m.group(0), m.group(0)), fmt)
+
+
+def _date_format(value, fmt):
+    date = _parse(value)
+    if date is None:
+        return None
+    return date.strftime(strftime_format(fmt))
+
+
+def _date_part(attribute):
+    def part(value):
+        date = _parse(value)
+        return None if date is None else getattr(date, attribute)
+    return part
+
+
+def _register_functions(conn):
+    conn.create_function('NOW', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    conn.create_function('CURDATE', 0, lambda: datetime.now().strftime('%Y-%m-%d'))
+    conn.create_function('DATE_ADD', 3, _date_add, deterministic=True)
+    conn.create_function('DATE_SUB', 3, lambda v, n, u: _date_add(v, n, u, -1), deterministic=True)
+    conn.create_function('DATE_FORMAT', 2, _date_format, deterministic=True)
+    for name, attribute in (('DAY', 'day'), ('MONTH', 'month'), ('YEAR', 'year')):
+        conn.create_function(name, 1, _date_part(attribute), deterministic=True)
+
+
+class SQLiteCursor:
+    """sqlite3 cursor with the mysql.connector calling conventions"""
+
+    def __init__(self, cursor, dictionary=False):
+        self.cursor = cursor
+        self.dictionary = dictionary
+
+    def execute(self, query, params=None):
+        self.cursor.execute(translate_sql(query, params is not None), tuple(params or ()))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self.cursor.executemany(translate_sql(query), [tuple(p) for p in seq_of_params])
+        return self
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return dict(zip([col[0] for col in self.cursor.description], row))
+
+    def fetchone(self):
+        return self._row(self.cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self.cursor.fetchmany(size) if size else self.cursor.fetchmany()
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        return [self._row(row) for row in self.cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """sqlite3 connection with the mysql.connector (and engine.dispose) interface"""
+
+    def __init__(self, target, uri=False):
+        self.conn = sqlite3.connect(target, uri=uri, check_same_thread=False)
+        _register_functions(self.conn)
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        return SQLiteCursor(self.conn.cursor(), dictionary)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self.conn.close()
+
+    # sarima_delivery_optimization disposes of its engine after each read
+    dispose = close
+
+
+class SQLiteRepository(SalesRepository):
+    """
+    SQLite stand-in for the MySQL database.
+
+    Args:
+        path: Database file, or ':memory:' for a private in-memory database
+            shared by the connections of this repository
+        fixtures: Directory of <table>.csv / <table>.parquet files, or dict
+            {table: DataFrame}, loaded when the database is created
+    """
+
+    dialect = 'sqlite'
+
+    def __init__(self, path=':memory:', fixtures=None):
+        self.path = path
+        if path == ':memory:':
+            self.target, self.uri = f"file:sales_{uuid.uuid4().hex}?mode=memory&cache=shared", True
+        else:
+            self.target, self.uri = path, False
+        self.lock = threading.Lock()
+        # Keeps a shared in-memory database alive between connections
+        self.keeper = self.connect()
+        self.create_schema()
+        if fixtures is not None:
+            self.load_fixtures(fixtures)
+
+    def connect(self):
+        return SQLiteConnection(self.target, self.uri)
+
+    def engine(self):
+        return self.connect()
+
+    def create_schema(self):
+        for statement in SQLITE_SCHEMA:
+            self.keeper.conn.execute(statement)
+        self.keeper.commit()
+
+    def load_fixtures(self, fixtures, replace=False):
+        """
+        Append (or, with replace, substitute) the rows of the fixture tables.
+
+        Returns:
+            dict: {table: rows loaded}
+        """
+        if isinstance(fixtures, dict):
+            frames = dict(fixtures)
+        else:
+            frames = {}
+            for table in TABLES:
+                for extension, reader in (('parquet', pd.read_parquet), ('csv', pd.read_csv)):
+                    path = os.path.join(fixtures, f"{table}.{extension}")
+                    if os.path.exists(path):
+                        frames[table] = reader(path, dtype=str) if extension == 'csv' else reader(path)
+                        break
+        loaded = {}
+        with self.lock:
+            for table, df in frames.items():
+                if replace:
+                    self.keeper.conn.execute(f"DELETE FROM {table}")
+                df = df.copy()
+                for column in df.columns:
+                    if pd.api.types.is_datetime64_any_dtype(df[column]):
+                        df[column] = df[column].dt.strftime('%Y-%m-%d %H:%M:%S').str.replace(' 00:00:00', '')
+                df.to_sql(table, self.keeper.conn, if_exists='append', index=False)
+                loaded[table] = len(df)
+            self.keeper.commit()
+        logger.info(f"Fixtures loaded: {loaded}")
+        return loaded
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
+    """Process-wide repository of the backend chosen by SALES_DB_BACKEND"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            backend = os.environ.get('SALES_DB_BACKEND', 'mysql').lower()
+            if backend == 'sqlite':
+                _repository = SQLiteRepository(os.environ.get('SALES_SQLITE_PATH', ':memory:'),
+                                               os.environ.get('SALES_FIXTURES_DIR') or None)
+            elif backend == 'mysql':
+                _repository = MySQLRepository()
+            else:
+                raise ValueError(f"Unknown SALES_DB_BACKEND: {backend}")
+            logger.info(f"Sales repository: {_repository.dialect}")
+        return _repository
+
+
+def set_repository(repository):
+    """Replace the process-wide repository (tests, benchmarks)"""
+    global _repository
+    with _repository_lock:
+        _repository = repository
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite stand-in for the sales database")
+    parser.add_argument('command', choices=['seed'])
+    parser.add_argument('--fixtures', required=True, help="Directory of <table>.csv / <table>.parquet files")
+    parser.add_argument('--path', default=os.environ.get('SALES_SQLITE_PATH', 'sales.db'))
+    parser.add_argument('--replace', action='store_true', help="Empty the tables before loading")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    repository = SQLiteRepository(args.path)
+    print(f"{args.command}: {repository.load_fixtures(args.fixtures, replace=args.replace)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
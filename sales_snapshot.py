@@ -0,0 +1,417 @@
+"""
+Sales Snapshot Module
+Local Parquet copy of the sales history, synchronized incrementally
+
+The SARIMA windows, the delivery history, the exports and the dashboards read
+the same past invoices from MySQL again and again. The snapshot keeps
+entetecommercials and lignecommercials on disk, one Parquet file per month:
+
+    <root>/entetecommercials/month=YYYY-MM/part.parquet
+    <root>/lignecommercials/month=YYYY-MM/part.parquet   (month of the invoice)
+    <root>/_state.json                                     (watermark)
+
+Codes are stored as categorical (dictionary-encoded) columns, dates as
+datetime64 and amounts as float64.
+
+sync() fetches the invoices dated from the watermark minus a lookback (late
+invoices), replaces them by invoice code in the first month and rewrites the
+following months. The loaders read the months of the requested range from the
+snapshot and query MySQL only for the tail after the watermark.
+
+    python sales_snapshot.py sync [--lookback-days 3]
+    python sales_snapshot.py rebuild
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from chunked_loader import load_dataframe
+
+logger = logging.getLogger("SalesSnapshot")
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get('SALES_SNAPSHOT_DIR', os.path.join('snapshots', 'sales'))
+
+# Days re-fetched before the watermark, for invoices entered late
+DEFAULT_LOOKBACK_DAYS = 3
+
+INVOICE_COLUMNS = ['code', 'date', 'commercial_code', 'client_code', 'net_a_payer']
+LINE_COLUMNS = ['entetecommercial_code', 'produit_code', 'quantite']
+
+INVOICE_DTYPES = {
+    'code': 'str',
+    'date': 'datetime',
+    'commercial_code': 'str',
+    'client_code': 'str',
+    'net_a_payer': 'float'
+}
+LINE_DTYPES = {
+    'entetecommercial_code': 'str',
+    'produit_code': 'str',
+    'quantite': 'float',
+    'date': 'datetime'
+}
+CATEGORY_COLUMNS = ['commercial_code', 'client_code', 'produit_code']
+
+INVOICES_QUERY = """
+    SELECT code, date, commercial_code, client_code, net_a_payer
+    FROM entetecommercials
+    WHERE 1=1
+"""
+
+# Lines with the date of their invoice (partitioning and tail filters)
+LINES_QUERY = """
+    SELECT lc.entetecommercial_code, lc.produit_code, lc.quantite, ec.date
+    FROM lignecommercials lc
+    JOIN entetecommercials ec ON lc.entetecommercial_code = ec.code
+    WHERE 1=1
+"""
+
+# Columns returned by load_lines (same as delivery_data.DELIVERY_LINE_COLUMNS)
+JOINED_LINE_COLUMNS = ['code', 'date', 'commercial_code', 'client_code', 'net_a_payer',
+                       'produit_code', 'product_quantity']
+
+
+def _filters(date_column, start=None, end=None, commercial_column=None, commercial_code=None, after=None):
+    """SQL conditions and parameters of a range query"""
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{date_column} >= %s")
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if after is not None:
+        # Whole day of the watermark: invoices added later with the same date are
+        # fetched too (the ones already in the snapshot are de-duplicated by code)
+        conditions.append(f"{date_column} >= %s")
+        params.append(pd.Timestamp(after).strftime('%Y-%m-%d'))
+    if end is not None:
+        conditions.append(f"{date_column} < %s")
+        params.append((pd.Timestamp(end) + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if commercial_code is not None:
+        conditions.append(f"{commercial_column} = %s")
+        params.append(str(commercial_code))
+    return ''.join(f" AND {condition}" for condition in conditions), params
+
+
+def _as_category(df):
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def _as_plain(df):
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object).where(df[col].notna(), None)
+    return df
+
+
+class SalesSnapshot:
+    """Monthly Parquet partitions of the invoices and their lines"""
+
+    def __init__(self, root=None):
+        self.root = root or DEFAULT_SNAPSHOT_DIR
+        self.lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Files and state
+    # ------------------------------------------------------------------
+
+    def _partition(self, table, month):
+        return os.path.join(self.root, table, f"month={month}", 'part.parquet')
+
+    def _state_path(self):
+        return os.path.join(self.root, '_state.json')
+
+    def state(self):
+        """Synchronization state ({'watermark', 'synced_at', ...}), None before the first sync"""
+        try:
+            with open(self._state_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def watermark(self):
+        """Date of the newest synchronized invoice (pd.Timestamp) or None"""
+        state = self.state()
+        if not state or not state.get('watermark'):
+            return None
+        return pd.Timestamp(state['watermark'])
+
+    def available(self):
+        return self.watermark is not None
+
+    def months(self, table='entetecommercials'):
+        """Months ('YYYY-MM') present in the snapshot"""
+        directory = os.path.join(self.root, table)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[len('month='):] for name in os.listdir(directory) if name.startswith('month='))
+
+    def _write(self, table, month, df):
+        path = self._partition(table, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        _as_category(df).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, table, month):
+        path = self._partition(table, month)
+        if not os.path.exists(path):
+            return None
+        return pd.read_parquet(path)
+
+    # ------------------------------------------------------------------
+    # Synchronization
+    # ------------------------------------------------------------------
+
+    def sync(self, conn, lookback_days=DEFAULT_LOOKBACK_DAYS, full=False):
+        """
+        Bring the snapshot up to date.
+
+        Args:
+            conn: MySQL connection (DBAPI or SQLAlchemy engine)
+            lookback_days: Days re-fetched before the watermark
+            full: Re-fetch the whole history
+
+        Returns:
+            dict: from, watermark, invoices, lines, months, seconds
+        """
+        started = time.perf_counter()
+        with self.lock:
+            watermark = None if full else self.watermark
+            start = None if watermark is None else (watermark.normalize() - timedelta(days=lookback_days))
+
+            where, params = _filters('date', start=start)
+            invoices = load_dataframe(conn, INVOICES_QUERY + where, params, dtypes=INVOICE_DTYPES,
+                                      columns=INVOICE_COLUMNS)
+            where, params = _filters('ec.date', start=start)
+            lines = load_dataframe(conn, LINES_QUERY + where, params, dtypes=LINE_DTYPES,
+                                   columns=LINE_COLUMNS + ['date'])
+            if invoices.empty:
+                return {'from': None if start is None else str(start.date()),
+                        'watermark': None if watermark is None else str(watermark),
+                        'invoices': 0, 'lines': 0, 'months': 0,
+                        'seconds': round(time.perf_counter() - started, 3)}
+
+            invoices['date'] = pd.to_datetime(invoices['date'])
+            lines['date'] = pd.to_datetime(lines['date'])
+            invoice_months = invoices['date'].dt.strftime('%Y-%m')
+            line_months = lines['date'].dt.strftime('%Y-%m')
+            first_month = None if start is None else start.strftime('%Y-%m')
+
+            if full:
+                for month in self.months():
+                    for table in ('entetecommercials', 'lignecommercials'):
+                        path = self._partition(table, month)
+                        if os.path.exists(path):
+                            os.remove(path)
+
+            months = sorted(invoice_months.dropna().unique())
+            for month in months:
+                new_invoices = invoices[invoice_months == month][INVOICE_COLUMNS]
+                new_lines = lines[line_months == month][LINE_COLUMNS]
+                if month == first_month:
+                    # Partially re-fetched month: keep the invoices before `start`,
+                    # replacing the ones fetched again (by code)
+                    existing = self._read('entetecommercials', month)
+                    if existing is not None:
+                        kept = existing[(existing['date'] < start) & ~existing['code'].isin(new_invoices['code'])]
+                        new_invoices = pd.concat([_as_plain(kept), new_invoices], ignore_index=True)
+                        existing_lines = self._read('lignecommercials', month)
+                        if existing_lines is not None:
+                            kept_lines = existing_lines[existing_lines['entetecommercial_code'].isin(kept['code'])]
+                            new_lines = pd.concat([_as_plain(kept_lines), new_lines], ignore_index=True)
+                self._write('entetecommercials', month, new_invoices.sort_values('date', kind='stable'))
+                self._write('lignecommercials', month, new_lines.reset_index(drop=True))
+
+            # Capped at now, like the rollups: a future-dated invoice must not move
+            # the watermark (and the start of the next sync) ahead of the present
+            latest = invoices.loc[invoices['date'] <= pd.Timestamp.now(), 'date'].max()
+            if pd.isna(latest):
+                latest = watermark if watermark is not None else invoices['date'].min()
+            state = {
+                'watermark': latest.strftime('%Y-%m-%d %H:%M:%S'),
+                'synced_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'months': len(self.months())
+            }
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self._state_path() + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self._state_path())
+
+        result = {'from': None if start is None else str(start.date()), 'watermark': state['watermark'],
+                  'invoices': len(invoices), 'lines': len(lines), 'months': len(months),
+                  'seconds': round(time.perf_counter() - started, 3)}
+        logger.info(f"Sales snapshot synchronized: {result}")
+        return result
+
+    # ------------------------------------------------------------------
+    # Loaders
+    # ------------------------------------------------------------------
+
+    def _months_between(self, start, end, table):
+        months = self.months(table)
+        if start is not None:
+            months = [m for m in months if m >= pd.Timestamp(start).strftime('%Y-%m')]
+        if end is not None:
+            months = [m for m in months if m <= pd.Timestamp(end).strftime('%Y-%m')]
+        return months
+
+    def _read_range(self, table, start, end):
+        frames = [self._read(table, month) for month in self._months_between(start, end, table)]
+        frames = [frame for frame in frames if frame is not None and not frame.empty]
+        if not frames:
+            return None
+        return pd.concat([_as_plain(frame) for frame in frames], ignore_index=True)
+
+    @staticmethod
+    def _in_range(df, start, end, commercial_code):
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df['date'] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= df['date'] < pd.Timestamp(end) + timedelta(days=1)
+        if commercial_code is not None:
+            mask &= df['commercial_code'] == str(commercial_code)
+        return df[mask]
+
+    @staticmethod
+    def _needs_tail(watermark, end):
+        return watermark is None or end is None or pd.Timestamp(end) + timedelta(days=1) > watermark
+
+    def _load_invoices(self, start_date, end_date, commercial_code, conn, watermark):
+        frames = []
+        snapshot = self._read_range('entetecommercials', start_date, end_date)
+        if snapshot is not None:
+            snapshot = self._in_range(snapshot, start_date, end_date, commercial_code)
+            if watermark is not None:
+                # A sync running concurrently may already have written partitions
+                # newer than the watermark read by this call: those rows come from the tail
+                snapshot = snapshot[snapshot['date'] <= watermark]
+            frames.append(snapshot)
+        if conn is not None and self._needs_tail(watermark, end_date):
+            where, params = _filters('date', start=start_date, end=end_date,
+                                     commercial_column='commercial_code', commercial_code=commercial_code,
+                                     after=watermark)
+            frames.append(load_dataframe(conn, INVOICES_QUERY + where, params, dtypes=INVOICE_DTYPES,
+                                         columns=INVOICE_COLUMNS))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=INVOICE_COLUMNS)
+        df = pd.concat([_as_plain(frame) for frame in frames], ignore_index=True) if len(frames) > 1 \
+            else frames[0].reset_index(drop=True)
+        # The tail starts at the watermark itself: the last fetched version of an invoice wins
+        df = df.drop_duplicates('code', keep='last')
+        df['date'] = pd.to_datetime(df['date'])
+        return df.sort_values('date', kind='stable').reset_index(drop=True)[INVOICE_COLUMNS]
+
+    def load_invoices(self, start_date=None, end_date=None, commercial_code=None, conn=None, categorical=True):
+        """
+        Invoices between two dates (inclusive) of one or all commercials.
+
+        Args:
+            conn: MySQL connection for the invoices from the watermark on
+                (None: snapshot only)
+            categorical: Codes as categories (False: plain strings)
+
+        Returns:
+            pd.DataFrame: INVOICE_COLUMNS ordered by date
+        """
+        # State read once: the snapshot rows and the tail share the same bound
+        df = self._load_invoices(start_date, end_date, commercial_code, conn, self.watermark)
+        return _as_category(df) if categorical else df
+
+    def load_lines(self, start_date=None, end_date=None, commercial_code=None, conn=None, categorical=True):
+        """
+        Invoice lines with their invoice columns (invoices without lines kept),
+        in the shape of delivery_data.load_delivery_lines.
+
+        Returns:
+            pd.DataFrame: JOINED_LINE_COLUMNS ordered by date
+        """
+        watermark = self.watermark
+        invoices = self._load_invoices(start_date, end_date, commercial_code, conn, watermark)
+        if invoices.empty:
+            return pd.DataFrame(columns=JOINED_LINE_COLUMNS)
+        frames = []
+        tail = None
+        if conn is not None and self._needs_tail(watermark, end_date):
+            where, params = _filters('ec.date', start=start_date, end=end_date,
+                                     commercial_column='ec.commercial_code', commercial_code=commercial_code,
+                                     after=watermark)
+            tail = load_dataframe(conn, LINES_QUERY + where, params, dtypes=LINE_DTYPES,
+                                  columns=LINE_COLUMNS + ['date'])[LINE_COLUMNS]
+        snapshot = self._read_range('lignecommercials', start_date, end_date)
+        if snapshot is not None:
+            kept = snapshot['entetecommercial_code'].isin(invoices['code'])
+            if tail is not None:
+                # Invoices present in both keep the lines of the tail only
+                kept &= ~snapshot['entetecommercial_code'].isin(tail['entetecommercial_code'])
+            frames.append(snapshot[kept])
+        if tail is not None:
+            frames.append(tail)
+        frames = [frame for frame in frames if not frame.empty]
+        lines = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LINE_COLUMNS)
+        lines = lines.rename(columns={'entetecommercial_code': 'code', 'quantite': 'product_quantity'})
+        df = invoices.merge(lines, on='code', how='left', sort=False)
+        df = df.sort_values('date', kind='stable').reset_index(drop=True)[JOINED_LINE_COLUMNS]
+        df['product_quantity'] = df['product_quantity'].astype('float64')
+        return _as_category(df) if categorical else df
+
+
+_default_snapshot = None
+
+
+def get_snapshot():
+    """Process-wide snapshot at DEFAULT_SNAPSHOT_DIR"""
+    global _default_snapshot
+    if _default_snapshot is None:
+        _default_snapshot = SalesSnapshot()
+    return _default_snapshot
+
+
+def snapshot_available():
+    """True when the default snapshot has been synchronized (SALES_SNAPSHOT=0 disables it)"""
+    if os.environ.get('SALES_SNAPSHOT', '1') == '0':
+        return False
+    return get_snapshot().available()
+
+
+def sync_if_built(conn, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """Incremental sync of the default snapshot once it has been built (rollup refresher hook)"""
+    if not get_snapshot().available():
+        return None
+    return get_snapshot().sync(conn, lookback_days)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the local Parquet snapshot of the sales history")
+    parser.add_argument('command', choices=['sync', 'rebuild'])
+    parser.add_argument('--lookback-days', type=int, default=DEFAULT_LOOKBACK_DAYS,
+                        help="Days re-fetched before the watermark (sync only)")
+    parser.add_argument('--root', default=None, help=f"Snapshot directory (default: {DEFAULT_SNAPSHOT_DIR})")
+    args = parser.parse_args(argv)
+
+    from daily_rollups import get_db_connection
+    logging.basicConfig(level=logging.INFO)
+    conn = get_db_connection()
+    try:
+        result = SalesSnapshot(args.root).sync(conn, args.lookback_days, full=args.command == 'rebuild')
+    finally:
+        conn.close()
+    print(f"{args.command}: {result}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,28 +1,26 @@
-def get_realistic_clients_for_date(commercial_code, target_date, max_clients=20):
+def get_realistic_clients_for_date(commercial_code, target_date, max_clients=20, calendar_index=None):
     """
     Pour une date future, retourne la liste des clients visités par le commercial
     lors des mêmes jour/mois dans les années précédentes, triés par fréquence (max 20).
+    
+    Args:
+        calendar_index: CalendarIndex déjà construit (évite la requête)
     """
     import logging
+    from calendar_index import candidates_query
     logger = logging.getLogger('realistic_clients')
+    # Extraire jour et mois de la date cible
+    date_obj = pd.to_datetime(target_date)
+    day = date_obj.day
+    month = date_obj.month
+    if calendar_index is not None:
+        ranked = calendar_index.candidates(commercial_code, date_obj, before_year=date_obj.year, limit=max_clients)
+        return [client for client, _ in ranked]
     conn = get_db_connection()
     try:
-        # Extraire jour et mois de la date cible
-        date_obj = pd.to_datetime(target_date)
-        day = date_obj.day
-        month = date_obj.month
-        # Requête pour trouver les clients visités le même jour/mois les années précédentes
-        query = '''
-            SELECT ec.client_code, COUNT(*) as freq
-            FROM entetecommercials ec
-            WHERE ec.commercial_code = %s
-              AND DAY(ec.date) = %s
-              AND MONTH(ec.date) = %s
-              AND YEAR(ec.date) < %s
-            GROUP BY ec.client_code
-            ORDER BY freq DESC
-        '''
-        params = [commercial_code, day, month, date_obj.year]
+        # Clients visités le même jour/mois les années précédentes
+        # (colonne month_day indexée quand la migration a été appliquée)
+        query, params = candidates_query(conn, commercial_code, date_obj)
         df = pd.read_sql(query, conn, params=params)
         if df.empty:
             logger.info(f"Aucun client trouvé pour le {day}/{month} sur les années précédentes pour commercial {commercial_code}")
@@ -46,6 +44,19 @@ import statsmodels.api as sm
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 from statsmodels.graphics.tsaplots import plot_acf, plot_pacf
 from datetime import datetime, timedelta
+from chunked_loader import load_dataframe
+from daily_rollups import rollups_available, daily_stats_query, commercial_summary_query
+from analytics_engine import read_aggregate, analytics_available
+from sales_repository import get_repository
+from metrics import span, model_fit
+
+# Types des colonnes renvoyées par get_historical_deliveries
+HISTORICAL_DELIVERIES_DTYPES = {
+    'date': 'datetime',
+    'nombre_livraisons': 'int',
+    'nb_clients_visites': 'int',
+    'valeur_totale': 'float'
+}
 
 # Connexion à la base de données
 def get_db_connection():
@@ -57,12 +68,11 @@ def get_db_connection():
     import logging
     logger = logging.getLogger('database')
     
-    db_config = {
-        'host': '127.0.0.1',
-        'database': 'pfe1',
-        'user': 'root',
-        'password': ''
-    }
+    repository = get_repository()
+    if repository.dialect != 'mysql':
+        # Base SQLite locale (SALES_DB_BACKEND=sqlite) : connexion lisible par pandas, avec dispose()
+        return repository.engine()
+    db_config = repository.config
     
     try:
         # Configuration de la connexion à la base de données
@@ -90,13 +100,14 @@ def get_db_connection():
         raise e
 
 # Récupérer les données historiques des livraisons par commercial
-def get_historical_deliveries(date_debut='2023-01-01', date_fin='2024-12-31'):
+def get_historical_deliveries(date_debut='2023-01-01', date_fin='2024-12-31', commercial_code=None):
     """
     Récupère les données historiques des livraisons avec gestion des erreurs avancée
     
     Args:
         date_debut: Date de début pour la récupération des données (format YYYY-MM-DD)
         date_fin: Date de fin pour la récupération des données (format YYYY-MM-DD)
+        commercial_code: Limiter la requête à un commercial (None = tous les commerciaux)
     
     Returns:
     df: DataFrame avec les données historiques
@@ -106,28 +117,49 @@ def get_historical_deliveries(date_debut='2023-01-01', date_fin='2024-12-31'):
     logger.info(f"Récupération des données historiques du {date_debut} au {date_fin}")
     
     try:
-        # Optimiser la requête en utilisant des paramètres préparés pour éviter les injections SQL
-        query = """
-        SELECT 
-            ec.date,
-            ec.commercial_code,
-            COUNT(ec.code) AS nombre_livraisons,
-            COUNT(DISTINCT ec.client_code) AS nb_clients_visites,
-            SUM(ec.net_a_payer) AS valeur_totale
-        FROM entetecommercials ec
-        WHERE ec.date BETWEEN %s AND %s
-        GROUP BY ec.date, ec.commercial_code
-        ORDER BY ec.date, ec.commercial_code
-        """
-        
         conn = get_db_connection()
         
-        # Exécuter la requête avec des paramètres pour éviter les injections SQL
-        df = pd.read_sql(query, conn, params=(date_debut, date_fin))
-        conn.dispose()
+        use_rollups = rollups_available(conn)
+        if use_rollups:
+            # Agrégats journaliers matérialisés (commercial_daily_stats)
+            query, params = daily_stats_query({
+                'date': 'stat_date',
+                'commercial_code': 'commercial_code',
+                'nombre_livraisons': 'invoice_count',
+                'nb_clients_visites': 'visits',
+                'valeur_totale': 'revenue'
+            }, date_debut, date_fin, commercial_code)
+        else:
+            # Optimiser la requête en utilisant des paramètres préparés pour éviter les injections SQL
+            query = """
+            SELECT 
+                ec.date,
+                ec.commercial_code,
+                COUNT(ec.code) AS nombre_livraisons,
+                COUNT(DISTINCT ec.client_code) AS nb_clients_visites,
+                SUM(ec.net_a_payer) AS valeur_totale
+            FROM entetecommercials ec
+            WHERE ec.date BETWEEN %s AND %s
+            """
+            params = [date_debut, date_fin]
+            if commercial_code is not None:
+                query += " AND ec.commercial_code = %s"
+                params.append(commercial_code)
+            query += """
+            GROUP BY ec.date, ec.commercial_code
+            ORDER BY ec.date, ec.commercial_code
+            """
         
-        # Convertir la date en format datetime
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        columns = ['date', 'commercial_code', 'nombre_livraisons', 'nb_clients_visites', 'valeur_totale']
+        if not use_rollups and analytics_available():
+            # Agrégation brute sur l'historique : calculée par DuckDB sur l'instantané Parquet local
+            with span('db_fetch'):
+                df = read_aggregate(query, params, conn, dtypes=HISTORICAL_DELIVERIES_DTYPES, columns=columns)
+        else:
+            # Lecture par blocs via un curseur côté serveur, types convertis bloc par bloc
+            with span('db_fetch'):
+                df = load_dataframe(conn, query, params=params, dtypes=HISTORICAL_DELIVERIES_DTYPES, columns=columns)
+        conn.dispose()
         
         # Supprimer les lignes avec des dates invalides
         invalid_dates = df['date'].isna().sum()
@@ -533,7 +565,8 @@ def identify_sarima_parameters(time_series, seasonal_period=52, business_constra
                              seasonal_order=seasonal_param,
                              enforce_stationarity=False,
                              enforce_invertibility=False)
-                results = mod.fit(disp=False, maxiter=200)
+                with model_fit('sarimax'):
+                    results = mod.fit(disp=False, maxiter=200)
                 
                 # Multiple validation metrics
                 metrics = {
@@ -564,7 +597,8 @@ def identify_sarima_parameters(time_series, seasonal_period=52, business_constra
                                        seasonal_order=seasonal_param,
                                        enforce_stationarity=False,
                                        enforce_invertibility=False)
-                        cv_results = cv_mod.fit(disp=False, maxiter=100)
+                        with model_fit('sarimax'):
+                            cv_results = cv_mod.fit(disp=False, maxiter=100)
                         
                         # Predictions on test set
                         pred = cv_results.get_forecast(steps=len(test))
@@ -778,7 +812,8 @@ def fit_sarima_and_predict(time_series, params, forecast_steps=12, prediction_ty
     )
     
     # Augmenter le nombre maximum d'itérations pour une meilleure convergence
-    results = model.fit(disp=False, maxiter=500)
+    with model_fit('sarimax'):
+        results = model.fit(disp=False, maxiter=500)
     
     # Résumé du modèle
     logger.info("Modèle SARIMA ajusté avec succès")
@@ -987,7 +1022,7 @@ def run_sarima_analysis(commercial_code, metric='nombre_livraisons', frequency='
     current_date = datetime.now()
     date_debut = (current_date - timedelta(days=365*3)).strftime('%Y-%m-%d')
     date_fin = current_date.strftime('%Y-%m-%d')
-    historical_data = get_historical_deliveries(date_debut, date_fin)
+    historical_data = get_historical_deliveries(date_debut, date_fin, commercial_code=commercial_code)
     
     if historical_data.empty:
         logger.error("Aucune donnée trouvée")
@@ -1213,30 +1248,40 @@ def get_commercial_visits(date_debut=None, date_fin=None, commercial_code=None):
     Récupérer les visites journalières des commerciaux
     """
     conn = get_db_connection()
-    query = """
-    SELECT 
-        ec.date,
-        ec.commercial_code,
-        COUNT(DISTINCT ec.client_code) as nombre_visites,
-        COUNT(DISTINCT lc.produit_code) as nombre_produits_vendus,
-        SUM(ec.net_a_payer) as chiffre_affaires
-    FROM entetecommercials ec
-    LEFT JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
-    WHERE 1=1
-    """
-    params = []
-    if date_debut:
-        query += " AND ec.date >= %s"
-        params.append(date_debut)
-    if date_fin:
-        query += " AND ec.date <= %s"
-        params.append(date_fin)
-    if commercial_code:
-        query += " AND ec.commercial_code = %s"
-        params.append(commercial_code)
-    query += " GROUP BY ec.date, ec.commercial_code ORDER BY ec.date"
+    if rollups_available(conn):
+        # Agrégats journaliers matérialisés (commercial_daily_stats)
+        query, params = daily_stats_query({
+            'date': 'stat_date',
+            'commercial_code': 'commercial_code',
+            'nombre_visites': 'visits',
+            'nombre_produits_vendus': 'products_sold',
+            'chiffre_affaires': 'revenue'
+        }, date_debut, date_fin, commercial_code or None)
+    else:
+        query = """
+        SELECT 
+            ec.date,
+            ec.commercial_code,
+            COUNT(DISTINCT ec.client_code) as nombre_visites,
+            COUNT(DISTINCT lc.produit_code) as nombre_produits_vendus,
+            SUM(ec.net_a_payer) as chiffre_affaires
+        FROM entetecommercials ec
+        LEFT JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+        WHERE 1=1
+        """
+        params = []
+        if date_debut:
+            query += " AND ec.date >= %s"
+            params.append(date_debut)
+        if date_fin:
+            query += " AND ec.date <= %s"
+            params.append(date_fin)
+        if commercial_code:
+            query += " AND ec.commercial_code = %s"
+            params.append(commercial_code)
+        query += " GROUP BY ec.date, ec.commercial_code ORDER BY ec.date"
     df = pd.read_sql(query, conn, params=params)
-    conn.close()
+    conn.dispose()
     df['date'] = pd.to_datetime(df['date'])
     return df
 
@@ -1251,7 +1296,8 @@ def train_sarima_model(data):
         enforce_stationarity=False,
         enforce_invertibility=False
     )
-    fitted_model = model.fit(disp=False)
+    with model_fit('sarimax'):
+        fitted_model = model.fit(disp=False)
     return fitted_model
 
 def predict_future_visits_sarima(historical_data, days_to_predict=730):  # 2 ans
@@ -2692,7 +2738,19 @@ def get_commercial_list(reference_date=None):
     try:
         conn = get_db_connection()
         
-        if reference_date:
+        if rollups_available(conn):
+            # Totaux par commercial depuis les agrégats matérialisés
+            if reference_date:
+                if isinstance(reference_date, str):
+                    reference_date = datetime.strptime(reference_date, '%Y-%m-%d')
+                query, params = commercial_summary_query(
+                    (reference_date - timedelta(days=365)).strftime('%Y-%m-%d'),
+                    reference_date.strftime('%Y-%m-%d')
+                )
+            else:
+                query, params = commercial_summary_query()
+            df = pd.read_sql(query, conn, params=tuple(params))
+        elif reference_date:
             # If reference date provided, filter for commercials with data in training period
             if isinstance(reference_date, str):
                 reference_date = datetime.strptime(reference_date, '%Y-%m-%d')
@@ -2715,12 +2773,13 @@ def get_commercial_list(reference_date=None):
             ORDER BY training_period_records DESC, total_records DESC
             """
             
-            df = pd.read_sql(query, conn, params=(
+            # Agrégation sur tout l'historique : DuckDB sur l'instantané local si disponible
+            df = read_aggregate(query, (
                 training_start.strftime('%Y-%m-%d'),
                 training_end.strftime('%Y-%m-%d'),
                 training_start.strftime('%Y-%m-%d'),
                 training_end.strftime('%Y-%m-%d')
-            ))
+            ), conn)
         else:
             # Original query for all-time data
             query = """
@@ -2737,7 +2796,7 @@ def get_commercial_list(reference_date=None):
             ORDER BY total_records DESC
             """
             
-            df = pd.read_sql(query, conn)
+            df = read_aggregate(query, None, conn)
         
         conn.dispose()
         
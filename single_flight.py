@@ -0,0 +1,182 @@
+"""
+Single Flight Module
+Request coalescing for expensive, identical computations
+
+While a computation for a given key is running, later callers with the same
+key wait for its result instead of starting their own. Within a process this
+uses an in-flight table guarded by a lock; with a lock directory it also works
+across worker processes (gunicorn, several Flask instances) through file locks,
+the leader publishing its result in a file the followers read.
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+logger = logging.getLogger("SingleFlight")
+
+# Seconds a published result stays usable by followers of other processes
+RESULT_TTL = 60
+
+
+def normalize_key(name, **params):
+    """
+    Build a stable key from a computation name and its parameters.
+
+    Strings are stripped, dates/datetimes become ISO strings, lists/sets are
+    sorted, and parameters are ordered by name, so equivalent requests share a key.
+    """
+    def normalize(value):
+        if isinstance(value, str):
+            return value.strip()
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sorted((normalize(v) for v in value), key=str)
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    normalized = {k: normalize(v) for k, v in params.items()}
+    return f"{name}:{json.dumps(normalized, sort_keys=True, default=str)}"
+
+
+class _Call:
+    """One in-flight computation"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key"""
+
+    def __init__(self, lock_dir=None, result_ttl=RESULT_TTL):
+        """
+        Args:
+            lock_dir: Directory for cross-process lock and result files
+                (None: coalescing within this process only)
+            result_ttl: Seconds a result published by another process is reused
+        """
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.result_ttl = result_ttl
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if lock_dir and fcntl is None:
+            logger.warning("fcntl unavailable: cross-process single flight disabled")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.stats = {'leaders': 0, 'followers': 0, 'cross_process_hits': 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless an identical computation is in flight.
+
+        Returns:
+            tuple: (result, shared) where shared is True when the result came
+            from another caller's computation
+
+        Raises:
+            Whatever fn raised, for the leader and for every waiting follower
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self.stats['followers'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self.calls[key] = call
+                self.stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            logger.info(f"Waiting for in-flight computation {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            if self.lock_dir:
+                call.result, shared = self._run_cross_process(key, fn, args, kwargs)
+            else:
+                call.result, shared = fn(*args, **kwargs), False
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    # ------------------------------------------------------------------
+    # Cross-process mode
+    # ------------------------------------------------------------------
+
+    def _paths(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return (os.path.join(self.lock_dir, f"{digest}.lock"),
+                os.path.join(self.lock_dir, f"{digest}.result"))
+
+    def _read_result(self, result_path, not_before):
+        """Result published by another process after `not_before` (epoch seconds)"""
+        try:
+            with open(result_path, 'rb') as f:
+                published_at, result = pickle.load(f)
+        except (OSError, EOFError, pickle.PickleError):
+            return False, None
+        if published_at < not_before or time.time() - published_at > self.result_ttl:
+            return False, None
+        return True, result
+
+    def _publish_result(self, result_path, result):
+        fd, tmp_path = tempfile.mkstemp(dir=self.lock_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((time.time(), result), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, result_path)
+        except Exception as e:
+            logger.warning(f"Could not publish single-flight result: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _run_cross_process(self, key, fn, args, kwargs):
+        lock_path, result_path = self._paths(key)
+        arrived_at = time.time()
+        with open(lock_path, 'a+') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is computing: wait for it, then use its result
+                logger.info(f"Waiting for computation {key} in another process")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                found, result = self._read_result(result_path, arrived_at)
+                if found:
+                    self.stats['cross_process_hits'] += 1
+                    return result, True
+                # The other process failed: compute here (still holding the lock)
+            try:
+                result = fn(*args, **kwargs)
+                self._publish_result(result_path, result)
+                return result, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
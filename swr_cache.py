@@ -0,0 +1,203 @@
+"""
+Stale-While-Revalidate Cache Module
+In-memory result cache for the dashboard and KPI endpoints
+
+- fresh entries are served directly
+- after `fresh_ttl`, the last good result is still served immediately and a
+  single background refresh is started
+- when the data version changes (new invoices), entries are refreshed the same way
+- when a refresh fails (MySQL slow or down), the previous result keeps being
+  served, flagged as stale, up to `max_stale` seconds
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from fast_json import fast_jsonify
+
+logger = logging.getLogger("SWRCache")
+
+# Seconds during which a result is served without refreshing it
+FRESH_TTL = 300
+
+# Seconds after which a result is too old to be served without recomputing
+# (unless the recomputation fails)
+MAX_STALE = 24 * 3600
+
+MAX_ENTRIES = 512
+
+# Seconds between two refresh attempts after a failed one
+RETRY_DELAY = 10
+
+
+class _Entry:
+    __slots__ = ('value', 'stored_at', 'version', 'refreshing', 'last_error', 'failed_at')
+
+    def __init__(self, value, version):
+        self.value = value
+        self.stored_at = time.monotonic()
+        self.version = version
+        self.refreshing = False
+        self.last_error = None
+        self.failed_at = None
+
+
+class SWRCache:
+    """Stale-while-revalidate cache with background refresh"""
+
+    def __init__(self, fresh_ttl=FRESH_TTL, max_stale=MAX_STALE, max_entries=MAX_ENTRIES,
+                 version=None, retry_delay=RETRY_DELAY):
+        """
+        Args:
+            fresh_ttl: Seconds a result is fresh
+            max_stale: Seconds a result may be served while refreshing in the background
+            max_entries: Maximum number of cached results (least recently used evicted)
+            version: Optional callable returning the current data version
+                (e.g. DataWatermark.get); None means unknown and never invalidates
+            retry_delay: Seconds between refresh attempts while the database fails
+        """
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.version = version
+        self.retry_delay = retry_delay
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0}
+
+    def _current_version(self):
+        if self.version is None:
+            return None
+        try:
+            return self.version()
+        except Exception as e:
+            logger.warning(f"Data version unavailable: {e}")
+            return None
+
+    def _store(self, key, value, version):
+        with self.lock:
+            self.entries[key] = _Entry(value, version)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _refresh(self, key, loader, version):
+        try:
+            value = loader()
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed, serving stale data: {e}")
+            with self.lock:
+                self.stats['refresh_errors'] += 1
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.refreshing = False
+                    entry.last_error = str(e)
+                    entry.failed_at = time.monotonic()
+            return
+        self._store(key, value, version)
+        with self.lock:
+            self.stats['refreshes'] += 1
+
+    def _start_refresh(self, key, loader, version):
+        """Start a background refresh unless one is already running for this key"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.refreshing:
+                return
+            if entry.failed_at is not None and time.monotonic() - entry.failed_at < self.retry_delay:
+                return
+            entry.refreshing = True
+        threading.Thread(target=self._refresh, args=(key, loader, version),
+                         name=f"swr-refresh-{key}", daemon=True).start()
+
+    def get(self, key, loader):
+        """
+        Cached result for key, computed with loader() when missing.
+
+        Args:
+            key: Cache key (include every parameter the result depends on)
+            loader: Callable computing the result
+
+        Returns:
+            tuple: (value, info) with info = {'status': 'hit'|'stale'|'miss',
+                   'stale': bool, 'age': seconds, 'error': last refresh error or None}
+
+        Raises:
+            Whatever loader raised when nothing can be served
+        """
+        version = self._current_version()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None:
+            with self.lock:
+                self.stats['misses'] += 1
+            value = loader()
+            self._store(key, value, version)
+            return value, {'status': 'miss', 'stale': False, 'age': 0, 'error': None}
+
+        age = time.monotonic() - entry.stored_at
+        outdated = version is not None and entry.version is not None and version != entry.version
+        if age <= self.fresh_ttl and not outdated and entry.last_error is None:
+            with self.lock:
+                self.stats['hits'] += 1
+            return entry.value, {'status': 'hit', 'stale': False, 'age': int(age), 'error': None}
+
+        retry_due = entry.failed_at is None or time.monotonic() - entry.failed_at >= self.retry_delay
+        if age > self.max_stale and not entry.refreshing and retry_due:
+            # Too old to be served while refreshing: recompute now, stale data as a last resort
+            try:
+                value = loader()
+            except Exception as e:
+                logger.warning(f"Recomputing {key} failed, serving data aged {int(age)}s: {e}")
+                entry.last_error = str(e)
+                entry.failed_at = time.monotonic()
+            else:
+                self._store(key, value, version)
+                with self.lock:
+                    self.stats['misses'] += 1
+                return value, {'status': 'miss', 'stale': False, 'age': 0, 'error': None}
+        else:
+            self._start_refresh(key, loader, version)
+
+        with self.lock:
+            self.stats['stale_hits'] += 1
+        return entry.value, {'status': 'stale', 'stale': True, 'age': int(age), 'error': entry.last_error}
+
+    def invalidate(self, prefix=None):
+        """Drop every entry, or the entries whose key starts with prefix"""
+        with self.lock:
+            if prefix is None:
+                self.entries.clear()
+            else:
+                for key in [k for k in self.entries if k.startswith(prefix)]:
+                    del self.entries[key]
+
+
+def swr_jsonify(value, info, status=200):
+    """
+    JSON response for a result returned by SWRCache.get, with its freshness exposed.
+
+    Headers: X-Cache (HIT/STALE/MISS), Age, and Warning: 110 when stale.
+    Dict payloads also get a 'stale' field so the dashboards can show it.
+    """
+    if isinstance(value, dict):
+        value = dict(value, stale=info['stale'])
+        if info['stale']:
+            value['data_age_seconds'] = info['age']
+    response = fast_jsonify(value, status=status)
+    response.headers['X-Cache'] = info['status'].upper()
+    response.headers['Age'] = str(info['age'])
+    if info['stale']:
+        response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
+
+
+def cached_jsonify(cache, key, loader, status=200):
+    """cache.get(key, loader) rendered by swr_jsonify"""
+    value, info = cache.get(key, loader)
+    return swr_jsonify(value, info, status=status)
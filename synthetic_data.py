@@ -0,0 +1,369 @@
+"""
+Synthetic Data Module
+Seeded generator of large sales histories for load and scaling experiments
+
+The sample data of fixed_delivery_optimization (a few clients, weekly visits)
+cannot reproduce the volumes of production. This generator produces the
+tables of the sales database at a configurable scale factor:
+
+- users (the commercials), clients, produits (catalogue and price list)
+- entetecommercials and lignecommercials, generated month by month
+
+Scale factor 1 is about 20 commercials, 2,000 clients, 300 products and
+200,000 invoice lines over two years; scale 10 gives 200 commercials,
+20,000 clients and about two million lines.
+
+The histories have:
+- weekly seasonality (route day of each client, quiet Saturdays, almost no
+  Sundays), a start-of-month peak and a yearly cycle
+- a Ramadan-like month, moving 11 days earlier each year, with fewer visits,
+  bigger baskets and a peak before the Eid
+- intermittent clients: each client has its own purchase rate and
+  alternates between active and dormant months
+- clients clustered around Tunisian cities, served by the commercials of
+  their city
+
+The same seed always gives the same data. The output goes to the SQLite
+stand-in (sales_repository) or to Parquet files, one per table, which can be
+used as SALES_FIXTURES_DIR:
+
+    python synthetic_data.py --scale 10 --parquet fixtures/large
+    python synthetic_data.py --scale 1 --sqlite sales.db
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("SyntheticData")
+
+# Size of scale factor 1
+SCALE_UNIT = {'commercials': 20, 'clients': 2000, 'products': 300}
+
+# (city, latitude, longitude, weight)
+CITIES = [
+    ('Tunis', 36.8065, 10.1815, 0.20),
+    ('Ariana', 36.8625, 10.1956, 0.09),
+    ('Ben Arous', 36.7531, 10.2189, 0.08),
+    ('Sfax', 34.7406, 10.7603, 0.13),
+    ('Sousse', 35.8256, 10.6084, 0.10),
+    ('Nabeul', 36.4561, 10.7376, 0.07),
+    ('Bizerte', 37.2744, 9.8739, 0.06),
+    ('Kairouan', 35.6781, 10.0963, 0.06),
+    ('Monastir', 35.7643, 10.8113, 0.06),
+    ('Gabès', 33.8815, 10.0982, 0.05),
+    ('Gafsa', 34.4250, 8.7842, 0.05),
+    ('Médenine', 33.3549, 10.5055, 0.05),
+]
+# Spread of the clients around the city centre (degrees)
+CITY_SPREAD = 0.035
+
+# (category, median price TND, mean quantity per line)
+CATEGORIES = [
+    ('Biscuit', 1.2, 12), ('Gaufrette', 0.8, 15), ('Chocolat', 2.5, 8), ('Confiserie', 0.5, 20),
+    ('Gâteau', 1.8, 10), ('Chips', 1.0, 12), ('Boisson', 1.5, 18), ('Céréales', 4.5, 4),
+]
+
+# Visit intensity per weekday (Monday first)
+WEEKDAY_WEIGHTS = np.array([1.10, 1.05, 1.00, 1.00, 0.95, 0.60, 0.05])
+# Weight of a visit on the client's route day and on the other days
+ROUTE_DAY_BOOST = 3.0
+OFF_ROUTE_WEIGHT = 0.35
+
+# First day of a Ramadan-like month, moving by one lunar year (354.37 days)
+RAMADAN_ANCHOR = pd.Timestamp('2023-03-23')
+LUNAR_YEAR_DAYS = 354.37
+RAMADAN_VISITS = 0.85
+RAMADAN_BASKET = 1.35
+EID_PEAK = 1.6
+
+# Monthly probability of an active client becoming dormant, and back
+DORMANT_PROBABILITY = 0.06
+REACTIVATION_PROBABILITY = 0.35
+
+MAX_LINES_PER_INVOICE = 15
+
+
+def ramadan_starts(start, end):
+    """First days of the Ramadan-like months overlapping [start, end]"""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    first = int(np.floor((start - RAMADAN_ANCHOR).days / LUNAR_YEAR_DAYS)) - 1
+    last = int(np.ceil((end - RAMADAN_ANCHOR).days / LUNAR_YEAR_DAYS)) + 1
+    starts = [(RAMADAN_ANCHOR + pd.Timedelta(days=round(k * LUNAR_YEAR_DAYS))).normalize()
+              for k in range(first, last + 1)]
+    return [s for s in starts if s + pd.Timedelta(days=30) > start and s <= end]
+
+
+def daily_seasonality(dates):
+    """
+    Visit and basket multipliers of each day.
+
+    Returns:
+        tuple: (visits, basket) arrays aligned with `dates`
+    """
+    dates = pd.DatetimeIndex(dates)
+    # Payday peak at the start of the month, summer and year-end highs
+    monthly = 1.0 + 0.25 * np.exp(-(dates.day.to_numpy() - 1) / 4.0)
+    yearly = 1.0 + 0.12 * np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 200) / 365.25)
+    visits = WEEKDAY_WEIGHTS[dates.weekday] * monthly * yearly
+    basket = np.ones(len(dates))
+    if len(dates):
+        for ramadan in ramadan_starts(dates.min(), dates.max()):
+            offset = (dates - ramadan).days.to_numpy()
+            during = (offset >= 0) & (offset < 30)
+            visits = np.where(during, visits * RAMADAN_VISITS, visits)
+            basket = np.where(during, RAMADAN_BASKET, basket)
+            # Last days before the Eid
+            basket = np.where((offset >= 25) & (offset < 30), RAMADAN_BASKET * EID_PEAK, basket)
+    return visits, basket
+
+
+class SyntheticSalesGenerator:
+    """
+    Seeded generator of the sales tables.
+
+    Args:
+        scale: Scale factor (1 = SCALE_UNIT entities)
+        seed: Random seed; the same seed gives the same tables
+        start, end: Period of the invoices
+        visits_per_week: Mean purchase rate of an active client
+        lines_per_invoice: Mean number of lines of an invoice
+    """
+
+    def __init__(self, scale=1.0, seed=42, start='2023-01-01', end='2024-12-31',
+                 visits_per_week=0.6, lines_per_invoice=3.0):
+        self.scale = scale
+        self.seed = seed
+        self.start = pd.Timestamp(start)
+        self.end = pd.Timestamp(end)
+        self.visits_per_week = visits_per_week
+        self.lines_per_invoice = lines_per_invoice
+        self.n_commercials = max(1, int(round(SCALE_UNIT['commercials'] * scale)))
+        self.n_clients = max(1, int(round(SCALE_UNIT['clients'] * scale)))
+        # The catalogue grows slower than the client base
+        self.n_products = max(10, int(round(SCALE_UNIT['products'] * max(scale, 1.0) ** 0.5)))
+        self._build_entities()
+
+    # ------------------------------------------------------------------
+    # Reference tables
+    # ------------------------------------------------------------------
+
+    def _build_entities(self):
+        rng = np.random.default_rng([self.seed, 0])
+        weights = np.array([c[3] for c in CITIES])
+        weights = weights / weights.sum()
+
+        # Commercials: at least one per city while there are enough of them
+        cities = list(range(min(len(CITIES), self.n_commercials)))
+        cities += list(rng.choice(len(CITIES), self.n_commercials - len(cities), p=weights))
+        self.commercial_cities = np.array(cities)
+        self.commercial_codes = np.array([str(1300 + i) for i in range(self.n_commercials)])
+
+        # Clients: in the cities that have commercials, served by one of them
+        served = np.unique(self.commercial_cities)
+        client_weights = weights[served] / weights[served].sum()
+        self.client_cities = served[rng.choice(len(served), self.n_clients, p=client_weights)]
+        self.client_commercial = np.empty(self.n_clients, dtype=int)
+        for city in served:
+            clients = np.flatnonzero(self.client_cities == city)
+            commercials = np.flatnonzero(self.commercial_cities == city)
+            self.client_commercial[clients] = commercials[rng.integers(len(commercials), size=len(clients))]
+        self.client_codes = np.array([f"C{i:06d}" for i in range(self.n_clients)])
+        centres = np.array([(c[1], c[2]) for c in CITIES])
+        self.client_coordinates = centres[self.client_cities] + rng.normal(0, CITY_SPREAD, (self.n_clients, 2))
+
+        # Purchase behaviour: skewed rates (many occasional buyers), a route day, basket size
+        self.client_rate = rng.gamma(0.9, self.visits_per_week / 0.9, self.n_clients) / 7.0
+        self.client_route_day = rng.integers(0, 6, self.n_clients)
+        self.client_basket = rng.gamma(3.0, (self.lines_per_invoice - 1) / 3.0, self.n_clients)
+
+        # Catalogue: log-normal prices around the category median, Zipf popularity
+        self.product_categories = rng.integers(len(CATEGORIES), size=self.n_products)
+        medians = np.array([c[1] for c in CATEGORIES])[self.product_categories]
+        self.product_prices = np.round(medians * rng.lognormal(0.0, 0.35, self.n_products), 3)
+        self.product_quantity = np.array([c[2] for c in CATEGORIES], dtype=float)[self.product_categories]
+        popularity = 1.0 / np.arange(1, self.n_products + 1) ** 1.1
+        self.product_popularity = rng.permutation(popularity / popularity.sum())
+        self.product_codes = np.array([f"KC{i:06d}" for i in range(self.n_products)])
+
+    def users(self):
+        """The commercials, as rows of the users table"""
+        centres = np.array([(c[1], c[2]) for c in CITIES])[self.commercial_cities]
+        return pd.DataFrame({
+            'id': np.arange(1, self.n_commercials + 1),
+            'code': self.commercial_codes,
+            'login': [f"com{code}" for code in self.commercial_codes],
+            'password': 'password',
+            'nom': [f"Commercial {code}" for code in self.commercial_codes],
+            'prenom': [CITIES[c][0] for c in self.commercial_cities],
+            'grade': 'COM',
+            'isadmin': 0,
+            'isactif': 1,
+            'latitude': np.round(centres[:, 0], 6).astype(str),
+            'longitude': np.round(centres[:, 1], 6).astype(str),
+        })
+
+    def clients(self):
+        return pd.DataFrame({
+            'code': self.client_codes,
+            'nom': [f"Client {i}" for i in range(self.n_clients)],
+            'prenom': '',
+            'adresse': [f"{CITIES[c][0]} {i % 97 + 1}" for i, c in enumerate(self.client_cities)],
+            'ville': [CITIES[c][0] for c in self.client_cities],
+            'latitude': np.round(self.client_coordinates[:, 0], 6).astype(str),
+            'longitude': np.round(self.client_coordinates[:, 1], 6).astype(str),
+        })
+
+    def products(self):
+        """Catalogue with its price list"""
+        return pd.DataFrame({
+            'code': self.product_codes,
+            'libelle': [f"{CATEGORIES[c][0]} {i:04d}" for i, c in enumerate(self.product_categories)],
+            'prix_ttc': self.product_prices,
+        })
+
+    def reference_tables(self):
+        return {'users': self.users(), 'clients': self.clients(), 'produits': self.products()}
+
+    # ------------------------------------------------------------------
+    # Invoices
+    # ------------------------------------------------------------------
+
+    def iter_months(self):
+        """
+        Invoices and lines, one month at a time (memory bounded by a month).
+
+        Yields:
+            tuple: (month 'YYYY-MM', entetecommercials DataFrame, lignecommercials DataFrame)
+        """
+        rng = np.random.default_rng([self.seed, 1])
+        active = rng.random(self.n_clients) < 0.85
+        next_code = 0
+        for month_start in pd.date_range(self.start.replace(day=1), self.end, freq='MS'):
+            days = pd.date_range(max(month_start, self.start),
+                                 min(month_start + pd.offsets.MonthEnd(0), self.end), freq='D')
+            if len(days) == 0:
+                continue
+            visits, basket = daily_seasonality(days)
+
+            # Intermittency: active / dormant state carried from month to month
+            switch = rng.random(self.n_clients)
+            active = np.where(active, switch >= DORMANT_PROBABILITY, switch < REACTIVATION_PROBABILITY)
+
+            route = np.where(self.client_route_day[:, None] == days.weekday.to_numpy()[None, :],
+                             ROUTE_DAY_BOOST, OFF_ROUTE_WEIGHT)
+            probability = (self.client_rate * active)[:, None] * visits[None, :] * route
+            clients, day_index = np.nonzero(rng.random(probability.shape) < np.minimum(probability, 0.95))
+            order = np.lexsort((clients, day_index))
+            clients, day_index = clients[order], day_index[order]
+            n_invoices = len(clients)
+            if n_invoices == 0:
+                continue
+
+            # Lines: basket size of the client, bigger during the Ramadan-like month
+            n_lines = 1 + rng.poisson(self.client_basket[clients] * basket[day_index])
+            n_lines = np.minimum(n_lines, MAX_LINES_PER_INVOICE)
+            invoice_of_line = np.repeat(np.arange(n_invoices), n_lines)
+            products = rng.choice(self.n_products, size=len(invoice_of_line), p=self.product_popularity)
+            quantities = 1 + rng.poisson(self.product_quantity[products] * basket[day_index][invoice_of_line] - 1)
+            amounts = quantities * self.product_prices[products]
+
+            codes = np.array([f"FS{n:09d}" for n in range(next_code, next_code + n_invoices)])
+            next_code += n_invoices
+            invoices = pd.DataFrame({
+                'code': codes,
+                'date': days[day_index],
+                'commercial_code': self.commercial_codes[self.client_commercial[clients]],
+                'client_code': self.client_codes[clients],
+                'net_a_payer': np.round(np.bincount(invoice_of_line, weights=amounts, minlength=n_invoices), 3),
+            })
+            lines = pd.DataFrame({
+                'entetecommercial_code': codes[invoice_of_line],
+                'produit_code': self.product_codes[products],
+                'quantite': quantities.astype(float),
+            })
+            yield month_start.strftime('%Y-%m'), invoices, lines
+
+    # ------------------------------------------------------------------
+    # Outputs
+    # ------------------------------------------------------------------
+
+    def write_repository(self, repository):
+        """
+        Load the tables into a SQLite stand-in (sales_repository.SQLiteRepository).
+
+        Returns:
+            dict: Rows written per table
+        """
+        counts = dict(repository.load_fixtures(self.reference_tables()))
+        for month, invoices, lines in self.iter_months():
+            loaded = repository.load_fixtures({'entetecommercials': invoices, 'lignecommercials': lines})
+            for table, rows in loaded.items():
+                counts[table] = counts.get(table, 0) + rows
+            logger.info(f"{month}: {len(invoices)} invoices, {len(lines)} lines")
+        return counts
+
+    def write_parquet(self, directory):
+        """
+        Write one <table>.parquet file per table (a SALES_FIXTURES_DIR).
+
+        The invoice tables are appended month by month as row groups.
+
+        Returns:
+            dict: Rows written per table
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(directory, exist_ok=True)
+        counts = {}
+        for table, df in self.reference_tables().items():
+            df.to_parquet(os.path.join(directory, f"{table}.parquet"), index=False)
+            counts[table] = len(df)
+
+        writers = {}
+        try:
+            for month, invoices, lines in self.iter_months():
+                for table, df in (('entetecommercials', invoices), ('lignecommercials', lines)):
+                    batch = pa.Table.from_pandas(df, preserve_index=False)
+                    if table not in writers:
+                        writers[table] = pq.ParquetWriter(os.path.join(directory, f"{table}.parquet"), batch.schema)
+                    writers[table].write_table(batch)
+                    counts[table] = counts.get(table, 0) + len(df)
+                logger.info(f"{month}: {len(invoices)} invoices, {len(lines)} lines")
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic sales history")
+    parser.add_argument('--scale', type=float, default=1.0, help="Scale factor (1 = 20 commercials, 2000 clients)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--start', default='2023-01-01')
+    parser.add_argument('--end', default='2024-12-31')
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--parquet', help="Directory of <table>.parquet files")
+    output.add_argument('--sqlite', help="SQLite database file (created or appended to)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    generator = SyntheticSalesGenerator(args.scale, args.seed, args.start, args.end)
+    if args.parquet:
+        counts = generator.write_parquet(args.parquet)
+    else:
+        from sales_repository import SQLiteRepository
+        counts = generator.write_repository(SQLiteRepository(args.sqlite))
+    print(f"Generated {counts} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
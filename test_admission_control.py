@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test script for admission control of the modelling endpoints
+"""
+
+import os
+import sys
+import time
+import threading
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify
+from admission_control import AdmissionController, AdmissionRejected
+from single_flight import SingleFlight
+
+
+def make_app(max_concurrent=2, max_queue=2, max_wait=5, job_seconds=0.3):
+    app = Flask(__name__)
+    admission = AdmissionController()
+    admission.add_class('modelling', max_concurrent=max_concurrent, max_queue=max_queue,
+                        max_wait=max_wait, blas_threads=1)
+    state = {'running': 0, 'peak': 0, 'blas_env': set(), 'blas_capped': set()}
+    lock = threading.Lock()
+
+    @app.route('/api/365_prediction/analyze', methods=['POST'])
+    @admission.guard('modelling')
+    def analyze():
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+            state['blas_env'].add(os.environ.get('OPENBLAS_NUM_THREADS'))
+            state['blas_capped'].add(admission.blas_users > 0)
+        time.sleep(job_seconds)
+        with lock:
+            state['running'] -= 1
+        return jsonify({'success': True})
+
+    @app.route('/search_clients')
+    def search():
+        return jsonify([])
+
+    return app, admission, state
+
+
+def burst(app, count, path='/api/365_prediction/analyze'):
+    responses = []
+    lock = threading.Lock()
+
+    def call():
+        response = app.test_client().post(path)
+        with lock:
+            responses.append(response)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for t in threads:
+        t.start()
+        time.sleep(0.01)
+    return threads, responses
+
+
+def test_concurrency_and_queue():
+    """At most max_concurrent jobs, max_queue waiting, the rest 429"""
+    print("\n=== Test 1: Semaphore and bounded queue ===")
+    app, admission, state = make_app()
+    threads, responses = burst(app, 6)
+    time.sleep(0.1)
+    snapshot = admission.snapshot()['modelling']
+    print(f"During burst: {snapshot}")
+    assert snapshot['running'] == 2 and snapshot['queued'] == 2
+    for t in threads:
+        t.join()
+
+    statuses = sorted(r.status_code for r in responses)
+    print(f"Statuses: {statuses}, peak concurrency: {state['peak']}")
+    assert statuses == [200, 200, 200, 200, 429, 429]
+    assert state['peak'] == 2
+
+    rejected = [r for r in responses if r.status_code == 429][0]
+    retry_after = int(rejected.headers['Retry-After'])
+    assert rejected.get_json()['reason'] == 'queue full' and retry_after >= 1
+    print(f"✓ 429 with Retry-After: {retry_after}s")
+
+    snapshot = admission.snapshot()['modelling']
+    assert snapshot['admitted'] == 4 and snapshot['rejected'] == 2
+    assert snapshot['max_queued_seen'] == 2 and snapshot['running'] == 0
+    assert 0.25 < snapshot['avg_duration'] < 1
+    print(f"✓ Metrics: {snapshot}")
+
+
+def test_wait_timeout():
+    """Queued requests give up after max_wait"""
+    print("\n=== Test 2: Wait timeout ===")
+    app, admission, _ = make_app(max_concurrent=1, max_queue=1, max_wait=0.1, job_seconds=0.5)
+    threads, responses = burst(app, 2)
+    for t in threads:
+        t.join()
+    rejected = [r for r in responses if r.status_code == 429]
+    assert len(rejected) == 1 and rejected[0].get_json()['reason'] == 'wait timeout'
+    assert admission.snapshot()['modelling']['timed_out'] == 1
+    print("✓ Second request rejected after 0.1s in queue")
+
+    # Context manager usage outside Flask
+    with admission.admit('modelling'):
+        try:
+            with admission.admit('modelling'):
+                pass
+        except AdmissionRejected as e:
+            print(f"✓ Nested admission rejected: {e}")
+
+
+def test_blas_caps_and_light_endpoints():
+    """Global BLAS cap held while jobs run, environment untouched; light routes unaffected"""
+    print("\n=== Test 3: BLAS caps and light endpoints ===")
+    os.environ.pop('OPENBLAS_NUM_THREADS', None)
+    app, admission, state = make_app(max_concurrent=2, max_queue=4, job_seconds=0.4)
+    threads, _ = burst(app, 4)
+    time.sleep(0.05)
+
+    client = app.test_client()
+    latencies = []
+    for _ in range(20):
+        start = time.perf_counter()
+        assert client.get('/search_clients').status_code == 200
+        latencies.append((time.perf_counter() - start) * 1000)
+    for t in threads:
+        t.join()
+
+    print(f"Light endpoint during heavy jobs: max {max(latencies):.1f} ms")
+    assert max(latencies) < 100
+    assert state['blas_capped'] == {True} and admission.blas_users == 0
+    assert state['blas_env'] == {None} and 'OPENBLAS_NUM_THREADS' not in os.environ
+    print("✓ Cap held inside jobs and released afterwards, environment not changed by request threads")
+
+
+def test_single_flight_leader_only():
+    """Identical concurrent requests: only the single-flight leader takes a slot"""
+    print("\n=== Test 4: Admission inside single-flight ===")
+    admission = AdmissionController()
+    admission.add_class('modelling', max_concurrent=1, max_queue=0, max_wait=1, blas_threads=1)
+    flights = SingleFlight()
+    results = []
+    lock = threading.Lock()
+
+    def plan(code):
+        time.sleep(0.3)
+        return {'code': code}
+
+    def call():
+        result, shared = flights.do('plan:1300', admission.run, 'modelling', plan, '1300')
+        with lock:
+            results.append((result, shared))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for t in threads:
+        t.start()
+        time.sleep(0.01)
+    for t in threads:
+        t.join()
+    snapshot = admission.snapshot()['modelling']
+    assert len(results) == 5 and all(result == {'code': '1300'} for result, _ in results)
+    assert sum(shared for _, shared in results) == 4
+    assert snapshot['admitted'] == 1 and snapshot['rejected'] == 0
+    print("✓ 5 requests, 1 slot taken, no 429 for the followers")
+
+
+if __name__ == "__main__":
+    test_concurrency_and_queue()
+    test_wait_timeout()
+    test_blas_caps_and_light_endpoints()
+    test_single_flight_leader_only()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test script for the DuckDB analytics engine over the local Parquet snapshot
+Compares DuckDB results with the same queries run on the source database
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import warnings
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from sales_snapshot import SalesSnapshot
+from analytics_engine import AnalyticsEngine, to_duckdb_sql, read_aggregate, iter_aggregate_chunks, uses_line_columns
+from export_utilities import EXPORT_DEFINITIONS, build_export_query
+from sales_repository import translate_sql
+from sales_fixtures import sales_database, RecordingConnection
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+# get_commercial_list query with a reference date
+COMMERCIAL_LIST_QUERY = """
+SELECT
+    commercial_code,
+    COUNT(*) as total_records,
+    COUNT(DISTINCT client_code) as unique_clients,
+    MIN(date) as first_record,
+    MAX(date) as last_record,
+    AVG(net_a_payer) as avg_transaction_value,
+    COUNT(CASE WHEN date BETWEEN %s AND %s THEN 1 END) as training_period_records
+FROM entetecommercials
+GROUP BY commercial_code
+HAVING COUNT(CASE WHEN date BETWEEN %s AND %s THEN 1 END) >= 30  -- At least 30 records in training period
+ORDER BY training_period_records DESC, total_records DESC
+"""
+
+
+def make_database(count=8000):
+    # Two years, 120 clients, every 9th invoice without lines
+    return RecordingConnection(sales_database('2022-01-01', count, seed=3, days=730, clients=120,
+                                              no_lines_every=9))
+
+
+def sqlite_frame(conn, query, params=None):
+    """Reference result read on the connection's database, without recording the query"""
+    return pd.read_sql(translate_sql(query, params is not None), conn.conn, params=params)
+
+
+def test_commercial_list():
+    """get_commercial_list aggregation: DuckDB over the snapshot equals the database"""
+    print("\n=== Test 1: Commercial list ===")
+    assert to_duckdb_sql("SELECT DATE_FORMAT(date, '%%Y-%%m') FROM t WHERE date < DATE_ADD(%s, INTERVAL 1 DAY)") == \
+        "SELECT strftime(date, '%Y-%m') FROM t WHERE date < (CAST(? AS DATE) + INTERVAL 1 DAY)"
+    assert to_duckdb_sql("WHERE x LIKE '%%s%%' AND y = %s") == "WHERE x LIKE '%s%' AND y = ?"
+    # MySQL specifiers: %M month name, %i minutes, %s seconds
+    assert to_duckdb_sql("SELECT DATE_FORMAT(DATE(date), '%%M %%Y %%H:%%i:%%s') FROM t WHERE a = %s") == \
+        "SELECT strftime(DATE(date), '%B %Y %H:%M:%S') FROM t WHERE a = ?"
+
+    conn = make_database()
+    root = tempfile.mkdtemp()
+    try:
+        SalesSnapshot(root).sync(conn)
+        engine = AnalyticsEngine(SalesSnapshot(root))
+        assert engine.available()
+
+        params = ('2022-12-31', '2023-12-31', '2022-12-31', '2023-12-31')
+        expected = sqlite_frame(conn, COMMERCIAL_LIST_QUERY, params)
+        conn.executed.clear()
+        actual = read_aggregate(COMMERCIAL_LIST_QUERY, params, conn, engine=engine)
+        assert conn.executed == []
+        print(actual[['commercial_code', 'total_records', 'training_period_records']])
+
+        assert list(actual.columns) == list(expected.columns)
+        assert (actual['commercial_code'].values == expected['commercial_code'].values).all()
+        for column in ['total_records', 'unique_clients', 'training_period_records']:
+            assert (actual[column].values == expected[column].values).all(), column
+        assert np.allclose(actual['avg_transaction_value'], expected['avg_transaction_value'])
+        assert (actual['first_record'].dt.strftime('%Y-%m-%d').values == expected['first_record'].values).all()
+        print(f"✓ {len(actual)} commercials, no query on the database")
+    finally:
+        shutil.rmtree(root)
+
+
+def test_export_sheets():
+    """Export sheets, including line columns read through the sales_lines view"""
+    print("\n=== Test 2: Export sheets ===")
+    conn = make_database()
+    root = tempfile.mkdtemp()
+    try:
+        SalesSnapshot(root).sync(conn)
+        engine = AnalyticsEngine(SalesSnapshot(root))
+        sheets = EXPORT_DEFINITIONS['commercials']['sheets']
+        filters = {'start_date': '2023-03-01', 'end_date': '2023-08-31', 'commercial_code': '1302'}
+
+        # Monthly sheet: DATE_FORMAT and DATE_ADD translated
+        query, params = build_export_query(sheets['Performance_Mensuelle'], filters=filters)
+        monthly = pd.concat(iter_aggregate_chunks(query, params, conn, chunksize=2, engine=engine))
+        invoices = sqlite_frame(conn, "SELECT * FROM entetecommercials WHERE commercial_code = '1302' "
+                                      "AND date BETWEEN '2023-03-01' AND '2023-08-31'")
+        invoices['mois'] = invoices['date'].str[:7]
+        expected = invoices.groupby('mois').agg(visites=('code', 'size'), ca_mensuel=('net_a_payer', 'sum'))
+        assert list(monthly['mois']) == list(expected.index) == [f"2023-{m:02d}" for m in range(3, 9)]
+        assert (monthly['visites'].values == expected['visites'].values).all()
+        assert np.allclose(monthly['ca_mensuel'], expected['ca_mensuel'])
+        print(f"✓ Monthly sheet: {len(monthly)} months in chunks of 2")
+
+        # Line columns: the engine reads the invoice/line join
+        sheet = sheets['Produits_par_Commercial']
+        query, params = build_export_query(sheet, filters=filters)
+        assert uses_line_columns(query)
+        engine_query, _ = build_export_query(sheet, filters=filters, table='sales_lines')
+        products = pd.concat(iter_aggregate_chunks(query, params, conn, engine=engine, engine_query=engine_query))
+        expected = sqlite_frame(conn, """
+            SELECT lc.produit_code, SUM(lc.quantite) AS quantite_totale, COUNT(DISTINCT ec.client_code) AS clients
+            FROM entetecommercials ec JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+            WHERE ec.commercial_code = '1302' AND ec.date BETWEEN '2023-03-01' AND '2023-08-31'
+            GROUP BY lc.produit_code ORDER BY lc.produit_code
+        """)
+        products = products.sort_values('produit_code').reset_index(drop=True)
+        assert (products['produit_code'].values == expected['produit_code'].values).all()
+        assert np.allclose(products['quantite_totale'], expected['quantite_totale'])
+        assert (products['clients_touches'].values == expected['clients'].values).all()
+        print(f"✓ Product sheet: {len(products)} products from the sales_lines view")
+    finally:
+        shutil.rmtree(root)
+
+
+def test_fallback():
+    """Columns missing from the snapshot, or no snapshot: the database answers"""
+    print("\n=== Test 3: Fallback ===")
+    conn = make_database(2000)
+    conn.conn.execute("ALTER TABLE entetecommercials ADD COLUMN ville TEXT DEFAULT 'Sfax'")
+    root = tempfile.mkdtemp()
+    try:
+        query = "SELECT ville, COUNT(*) AS n FROM entetecommercials WHERE commercial_code = %s GROUP BY ville"
+        expected = sqlite_frame(conn, query, ['1301'])
+
+        empty = AnalyticsEngine(SalesSnapshot(root))
+        assert not empty.available()
+
+        SalesSnapshot(root).sync(conn)
+        engine = AnalyticsEngine(SalesSnapshot(root))
+        conn.executed.clear()
+        result = read_aggregate(query, ['1301'], conn, engine=engine)
+        assert len(conn.executed) == 1
+        assert result.to_dict('records') == expected.to_dict('records') == [{'ville': 'Sfax', 'n': expected['n'][0]}]
+
+        conn.executed.clear()
+        chunks = list(iter_aggregate_chunks(query, ['1301'], conn, engine=engine))
+        assert len(conn.executed) == 1 and chunks[0].to_dict('records') == expected.to_dict('records')
+        print("✓ Unknown column: DuckDB error logged, same result from the database")
+
+        # Snapshot not synchronized for longer than the bound: MySQL answers
+        query = "SELECT commercial_code, COUNT(*) AS n FROM entetecommercials GROUP BY commercial_code"
+        conn.executed.clear()
+        read_aggregate(query, None, conn, engine=AnalyticsEngine(SalesSnapshot(root), max_staleness=60))
+        assert conn.executed == []
+        state_path = os.path.join(root, '_state.json')
+        with open(state_path) as f:
+            state = json.load(f)
+        state['synced_at'] = '2000-01-01 00:00:00'
+        with open(state_path, 'w') as f:
+            json.dump(state, f)
+        stale = AnalyticsEngine(SalesSnapshot(root), max_staleness=60)
+        assert stale.staleness() > 60 and not stale.available()
+        result = read_aggregate(query, None, conn, engine=stale)
+        assert len(conn.executed) == 1 and result['n'].sum() == 2000
+        assert AnalyticsEngine(SalesSnapshot(root), max_staleness=0).available()
+        print("✓ Stale snapshot: the database answers")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    test_commercial_list()
+    test_export_sheets()
+    test_fallback()
+    print("\n=== All tests completed! ===")
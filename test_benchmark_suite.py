@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for the offline benchmark suite
+"""
+
+import os
+import sys
+import copy
+import shutil
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import benchmark_suite
+from benchmark_suite import (run_suite, compare, format_report, append_history, load_json, measure,
+                             FitCounter, BENCHMARKS)
+
+RUNNABLE = ['load_delivery_lines', 'daily_client_aggregates', 'calendar_index', 'export_commercials_parquet']
+
+
+def test_run_and_history():
+    """Runs on a small synthetic dataset, appends to the history"""
+    print("\n=== Test 1: Run and history ===")
+    directory = tempfile.mkdtemp()
+    try:
+        record = run_suite(scales=[0.05], names=RUNNABLE, repeat=2)
+        print(format_report(record, compare(record, None)))
+        assert record['datasets'][0]['invoices'] > 1000
+        for result in record['results']:
+            assert result['status'] == 'ok', result
+            assert len(result['wall_times']) == 2 and result['peak_memory_mb'] > 0
+        assert os.environ.get('SALES_SNAPSHOT') is None
+
+        history = os.path.join(directory, 'history.json')
+        assert append_history(record, history) == 1
+        assert append_history(record, history) == 2
+        assert load_json(history)[1]['results'][0]['benchmark'] == 'load_delivery_lines'
+        print(f"✓ {len(record['results'])} benchmarks measured, history of 2 runs")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_comparison_and_fit_counts():
+    """Regressions against the baseline; model fits counted"""
+    print("\n=== Test 2: Baseline comparison and fit counts ===")
+    record = {'run_at': 'now', 'commit': None, 'repeat': 3, 'datasets': [], 'results': [
+        {'benchmark': 'a', 'kind': 'micro', 'scale': 1, 'status': 'ok', 'wall_time_s': 1.5,
+         'peak_memory_mb': 10.0, 'fits': {'SARIMAX': 4}},
+        {'benchmark': 'b', 'kind': 'micro', 'scale': 1, 'status': 'ok', 'wall_time_s': 0.5,
+         'peak_memory_mb': 10.0, 'fits': {}},
+        {'benchmark': 'c', 'kind': 'macro', 'scale': 1, 'status': 'ok', 'wall_time_s': 1.0,
+         'peak_memory_mb': 10.0, 'fits': {'SARIMAX': 6}},
+        {'benchmark': 'd', 'kind': 'macro', 'scale': 1, 'status': 'skipped', 'error': 'missing dependency'},
+    ]}
+    baseline = copy.deepcopy(record)
+    baseline['results'][0]['wall_time_s'] = 1.0
+    baseline['results'][1]['wall_time_s'] = 1.0
+    baseline['results'][2]['fits'] = {'SARIMAX': 4}
+    rows = {row['benchmark']: row for row in compare(record, baseline, threshold=0.2)}
+    print(format_report(record, list(rows.values())))
+    assert rows['a']['status'] == 'regression' and rows['a']['time_ratio'] == 1.5
+    assert rows['b']['status'] == 'improvement'
+    assert rows['c']['status'] == 'regression' and rows['c']['fits'] == 6
+    assert rows['d']['status'] == 'skipped'
+    print("✓ Slower run, extra fits and improvement detected")
+
+    class Model:
+        def fit(self, n):
+            return sum(range(n))
+
+    benchmark_suite.Model = Model
+    try:
+        with FitCounter([('benchmark_suite', 'Model', 'fit')]) as fits:
+            Model().fit(10)
+            Model().fit(5)
+        assert fits.counts['Model'] == 2
+        Model().fit(3)
+        assert fits.counts['Model'] == 2 and Model.fit.__name__ == 'fit'
+        result = measure(lambda: [Model().fit(1000) for _ in range(5)], repeat=2)
+        assert result['fits'] == {} and result['wall_time_s'] >= 0
+    finally:
+        del benchmark_suite.Model
+    assert set(RUNNABLE) <= set(BENCHMARKS)
+    print("✓ Fits counted inside the context only, original methods restored")
+
+
+if __name__ == "__main__":
+    test_run_and_history()
+    test_comparison_and_fit_counts()
+    print("\n=== All tests completed! ===")
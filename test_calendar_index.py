@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for the month_day column, the indexes and the calendar index
+"""
+
+import os
+import sys
+import warnings
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+import calendar_index
+from calendar_index import migrate, candidates_query, month_day, CalendarIndex
+from sales_fixtures import sales_database
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+
+def make_database(rows=20000):
+    # Five years of invoices of 150 clients and five commercials (no lines needed)
+    conn = sales_database('2020-01-01', rows, seed=5, days=1827, commercials=5, clients=150,
+                          lines_per_invoice=(0, 1)).connect()
+    calendar_index._availability.clear()
+    return conn
+
+
+def run(conn, query, params):
+    return pd.read_sql(query, conn, params=params)
+
+
+def test_migration_and_index_seek():
+    """Migration is idempotent; the candidate query seeks the month_day index"""
+    print("\n=== Test 1: Migration and sargable query ===")
+    conn = make_database()
+    legacy_query, legacy_params = candidates_query(conn, '1302', '2025-03-14')
+    assert 'DAY(ec.date)' in legacy_query
+    expected = run(conn, legacy_query, legacy_params)
+
+    assert set(migrate(conn, 'sqlite').values()) == {'applied'}
+    result = migrate(conn, 'sqlite')
+    print(f"Second run: {result}")
+    assert result['month_day column'] == 'present'
+
+    conn.conn.execute("ANALYZE")  # statistics, as a populated MySQL table has
+    query, params = candidates_query(conn, '1302', '2025-03-14')
+    assert params == [314, '1302', '2025-01-01']
+    plan = ' '.join(str(row) for row in conn.cursor().execute(
+        "EXPLAIN QUERY PLAN " + query, params).fetchall())
+    print(f"Plan: {plan}")
+    assert 'idx_ec_month_day_commercial' in plan and 'SCAN ec' not in plan
+
+    actual = run(conn, query, params)
+    merged = expected.merge(actual, on='client_code', suffixes=('_legacy', '_indexed'))
+    assert len(merged) == len(expected) == len(actual)
+    assert (merged['freq_legacy'] == merged['freq_indexed']).all()
+    print(f"✓ {len(actual)} clients, same frequencies as the DAY/MONTH query")
+
+
+def delivery_plan_candidates(historical_data, delivery_date):
+    """The per-year mask loop formerly in generate_delivery_plan"""
+    day, month, year = delivery_date.day, delivery_date.month, delivery_date.year
+    years = [y for y in historical_data['date'].dt.year.unique() if y != year]
+    client_counts = {}
+    for y in years:
+        mask = ((historical_data['date'].dt.year == y) &
+                (historical_data['date'].dt.month == month) &
+                (historical_data['date'].dt.day == day))
+        for c in historical_data[mask]['client_code'].values:
+            client_counts[c] = client_counts.get(c, 0) + 1
+    return sorted(client_counts.items(), key=lambda x: (-x[1], str(x[0])))
+
+
+def test_calendar_index():
+    """In-memory index gives the same candidates as the mask loop and the SQL"""
+    print("\n=== Test 2: Calendar index ===")
+    conn = make_database()
+    lines = pd.read_sql("SELECT date, commercial_code, client_code FROM entetecommercials", conn.conn)
+    lines['date'] = pd.to_datetime(lines['date'])
+
+    one_commercial = lines[lines['commercial_code'] == '1300'].drop(columns='commercial_code')
+    index = CalendarIndex.from_frame(one_commercial, commercial_column=None)
+    for target in ['2023-02-28', '2024-02-29', '2022-07-01', '2025-12-25']:
+        target = pd.Timestamp(target)
+        assert index.candidates(None, target, exclude_year=target.year) == \
+            delivery_plan_candidates(one_commercial, target)
+    print(f"✓ {len(index)} (month, day) keys, same ranking as the per-year masks")
+
+    fleet = CalendarIndex.from_database(conn)
+    query, params = candidates_query(conn, '1304', '2025-06-02')
+    expected = run(conn, query, params)
+    ranked = dict(fleet.candidates('1304', '2025-06-02', before_year=2025))
+    assert ranked == dict(zip(expected['client_code'], expected['freq']))
+    sets = fleet.client_sets('1304', 6, 2)
+    assert set().union(*sets.values()) == set(ranked)
+    assert len(fleet.candidates('1304', '2025-06-02', before_year=2025, limit=3)) == 3
+    assert month_day('2024-12-25') == 1225
+    print(f"✓ Database index matches the query for commercial 1304 ({len(ranked)} clients)")
+
+
+if __name__ == "__main__":
+    test_migration_and_index_seek()
+    test_calendar_index()
+    print("\n=== All tests completed! ===")
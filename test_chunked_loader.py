@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script for the chunked loader
+Checks chunk iteration, per-chunk dtype coercion and incremental aggregation
+"""
+
+import os
+import sys
+import sqlite3
+import decimal
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from chunked_loader import iter_query_chunks, load_dataframe, coerce_chunk, aggregate_chunks
+
+ROWS = 25000
+
+
+def make_connection():
+    conn = sqlite3.connect(':memory:')
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({
+        'date': pd.date_range('2022-01-01', periods=ROWS, freq='37min').strftime('%Y-%m-%d %H:%M:%S'),
+        'commercial_code': rng.choice(['1300', '1301', '1302'], ROWS),
+        'client_code': [f"CL{i:04d}" for i in rng.integers(0, 500, ROWS)],
+        'net_a_payer': rng.gamma(2.0, 100.0, ROWS).round(3),
+    })
+    df.to_sql('entetecommercials', conn, index=False)
+    return conn, df
+
+
+def test_chunk_iteration():
+    """Chunks respect the size and the declared dtypes"""
+    print("\n=== Test 1: Chunk iteration and coercion ===")
+    conn, _ = make_connection()
+    chunks = list(iter_query_chunks(conn, "SELECT * FROM entetecommercials", chunksize=4000,
+                                    dtypes={'date': 'datetime', 'net_a_payer': 'float'}))
+    print(f"{len(chunks)} chunks, sizes: {[len(c) for c in chunks]}")
+    assert len(chunks) == 7 and all(len(c) <= 4000 for c in chunks)
+    assert sum(len(c) for c in chunks) == ROWS
+    assert pd.api.types.is_datetime64_any_dtype(chunks[0]['date'])
+    assert chunks[0]['net_a_payer'].dtype == np.float64
+
+    df = load_dataframe(conn, "SELECT * FROM entetecommercials WHERE commercial_code = ?", params=('1300',))
+    assert (df['commercial_code'] == '1300').all()
+    empty = load_dataframe(conn, "SELECT * FROM entetecommercials WHERE 1 = 0", columns=['date'])
+    assert empty.empty and list(empty.columns) == ['date']
+    print("✓ Parameters and empty results handled")
+
+
+def test_decimal_coercion():
+    """MySQL Decimal columns become floats without explicit dtypes"""
+    print("\n=== Test 2: Decimal coercion ===")
+    chunk = pd.DataFrame({'ca': [decimal.Decimal('10.50'), None, decimal.Decimal('3.25')], 'code': ['a', 'b', 'c']})
+    chunk = coerce_chunk(chunk)
+    assert chunk['ca'].dtype == np.float64 and pd.api.types.is_string_dtype(chunk['code'])
+    print(f"✓ Decimal column converted: {chunk['ca'].tolist()}")
+
+
+def test_incremental_aggregation():
+    """Streaming aggregates match a full in-memory groupby"""
+    print("\n=== Test 3: Incremental aggregation ===")
+    conn, raw = make_connection()
+    raw['date'] = pd.to_datetime(raw['date'])
+
+    for freq in ('D', 'M'):
+        result = aggregate_chunks(
+            iter_query_chunks(conn, "SELECT * FROM entetecommercials", chunksize=1000,
+                              dtypes={'date': 'datetime'}),
+            by=['date', 'commercial_code'],
+            aggregations={
+                'visites': ('client_code', 'count'),
+                'clients_uniques': ('client_code', 'nunique'),
+                'ca': ('net_a_payer', 'sum'),
+                'panier_moyen': ('net_a_payer', 'mean'),
+                'max_facture': ('net_a_payer', 'max'),
+            },
+            freq=freq
+        )
+        period = raw['date'].dt.to_period(freq).dt.to_timestamp() if freq == 'M' else raw['date'].dt.normalize()
+        expected = raw.assign(date=period).groupby(['date', 'commercial_code'], as_index=False).agg(
+            visites=('client_code', 'count'),
+            clients_uniques=('client_code', 'nunique'),
+            ca=('net_a_payer', 'sum'),
+            panier_moyen=('net_a_payer', 'mean'),
+            max_facture=('net_a_payer', 'max'),
+        )
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected, check_dtype=False)
+        print(f"✓ freq={freq}: {len(result)} groups match the full groupby")
+
+
+if __name__ == "__main__":
+    test_chunk_iteration()
+    test_decimal_coercion()
+    test_incremental_aggregation()
+    print("\n=== All tests completed! ===")
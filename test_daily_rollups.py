@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Test script for the materialized daily commercial aggregates
+"""
+
+import os
+import sys
+import warnings
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+import daily_rollups
+from daily_rollups import (rebuild, refresh, get_watermark, rollups_available,
+                           daily_stats_query, commercial_summary_query, refresh_lock)
+from sales_fixtures import sales_database, random_invoices, insert_rows
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+# Invoices of 60 clients over two months, some without lines or amount
+DATASET = dict(clients=60, lines_per_invoice=(0, 4), null_amount_every=50)
+
+
+def make_database():
+    return sales_database('2024-01-01', 4000, days=60, **DATASET).connect()
+
+
+def raw_daily(conn):
+    """The former per-call aggregation (get_historical_deliveries / revenue analysis)"""
+    return pd.read_sql("""
+        SELECT date, commercial_code, COUNT(code) AS invoice_count,
+               COUNT(DISTINCT client_code) AS visits, SUM(net_a_payer) AS revenue
+        FROM entetecommercials
+        GROUP BY date, commercial_code
+        ORDER BY date, commercial_code
+    """, conn.conn)
+
+
+def rollup_daily(conn):
+    query, params = daily_stats_query({'date': 'stat_date', 'commercial_code': 'commercial_code',
+                                       'invoice_count': 'invoice_count', 'visits': 'visits',
+                                       'revenue': 'revenue'})
+    return pd.read_sql(query, conn, params=params)
+
+
+def assert_same_daily(expected, actual):
+    assert len(expected) == len(actual)
+    for col in ['date', 'commercial_code', 'invoice_count', 'visits']:
+        assert (expected[col].values == actual[col].values).all(), col
+    assert np.allclose(expected['revenue'], actual['revenue'])
+
+
+def test_rebuild_matches_raw_aggregation():
+    """Rebuilt rollups equal the GROUP BY the call sites ran"""
+    print("\n=== Test 1: Rebuild ===")
+    conn = make_database()
+    result = rebuild(conn)
+    print(f"Rebuild: {result}")
+    assert_same_daily(raw_daily(conn), rollup_daily(conn))
+
+    # Distinct products, without the revenue multiplied by the line join
+    products = pd.read_sql("""
+        SELECT ec.date, ec.commercial_code, COUNT(DISTINCT lc.produit_code) AS products_sold
+        FROM entetecommercials ec
+        LEFT JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+        GROUP BY ec.date, ec.commercial_code ORDER BY ec.date, ec.commercial_code
+    """, conn.conn)
+    stats = pd.read_sql("SELECT products_sold, avg_basket, revenue, invoice_count FROM commercial_daily_stats "
+                        "ORDER BY stat_date, commercial_code", conn.conn)
+    assert (stats['products_sold'].values == products['products_sold'].values).all()
+    assert np.allclose(stats['avg_basket'], stats['revenue'] / stats['invoice_count'])
+    assert str(get_watermark(conn)) == pd.read_sql("SELECT MAX(date) AS d FROM entetecommercials", conn.conn)['d'][0]
+    print("✓ Visits, revenue, invoice count, products and average basket match")
+
+
+def test_incremental_refresh():
+    """Only days from the watermark are re-aggregated; result equals a rebuild"""
+    print("\n=== Test 2: Incremental refresh ===")
+    conn = make_database()
+    rebuild(conn)
+    watermark = get_watermark(conn)
+
+    # New invoices after the watermark, plus a late one two days before it
+    insert_rows(conn, random_invoices(str(watermark), 300, seed=2, first_code=10000, days=5, **DATASET))
+    late_day = str(watermark - pd.Timedelta(days=2))
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO entetecommercials VALUES ('F999999', %s, '1300', 'C001', 999.0)", (late_day,))
+    conn.commit()
+
+    result = refresh(conn, lookback_days=3)
+    print(f"Refresh: {result}")
+    total_days = len(rollup_daily(conn))
+    assert result['daily_rows'] < total_days / 3
+    assert get_watermark(conn) > watermark
+    assert_same_daily(raw_daily(conn), rollup_daily(conn))
+    print(f"✓ {result['daily_rows']} of {total_days} daily rows recomputed, late invoice included")
+
+    before = pd.read_sql("SELECT * FROM commercial_client_stats ORDER BY commercial_code, client_code", conn.conn)
+    rebuild(conn)
+    after = pd.read_sql("SELECT * FROM commercial_client_stats ORDER BY commercial_code, client_code", conn.conn)
+    assert before.equals(after)
+    print("✓ Client stats identical to a full rebuild")
+
+    # A future-dated invoice is aggregated but does not move the watermark past today
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO entetecommercials VALUES ('F888888', '2099-01-01', '1300', 'C001', 10.0)")
+    conn.commit()
+    latest = get_watermark(conn)
+    refresh(conn)
+    assert get_watermark(conn) == latest <= pd.Timestamp.now().date()
+    assert_same_daily(raw_daily(conn), rollup_daily(conn))
+    print("✓ Future-dated invoice aggregated, watermark capped at today")
+
+
+def test_readers():
+    """Commercial list and availability check"""
+    print("\n=== Test 3: Readers ===")
+    conn = make_database()
+    daily_rollups._availability.clear()
+    assert not rollups_available(conn)
+    rebuild(conn)
+    assert rollups_available(conn)
+    os.environ['DAILY_ROLLUPS'] = '0'
+    assert not rollups_available(conn)
+    del os.environ['DAILY_ROLLUPS']
+
+    # Refresher stopped: a rollup older than ROLLUP_MAX_AGE is no longer used
+    cursor = conn.cursor()
+    cursor.execute("UPDATE rollup_watermarks SET refreshed_at = '2000-01-01 00:00:00'")
+    conn.commit()
+    daily_rollups._availability.clear()
+    assert not rollups_available(conn)
+    os.environ['ROLLUP_MAX_AGE'] = '0'
+    daily_rollups._availability.clear()
+    assert rollups_available(conn)
+    del os.environ['ROLLUP_MAX_AGE']
+    print("✓ Stale rollup (last refresh older than ROLLUP_MAX_AGE) falls back to raw aggregation")
+
+    expected = pd.read_sql("""
+        SELECT commercial_code, COUNT(*) AS total_records, COUNT(DISTINCT client_code) AS unique_clients,
+               MIN(date) AS first_record, MAX(date) AS last_record, AVG(net_a_payer) AS avg_transaction_value,
+               COUNT(CASE WHEN date BETWEEN '2024-01-20' AND '2024-02-10' THEN 1 END) AS training_period_records
+        FROM entetecommercials GROUP BY commercial_code
+        HAVING COUNT(CASE WHEN date BETWEEN '2024-01-20' AND '2024-02-10' THEN 1 END) >= 30
+        ORDER BY training_period_records DESC, total_records DESC
+    """, conn.conn)
+    query, params = commercial_summary_query('2024-01-20', '2024-02-10')
+    actual = pd.read_sql(query, conn, params=params)
+    for col in ['commercial_code', 'total_records', 'unique_clients', 'first_record', 'last_record',
+                'training_period_records']:
+        assert (expected[col].values == actual[col].values).all(), col
+    assert np.allclose(expected['avg_transaction_value'], actual['avg_transaction_value'])
+
+    query, params = daily_stats_query({'date': 'stat_date', 'revenue': 'revenue'},
+                                      '2024-01-10', '2024-01-12', 1301)
+    assert params == ['2024-01-10', '2024-01-12', '1301']
+    assert len(pd.read_sql(query, conn, params=params)) == 3
+    print("✓ Commercial list and filtered daily stats match the raw queries")
+
+
+def test_refresh_lock():
+    """One refresh round at a time across processes (flock without GET_LOCK)"""
+    print("\n=== Test 4: Refresh lock ===")
+    first, second = make_database(), make_database()
+    with refresh_lock(first, 'rollups_test') as acquired:
+        assert acquired
+        with refresh_lock(second, 'rollups_test') as other:
+            assert not other
+    with refresh_lock(second, 'rollups_test') as acquired:
+        assert acquired
+    print("✓ Second round skipped while the first holds the lock, acquired once released")
+
+
+if __name__ == "__main__":
+    test_rebuild_matches_raw_aggregation()
+    test_incremental_refresh()
+    test_readers()
+    test_refresh_lock()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script for the request-scoped client dashboard context
+"""
+
+import os
+import sys
+import time
+import threading
+import warnings
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from dashboard_context import ClientDataContext, fan_out
+from sales_fixtures import sales_database, RecordingConnection
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+
+def make_database():
+    """Three years of invoices of two named clients, C000 and C001"""
+    repository = sales_database('2022-01-01', 1500, seed=3, days=1096, clients=2, products=12)
+    conn = repository.connect()
+    conn.cursor().executemany("UPDATE clients SET nom = %s, prenom = %s WHERE code = %s",
+                              [('Ben Ali', 'Sami', 'C000'), ('Trabelsi', None, 'C001')])
+    conn.commit()
+    return repository, conn
+
+
+def test_derived_results_match_sql():
+    """Top products and average basket equal the original per-function queries"""
+    print("\n=== Test 1: Same results as the separate queries ===")
+    repository, conn = make_database()
+    context = ClientDataContext('C000', repository.connect)
+
+    expected_top = pd.read_sql("""
+        SELECT lc.produit_code, p.libelle AS produit_nom, SUM(ec.net_a_payer) AS total_ventes, p.image_url
+        FROM lignecommercials lc
+        JOIN entetecommercials ec ON lc.entetecommercial_code = ec.code
+        LEFT JOIN produits p ON lc.produit_code = p.code
+        WHERE ec.client_code = 'C000'
+        GROUP BY lc.produit_code, p.libelle, p.image_url
+        ORDER BY total_ventes DESC
+        LIMIT 5
+    """, conn.conn)
+    top = context.top_products(5)
+    print(top)
+    assert top['produit_code'].tolist() == expected_top['produit_code'].tolist()
+    assert np.allclose(top['total_ventes'], expected_top['total_ventes'])
+    assert top['image_url'].tolist() == expected_top['image_url'].tolist()
+
+    expected_basket = pd.read_sql("""
+        SELECT SUM(net_a_payer) AS total, COUNT(*) AS n FROM entetecommercials
+        WHERE client_code = 'C000' AND date BETWEEN '2024-01-01' AND '2024-06-30'
+    """, conn.conn)
+    basket = context.average_basket('2024-01-01', '2024-06-30')
+    print(basket)
+    assert basket['nombre_factures'] == int(expected_basket['n'][0])
+    assert abs(basket['chiffre_affaire_total'] - float(expected_basket['total'][0])) < 1e-6
+
+    assert context.client_full_name == 'Ben Ali Sami' and context.client_name == 'Ben Ali'
+    assert ClientDataContext('C001', repository.connect).client_full_name == 'Trabelsi'
+    assert ClientDataContext('C009', repository.connect).client_full_name == 'C009'
+    # client, rollup lookup (not built here), invoices, lines, product details
+    assert context.queries == 5
+    assert context.top_products(5) is top and context.queries == 5
+    print(f"✓ {context.queries} queries for name, forecast input, top products and basket")
+    conn.close()
+
+
+def test_loads_once_under_concurrency():
+    """Concurrent users of the context trigger a single load"""
+    print("\n=== Test 2: Shared lazy loading ===")
+    repository, conn = make_database()
+    context = ClientDataContext('C000', lambda: RecordingConnection(repository, delay=0.2))
+    sizes = []
+    threads = [threading.Thread(target=lambda: sizes.append(len(context.invoices))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(sizes)) == 1 and context.queries == 1
+    print(f"✓ 5 concurrent readers, {context.queries} query ({sizes[0]} invoices)")
+    conn.close()
+
+
+def test_fan_out():
+    """Latency of the slowest task; failures propagate"""
+    print("\n=== Test 3: Fan-out ===")
+    repository, conn = make_database()
+    context = ClientDataContext('C000', lambda: RecordingConnection(repository, delay=0.1))
+
+    def slow_forecast():
+        monthly = context.invoices.set_index('date')['net_a_payer'].resample('MS').sum()
+        time.sleep(0.3)  # model fitting
+        return len(monthly)
+
+    start = time.perf_counter()
+    results = fan_out({
+        'forecast': slow_forecast,
+        'top_products': lambda: context.top_products(5),
+        'basket': lambda: context.average_basket('2024-01-01', '2024-12-31')
+    })
+    elapsed = time.perf_counter() - start
+    print(f"Fan-out: {elapsed:.2f}s, {context.queries} queries")
+    assert results['forecast'] == 36 and len(results['top_products']) == 5
+    assert elapsed < 0.7  # sequential would be >= 0.3 + 3 x 0.1 + queries of each function
+    assert context.queries == 4  # rollup lookup, invoices, lines, product details
+
+    def failing():
+        raise ConnectionError("Lost connection to MySQL server")
+    try:
+        fan_out({'ok': lambda: 1, 'failing': failing})
+        assert False, "expected ConnectionError"
+    except ConnectionError:
+        print("✓ Failure of one component raised to the view")
+    conn.close()
+
+
+if __name__ == "__main__":
+    test_derived_results_match_sql()
+    test_loads_once_under_concurrency()
+    test_fan_out()
+    print("\n=== All tests completed! ===")
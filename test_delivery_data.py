@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Test script for the single-scan delivery data loading
+"""
+
+import os
+import sys
+import sqlite3
+import warnings
+from decimal import Decimal
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from delivery_data import load_delivery_lines, daily_client_aggregates, delivery_lines_view
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+
+def make_tables(rows=3000):
+    """entetecommercials / lignecommercials for two commercials, some invoices without lines"""
+    rng = np.random.default_rng(11)
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE entetecommercials (code TEXT, date TEXT, commercial_code TEXT, client_code TEXT, net_a_payer REAL)")
+    conn.execute("CREATE TABLE lignecommercials (entetecommercial_code TEXT, produit_code TEXT, quantite REAL)")
+    dates = pd.date_range('2024-01-01', periods=120, freq='D')
+    invoices, lines = [], []
+    for i in range(rows):
+        code = f"F{i:06d}"
+        invoices.append((code, str(dates[rng.integers(len(dates))].date()),
+                         '1300' if i % 4 else '1301', f"C{rng.integers(40):03d}",
+                         None if i % 97 == 0 else float(round(rng.gamma(2.0, 120.0), 2))))
+        for _ in range(0 if i % 13 == 0 else rng.integers(1, 6)):
+            lines.append((code, f"P{rng.integers(30):02d}", float(rng.integers(1, 20))))
+    conn.executemany("INSERT INTO entetecommercials VALUES (?, ?, ?, ?, ?)", invoices)
+    conn.executemany("INSERT INTO lignecommercials VALUES (?, ?, ?)", lines)
+    return conn
+
+
+def line_level(conn, commercial_code):
+    return pd.read_sql("""
+        SELECT ec.code, ec.date, ec.commercial_code, ec.client_code, ec.net_a_payer,
+               lc.produit_code, lc.quantite as product_quantity
+        FROM entetecommercials ec
+        LEFT JOIN lignecommercials lc ON ec.code = lc.entetecommercial_code
+        WHERE ec.commercial_code = ?
+        ORDER BY ec.date
+    """, conn, params=[commercial_code], parse_dates=['date'])
+
+
+def test_aggregates_match_sarima_query():
+    """Aggregates derived from the lines equal the former SQL aggregate"""
+    print("\n=== Test 1: Derived aggregates ===")
+    conn = make_tables()
+    lines = line_level(conn, '1300')
+    expected = pd.read_sql("""
+        SELECT ec.date, ec.commercial_code, ec.client_code,
+               COUNT(DISTINCT ec.client_code) as nombre_visites,
+               SUM(ec.net_a_payer) as net_a_payer,
+               COUNT(*) as quantite
+        FROM entetecommercials ec
+        WHERE ec.commercial_code = '1300'
+        GROUP BY ec.date, ec.commercial_code, ec.client_code
+        ORDER BY ec.date, ec.client_code
+    """, conn, parse_dates=['date'])
+
+    derived = daily_client_aggregates(lines)
+    print(f"{len(lines)} lines -> {len(derived)} daily client rows (SQL: {len(expected)})")
+    assert list(derived.columns) == list(expected.columns)
+    assert len(derived) == len(expected)
+    assert (derived['date'].values == expected['date'].values).all()
+    assert (derived['client_code'].values == expected['client_code'].values).all()
+    assert (derived['quantite'].values == expected['quantite'].values).all()
+    assert (derived['nombre_visites'].values == expected['nombre_visites'].values).all()
+    assert np.allclose(derived['net_a_payer'].astype(float), expected['net_a_payer'].astype(float), equal_nan=True)
+    print("✓ Same rows, invoice counts and revenue as the aggregated query")
+
+    view = delivery_lines_view(lines)
+    assert list(view.columns) == ['date', 'commercial_code', 'client_code', 'net_a_payer',
+                                  'produit_code', 'product_quantity']
+    assert daily_client_aggregates(lines.iloc[0:0]).empty
+
+
+class RecordingConnection:
+    """DBAPI connection returning fixed rows and recording the executed query"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def cursor(self, buffered=True):
+        connection = self
+
+        class Cursor:
+            description = [(c,) for c in ['code', 'date', 'commercial_code', 'client_code', 'net_a_payer',
+                                          'produit_code', 'product_quantity']]
+
+            def __init__(self):
+                self.pending = list(connection.rows)
+
+            def execute(self, query, params=None):
+                connection.executed.append((query, params))
+
+            def fetchmany(self, size):
+                chunk, self.pending = self.pending[:size], self.pending[size:]
+                return chunk
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+
+def test_single_bounded_typed_query():
+    """One query, bounded to the commercial, with typed columns"""
+    print("\n=== Test 2: Single typed query ===")
+    rows = [
+        ('F1', '2024-03-01', 1300, 'C001', Decimal('120.50'), 'P01', Decimal('3')),
+        ('F1', '2024-03-01', 1300, 'C001', Decimal('120.50'), 'P02', Decimal('1')),
+        ('F2', '2024-03-02', 1300, 'C002', Decimal('80.00'), None, None),
+    ]
+    conn = RecordingConnection(rows)
+    lines = load_delivery_lines(conn, 1300)
+    assert len(conn.executed) == 1
+    query, params = conn.executed[0]
+    assert 'ec.commercial_code = %s' in query and params == (12, 1300)
+    assert pd.api.types.is_datetime64_any_dtype(lines['date'])
+    assert lines['net_a_payer'].dtype == 'float64' and lines['product_quantity'].dtype == 'float64'
+    print(f"✓ One query with params {params}, dtypes: {dict(lines.dtypes.astype(str))}")
+
+    aggregates = daily_client_aggregates(lines)
+    assert aggregates['net_a_payer'].tolist() == [120.5, 80.0]
+    assert aggregates['quantite'].tolist() == [1, 1]
+    print("✓ Multi-line invoice counted once")
+
+    fleet = RecordingConnection([])
+    assert load_delivery_lines(fleet).empty
+    assert 'commercial_code = %s' not in fleet.executed[0][0]
+
+
+if __name__ == "__main__":
+    test_aggregates_match_sarima_query()
+    test_single_bounded_typed_query()
+    print("\n=== All tests completed! ===")
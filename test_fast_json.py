@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script for the orjson-based serialization layer
+"""
+
+import os
+import sys
+import json
+import time
+import decimal
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify
+from fast_json import dumps, fast_jsonify, register_default
+
+
+def make_plan(days=365 * 40):
+    """Daily plan shaped like dual_delivery_optimization_365_days()['daily_plan']"""
+    rng = np.random.default_rng(5)
+    return pd.DataFrame({
+        'date': pd.date_range('2025-01-01', periods=days, freq='D'),
+        'predicted_visits': rng.integers(0, 30, days),
+        'visits_lower_ci': rng.normal(5, 1, days),
+        'visits_upper_ci': rng.normal(20, 1, days),
+        'predicted_revenue': rng.gamma(2.0, 200.0, days),
+        'day_of_week': pd.date_range('2025-01-01', periods=days, freq='D').day_name(),
+        'period_type': rng.choice(['Peak', 'Normal', 'Low'], days),
+    })
+
+
+def test_types():
+    """numpy, pandas and datetime values are encoded without manual casts"""
+    print("\n=== Test 1: Supported types ===")
+    payload = {
+        'count': np.int64(3),
+        'ratio': np.float32(0.5),
+        'missing': np.float64('nan'),
+        'flag': np.bool_(True),
+        'day': pd.Timestamp('2025-03-01'),
+        'moment': pd.Timestamp('2025-03-01 08:30'),
+        'nat': pd.NaT,
+        'amount': decimal.Decimal('12.50'),
+        'values': np.array([1, 2, 3]),
+        'series': pd.Series([1.0, np.nan]),
+        'packing_list': {1001: 4},
+    }
+    decoded = json.loads(dumps(payload))
+    print(decoded)
+    assert decoded == {
+        'count': 3, 'ratio': 0.5, 'missing': None, 'flag': True,
+        'day': '2025-03-01', 'moment': '2025-03-01T08:30:00', 'nat': None,
+        'amount': 12.5, 'values': [1, 2, 3], 'series': [1.0, None], 'packing_list': {'1001': 4},
+    }
+
+
+def test_layouts_and_handlers():
+    """Records and columnar layouts, custom default handlers"""
+    print("\n=== Test 2: Layouts and custom handlers ===")
+    df = make_plan(3)
+    records = json.loads(dumps({'plan': df}))['plan']
+    columns = json.loads(dumps({'plan': df}, layout='columnar'))['plan']
+    assert records[0]['date'] == '2025-01-01' and len(records) == 3
+    assert columns['columns'] == list(df.columns)
+    assert columns['data']['predicted_visits'] == df['predicted_visits'].tolist()
+    print(f"✓ Columnar: {list(columns['data'])}")
+
+    class Coordinates:
+        def __init__(self, lat, lon):
+            self.lat, self.lon = lat, lon
+
+    register_default(Coordinates, lambda c: [c.lat, c.lon])
+    assert json.loads(dumps({'location': Coordinates(36.8, 10.18)})) == {'location': [36.8, 10.18]}
+    print("✓ Registered handler used")
+
+    app = Flask(__name__)
+    with app.test_request_context('/?layout=columnar'):
+        response = fast_jsonify({'plan': df})
+        assert response.mimetype == 'application/json'
+        assert 'columns' in json.loads(response.get_data())['plan']
+
+
+def test_faster_and_smaller():
+    """Faster than to_dict + jsonify; columnar payload is smaller"""
+    print("\n=== Test 3: Large plan ===")
+    df = make_plan()
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        start = time.perf_counter()
+        plan = df.copy()
+        plan['date'] = plan['date'].dt.strftime('%Y-%m-%d')
+        baseline = jsonify({'daily_plan': plan.to_dict('records')}).get_data()
+        baseline_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        records = fast_jsonify({'daily_plan': df}, layout='records').get_data()
+        records_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columnar = fast_jsonify({'daily_plan': df}, layout='columnar').get_data()
+        columnar_time = time.perf_counter() - start
+
+    print(f"to_dict + jsonify: {len(baseline) / 1024:.0f} KB in {baseline_time * 1000:.0f} ms")
+    print(f"fast_json records: {len(records) / 1024:.0f} KB in {records_time * 1000:.0f} ms")
+    print(f"fast_json columnar: {len(columnar) / 1024:.0f} KB in {columnar_time * 1000:.0f} ms")
+    assert json.loads(records)['daily_plan'][10]['date'] == json.loads(baseline)['daily_plan'][10]['date']
+    assert records_time < baseline_time
+    assert columnar_time < baseline_time / 3
+    assert len(columnar) < len(records) * 0.7
+    print("✓ Serialization time and payload size reduced")
+
+
+if __name__ == "__main__":
+    test_types()
+    test_layouts_and_handlers()
+    test_faster_and_smaller()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test script for response compression and conditional GET
+"""
+
+import os
+import sys
+import gzip
+import time
+import threading
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify, Response
+import http_caching
+from http_caching import init_http_caching, choose_encoding, DataWatermark
+
+
+def make_app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    state = {'watermark': '2024-05-01|F001', 'loads': 0, 'calls': 0}
+
+    def loader():
+        state['loads'] += 1
+        return state['watermark']
+
+    watermark = init_http_caching(app, loader, exclude_prefixes=('/api/export',), watermark_ttl=60)
+
+    @app.route('/api/chart_data/<code>')
+    def chart_data(code):
+        state['calls'] += 1
+        return jsonify({'code': code, 'values': list(range(2000))})
+
+    @app.route('/api/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/api/export/stream')
+    def stream():
+        return Response((f"{i}\n" for i in range(5000)), mimetype='text/csv')
+
+    return app, state, watermark
+
+
+def logged_client(app, user_id=1):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['is_admin'] = False
+    return client
+
+
+def test_conditional_get():
+    """Unchanged data answers 304 without running the view"""
+    print("\n=== Test 1: ETag / 304 ===")
+    app, state, watermark = make_app()
+    client = logged_client(app)
+
+    first = client.get('/api/chart_data/1300?selected_date=2024-05-01')
+    etag = first.headers['ETag']
+    print(f"ETag: {etag}, Cache-Control: {first.headers['Cache-Control']}")
+    assert first.status_code == 200 and etag.startswith('W/"')
+
+    second = client.get('/api/chart_data/1300?selected_date=2024-05-01', headers={'If-None-Match': etag})
+    assert second.status_code == 304 and second.data == b''
+    assert state['calls'] == 1
+    print("✓ 304 returned, view not executed")
+
+    other = client.get('/api/chart_data/1300?selected_date=2024-06-01', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+    print("✓ Different parameters give a different ETag")
+
+    other_user = logged_client(app, user_id=2).get('/api/chart_data/1300?selected_date=2024-05-01',
+                                                  headers={'If-None-Match': etag})
+    assert other_user.status_code == 200
+    print("✓ ETags are per user")
+
+    state['watermark'] = '2024-05-02|F002'
+    watermark.invalidate()
+    changed = client.get('/api/chart_data/1300?selected_date=2024-05-01', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    print("✓ New invoice data invalidates the ETag")
+    assert state['loads'] == 2
+
+
+def test_anonymous_and_excluded():
+    """No ETag for anonymous requests or excluded prefixes"""
+    print("\n=== Test 2: Exclusions ===")
+    app, _, _ = make_app()
+    assert 'ETag' not in app.test_client().get('/api/chart_data/1300').headers
+    response = logged_client(app).get('/api/export/stream', headers={'Accept-Encoding': 'gzip'})
+    assert 'ETag' not in response.headers and 'Content-Encoding' not in response.headers
+    print("✓ Anonymous and streamed export responses untouched")
+
+
+def test_compression():
+    """gzip / brotli negotiation and size threshold"""
+    print("\n=== Test 3: Compression ===")
+    app, _, _ = make_app()
+    client = logged_client(app)
+
+    plain = client.get('/api/chart_data/1300')
+    gz = client.get('/api/chart_data/1300', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert gz.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gz.data) == plain.data
+    assert 'Accept-Encoding' in gz.headers['Vary']
+    print(f"gzip: {len(plain.data)} -> {len(gz.data)} bytes")
+
+    if http_caching.brotli is not None:
+        br = client.get('/api/chart_data/1300', headers={'Accept-Encoding': 'gzip, br'})
+        assert br.headers['Content-Encoding'] == 'br'
+        assert http_caching.brotli.decompress(br.data) == plain.data
+        print(f"brotli: {len(plain.data)} -> {len(br.data)} bytes")
+
+    small = client.get('/api/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    print("✓ Small responses sent as is")
+
+    assert choose_encoding('gzip;q=0, identity') is None
+    assert choose_encoding('*') in ('br', 'gzip')
+    assert choose_encoding('br;q=0.5, gzip') == 'gzip'
+
+
+def test_watermark_reload():
+    """One reload at TTL expiry for concurrent requests, failures cached for the TTL"""
+    print("\n=== Test 4: Watermark reload ===")
+    state = {'loads': 0, 'fail': False}
+
+    def loader():
+        state['loads'] += 1
+        time.sleep(0.1)
+        if state['fail']:
+            raise ConnectionError("MySQL unreachable")
+        return '2024-05-01|F001'
+
+    watermark = DataWatermark(loader, ttl=0.5)
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(watermark.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state['loads'] == 1 and values == ['2024-05-01|F001'] * 8
+    print("✓ 8 concurrent requests, 1 query")
+
+    state['fail'] = True
+    watermark.invalidate()
+    assert watermark.get() is None and watermark.get() is None
+    assert state['loads'] == 2
+    time.sleep(0.5)
+    state['fail'] = False
+    assert watermark.get() == '2024-05-01|F001' and state['loads'] == 3
+    print("✓ Failure cached for the TTL, reloaded afterwards")
+
+
+if __name__ == "__main__":
+    test_conditional_get()
+    test_anonymous_and_excluded()
+    test_compression()
+    test_watermark_reload()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Test script for the load-testing harness
+Drives a small Flask application served in a background thread
+"""
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify, session, request, redirect
+from werkzeug.serving import make_server
+import requests
+from load_test import (run_load_test, summarize, find_saturation, weighted_mix, format_report, AppServer,
+                       dataset_context, SCENARIOS)
+
+SERIAL_LOCK = threading.Lock()
+BUSY = threading.Semaphore(2)
+
+
+def create_app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+
+    @app.route('/login', methods=['POST'])
+    def login():
+        if request.form['password'] != 'pw':
+            return 'Bad credentials', 200
+        session['user_id'] = request.form['login']
+        return redirect('/')
+
+    @app.route('/fast')
+    def fast():
+        if 'user_id' not in session:
+            return redirect('/login')
+        return jsonify({'term': request.args.get('term')})
+
+    @app.route('/serial')
+    def serial():
+        # One request at a time: throughput cannot grow with concurrency
+        with SERIAL_LOCK:
+            time.sleep(0.05)
+        return jsonify({})
+
+    @app.route('/busy')
+    def busy():
+        if not BUSY.acquire(blocking=False):
+            return jsonify({'error': 'busy'}), 429
+        try:
+            time.sleep(0.05)
+            return jsonify({})
+        finally:
+            BUSY.release()
+
+    return app
+
+
+@contextmanager
+def stand_in_server():
+    """create_app() served in a background thread; yields its base URL"""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+
+
+def missing_app_dependency():
+    """Module app.py cannot import in this environment, None when it imports"""
+    result = subprocess.run([sys.executable, '-c', 'import app'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env={**os.environ, 'SALES_DB_BACKEND': 'sqlite'}, capture_output=True, text=True,
+                            timeout=300)
+    if result.returncode == 0:
+        return None
+    match = re.search(r"ModuleNotFoundError: No module named '([^']+)'", result.stderr)
+    assert match, f"app.py failed to import:\n{result.stderr[-2000:]}"
+    return match.group(1)
+
+
+SCENARIOS_UNDER_TEST = {
+    'fast': {'name': 'fast', 'weight': 1,
+             'build': lambda context, rng: {'method': 'GET', 'path': '/fast', 'params': {'term': rng.choice(context)}}},
+    'serial': {'name': 'serial', 'weight': 1, 'build': lambda context, rng: {'method': 'GET', 'path': '/serial'}},
+    'busy': {'name': 'busy', 'weight': 1, 'build': lambda context, rng: {'method': 'GET', 'path': '/busy'}},
+}
+
+
+def test_closed_model():
+    """Percentiles per scenario, login, saturation of a serialized endpoint"""
+    print("\n=== Test 1: Closed model ===")
+    with stand_in_server() as url:
+        result = run_load_test(url, ['C1', 'C2'], [1, 2], 'closed', duration=0.5, credentials=('user', 'pw'),
+                               scenarios=SCENARIOS_UNDER_TEST, weights={'serial': 0, 'busy': 0})
+        fast = result['levels'][1]['stats']['fast']
+        assert fast['requests'] > 20 and fast['error_rate'] == 0, fast
+        assert fast['latency_ms']['p50'] <= fast['latency_ms']['p99'] <= fast['latency_ms']['max']
+        assert result['mix'] == {'fast': 1.0}
+        print(f"✓ fast: {fast['throughput']:.0f} req/s at 2 users, p95 {fast['latency_ms']['p95']} ms")
+
+        # Without the session, /fast redirects to /login: counted as errors
+        result = run_load_test(url, ['C1'], [1], 'closed', duration=0.3, scenarios=SCENARIOS_UNDER_TEST,
+                               weights={'serial': 0, 'busy': 0})
+        assert result['levels'][0]['stats']['fast']['error_rate'] == 1.0
+        assert list(result['levels'][0]['stats']['fast']['errors']) == ['HTTP 302']
+        try:
+            run_load_test(url, ['C1'], [1], 'closed', duration=0.3, credentials=('user', 'wrong'),
+                          scenarios=SCENARIOS_UNDER_TEST, weights={'serial': 0, 'busy': 0})
+            assert False, "login should fail"
+        except RuntimeError as e:
+            assert 'Login failed' in str(e)
+        print("✓ Redirects to /login are errors, a failed login stops the run")
+
+        result = run_load_test(url, [], [1, 4], 'closed', duration=1.0, scenarios=SCENARIOS_UNDER_TEST,
+                               weights={'fast': 0, 'busy': 0})
+        print(format_report(result))
+        point = result['saturation']['serial']
+        assert point['saturated_at'] == 4 and point['max_sustained'] == 1, point
+        print(f"✓ serial saturated at 4 users: {point['reason']}")
+
+
+def test_open_model():
+    """Poisson arrivals, 429 counted as rejections"""
+    print("\n=== Test 2: Open model ===")
+    with stand_in_server() as url:
+        result = run_load_test(url, [], [40], 'open', duration=1.5, scenarios=SCENARIOS_UNDER_TEST,
+                               weights={'fast': 0, 'serial': 0}, max_workers=16, seed=3)
+        stats = result['levels'][0]['stats']['busy']
+        print(format_report(result))
+        assert 30 < stats['requests'] < 95, stats
+        assert stats['rejected_rate'] > 0 and stats['error_rate'] == 0
+        assert result['saturation']['busy']['saturated_at'] == 40
+        print(f"✓ {stats['requests']} arrivals, {stats['rejected_rate']:.0%} rejected by the busy endpoint")
+
+
+def test_statistics_and_mix():
+    """Saturation criteria, mix validation, default scenarios"""
+    print("\n=== Test 3: Statistics and request mix ===")
+    samples = [{'scenario': 'a', 'latency': latency / 1000, 'outcome': 'ok', 'error': None}
+               for latency in range(1, 101)]
+    stats = summarize(samples, elapsed=10)
+    assert stats['a']['latency_ms']['p50'] == 50.5 and stats['a']['throughput'] == 10.0
+
+    def level(load, throughput, p95, errors=0.0):
+        return {'load': load, 'stats': {'a': {'throughput': throughput, 'error_rate': errors, 'rejected_rate': 0.0,
+                                              'latency_ms': {'p95': p95}}}}
+    assert find_saturation([level(1, 10, 50), level(2, 19, 60), level(4, 35, 200)])['a']['saturated_at'] == 4
+    assert find_saturation([level(1, 10, 50), level(2, 10.5, 60)])['a']['saturated_at'] == 2
+    assert find_saturation([level(1, 10, 50, errors=0.2)])['a'] == \
+        {'saturated_at': 1, 'max_sustained': None, 'reason': '20% errors/rejections'}
+    assert find_saturation([level(1, 10, 50), level(2, 19, 60)])['a']['saturated_at'] is None
+    print("✓ Latency, throughput and error criteria")
+
+    try:
+        weighted_mix(SCENARIOS, {'unknown': 1})
+        assert False, "unknown scenario should be refused"
+    except ValueError:
+        pass
+    names, cumulative = weighted_mix(SCENARIOS, {'analysis_365': 0})
+    assert 'analysis_365' not in names and cumulative[-1] == 90
+
+    from synthetic_data import SyntheticSalesGenerator
+    import random
+    context = dataset_context(SyntheticSalesGenerator(0.05, 1, '2024-01-01', '2024-03-31'))
+    rng = random.Random(0)
+    for name, spec in SCENARIOS.items():
+        built = spec['build'](context, rng)
+        assert built['method'] in ('GET', 'POST') and built['path'].startswith('/'), built
+    print(f"✓ Default mix: {', '.join(SCENARIOS)}")
+
+
+def test_app_server():
+    """app.py started on the SQLite stand-in, or its startup failure reported with the log"""
+    print("\n=== Test 4: Application server ===")
+    missing = missing_app_dependency()
+    server = AppServer(scale=0.02, startup_timeout=120)
+    if missing is None:
+        with server:
+            assert requests.get(f"{server.url}/login", timeout=10).status_code == 200
+        assert server.directory is None and server.process is None
+        print("✓ app.py started on the SQLite stand-in and answered /login")
+        return
+
+    # Expected failure: the module app.py cannot import here
+    try:
+        server.start()
+        assert False, "app.py should not start without " + missing
+    except RuntimeError as e:
+        assert 'exited with status' in str(e) and f"No module named '{missing}'" in str(e)
+    assert server.directory is None and server.process is None
+    print(f"✓ Skipped (no module named '{missing}'): startup failure reported with the app log")
+
+
+if __name__ == "__main__":
+    test_closed_model()
+    test_open_model()
+    test_statistics_and_mix()
+    test_app_server()
+    print("\n=== All tests completed! ===")
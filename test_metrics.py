@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Test script for the metrics module
+Request middleware, stage spans and the Prometheus /metrics endpoint
+"""
+
+import os
+import sys
+import time
+import threading
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify
+from metrics import (init_request_metrics, span, model_fit, Registry, REGISTRY, HTTP_REQUESTS, HTTP_DURATION,
+                     HTTP_IN_FLIGHT, STAGE_DURATION, MODEL_FITS, CONTENT_TYPE)
+from fast_json import fast_jsonify
+
+
+def parse(text):
+    """Prometheus text -> {'name{labels}': value}, checking the HELP/TYPE headers"""
+    samples, types = {}, {}
+    for line in text.strip().split("\n"):
+        if line.startswith('# TYPE'):
+            _, _, name, kind = line.split(' ')
+            types[name] = kind
+        elif not line.startswith('#'):
+            key, value = line.rsplit(' ', 1)
+            samples[key] = float(value)
+    return samples, types
+
+
+def create_app():
+    app = Flask(__name__)
+    app.logger.disabled = True
+    init_request_metrics(app)
+
+    @app.route('/api/plan/<code>')
+    def plan(code):
+        with span('db_fetch'):
+            time.sleep(0.02)
+        for _ in range(3):
+            with model_fit('sarimax'):
+                time.sleep(0.001)
+        return fast_jsonify({'code': code, 'stops': list(range(100))})
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError("boom")
+
+    @app.route('/missing')
+    def missing():
+        return jsonify({'error': 'not found'}), 404
+
+    return app
+
+
+def test_request_metrics():
+    """Route templates, statuses, stage histograms and fits on /metrics"""
+    print("\n=== Test 1: Request metrics and /metrics ===")
+    fits_before = MODEL_FITS.get(model='sarimax')
+    app = create_app()
+    client = app.test_client()
+    for code in ('1300', '1301'):
+        assert client.get(f'/api/plan/{code}').status_code == 200
+    assert client.get('/missing').status_code == 404
+    assert client.get('/boom').status_code == 500
+    assert client.get('/nowhere').status_code == 404
+
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.headers['Content-Type'] == CONTENT_TYPE
+    samples, types = parse(response.get_data(as_text=True))
+    assert types['http_request_duration_seconds'] == 'histogram' and types['model_fits_total'] == 'counter'
+
+    assert samples['http_requests_total{route="/api/plan/<code>",method="GET",status="200"}'] == 2
+    assert samples['http_requests_total{route="/missing",method="GET",status="404"}'] == 1
+    assert samples['http_requests_total{route="/boom",method="GET",status="500"}'] == 1
+    assert samples['http_requests_total{route="unmatched",method="GET",status="404"}'] == 1
+    assert samples['http_request_duration_seconds_count{route="/api/plan/<code>",method="GET"}'] == 2
+    assert samples['http_request_duration_seconds_sum{route="/api/plan/<code>",method="GET"}'] >= 0.04
+    # The scrape itself is in flight while the registry is rendered
+    assert samples['http_requests_in_flight'] == 1 and HTTP_IN_FLIGHT.get() == 0
+    print("✓ Requests counted per route template and status, unmatched paths grouped")
+
+    def stage(sample, name, le=None):
+        bound = f',le="{le}"' if le else ''
+        return f'stage_duration_seconds_{sample}{{route="/api/plan/<code>",stage="{name}"{bound}}}'
+    db = STAGE_DURATION.get(route='/api/plan/<code>', stage='db_fetch')
+    assert db['count'] == 2 and db['sum'] >= 0.04
+    assert samples[stage('bucket', 'db_fetch', '0.01')] == 0
+    assert samples[stage('bucket', 'db_fetch', '0.025')] == 2
+    assert samples[stage('bucket', 'model_fit', '+Inf')] == 6
+    assert samples[stage('count', 'serialize')] == 2
+    assert MODEL_FITS.get(model='sarimax') - fits_before == 6
+    print(f"✓ Stages: db_fetch {db['sum'] / 2 * 1000:.0f} ms per request, 6 SARIMAX fits, serialize timed")
+
+    buckets = [value for key, value in samples.items()
+               if key.startswith('http_request_duration_seconds_bucket{route="/api/plan/<code>"')]
+    assert buckets == sorted(buckets) and buckets[-1] == 2
+    print("✓ Cumulative buckets ending with +Inf == count")
+
+
+def test_spans_and_registry():
+    """Spans outside requests and across threads, callbacks, label checks, escaping"""
+    print("\n=== Test 2: Spans and registry ===")
+    before = STAGE_DURATION.get(route='background', stage='refresh')['count']
+
+    @span('refresh')
+    def refresh(depth=0):
+        time.sleep(0.005)
+        if depth < 2:
+            refresh(depth + 1)
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    timing = STAGE_DURATION.get(route='background', stage='refresh')
+    assert timing['count'] - before == 12
+    print("✓ Decorator spans: nested calls and threads timed separately, route 'background'")
+
+    registry = Registry()
+    counter = registry.counter('jobs_total', 'Jobs "done"\nper kind', ('kind',))
+    assert registry.counter('jobs_total', 'again', ('kind',)) is counter
+    try:
+        registry.gauge('jobs_total', 'other type')
+        assert False, "conflicting registration"
+    except ValueError:
+        pass
+    try:
+        counter.inc(kind='a', extra='b')
+        assert False, "unexpected label"
+    except ValueError:
+        pass
+    counter.inc(kind='say "hi"\\')
+    counter.inc(2.5, kind='b')
+    stats = {'running': 2}
+    registry.register_callback('active_jobs', 'Running jobs', ('job_class',), lambda: {'modelling': stats['running']})
+    registry.register_callback('broken', 'Fails at scrape', (), lambda: 1 / 0)
+    text = registry.render()
+    print(text)
+    assert '# HELP jobs_total Jobs "done"\\nper kind' in text
+    assert 'jobs_total{kind="say \\"hi\\"\\\\"} 1' in text
+    assert 'jobs_total{kind="b"} 2.5' in text
+    assert 'active_jobs{job_class="modelling"} 2' in text
+    assert '# TYPE broken gauge' in text and not any(line.startswith('broken') for line in text.split("\n"))
+    stats['running'] = 0
+    assert 'active_jobs{job_class="modelling"} 0' in registry.render()
+    assert REGISTRY.metrics['http_requests_total'] is HTTP_REQUESTS and HTTP_DURATION.type == 'histogram'
+    print("✓ Escaping, callbacks read at scrape time, failing callback skipped")
+
+
+if __name__ == "__main__":
+    test_request_metrics()
+    test_spans_and_registry()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for the parallel module runner used by /api/export/all_modules
+"""
+
+import os
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from parallel_runner import run_parallel, STATUS_SUCCESS, STATUS_ERROR, STATUS_TIMEOUT
+
+
+def slow_module(seconds, value):
+    time.sleep(seconds)
+    return {'value': value, 'pid': os.getpid()}
+
+
+def failing_module():
+    raise RuntimeError("Commercial introuvable")
+
+
+def crashing_module():
+    os._exit(3)
+
+
+def test_wall_time_is_slowest_module():
+    """Modules run side by side: wall time ~ slowest module"""
+    print("\n=== Test 1: Parallel wall time ===")
+    tasks = {
+        'visits': (slow_module, (0.6, 'a'), {}),
+        'prediction': (slow_module, (1.0, 'b'), {}),
+        'product': (slow_module, (0.6, 'c'), {}),
+        'delivery': (slow_module, (0.6, 'd'), {}),
+    }
+    start = time.monotonic()
+    outcomes = run_parallel(tasks)
+    elapsed = time.monotonic() - start
+    print(f"Sum of modules: 2.8s, wall time: {elapsed:.2f}s")
+    assert all(o['status'] == STATUS_SUCCESS for o in outcomes.values())
+    assert list(outcomes) == list(tasks)
+    assert outcomes['prediction']['result']['value'] == 'b'
+    assert len({o['result']['pid'] for o in outcomes.values()}) == 4
+    assert elapsed < 2.0
+    print("✓ Wall time close to the slowest module")
+
+
+def test_partial_results():
+    """Timeouts, errors and crashes are reported next to successful modules"""
+    print("\n=== Test 2: Partial results ===")
+    tasks = {
+        'ok': (slow_module, (0.1, 'ok'), {}),
+        'slow': (slow_module, (30, 'never'), {}),
+        'failing': (failing_module, (), {}),
+        'crash': (crashing_module, (), {}),
+    }
+    start = time.monotonic()
+    outcomes = run_parallel(tasks, timeouts={'slow': 0.5})
+    elapsed = time.monotonic() - start
+    for name, outcome in outcomes.items():
+        print(f"{name}: {outcome['status']} ({outcome['duration']}s) {(outcome['error'] or '').splitlines()[:1]}")
+    assert outcomes['ok']['status'] == STATUS_SUCCESS
+    assert outcomes['slow']['status'] == STATUS_TIMEOUT
+    assert outcomes['failing']['status'] == STATUS_ERROR and 'Commercial introuvable' in outcomes['failing']['error']
+    assert outcomes['crash']['status'] == STATUS_ERROR
+    assert elapsed < 3
+    print("✓ Slow module terminated at its timeout, others reported")
+
+
+def test_max_workers():
+    """No more than max_workers modules run at the same time"""
+    print("\n=== Test 3: Bounded concurrency ===")
+    tasks = {f"m{i}": (slow_module, (0.4, i), {}) for i in range(4)}
+    start = time.monotonic()
+    outcomes = run_parallel(tasks, max_workers=2)
+    elapsed = time.monotonic() - start
+    print(f"4 modules of 0.4s with 2 workers: {elapsed:.2f}s")
+    assert all(o['status'] == STATUS_SUCCESS for o in outcomes.values())
+    assert elapsed >= 0.8
+
+
+if __name__ == "__main__":
+    test_wall_time_is_slowest_module()
+    test_partial_results()
+    test_max_workers()
+    print("\n=== All tests completed! ===")
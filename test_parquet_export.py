@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test script for the Parquet export format
+Checks SQL pushdown of columns and filters, and compares Parquet to the Excel path
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import zipfile
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from export_utilities import ExportManager, EXPORT_DEFINITIONS, build_export_query, query_chunks
+
+ROWS = 40000
+
+
+def make_connection():
+    conn = sqlite3.connect(':memory:')
+    rng = np.random.default_rng(11)
+    pd.DataFrame({
+        'date': pd.date_range('2021-01-01', periods=ROWS, freq='45min').strftime('%Y-%m-%d %H:%M:%S'),
+        'commercial_code': rng.choice([str(c) for c in range(1300, 1320)], ROWS),
+        'client_code': [f"CL{i:05d}" for i in rng.integers(0, 3000, ROWS)],
+        'produit_code': [f"KC{i:06d}" for i in rng.integers(0, 400, ROWS)],
+        'ville': rng.choice(['Tunis', 'Sfax', 'Sousse', 'Nabeul'], ROWS),
+        'quantite': rng.integers(1, 50, ROWS),
+        'net_a_payer': rng.gamma(2.0, 90.0, ROWS).round(3),
+    }).to_sql('entetecommercials', conn, index=False)
+    return conn
+
+
+def test_query_pushdown():
+    """Column selection and filters end up in the SQL"""
+    print("\n=== Test 1: SQL pushdown ===")
+    sheet = EXPORT_DEFINITIONS['commercials']['sheets']['Performance_Mensuelle']
+
+    query, params = build_export_query(sheet)
+    print(query)
+    assert params == [] and "'%Y-%m'" in query
+
+    query, params = build_export_query(sheet, columns=['mois', 'ca_mensuel'],
+                                       filters={'start_date': '2023-01-01', 'end_date': '2023-12-31',
+                                                'commercial_code': '1300'})
+    print(query, params)
+    assert query.startswith("SELECT DATE_FORMAT(date, '%%Y-%%m') AS mois, SUM(net_a_payer) AS ca_mensuel FROM")
+    assert "COUNT(DISTINCT client_code)" not in query
+    # Grouping keys are kept even when not selected
+    assert "GROUP BY commercial_code, DATE_FORMAT" in query
+    assert "date >= %s" in query and "commercial_code = %s" in query
+    assert params == ['2023-01-01', '2023-12-31', '1300']
+
+    assert build_export_query(sheet, columns=['nom_client']) == (None, [])
+    print("✓ Pruned columns, filters and unrelated sheets handled")
+
+
+def test_parquet_roundtrip():
+    """Parquet files read back with dictionary-encoded codes"""
+    print("\n=== Test 2: Parquet round trip ===")
+    conn = make_connection()
+    path = ExportManager().export_to_parquet_streaming({
+        'Factures': query_chunks(conn, "SELECT * FROM entetecommercials", chunksize=7000),
+        'Vide': query_chunks(conn, "SELECT * FROM entetecommercials WHERE 1 = 0"),
+    }, "parquet_test")
+    conn.close()
+
+    extract_dir = tempfile.mkdtemp(prefix='parquet_test_')
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist() == ['Factures.parquet']
+        archive.extractall(extract_dir)
+    table = pq.read_table(os.path.join(extract_dir, 'Factures.parquet'))
+    print(table.schema)
+    assert table.num_rows == ROWS
+    assert pa.types.is_dictionary(table.schema.field('commercial_code').type)
+    assert pa.types.is_dictionary(table.schema.field('ville').type)
+    assert pa.types.is_floating(table.schema.field('net_a_payer').type)
+    assert pq.ParquetFile(os.path.join(extract_dir, 'Factures.parquet')).metadata.num_row_groups == 6
+    os.remove(path)
+    print("✓ One row group per chunk, codes stored as dictionaries")
+
+
+def test_parquet_vs_excel():
+    """Parquet is much smaller and faster to write than the xlsxwriter path"""
+    print("\n=== Test 3: Parquet vs Excel ===")
+    conn = make_connection()
+    manager = ExportManager()
+    query = "SELECT * FROM entetecommercials"
+    dtypes = {'date': 'datetime'}
+
+    start = time.perf_counter()
+    xlsx_path = manager.export_to_excel_streaming({'Factures': query_chunks(conn, query, dtypes=dtypes)}, "bench")
+    xlsx_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parquet_path = manager.export_to_parquet_streaming({'Factures': query_chunks(conn, query, dtypes=dtypes)}, "bench")
+    parquet_time = time.perf_counter() - start
+    conn.close()
+
+    xlsx_size = os.path.getsize(xlsx_path)
+    parquet_size = os.path.getsize(parquet_path)
+    print(f"Excel:   {xlsx_size / 1024:.0f} KB in {xlsx_time:.2f}s")
+    print(f"Parquet: {parquet_size / 1024:.0f} KB in {parquet_time:.2f}s")
+    os.remove(xlsx_path)
+    os.remove(parquet_path)
+    assert parquet_size * 3 < xlsx_size
+    assert parquet_time * 3 < xlsx_time
+    print(f"✓ {xlsx_size / parquet_size:.1f}x smaller, {xlsx_time / parquet_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    test_query_pushdown()
+    test_parquet_roundtrip()
+    test_parquet_vs_excel()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test script for the concurrent product image ingestion pipeline
+Runs against a local stand-in HTTP server serving fixture images
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+from product_image_ingestion import ImageIngestionPipeline, TokenBucket
+
+
+def make_fixture_image(color, size=(1200, 900)):
+    buf = BytesIO()
+    Image.new('RGB', size, color=color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+# Fixture images: SHARED is served under two product codes to exercise deduplication
+FIXTURES = {
+    'P1': make_fixture_image((255, 0, 0)),
+    'P2': make_fixture_image((0, 255, 0)),
+    'SHARED': make_fixture_image((0, 0, 255)),
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves /img/<name>.png; /flaky/<name>.png fails twice with 503 first, /down/ always"""
+    hits = {}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            self.hits[self.path] = self.hits.get(self.path, 0) + 1
+            count = self.hits[self.path]
+        kind, name = self.path.strip('/').split('/', 1)
+        name = name.rsplit('.', 1)[0]
+        if kind == 'down' or (kind == 'flaky' and count <= 2):
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        if kind == 'text':
+            body = b'not an image'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+        elif name in FIXTURES:
+            body = FIXTURES[name]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_resolver(base_url):
+    routes = {
+        'A': ['/text/page.html', '/img/P1.png'],
+        'B': ['/flaky/P2.png'],
+        'C': ['/img/SHARED.png'],
+        'D': ['/img/SHARED.png'],
+        'E': ['/img/missing.png'],
+        'F': ['/down/P1.png'],
+    }
+
+    def resolve(product, fetch):
+        return [base_url + path for path in routes.get(product['code'], [])]
+    return resolve
+
+
+def test_token_bucket():
+    """The limiter enforces the configured request rate"""
+    print("\n=== Test 1: Token bucket rate limiting ===")
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+    print(f"11 acquisitions at 50/s took {elapsed:.3f}s")
+    assert elapsed >= 0.18
+
+
+def test_pipeline_end_to_end():
+    """Downloads, retries, dedup and resume against the local server"""
+    print("\n=== Test 2: Ingestion pipeline ===")
+    FixtureHandler.hits.clear()
+    server, base_url = start_server()
+    image_dir = tempfile.mkdtemp(prefix='ingestion_')
+    try:
+        products = [{'code': code, 'name': f'Produit {code}', 'barcode': None} for code in 'ABCDEF']
+
+        pipeline = ImageIngestionPipeline(make_resolver(base_url), image_dir, max_workers=4,
+                                          rate=100, burst=10, max_retries=3, backoff=0.01)
+        stats = pipeline.run(products[:3])
+        print(f"First run (A-C): {stats}")
+        assert stats['done'] == 3
+        assert FixtureHandler.hits['/flaky/P2.png'] == 3
+        print("✓ Flaky URL succeeded after retries")
+        pipeline.close()
+
+        # Simulated restart: a new pipeline on the same manifest only processes D, E and F
+        pipeline = ImageIngestionPipeline(make_resolver(base_url), image_dir, max_workers=4,
+                                          rate=100, burst=10, max_retries=1, backoff=0.01)
+        stats = pipeline.run(products)
+        print(f"Resumed run (A-F): {stats}")
+        assert stats['skipped'] == 3 and stats['done'] == 1 and stats['not_found'] == 1 and stats['failed'] == 1
+        assert FixtureHandler.hits['/img/P1.png'] == 1
+        print("✓ Completed products were not downloaded again")
+
+        # F failed (server down), E is a real miss: only F is tried again
+        stats = pipeline.run(products)
+        assert stats['skipped'] == 5 and stats['failed'] == 1
+        assert FixtureHandler.hits['/down/P1.png'] == 4 and FixtureHandler.hits['/img/missing.png'] == 1
+        print("✓ Failed downloads retried on resume, real misses skipped")
+
+        c_path = os.path.join(image_dir, 'C.jpg')
+        d_path = os.path.join(image_dir, 'D.jpg')
+        assert os.path.samefile(c_path, d_path) or open(c_path, 'rb').read() == open(d_path, 'rb').read()
+        print("✓ Identical content stored once for C and D")
+
+        with Image.open(os.path.join(image_dir, 'A.jpg')) as img:
+            assert max(img.size) <= 800
+        print("✓ Images resized to the 800px bounding box")
+
+        print(f"Manifest summary: {pipeline.manifest.summary()}")
+        pipeline.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+
+def test_existing_images_kept():
+    """Images already on disk before the first run are neither searched nor overwritten"""
+    print("\n=== Test 3: Existing images ===")
+    FixtureHandler.hits.clear()
+    server, base_url = start_server()
+    image_dir = tempfile.mkdtemp(prefix='ingestion_')
+    try:
+        curated = os.path.join(image_dir, 'A.jpg')
+        Image.new('RGB', (50, 50), color=(10, 20, 30)).save(curated, 'JPEG')
+        with open(curated, 'rb') as f:
+            original = f.read()
+        mtime = os.path.getmtime(curated)
+
+        pipeline = ImageIngestionPipeline(make_resolver(base_url), image_dir, max_workers=2,
+                                          rate=100, burst=10, max_retries=1, backoff=0.01)
+        stats = pipeline.run([{'code': code, 'name': f'Produit {code}', 'barcode': None} for code in 'AC'])
+        print(f"Run with A.jpg already present: {stats}")
+        assert stats['skipped'] == 1 and stats['done'] == 1
+        assert '/img/P1.png' not in FixtureHandler.hits and '/text/page.html' not in FixtureHandler.hits
+        with open(curated, 'rb') as f:
+            assert f.read() == original
+        assert os.path.getmtime(curated) == mtime
+        assert pipeline.manifest.get_status('A') == 'done'
+        print("✓ Existing A.jpg left untouched and recorded as done")
+        pipeline.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_pipeline_end_to_end()
+    test_existing_images_kept()
+    print("\n=== All tests completed! ===")
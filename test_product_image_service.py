@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test script for the cached product image service
+Checks thumbnail/placeholder generation, regeneration rules and 304 handling
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+from flask import Flask
+from product_image_service import ProductImageService, IMAGE_SIZES
+
+
+def make_service(labels):
+    image_dir = tempfile.mkdtemp(prefix='product_images_')
+    return ProductImageService(image_dir=image_dir, label_loader=lambda: labels)
+
+
+def test_thumbnails_from_original():
+    """Originals are resized to every size and format"""
+    print("\n=== Test 1: Thumbnails from original images ===")
+    service = make_service({})
+    Image.new('RGB', (1600, 1200), color=(200, 30, 30)).save(os.path.join(service.image_dir, 'P001.jpg'))
+
+    for size, box in IMAGE_SIZES.items():
+        for fmt in ('jpeg', 'webp'):
+            path, etag, _ = service.get_image('P001', size=size, fmt=fmt)
+            with Image.open(path) as img:
+                assert img.width <= box[0] and img.height <= box[1]
+                assert img.format == ('JPEG' if fmt == 'jpeg' else 'WEBP')
+            print(f"✓ {size}/{fmt}: {os.path.basename(path)} etag={etag[:8]}")
+
+
+def test_regeneration_rules():
+    """Cached files are only rebuilt when the source or the label changes"""
+    print("\n=== Test 2: Regeneration only on source/label change ===")
+    labels = {'P002': 'Yaourt nature'}
+    service = make_service(labels)
+
+    path, etag1, _ = service.get_image('P002', size='thumb')
+    mtime1 = os.stat(path).st_mtime_ns
+    path, etag2, _ = service.get_image('P002', size='thumb')
+    assert etag1 == etag2 and os.stat(path).st_mtime_ns == mtime1
+    print("✓ Placeholder reused when nothing changed")
+
+    _, etag3, _ = service.get_image('P002', label='Yaourt fraise', size='thumb')
+    assert etag3 != etag1
+    print("✓ Placeholder regenerated after label change")
+
+    source = os.path.join(service.image_dir, 'P002.png')
+    Image.new('RGB', (400, 400), color=(0, 0, 255)).save(source)
+    _, etag4, _ = service.get_image('P002', size='thumb')
+    assert etag4 != etag3
+    time.sleep(0.01)
+    Image.new('RGB', (500, 400), color=(0, 255, 0)).save(source)
+    _, etag5, _ = service.get_image('P002', size='thumb')
+    assert etag5 != etag4
+    print("✓ Thumbnail regenerated after source image change")
+
+
+def test_pregenerate():
+    """Bulk pre-generation is idempotent"""
+    print("\n=== Test 3: Bulk pre-generation ===")
+    labels = {'A1': 'Produit A', 'B2': 'Produit B'}
+    service = make_service(labels)
+    first = service.pregenerate(labels.items(), sizes=['thumb', 'medium'])
+    second = service.pregenerate(labels.items(), sizes=['thumb', 'medium'])
+    print(f"First run: {first}, second run: {second}")
+    assert first['generated'] == 8 and first['errors'] == 0
+    assert second['up_to_date'] == 8 and second['generated'] == 0
+    print("✓ Second run found everything up to date")
+
+
+def test_conditional_get():
+    """ETag and Last-Modified are honoured with 304 responses"""
+    print("\n=== Test 4: Conditional GET ===")
+    service = make_service({'C3': 'Produit C'})
+    app = Flask(__name__)
+
+    @app.route('/product_image/<product_code>')
+    def product_image(product_code):
+        from flask import request
+        fmt = service.negotiate_format(request.args.get('format'), request.headers.get('Accept', ''))
+        return service.send_image(product_code, size='thumb', fmt=fmt)
+
+    client = app.test_client()
+    response = client.get('/product_image/C3')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    print(f"✓ First request: 200, ETag={etag}")
+
+    response = client.get('/product_image/C3', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    response = client.get('/product_image/C3', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    print("✓ Revalidation answered with 304")
+
+    response = client.get('/product_image/C3', headers={'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200 and response.mimetype == 'image/webp'
+    print("✓ WebP served when accepted")
+
+
+if __name__ == "__main__":
+    test_thumbnails_from_original()
+    test_regeneration_rules()
+    test_pregenerate()
+    test_conditional_get()
+    print("\n=== All tests completed! ===")
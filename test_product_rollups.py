@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test script for the monthly client x product sales rollup
+"""
+
+import os
+import sys
+import warnings
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+import daily_rollups
+from product_rollups import (rebuild, refresh, get_watermark, ROLLUP_NAME, month_range,
+                             load_top_products, sales_by_client_query)
+from export_utilities import ROLLUP_EXPORT_DEFINITIONS, build_export_query
+from sales_fixtures import sales_database, random_invoices, insert_rows
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+
+# 40 clients, each served by one of three commercials, over six months
+DATASET = dict(commercials=3, clients=40, products=20)
+
+
+def make_database():
+    conn = sales_database('2024-01-01', 5000, days=180, **DATASET).connect()
+    daily_rollups._availability.clear()
+    return conn
+
+
+RAW_MONTHLY = """
+    SELECT ec.client_code, lc.produit_code, SUBSTR(ec.date, 1, 7) AS month, ec.commercial_code,
+           SUM(lc.quantite) AS quantity, SUM(ec.net_a_payer) AS revenue,
+           COUNT(*) AS line_count, COUNT(DISTINCT ec.code) AS invoice_count
+    FROM entetecommercials ec
+    JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+    GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+"""
+
+
+def rollup_rows(conn):
+    return pd.read_sql("""
+        SELECT client_code, produit_code, month, commercial_code, quantity, revenue, line_count, invoice_count
+        FROM client_product_monthly_sales ORDER BY 1, 2, 3, 4
+    """, conn.conn)
+
+
+def assert_same(expected, actual):
+    assert len(expected) == len(actual)
+    for col in ['client_code', 'produit_code', 'month', 'commercial_code', 'line_count', 'invoice_count']:
+        assert (expected[col].values == actual[col].values).all(), col
+    assert np.allclose(expected['quantity'], actual['quantity'])
+    assert np.allclose(expected['revenue'], actual['revenue'])
+
+
+def test_rebuild_and_refresh():
+    """Rollup equals the raw monthly aggregation, after a rebuild and after a refresh"""
+    print("\n=== Test 1: Rebuild and incremental refresh ===")
+    conn = make_database()
+    lines = conn.conn.execute("SELECT COUNT(*) FROM lignecommercials").fetchone()[0]
+    result = rebuild(conn)
+    print(f"Rebuild: {result} ({lines} lines)")
+    assert_same(pd.read_sql(RAW_MONTHLY, conn.conn), rollup_rows(conn))
+
+    watermark = get_watermark(conn, ROLLUP_NAME)
+    assert get_watermark(conn) is None  # the daily rollup has its own watermark
+    insert_rows(conn, random_invoices(str(watermark), 200, seed=2, first_code=10000, days=20, **DATASET))
+    result = refresh(conn, lookback_days=3)
+    print(f"Refresh: {result}")
+    assert result['from'] == (watermark - pd.Timedelta(days=3)).strftime('%Y-%m')
+    assert get_watermark(conn, ROLLUP_NAME) > watermark
+    assert_same(pd.read_sql(RAW_MONTHLY, conn.conn), rollup_rows(conn))
+    print(f"✓ {result['rows']} rows recomputed from {result['from']}, table equal to the raw aggregation")
+
+    conn.conn.execute("INSERT INTO entetecommercials VALUES ('F888888', '2099-01-01', '1300', 'C001', 10.0)")
+    conn.commit()
+    latest = get_watermark(conn, ROLLUP_NAME)
+    refresh(conn)
+    assert get_watermark(conn, ROLLUP_NAME) == latest <= pd.Timestamp.now().date()
+    print("✓ Future-dated invoice does not move the watermark past today")
+
+
+def test_readers():
+    """Top products and sales by client equal the queries of app.py"""
+    print("\n=== Test 2: Readers ===")
+    conn = make_database()
+    assert load_top_products(conn, 'C001') is None
+    rebuild(conn)
+    daily_rollups._availability.clear()
+
+    expected = pd.read_sql("""
+        SELECT lc.produit_code, p.libelle AS produit_nom, SUM(ec.net_a_payer) AS total_ventes, p.image_url
+        FROM lignecommercials lc
+        JOIN entetecommercials ec ON lc.entetecommercial_code = ec.code
+        LEFT JOIN produits p ON lc.produit_code = p.code
+        WHERE ec.client_code = 'C001'
+        GROUP BY lc.produit_code, p.libelle, p.image_url
+        ORDER BY total_ventes DESC
+        LIMIT 5
+    """, conn.conn)
+    top = load_top_products(conn, 'C001', 5)
+    assert top['produit_code'].tolist() == expected['produit_code'].tolist()
+    assert np.allclose(top['total_ventes'], expected['total_ventes'])
+    assert top['image_url'].tolist() == expected['image_url'].tolist()
+    print("✓ Top products match")
+
+    assert month_range('2024-02-01', '2024-04-30') == ('2024-02', '2024-04')
+    assert month_range('2024-02-01', '2024-02-29') == ('2024-02', '2024-02')
+    assert month_range('2024-02-02', '2024-04-30') is None
+    assert month_range('2024-02-01', '2024-04-29') is None
+    assert sales_by_client_query(1301, '2024-02-15', '2024-03-31') is None
+
+    expected = pd.read_sql("""
+        SELECT ec.client_code, lc.produit_code, SUM(lc.quantite) AS total_quantite
+        FROM entetecommercials ec
+        JOIN lignecommercials lc ON lc.entetecommercial_code = ec.code
+        WHERE ec.commercial_code = '1301' AND ec.date BETWEEN '2024-02-01' AND '2024-04-30'
+        GROUP BY ec.client_code, lc.produit_code ORDER BY 1, 2
+    """, conn.conn)
+    query, params = sales_by_client_query(1301, '2024-02-01', '2024-04-30')
+    actual = pd.read_sql(query, conn, params=params)
+    actual = actual.sort_values(['client_code', 'produit_code']).reset_index(drop=True)
+    assert actual['client_nom'].notna().all()
+    assert (actual['produit_code'].values == expected['produit_code'].values).all()
+    assert np.allclose(actual['total_quantite'], expected['total_quantite'])
+    print(f"✓ Sales by client match ({len(actual)} client x product rows)")
+
+
+def test_products_export_sheets():
+    """Rollup-backed export sheets run and select whole months"""
+    print("\n=== Test 3: Products export ===")
+    conn = make_database()
+    rebuild(conn)
+    definition = ROLLUP_EXPORT_DEFINITIONS['products']
+    filters = {'start_date': '2024-02-01', 'end_date': '2024-03-31', 'commercial_code': '1300'}
+    for name, sheet in definition['sheets'].items():
+        query, params = build_export_query(sheet, None, filters, definition['table'], 'month')
+        df = pd.read_sql(query, conn, params=params)
+        print(f"{name}: {len(df)} rows, {list(df.columns)}")
+        assert list(df.columns) == [alias for alias, _ in sheet['select']]
+        assert len(df) > 0
+    assert params == ['2024-02', '2024-03', '1300']
+    assert set(df['nom_client'].str.startswith('Client')) == {True}
+
+    query, params = build_export_query(definition['sheets']['Tendances_Mensuelles'], ['mois'], filters,
+                                       definition['table'], 'month')
+    months = pd.read_sql(query, conn, params=params)
+    assert sorted(months['mois'].unique()) == ['2024-02', '2024-03']
+    print("✓ Same columns as the raw export, filters on whole months")
+
+
+if __name__ == "__main__":
+    test_rebuild_and_refresh()
+    test_readers()
+    test_products_export_sheets()
+    print("\n=== All tests completed! ===")
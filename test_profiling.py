@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test script for the on-demand request profiler
+"""
+
+import os
+import sys
+import json
+import time
+import pstats
+import shutil
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify, session
+from profiling import init_profiling, ProfileStore, render_flame_graph, sample_summary, folded
+
+
+def crunch(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def load_rows():
+    time.sleep(0.03)
+    return crunch(200000)
+
+
+def create_app(directory, max_profiles=50):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    store = init_profiling(app, ProfileStore(directory, max_profiles=max_profiles))
+
+    @app.route('/login/<int:admin>')
+    def login(admin):
+        session['is_admin'] = admin
+        session['user_login'] = 'admin' if admin else 'commercial'
+        return 'ok'
+
+    @app.route('/api/dashboard/<code>')
+    def dashboard(code):
+        return jsonify({'code': code, 'total': load_rows()})
+
+    return app, store
+
+
+def test_profiles_for_admins_only():
+    """Only administrators trigger profiles and read them"""
+    print("\n=== Test 1: Admin-only profiling ===")
+    directory = tempfile.mkdtemp()
+    try:
+        app, store = create_app(directory)
+        client = app.test_client()
+        client.get('/login/0')
+        response = client.get('/api/dashboard/C1?_profile=cprofile')
+        assert response.status_code == 200 and 'X-Profile-Id' not in response.headers
+        assert store.list() == []
+        assert client.get('/admin/profiles/').status_code == 403
+        print("✓ Non-admin: request served normally, nothing profiled, pages forbidden")
+
+        client.get('/login/1')
+        response = client.get('/api/dashboard/C1?_profile=cprofile')
+        profile_id = response.headers['X-Profile-Id']
+        assert response.json['code'] == 'C1'
+        assert response.headers['X-Profile-Url'] == f"/admin/profiles/{profile_id}/report.html"
+        for name in ('report.html', 'request.prof', 'stacks.folded', 'meta.json'):
+            assert os.path.exists(os.path.join(directory, profile_id, name)), name
+
+        stats = pstats.Stats(os.path.join(directory, profile_id, 'request.prof'))
+        functions = {name for _, _, name in stats.stats}
+        assert {'load_rows', 'crunch', 'dashboard'} <= functions
+        meta = store.list()[0]
+        assert meta['mode'] == 'cprofile' and meta['status'] == 200 and meta['user'] == 'admin'
+        assert meta['route'] == '/api/dashboard/<code>' and meta['duration_ms'] >= 30
+        print(f"✓ cProfile of {meta['path']}: {meta['duration_ms']} ms, {meta['samples']} samples")
+
+        report = client.get(response.headers['X-Profile-Url']).get_data(as_text=True)
+        assert 'crunch (test_profiling.py' in report and 'class="flame"' in report
+        with open(os.path.join(directory, profile_id, 'meta.json')) as f:
+            top = [row['function'] for row in json.load(f)['top']]
+        assert top.index(next(f for f in top if f.startswith('dashboard'))) < top.index(
+            next(f for f in top if f.startswith('crunch')))
+        index = client.get('/admin/profiles/').get_data(as_text=True)
+        assert f'{profile_id}/report.html' in index and '/api/dashboard/C1' in index
+        assert client.get('/admin/profiles').status_code == 308
+        assert client.get(f'/admin/profiles/{profile_id}/secret.txt').status_code == 404
+        assert client.get('/admin/profiles/..%2F..%2Fetc/meta.json').status_code == 404
+        print("✓ Report (top-N, flame graph), index and raw files served to the admin")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_sampling_and_retention():
+    """Sampling mode from the header, folded stacks, oldest profiles removed"""
+    print("\n=== Test 2: Sampling mode and retention ===")
+    directory = tempfile.mkdtemp()
+    try:
+        app, store = create_app(directory, max_profiles=2)
+        client = app.test_client()
+        client.get('/login/1')
+        ids = []
+        for code in ('C1', 'C2', 'C3'):
+            response = client.get(f'/api/dashboard/{code}', headers={'X-Profile': 'sample'})
+            ids.append(response.headers['X-Profile-Id'])
+        assert client.get('/api/dashboard/C4?_profile=unknown').headers.get('X-Profile-Id') is None
+
+        profiles = store.list()
+        assert [p['id'] for p in profiles] == ids[:0:-1]
+        assert not os.path.exists(os.path.join(directory, ids[0]))
+        assert not os.path.exists(os.path.join(directory, ids[2], 'request.prof'))
+        with open(os.path.join(directory, ids[2], 'stacks.folded')) as f:
+            stacks = f.read()
+        assert stacks.splitlines()[0].startswith('full_dispatch_request') and 'load_rows' in stacks
+        print(f"✓ {profiles[0]['samples']} samples, 2 newest profiles kept")
+
+        stacks = {('view', 'load', 'sleep'): 30, ('view', 'crunch'): 10, ('view',): 1, ('tiny',): 0}
+        rows = {row['function']: row for row in sample_summary(stacks, interval=0.01)}
+        assert round(rows['view']['cumtime'], 6) == 0.41 and round(rows['sleep']['tottime'], 6) == 0.3
+        assert 'view;load;sleep 30\n' in folded(stacks)
+        flame = render_flame_graph({('a', 'b<c>'): 3, ('a',): 1})
+        assert 'b&lt;c&gt;' in flame and 'width:75.0000%' in flame and 'width:100.0000%' in flame
+        assert 'No samples' in render_flame_graph({})
+        print("✓ Inclusive/own sample times, flame graph widths and escaping")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    test_profiles_for_admins_only()
+    test_sampling_and_retention()
+    print("\n=== All tests completed! ===")
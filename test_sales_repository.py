@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script for the repository layer and its SQLite backend
+Runs the MySQL queries of the pipelines on an SQLite database seeded from fixtures
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import warnings
+from datetime import datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+import sales_repository
+from sales_repository import SQLiteRepository, MySQLRepository, get_repository, set_repository, translate_sql
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+
+def write_fixtures(directory, invoices=3000):
+    """CSV fixtures: invoices of the last two years, their lines, clients and users"""
+    rng = np.random.default_rng(9)
+    today = datetime.now().date()
+    dates = [today - timedelta(days=int(d)) for d in rng.integers(0, 730, invoices)]
+    ec = pd.DataFrame({
+        'code': [f"F{i:06d}" for i in range(invoices)],
+        'date': [str(d) for d in dates],
+        'commercial_code': [str(1300 + c) for c in rng.integers(0, 3, invoices)],
+        'client_code': [f"C{c:03d}" for c in rng.integers(0, 90, invoices)],
+        'net_a_payer': rng.gamma(2.0, 80.0, invoices).round(3),
+    })
+    lc = pd.DataFrame({
+        'entetecommercial_code': np.repeat(ec['code'].values, 2),
+        'produit_code': [f"P{p:02d}" for p in rng.integers(0, 20, 2 * invoices)],
+        'quantite': rng.integers(1, 8, 2 * invoices),
+    })
+    ec.to_csv(os.path.join(directory, 'entetecommercials.csv'), index=False)
+    lc.to_csv(os.path.join(directory, 'lignecommercials.csv'), index=False)
+    pd.DataFrame({'id': [1], 'login': ['admin'], 'password': ['secret'], 'nom': ['Admin'],
+                  'isadmin': [1], 'isactif': [1]}).to_csv(os.path.join(directory, 'users.csv'), index=False)
+    return ec, lc
+
+
+def test_mysql_dialect():
+    """MySQL date functions, placeholders and dictionary cursors on SQLite"""
+    print("\n=== Test 1: MySQL dialect on SQLite ===")
+    assert translate_sql("WHERE date >= DATE_SUB(NOW(), INTERVAL %s MONTH) AND x LIKE '%%a'") == \
+        "WHERE date >= DATE_SUB(NOW(), ?, 'MONTH') AND x LIKE '%a'"
+    # An escaped %%s is the literal %s, not a placeholder
+    assert translate_sql("WHERE x LIKE '%%s%%' AND y = %s") == "WHERE x LIKE '%s%' AND y = ?"
+
+    conn = SQLiteRepository().connect()
+    cursor = conn.cursor()
+    cursor.execute("""SELECT DATE_ADD('2024-01-31', INTERVAL 1 MONTH), DATE_SUB('2024-03-01 10:00:00', INTERVAL %s DAY),
+                             DATE_FORMAT('2024-07-05', '%%Y-%%m'), DAY('2024-07-05'), MONTH('2024-07-05'), YEAR('2024-07-05')""",
+                   (1,))
+    row = cursor.fetchone()
+    print(row)
+    assert row == ('2024-02-29', '2024-02-29 10:00:00', '2024-07', 5, 7, 2024)
+    cursor.execute("SELECT DATE_SUB(CURDATE(), INTERVAL 1 DAY)")
+    assert cursor.fetchone()[0] == str(datetime.now().date() - timedelta(days=1))
+
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("INSERT INTO users (id, login, password, isactif) VALUES (%s, %s, %s, %s)", (7, 'demo', 'pw', 1))
+    cursor.execute("SELECT * FROM users WHERE login = %s AND isactif = 1", ('demo',))
+    user = cursor.fetchone()
+    assert user['id'] == 7 and user['password'] == 'pw'
+    conn.dispose()
+    print("✓ DATE_ADD/DATE_SUB/DATE_FORMAT/DAY/MONTH/YEAR, dictionary cursor, dispose()")
+
+    repository = MySQLRepository({**sales_repository.MYSQL_CONFIG, 'host': 'db.example'})
+    assert repository.dialect == 'mysql' and repository.config['database'] == 'pfe1'
+    try:
+        sales_repository.SalesRepository()
+        assert False, "the interface is abstract"
+    except TypeError:
+        pass
+    print("✓ MySQL backend configuration, abstract interface")
+
+
+def test_pipelines_on_fixtures():
+    """Delivery lines, calendar candidates and export sheets on the seeded SQLite database"""
+    print("\n=== Test 2: Pipelines on fixtures ===")
+    os.environ['SALES_SNAPSHOT'] = '0'
+    os.environ['ANALYTICS_ENGINE'] = '0'
+    directory = tempfile.mkdtemp()
+    previous = sales_repository._repository
+    try:
+        ec, lc = write_fixtures(directory)
+        os.environ['SALES_DB_BACKEND'] = 'sqlite'
+        os.environ['SALES_FIXTURES_DIR'] = directory
+        set_repository(None)
+        repository = get_repository()
+        assert repository.dialect == 'sqlite'
+
+        invoices = repository.invoices(commercial_code='1301')
+        assert len(invoices) == (ec['commercial_code'] == '1301').sum()
+        assert pd.api.types.is_datetime64_any_dtype(invoices['date'])
+        print(f"✓ Fixtures loaded, {len(invoices)} invoices of commercial 1301")
+
+        from delivery_data import load_delivery_lines
+        conn = repository.connect()
+        lines = load_delivery_lines(conn, '1302', months=6)
+        cutoff = pd.Timestamp(datetime.now() - pd.DateOffset(months=6))
+        # As on MySQL, a DATE equal to the cutoff day is before the DATETIME cutoff
+        recent = ec[(ec['commercial_code'] == '1302') & (pd.to_datetime(ec['date']) >= cutoff)]
+        assert lines['code'].nunique() == len(recent)
+        print(f"✓ load_delivery_lines (DATE_SUB(NOW(), INTERVAL %s MONTH)): {len(lines)} lines")
+
+        from calendar_index import candidates_query, _availability
+        _availability.clear()
+        target = datetime.now().date()
+        query, params = candidates_query(conn, '1300', target)
+        assert 'DAY(ec.date)' in query
+        candidates = pd.read_sql(query, conn, params=params)
+        dates = pd.to_datetime(ec['date'])
+        expected = ec[(ec['commercial_code'] == '1300') & (dates.dt.month == target.month) &
+                      (dates.dt.day == target.day) & (dates.dt.year < target.year)]
+        assert candidates['freq'].sum() == len(expected)
+        print(f"✓ Same-day-of-year candidates (DAY/MONTH/YEAR): {len(candidates)} clients")
+
+        from export_utilities import EXPORT_DEFINITIONS, build_export_query, query_chunks, get_db_connection
+        sheet = EXPORT_DEFINITIONS['commercials']['sheets']['Performance_Mensuelle']
+        start = str(target - timedelta(days=200))
+        query, params = build_export_query(sheet, filters={'start_date': start, 'end_date': str(target)})
+        monthly = pd.concat(query_chunks(get_db_connection(), query, params))
+        window = ec[(ec['date'] >= start) & (ec['date'] <= str(target))]
+        assert monthly['visites'].sum() == len(window)
+        assert np.isclose(monthly['ca_mensuel'].sum(), window['net_a_payer'].sum())
+        print(f"✓ Export sheet (DATE_FORMAT, DATE_ADD): {len(monthly)} rows")
+        conn.close()
+    finally:
+        for name in ['SALES_DB_BACKEND', 'SALES_FIXTURES_DIR', 'SALES_SNAPSHOT', 'ANALYTICS_ENGINE']:
+            os.environ.pop(name, None)
+        set_repository(previous)
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    test_mysql_dialect()
+    test_pipelines_on_fixtures()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test script for the local Parquet snapshot of the sales history
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import warnings
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from sales_snapshot import SalesSnapshot
+from sales_fixtures import sales_database, random_invoices, insert_rows, RecordingConnection
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+
+# 80 clients and three commercials; every 11th invoice has no line
+DATASET = dict(commercials=3, clients=80, products=30, no_lines_every=11)
+
+
+def make_database():
+    return RecordingConnection(sales_database('2023-01-01', 6000, **DATASET))
+
+
+def db_invoices(conn, start, end, commercial_code=None):
+    query = "SELECT * FROM entetecommercials WHERE date BETWEEN ? AND ?"
+    params = [start, end]
+    if commercial_code:
+        query += " AND commercial_code = ?"
+        params.append(commercial_code)
+    return pd.read_sql(query + " ORDER BY code", conn.conn, params=params)
+
+
+def assert_same_invoices(expected, actual):
+    actual = actual.sort_values('code').reset_index(drop=True)
+    assert len(expected) == len(actual), (len(expected), len(actual))
+    assert (expected['code'].values == actual['code'].values).all()
+    assert (expected['client_code'].values == actual['client_code'].astype(str).values).all()
+    assert (pd.to_datetime(expected['date']).values == actual['date'].values).all()
+    assert np.allclose(expected['net_a_payer'], actual['net_a_payer'])
+
+
+def test_full_sync_and_load():
+    """Full sync, typed partitions, range loads equal the database"""
+    print("\n=== Test 1: Full sync ===")
+    conn = make_database()
+    root = tempfile.mkdtemp()
+    try:
+        snapshot = SalesSnapshot(root)
+        assert not snapshot.available()
+        result = snapshot.sync(conn)
+        print(f"Sync: {result}")
+        assert result['from'] is None and result['months'] == 12
+        assert snapshot.months() == [f"2023-{m:02d}" for m in range(1, 13)]
+
+        invoices = snapshot.load_invoices('2023-03-15', '2023-05-31', '1301')
+        assert isinstance(invoices['client_code'].dtype, pd.CategoricalDtype)
+        assert pd.api.types.is_datetime64_any_dtype(invoices['date'])
+        assert invoices['net_a_payer'].dtype == 'float64'
+        assert_same_invoices(db_invoices(conn, '2023-03-15', '2023-05-31', '1301'), invoices)
+        assert invoices['date'].is_monotonic_increasing
+        print(f"✓ {len(invoices)} invoices of commercial 1301, categorical codes")
+    finally:
+        shutil.rmtree(root)
+
+
+def test_incremental_sync_and_tail():
+    """Unsynchronized tail read from the database; incremental sync replaces by code"""
+    print("\n=== Test 2: Tail and incremental sync ===")
+    conn = make_database()
+    root = tempfile.mkdtemp()
+    try:
+        snapshot = SalesSnapshot(root)
+        snapshot.sync(conn)
+        watermark = snapshot.watermark
+
+        # New invoices, one late invoice and one corrected amount inside the lookback
+        insert_rows(conn, random_invoices(str((watermark + pd.Timedelta(days=1)).date()), 300, seed=2,
+                                          first_code=10000, days=20, **DATASET))
+        late_day = str((watermark - pd.Timedelta(days=1)).date())
+        conn.conn.execute("INSERT INTO entetecommercials VALUES ('F999999', ?, '1300', 'C001', 42.0)", (late_day,))
+        corrected = conn.conn.execute("SELECT code FROM entetecommercials WHERE date = ? LIMIT 1",
+                                      (str(watermark.date()),)).fetchone()[0]
+        conn.conn.execute("UPDATE entetecommercials SET net_a_payer = 1.5 WHERE code = ?", (corrected,))
+        # Added after the sync with the watermark's own date
+        conn.conn.execute("INSERT INTO entetecommercials VALUES ('F888888', ?, '1300', 'C001', 7.0)",
+                          (str(watermark.date()),))
+        conn.commit()
+
+        conn.executed.clear()
+        combined = snapshot.load_invoices('2023-12-01', None, None, conn)
+        tail_query, tail_params = conn.executed[0]
+        assert len(conn.executed) == 1 and 'date >= %s' in tail_query
+        tail = combined[combined['date'] > watermark]
+        assert len(tail) == 300
+        assert (combined['code'] == 'F888888').sum() == 1 and combined['code'].is_unique
+        assert combined.loc[combined['code'] == corrected, 'net_a_payer'].iloc[0] == 1.5
+        print(f"✓ One tail query ({tail_params}), {len(tail)} new invoices, same-day invoice once")
+
+        result = snapshot.sync(conn, lookback_days=3)
+        print(f"Incremental sync: {result}")
+        assert result['from'] == str((watermark - pd.Timedelta(days=3)).date())
+        assert result['invoices'] < 400
+        everything = snapshot.load_invoices()
+        assert_same_invoices(db_invoices(conn, '2000-01-01', '2100-01-01'), everything)
+        assert everything.loc[everything['code'] == corrected, 'net_a_payer'].iloc[0] == 1.5
+        assert (everything['code'] == 'F999999').sum() == 1
+        print("✓ Late invoice added, corrected invoice replaced, no duplicates")
+
+        conn.conn.execute("INSERT INTO entetecommercials VALUES ('F777777', '2099-01-01', '1300', 'C001', 5.0)")
+        conn.commit()
+        latest = snapshot.watermark
+        snapshot.sync(conn)
+        assert snapshot.watermark == latest
+        assert (snapshot.load_invoices(conn=conn)['code'] == 'F777777').sum() == 1
+        print("✓ Future-dated invoice kept, watermark not moved past today")
+    finally:
+        shutil.rmtree(root)
+
+
+def test_load_lines():
+    """Lines joined with their invoices, as load_delivery_lines returns them"""
+    print("\n=== Test 3: Lines ===")
+    conn = make_database()
+    root = tempfile.mkdtemp()
+    try:
+        snapshot = SalesSnapshot(root)
+        snapshot.sync(conn)
+        expected = pd.read_sql("""
+            SELECT ec.code, lc.produit_code, lc.quantite
+            FROM entetecommercials ec
+            LEFT JOIN lignecommercials lc ON ec.code = lc.entetecommercial_code
+            WHERE ec.commercial_code = '1302' AND ec.date >= '2023-06-01'
+            ORDER BY ec.code, lc.produit_code, lc.quantite
+        """, conn.conn)
+        lines = snapshot.load_lines('2023-06-01', None, '1302', conn, categorical=False)
+        assert list(lines.columns) == ['code', 'date', 'commercial_code', 'client_code', 'net_a_payer',
+                                       'produit_code', 'product_quantity']
+        actual = lines.sort_values(['code', 'produit_code', 'product_quantity'], na_position='first')
+        assert len(actual) == len(expected)
+        assert (actual['code'].values == expected['code'].values).all()
+        assert lines['produit_code'].isna().sum() == expected['produit_code'].isna().sum() > 0
+        assert np.isclose(lines['product_quantity'].sum(), expected['quantite'].sum())
+        print(f"✓ {len(lines)} lines, invoices without lines kept")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    test_full_sync_and_load()
+    test_incremental_sync_and_tail()
+    test_load_lines()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script for request coalescing (single flight)
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from datetime import datetime
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from single_flight import SingleFlight, normalize_key
+
+
+def test_normalize_key():
+    """Equivalent parameters give the same key"""
+    print("\n=== Test 1: Key normalization ===")
+    a = normalize_key('delivery_plan', commercial_code=' 1300', delivery_date=datetime(2025, 3, 1),
+                      min_revenue=150.0, product_codes=['B', 'A'])
+    b = normalize_key('delivery_plan', product_codes=['A', 'B'], min_revenue=150,
+                      delivery_date=datetime(2025, 3, 1), commercial_code='1300')
+    c = normalize_key('delivery_plan', commercial_code='1300', delivery_date=datetime(2025, 3, 2),
+                      min_revenue=150, product_codes=['A', 'B'])
+    print(a)
+    assert a == b and a != c
+
+
+def test_threads_share_one_computation():
+    """Concurrent identical calls run the function once"""
+    print("\n=== Test 2: In-process coalescing ===")
+    flights = SingleFlight()
+    calls = []
+
+    def expensive(code):
+        calls.append(code)
+        time.sleep(0.3)
+        return {'code': code, 'plan': list(range(5))}
+
+    results = []
+    lock = threading.Lock()
+
+    def worker(code):
+        result, shared = flights.do(f"365:{code}", expensive, code)
+        with lock:
+            results.append((result, shared))
+
+    threads = [threading.Thread(target=worker, args=('1300',)) for _ in range(8)]
+    threads.append(threading.Thread(target=worker, args=('1301',)))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"Calls: {calls}, stats: {flights.stats}")
+    assert sorted(calls) == ['1300', '1301']
+    assert sum(1 for _, shared in results if shared) == 7
+    assert all(r['code'] in ('1300', '1301') for r, _ in results)
+    assert not flights.calls
+
+    # Once finished, the next call computes again (no caching)
+    flights.do("365:1300", expensive, '1300')
+    assert calls.count('1300') == 2
+    print("✓ 9 requests, 2 computations; finished flights are not reused")
+
+
+def test_errors_propagate():
+    """Followers receive the leader's exception"""
+    print("\n=== Test 3: Error propagation ===")
+    flights = SingleFlight()
+    errors = []
+
+    def failing():
+        time.sleep(0.2)
+        raise ValueError("No historical data found")
+
+    def worker():
+        try:
+            flights.do("plan", failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == ["No historical data found"] * 4 and flights.stats['leaders'] == 1
+    print("✓ 4 callers, 1 computation, 4 errors")
+
+
+def _process_worker(lock_dir, counter_path, queue):
+    flights = SingleFlight(lock_dir=lock_dir)
+
+    def expensive():
+        with open(counter_path, 'a') as f:
+            f.write('x')
+        time.sleep(0.5)
+        return {'value': 42}
+
+    result, shared = flights.do("365:1300", expensive)
+    queue.put((result['value'], shared))
+
+
+def test_cross_process():
+    """With a lock directory, worker processes share one computation"""
+    print("\n=== Test 4: Cross-process coalescing ===")
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print("fork unavailable, skipped")
+        return
+    lock_dir = tempfile.mkdtemp(prefix='single_flight_')
+    counter_path = os.path.join(lock_dir, 'counter')
+    try:
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        processes = [context.Process(target=_process_worker, args=(lock_dir, counter_path, queue)) for _ in range(4)]
+        for p in processes:
+            p.start()
+            time.sleep(0.02)
+        for p in processes:
+            p.join(10)
+        outcomes = [queue.get(timeout=1) for _ in processes]
+        with open(counter_path) as f:
+            computations = len(f.read())
+        print(f"Outcomes: {outcomes}, computations: {computations}")
+        assert computations == 1
+        assert all(value == 42 for value, _ in outcomes)
+        assert sum(1 for _, shared in outcomes if shared) == 3
+        print("✓ 4 processes, 1 computation")
+    finally:
+        shutil.rmtree(lock_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    test_normalize_key()
+    test_threads_share_one_computation()
+    test_errors_propagate()
+    test_cross_process()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script for the constant-memory Excel export path
+Uses an in-memory SQLite table in place of MySQL
+"""
+
+import os
+import sys
+import sqlite3
+import tracemalloc
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from openpyxl import load_workbook
+from export_utilities import ExportManager, query_chunks, send_temp_file, estimate_column_widths
+
+ROWS = 30000
+
+
+def make_connection():
+    conn = sqlite3.connect(':memory:')
+    rng = np.random.default_rng(42)
+    df = pd.DataFrame({
+        'commercial_code': rng.integers(1000, 1100, ROWS).astype(str),
+        'client_code': [f"CL{i:06d}" for i in rng.integers(0, 20000, ROWS)],
+        'date': pd.date_range('2021-01-01', periods=ROWS, freq='h'),
+        'net_a_payer': rng.gamma(2.0, 150.0, ROWS).round(3),
+    })
+    df.to_sql('entetecommercials', conn, index=False)
+    return conn
+
+
+def test_streaming_workbook():
+    """Chunks are written to a temporary workbook with the expected content"""
+    print("\n=== Test 1: Streaming workbook content ===")
+    conn = make_connection()
+    manager = ExportManager()
+    sheets = {
+        'Factures': query_chunks(conn, "SELECT * FROM entetecommercials ORDER BY date", chunksize=5000),
+        'Vide': query_chunks(conn, "SELECT * FROM entetecommercials WHERE 1 = 0"),
+        'Resume': query_chunks(conn, "SELECT commercial_code, SUM(net_a_payer) AS ca FROM entetecommercials GROUP BY commercial_code"),
+    }
+    path = manager.export_to_excel_streaming(sheets, "test_export")
+    conn.close()
+
+    workbook = load_workbook(path, read_only=True)
+    print(f"Sheets: {workbook.sheetnames}")
+    assert workbook.sheetnames == ['Factures', 'Resume']
+    factures = workbook['Factures']
+    rows = list(factures.iter_rows(values_only=True))
+    assert rows[0] == ('commercial_code', 'client_code', 'date', 'net_a_payer')
+    assert len(rows) == ROWS + 1
+    print(f"✓ {len(rows) - 1} rows written to 'Factures'")
+    workbook.close()
+    os.remove(path)
+
+
+def test_bounded_memory():
+    """Peak memory does not grow with the number of rows"""
+    print("\n=== Test 2: Bounded peak memory ===")
+    conn = make_connection()
+    manager = ExportManager()
+
+    peaks = {}
+    for limit in (5000, ROWS):
+        tracemalloc.start()
+        path = manager.export_to_excel_streaming(
+            {'Factures': query_chunks(conn, f"SELECT * FROM entetecommercials LIMIT {limit}", chunksize=2000)},
+            "memory_test"
+        )
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        os.remove(path)
+        peaks[limit] = peak
+        print(f"{limit} rows: peak {peak / 1024 / 1024:.1f} MB")
+    conn.close()
+    assert peaks[ROWS] < peaks[5000] * 2
+    print("✓ Peak memory independent of table size")
+
+
+def test_column_widths_from_sample():
+    """Widths come from a sample and are capped"""
+    print("\n=== Test 3: Column width estimation ===")
+    df = pd.DataFrame({'code': ['A', 'BBBB'], 'libelle': ['x' * 80, 'y']})
+    widths = estimate_column_widths(df)
+    print(f"Widths: {widths}")
+    assert widths == [6, 50]
+
+
+def test_send_temp_file():
+    """The temporary file is streamed and deleted afterwards"""
+    print("\n=== Test 4: Streaming response ===")
+    conn = make_connection()
+    path = ExportManager().export_to_excel_streaming(
+        {'Factures': query_chunks(conn, "SELECT * FROM entetecommercials LIMIT 100")}, "send_test"
+    )
+    conn.close()
+    size = os.path.getsize(path)
+
+    app = Flask(__name__)
+
+    @app.route('/download')
+    def download():
+        return send_temp_file(path, 'export.xlsx')
+
+    response = app.test_client().get('/download')
+    body = response.get_data()
+    response.close()
+    assert response.status_code == 200 and len(body) == size
+    assert 'attachment' in response.headers['Content-Disposition']
+    assert not os.path.exists(path)
+    print(f"✓ {size} bytes streamed, temporary file removed")
+
+
+if __name__ == "__main__":
+    test_streaming_workbook()
+    test_bounded_memory()
+    test_column_widths_from_sample()
+    test_send_temp_file()
+    print("\n=== All tests completed! ===")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script for the NDJSON / CSV streaming exports
+Uses an in-memory SQLite table in place of MySQL
+"""
+
+import os
+import sys
+import io
+import json
+import sqlite3
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from flask import Flask, request
+from export_utilities import stream_export, stream_query_export, records_chunks, frame_chunks, ExportManager
+
+ROWS = 12000
+
+
+class TrackedConnection:
+    """sqlite3 connection wrapper recording when it is closed"""
+
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.closed = False
+        rng = np.random.default_rng(3)
+        pd.DataFrame({
+            'code': [f"F{i:06d}" for i in range(ROWS)],
+            'date': pd.date_range('2023-01-01', periods=ROWS, freq='h').strftime('%Y-%m-%d %H:%M:%S'),
+            'commercial_code': rng.choice(['1300', '1301'], ROWS),
+            'net_a_payer': rng.gamma(2.0, 80.0, ROWS).round(3),
+        }).to_sql('entetecommercials', self.conn, index=False)
+
+    def cursor(self, *args, **kwargs):
+        return self.conn.cursor()
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+def make_app(tracked):
+    app = Flask(__name__)
+
+    @app.route('/visits')
+    def visits():
+        return stream_query_export("SELECT * FROM entetecommercials WHERE commercial_code = ? ORDER BY date",
+                                   ['1300'], request.args.get('format', 'ndjson'), "visites",
+                                   dtypes={'date': 'datetime'}, connect=lambda: tracked, chunksize=1000)
+    return app
+
+
+def test_ndjson_stream():
+    """Rows are streamed as NDJSON with chunked transfer encoding"""
+    print("\n=== Test 1: NDJSON stream ===")
+    tracked = TrackedConnection()
+    expected = tracked.conn.execute("SELECT COUNT(*) FROM entetecommercials WHERE commercial_code = '1300'").fetchone()[0]
+
+    response = make_app(tracked).test_client().get('/visits?format=ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert 'Content-Length' not in response.headers
+    assert response.is_streamed
+
+    lines = response.get_data(as_text=True).splitlines()
+    response.close()
+    records = [json.loads(line) for line in lines]
+    print(f"{len(records)} NDJSON records, first: {records[0]}")
+    assert len(records) == expected
+    assert records[0]['date'].startswith('2023-01-01T')
+    assert tracked.closed
+    print("✓ All rows streamed and connection closed")
+
+
+def test_csv_stream():
+    """CSV output has a single header and matches pandas"""
+    print("\n=== Test 2: CSV stream ===")
+    tracked = TrackedConnection()
+    response = make_app(tracked).test_client().get('/visits?format=csv')
+    body = response.get_data(as_text=True)
+    response.close()
+    df = pd.read_csv(io.StringIO(body))
+    print(f"{len(df)} CSV rows, columns: {list(df.columns)}")
+    assert body.count('commercial_code') == 1
+    assert (df['commercial_code'] == 1300).all()
+    assert 'attachment' in response.headers['Content-Disposition']
+
+
+def test_lazy_generation():
+    """The first block is sent before the source has been fully consumed"""
+    print("\n=== Test 3: Lazy generation ===")
+    produced = []
+
+    def rows():
+        for i in range(50):
+            produced.append(i)
+            yield {'i': i, 'label': f"row {i}"}
+
+    app = Flask(__name__)
+    with app.test_request_context():
+        response = stream_export(records_chunks(rows(), chunksize=10), 'ndjson', 'lazy')
+        first = next(iter(response.response))
+        print(f"First block has {first.count(chr(10))} lines, {len(produced)} rows produced so far")
+        assert first.count('\n') == 10 and len(produced) <= 11
+        response.close()
+
+
+def test_helpers():
+    """Unsupported formats are rejected; in-memory frames are sliced"""
+    print("\n=== Test 4: Helpers ===")
+    app = Flask(__name__)
+    with app.test_request_context():
+        try:
+            stream_export(iter([]), 'xml')
+            assert False, "xml should be rejected"
+        except ValueError as e:
+            print(f"✓ Rejected: {e}")
+    df = pd.DataFrame({'a': range(25)})
+    assert [len(c) for c in frame_chunks(df, 10)] == [10, 10, 5]
+    csv_text = ''.join(ExportManager().stream_to_csv(frame_chunks(df, 10)))
+    assert csv_text == df.to_csv(index=False)
+    print("✓ Chunked CSV identical to a single to_csv call")
+
+
+if __name__ == "__main__":
+    test_ndjson_stream()
+    test_csv_stream()
+    test_lazy_generation()
+    test_helpers()
+    print("\n=== All tests completed! ===")
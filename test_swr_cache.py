@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Test script for the stale-while-revalidate dashboard cache
+"""
+
+import os
+import sys
+import json
+import time
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from swr_cache import SWRCache, cached_jsonify
+
+
+class FakeKpiSource:
+    """Stands in for get_commercial_performance: slow, can be made to fail"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self.down = False
+        self.revenue = 1000
+
+    def load(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.down:
+            raise ConnectionError("MySQL server has gone away")
+        return {'total_revenue': self.revenue, 'total_sales': 12}
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_fresh_and_stale():
+    """Fresh hits, then stale served instantly while refreshing in background"""
+    print("\n=== Test 1: Stale-while-revalidate ===")
+    source = FakeKpiSource()
+    cache = SWRCache(fresh_ttl=0.3)
+
+    value, info = cache.get('perf:1300', source.load)
+    assert info['status'] == 'miss' and value['total_revenue'] == 1000
+
+    start = time.perf_counter()
+    value, info = cache.get('perf:1300', source.load)
+    hit_ms = (time.perf_counter() - start) * 1000
+    assert info['status'] == 'hit' and source.calls == 1
+    print(f"✓ Hit served in {hit_ms:.2f} ms")
+
+    time.sleep(0.35)
+    source.revenue = 2000
+    start = time.perf_counter()
+    value, info = cache.get('perf:1300', source.load)
+    stale_ms = (time.perf_counter() - start) * 1000
+    assert info['status'] == 'stale' and value['total_revenue'] == 1000
+    assert stale_ms < 10
+    print(f"✓ Stale value served in {stale_ms:.2f} ms while refreshing")
+
+    # Concurrent stale reads do not start a second refresh
+    cache.get('perf:1300', source.load)
+    assert wait_for(lambda: cache.stats['refreshes'] == 1)
+    value, info = cache.get('perf:1300', source.load)
+    assert info['status'] == 'hit' and value['total_revenue'] == 2000
+    assert source.calls == 2
+    print("✓ Background refresh replaced the entry")
+
+
+def test_database_down():
+    """Failures keep serving the last good result, flagged stale"""
+    print("\n=== Test 2: MySQL unavailable ===")
+    source = FakeKpiSource(delay=0.05)
+    cache = SWRCache(fresh_ttl=0.1, max_stale=0.5, retry_delay=0.2)
+    cache.get('basket:C1', source.load)
+
+    source.down = True
+    time.sleep(0.15)
+    cache.get('basket:C1', source.load)  # triggers a failing refresh
+    assert wait_for(lambda: cache.stats['refresh_errors'] == 1)
+
+    value, info = cache.get('basket:C1', source.load)
+    assert info['stale'] and info['error'] == "MySQL server has gone away"
+    assert value['total_revenue'] == 1000
+    calls = source.calls
+    cache.get('basket:C1', source.load)
+    assert source.calls == calls
+    print("✓ Stale data served, refresh retried only after the retry delay")
+
+    # Past max_stale the cache tries synchronously, then still falls back
+    time.sleep(0.6)
+    value, info = cache.get('basket:C1', source.load)
+    assert info['stale'] and value['total_revenue'] == 1000
+    print(f"✓ Still served after max_stale (age {info['age']}s)")
+
+    # Nothing cached and database down: the error surfaces
+    try:
+        cache.get('basket:C2', source.load)
+        assert False, "expected ConnectionError"
+    except ConnectionError:
+        print("✓ Cold miss with database down raises")
+
+    source.down = False
+    time.sleep(0.25)
+    cache.get('basket:C1', source.load)
+    assert wait_for(lambda: cache.get('basket:C1', source.load)[1]['status'] == 'hit')
+    print("✓ Recovers when the database is back")
+
+
+def test_version_and_response():
+    """New invoices (watermark change) revalidate; Flask response headers"""
+    print("\n=== Test 3: Data version and HTTP response ===")
+    source = FakeKpiSource(delay=0.01)
+    watermark = {'value': '2024-05-01|F001'}
+    cache = SWRCache(fresh_ttl=60, version=lambda: watermark['value'])
+    app = Flask(__name__)
+
+    with app.test_request_context('/api/commercial_performance/1300'):
+        first = cached_jsonify(cache, 'perf:1300', source.load)
+        assert first.headers['X-Cache'] == 'MISS'
+        assert json.loads(first.get_data())['stale'] is False
+
+        watermark['value'] = '2024-05-02|F002'
+        source.revenue = 1500
+        stale = cached_jsonify(cache, 'perf:1300', source.load)
+        body = json.loads(stale.get_data())
+        assert stale.headers['X-Cache'] == 'STALE' and stale.headers['Warning'].startswith('110')
+        assert body['stale'] is True and body['total_revenue'] == 1000
+        print(f"✓ Headers: X-Cache={stale.headers['X-Cache']}, Warning={stale.headers['Warning']}")
+
+        assert wait_for(lambda: cache.stats['refreshes'] == 1)
+        fresh = cached_jsonify(cache, 'perf:1300', source.load)
+        assert fresh.headers['X-Cache'] == 'HIT' and json.loads(fresh.get_data())['total_revenue'] == 1500
+        assert 'Warning' not in fresh.headers
+
+        listing = cached_jsonify(cache, 'top:C1', lambda: [1, 2, 3])
+        assert json.loads(listing.get_data()) == [1, 2, 3]
+    print("✓ Watermark change triggered a refresh")
+
+    cache.invalidate('perf:')
+    assert 'perf:1300' not in cache.entries and 'top:C1' in cache.entries
+
+
+if __name__ == "__main__":
+    test_fresh_and_stale()
+    test_database_down()
+    test_version_and_response()
+    print("\n=== All tests completed! ===")
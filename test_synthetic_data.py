@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test script for the synthetic sales data generator
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import warnings
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+from synthetic_data import SyntheticSalesGenerator, ramadan_starts, CITIES
+from sales_repository import SQLiteRepository
+
+warnings.filterwarnings('ignore', message='.*pandas only supports SQLAlchemy.*')
+
+
+def generate(generator):
+    months = list(generator.iter_months())
+    invoices = pd.concat([m[1] for m in months], ignore_index=True)
+    lines = pd.concat([m[2] for m in months], ignore_index=True)
+    return invoices, lines
+
+
+def test_seeded_and_consistent():
+    """Same seed, same tables; amounts follow the price list"""
+    print("\n=== Test 1: Seeded generation ===")
+    generator = SyntheticSalesGenerator(scale=0.5, seed=7, start='2023-01-01', end='2023-12-31')
+    invoices, lines = generate(generator)
+    again, _ = generate(SyntheticSalesGenerator(scale=0.5, seed=7, start='2023-01-01', end='2023-12-31'))
+    other, _ = generate(SyntheticSalesGenerator(scale=0.5, seed=8, start='2023-01-01', end='2023-12-31'))
+    assert invoices.equals(again) and not invoices.equals(other)
+    print(f"✓ {len(invoices)} invoices, {len(lines)} lines, reproducible")
+
+    assert generator.n_commercials == 10 and generator.n_clients == 1000
+    assert invoices['code'].is_unique and invoices['date'].is_monotonic_increasing
+    assert set(lines['entetecommercial_code']) == set(invoices['code'])
+
+    prices = generator.products().set_index('code')['prix_ttc']
+    totals = (lines['quantite'] * lines['produit_code'].map(prices)).groupby(lines['entetecommercial_code']).sum()
+    assert np.allclose(totals.loc[invoices['code']].values, invoices['net_a_payer'].values, atol=1e-3)
+
+    # Each client buys from the commercial of its city
+    clients = generator.clients().set_index('code')
+    users = generator.users().set_index('code')
+    pairs = invoices[['client_code', 'commercial_code']].drop_duplicates()
+    assert pairs['client_code'].is_unique
+    assert (clients.loc[pairs['client_code'], 'ville'].values == users.loc[pairs['commercial_code'], 'prenom'].values).all()
+    print("✓ Amounts from the price list, one commercial per client, same city")
+
+
+def test_seasonality_and_geography():
+    """Weekly and Ramadan-like patterns, intermittent clients, coordinates around the cities"""
+    print("\n=== Test 2: Seasonality and geography ===")
+    generator = SyntheticSalesGenerator(scale=1, seed=3)
+    invoices, lines = generate(generator)
+
+    weekdays = invoices['date'].dt.weekday.value_counts()
+    assert weekdays[6] < 0.05 * weekdays[0] and weekdays[5] < weekdays[2]
+    print(f"✓ Sundays: {weekdays[6]}, Mondays: {weekdays[0]}")
+
+    assert ramadan_starts('2024-01-01', '2024-12-31') == [pd.Timestamp('2024-03-11')]
+    lines_per_invoice = lines.groupby('entetecommercial_code').size()
+    ramadan = invoices['date'].between('2024-03-11', '2024-04-09')
+    inside = lines_per_invoice.loc[invoices.loc[ramadan, 'code']].mean()
+    outside = lines_per_invoice.loc[invoices.loc[~ramadan & invoices['date'].dt.year.eq(2024), 'code']].mean()
+    assert inside > 1.15 * outside
+    print(f"✓ Ramadan-like month: {inside:.2f} lines per invoice vs {outside:.2f}")
+
+    # Intermittent buyers: many clients skip most months
+    months_active = invoices.groupby('client_code')['date'].apply(lambda d: d.dt.to_period('M').nunique())
+    assert (months_active < 12).mean() > 0.3 and months_active.max() == 24
+    print(f"✓ Median active months per client: {months_active.median():.0f} / 24")
+
+    clients = generator.clients()
+    centres = {c[0]: (c[1], c[2]) for c in CITIES}
+    distance = np.hypot(clients['latitude'].astype(float) - clients['ville'].map(lambda v: centres[v][0]),
+                        clients['longitude'].astype(float) - clients['ville'].map(lambda v: centres[v][1]))
+    assert distance.quantile(0.99) < 0.2
+    assert clients['ville'].value_counts().index[0] == 'Tunis'
+    print(f"✓ Clients within {distance.quantile(0.99):.2f}° of their city centre")
+
+
+def test_outputs():
+    """Parquet fixtures and the SQLite stand-in hold the same rows"""
+    print("\n=== Test 3: Parquet and SQLite outputs ===")
+    directory = tempfile.mkdtemp()
+    try:
+        generator = SyntheticSalesGenerator(scale=0.2, seed=5, start='2024-01-01', end='2024-06-30')
+        counts = generator.write_parquet(directory)
+        assert pd.read_parquet(os.path.join(directory, 'lignecommercials.parquet')).shape[0] == counts['lignecommercials']
+        print(f"Parquet: {counts}")
+
+        repository = SQLiteRepository()
+        assert generator.write_repository(repository) == counts
+        from_fixtures = SQLiteRepository(fixtures=directory)
+        direct = repository.invoices(commercial_code='1301')
+        loaded = from_fixtures.invoices(commercial_code='1301')
+        assert len(direct) == len(loaded) > 0
+        assert (direct['code'].values == loaded['code'].values).all()
+        assert np.allclose(direct['net_a_payer'], loaded['net_a_payer'])
+        print(f"✓ Same {len(direct)} invoices of commercial 1301 from both outputs")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    test_seeded_and_consistent()
+    test_seasonality_and_geography()
+    test_outputs()
+    print("\n=== All tests completed! ===")